@@ -7,7 +7,7 @@ import binascii
 import logging
 import os
 import time as timemod
-from glob import iglob
+from collections import deque
 from threading import Event, enumerate as enumerate_threads
 from traceback import print_exc
 
@@ -27,7 +27,6 @@ from Tribler.Core.Modules.versioncheck_manager import VersionCheckManager
 from Tribler.Core.Modules.watch_folder import WatchFolder
 from Tribler.Core.TorrentChecker.torrent_checker import TorrentChecker
 from Tribler.Core.TorrentDef import TorrentDef, TorrentDefNoMetainfo
-from Tribler.Core.Utilities.configparser import CallbackConfigParser
 from Tribler.Core.Utilities.install_dir import get_lib_path
 from Tribler.Core.Video.VideoServer import VideoServer
 from Tribler.Core.defaults import tribler_defaults
@@ -38,11 +37,14 @@ from Tribler.Core.simpledefs import (NTFY_DISPERSY, NTFY_STARTED, NTFY_TORRENTS,
                                      STATE_INITIALIZE_CHANNEL_MGR, STATE_START_MAINLINE_DHT, STATE_START_LIBTORRENT,
                                      STATE_START_TORRENT_CHECKER, STATE_START_REMOTE_TORRENT_HANDLER,
                                      STATE_START_API_ENDPOINTS, STATE_START_WATCH_FOLDER, STATE_START_CREDIT_MINING,
-                                     STATE_START_RESOURCE_MONITOR)
+                                     STATE_START_RESOURCE_MONITOR, NTFY_STATE)
 from Tribler.community.tunnel.tunnel_community import TunnelSettings
 from Tribler.dispersy.taskmanager import TaskManager
 from Tribler.dispersy.util import blockingCallFromThread, blocking_call_on_reactor_thread
 
+RESUME_BATCH_SIZE = 50  # the number of checkpoints that are parsed or resumed in one go
+RESUME_INTERVAL = 0.1  # downloads are resumed at a fixed rate of one batch per interval
+
 
 class TriblerLaunchMany(TaskManager):
 
@@ -71,6 +73,7 @@ class TriblerLaunchMany(TaskManager):
 
         # modules
         self.torrent_store = None
+        self.checkpoint_store = None
         self.metadata_store = None
         self.rtorrent_handler = None
         self.tftp_handler = None
@@ -101,6 +104,10 @@ class TriblerLaunchMany(TaskManager):
 
         self.boosting_manager = None
 
+        # The parsed checkpoints that still have to be resumed, and the resumed downloads without a libtorrent handle
+        self.resume_queue = deque()
+        self.resume_statistics = {}
+
     def register(self, session, sesslock):
         assert isInIOThread()
         if not self.registered:
@@ -116,10 +123,15 @@ class TriblerLaunchMany(TaskManager):
 
             if self.session.get_torrent_store():
                 from Tribler.Core.leveldbstore import LevelDbStore
-                self.torrent_store = LevelDbStore(self.session.get_torrent_store_dir())
+                self.torrent_store = LevelDbStore(self.session.get_torrent_store_dir(), compress=True)
                 if not self.torrent_store.get_db():
                     raise RuntimeError("Torrent store (leveldb) is None which should not normally happen")
 
+            if self.session.get_libtorrent():
+                from Tribler.Core.Libtorrent.checkpoint_store import CheckpointStore
+                self.checkpoint_store = CheckpointStore(self.session.get_downloads_checkpoint_store_dir())
+                self.checkpoint_store.migrate(self.session.get_downloads_pstate_dir())
+
             if self.session.get_enable_metadata():
                 from Tribler.Core.leveldbstore import LevelDbStore
                 self.metadata_store = LevelDbStore(self.session.get_metadata_store_dir())
@@ -177,7 +189,9 @@ class TriblerLaunchMany(TaskManager):
 
                 # register TFTP service
                 from Tribler.Core.TFTP.handler import TftpHandler
-                self.tftp_handler = TftpHandler(self.session, endpoint, "fffffffd".decode('hex'), block_size=1024)
+                from Tribler.Core.TFTP.session import DEFAULT_WINDOW_SIZE, MAX_BLOCK_SIZE
+                self.tftp_handler = TftpHandler(self.session, endpoint, "fffffffd".decode('hex'),
+                                                block_size=MAX_BLOCK_SIZE, window_size=DEFAULT_WINDOW_SIZE)
                 self.tftp_handler.initialize()
 
             if self.session.get_enable_torrent_search() or self.session.get_enable_channel_search():
@@ -594,42 +608,97 @@ class TriblerLaunchMany(TaskManager):
         if self.state_cb_count % 4 == 0 and self.tunnel_community:
             self.tunnel_community.monitor_downloads(states_list)
 
+        self.session.notifier.notify(NTFY_TORRENT, NTFY_STATE, None, states_list)
+
         return []
 
     #
     # Persistence methods
     #
+    @blocking_call_on_reactor_thread
     def load_checkpoint(self):
-        """ Called by any thread """
+        """
+        Resume the downloads of all checkpoints. The checkpoints are parsed in the thread pool, and the downloads are
+        handed to libtorrent at a fixed rate of RESUME_BATCH_SIZE downloads every RESUME_INTERVAL seconds.
+        :return: a Deferred that fires when all downloads have been resumed.
+        """
+        resumed_deferred = Deferred()
 
         def do_load_checkpoint():
-            with self.sesslock:
-                for i, filename in enumerate(iglob(os.path.join(self.session.get_downloads_pstate_dir(), '*.state'))):
-                    self.resume_download(filename, setupDelay=i * 0.1)
+            infohashes = self.checkpoint_store.get_infohashes() if self.checkpoint_store is not None else []
+            self.resume_statistics = {"checkpoints": len(infohashes), "parsed": 0, "resumed": 0, "parse_time": None, "resume_time": None}
+            start_time = timemod.time()
+
+            def on_parsed(resume_states):
+                self.resume_queue.extend(resume_states)
+                self.resume_statistics["parsed"] += len(resume_states)
+
+            def on_all_parsed(_):
+                self.resume_statistics["parse_time"] = timemod.time() - start_time
+
+            parse_deferreds = [deferToThread(self.load_resume_states, infohashes[i:i + RESUME_BATCH_SIZE])
+                               .addCallback(on_parsed) for i in xrange(0, len(infohashes), RESUME_BATCH_SIZE)]
+            parsed_deferred = DeferredList(parse_deferreds).addCallback(on_all_parsed)
+            self._resume_downloads(start_time, parsed_deferred, resumed_deferred)
 
         if self.initComplete:
             do_load_checkpoint()
         else:
             self.register_task("load_checkpoint", reactor.callLater(1, do_load_checkpoint))
+        return resumed_deferred
+
+    def _resume_downloads(self, start_time, parsed_deferred, resumed_deferred):
+        """
+        Resume a batch of parsed checkpoints. Reschedules itself until all checkpoints have been parsed and resumed.
+        """
+        with self.sesslock:
+            for _ in xrange(min(len(self.resume_queue), RESUME_BATCH_SIZE)):
+                infohash, resume_state = self.resume_queue.popleft()
+                self.resume_download(infohash, resume_state=resume_state)
+                self.resume_statistics["resumed"] += 1
+
+        if self.resume_queue or not parsed_deferred.called:
+            self.register_task("resume_downloads", reactor.callLater(RESUME_INTERVAL, self._resume_downloads,
+                                                                      start_time, parsed_deferred, resumed_deferred))
+        else:
+            self.resume_statistics["resume_time"] = timemod.time() - start_time
+            self._logger.info("tlm: resumed %d checkpoints, parsing took %.2f s and resuming took %.2f s",
+                              self.resume_statistics["resumed"], self.resume_statistics["parse_time"],
+                              self.resume_statistics["resume_time"])
+            resumed_deferred.callback(None)
+
+    def get_resume_statistics(self):
+        """
+        Return the progress and the duration of the parse and resume phases of loading the checkpoints.
+        """
+        return self.resume_statistics
 
     def load_download_pstate_noexc(self, infohash):
         """ Called by any thread, assume sesslock already held """
         try:
-            basename = binascii.hexlify(infohash) + '.state'
-            filename = os.path.join(self.session.get_downloads_pstate_dir(), basename)
-            if os.path.exists(filename):
-                return self.load_download_pstate(filename)
-            else:
-                self._logger.info("%s not found", basename)
+            pstate = self.checkpoint_store.get(infohash) if self.checkpoint_store is not None else None
+            if pstate is None:
+                self._logger.info("checkpoint of %s not found", binascii.hexlify(infohash))
+            return pstate
 
         except Exception:
             self._logger.exception("Exception while loading pstate: %s", infohash)
 
-    def resume_download(self, filename, setupDelay=0):
+    def load_resume_states(self, infohashes):
+        """
+        Called by any thread. Returns a list of (infohash, resume state) tuples, see load_resume_state.
+        """
+        return [(infohash, self.load_resume_state(infohash)) for infohash in infohashes]
+
+    def load_resume_state(self, infohash):
+        """
+        Called by any thread. Parses a checkpoint into a (pstate, tdef, dscfg) tuple, tdef and dscfg are None if the
+        checkpoint is invalid or does not exist.
+        """
         tdef = dscfg = pstate = None
 
         try:
-            pstate = self.load_download_pstate(filename)
+            pstate = self.checkpoint_store.get(infohash)
 
             # SWIFTPROC
             metainfo = pstate.get('state', 'metainfo')
@@ -645,11 +714,19 @@ class TriblerLaunchMany(TaskManager):
             dscfg = DownloadStartupConfig(pstate)
 
         except:
-            # pstate is invalid or non-existing
-            _, file = os.path.split(filename)
+            return pstate, None, None
 
-            infohash = binascii.unhexlify(file[:-6])
+        return pstate, tdef, dscfg
 
+    def resume_download(self, infohash, setupDelay=0, resume_state=None):
+        """
+        Resume the download of a checkpoint. The resume state can be parsed in advance with load_resume_state.
+        :return: the resumed download, or None if it could not be resumed.
+        """
+        pstate, tdef, dscfg = resume_state or self.load_resume_state(infohash)
+
+        if tdef is None or dscfg is None:
+            # pstate is invalid or non-existing
             torrent_data = self.torrent_store.get(infohash)
             if torrent_data:
                 try:
@@ -673,17 +750,18 @@ class TriblerLaunchMany(TaskManager):
             if dscfg.get_dest_dir() != '':  # removed torrent ignoring
                 try:
                     if not self.download_exists(tdef.get_infohash()):
-                        self.add(tdef, dscfg, pstate, setupDelay=setupDelay)
+                        return self.add(tdef, dscfg, pstate, setupDelay=setupDelay)
                     else:
                         self._logger.info("tlm: not resuming checkpoint because download has already been added")
 
                 except Exception as e:
                     self._logger.exception("tlm: load check_point: exception while adding download %s", tdef)
             else:
-                self._logger.info("tlm: removing checkpoint %s destdir is %s", filename, dscfg.get_dest_dir())
-                os.remove(filename)
+                self._logger.info("tlm: removing checkpoint %s destdir is %s", binascii.hexlify(infohash),
+                                  dscfg.get_dest_dir())
+                self.checkpoint_store.delete(infohash)
         else:
-            self._logger.info("tlm: could not resume checkpoint %s %s %s", filename, tdef, dscfg)
+            self._logger.info("tlm: could not resume checkpoint %s %s %s", binascii.hexlify(infohash), tdef, dscfg)
 
     def checkpoint_downloads(self):
         """
@@ -710,16 +788,11 @@ class TriblerLaunchMany(TaskManager):
     def remove_pstate(self, infohash):
         def do_remove():
             if not self.download_exists(infohash):
-                dlpstatedir = self.session.get_downloads_pstate_dir()
-
                 # Remove checkpoint
-                hexinfohash = binascii.hexlify(infohash)
                 try:
-                    basename = hexinfohash + '.state'
-                    filename = os.path.join(dlpstatedir, basename)
-                    self._logger.debug("remove pstate: removing dlcheckpoint entry %s", filename)
-                    if os.access(filename, os.F_OK):
-                        os.remove(filename)
+                    self._logger.debug("remove pstate: removing dlcheckpoint entry %s", binascii.hexlify(infohash))
+                    if self.checkpoint_store is not None:
+                        self.checkpoint_store.delete(infohash)
                 except:
                     # Show must go on
                     self._logger.exception("Could not remove state")
@@ -738,6 +811,7 @@ class TriblerLaunchMany(TaskManager):
         self._logger.info("tlm: early_shutdown")
 
         self.cancel_all_pending_tasks()
+        self.resume_queue.clear()
 
         # Note: sesslock not held
         self.shutdownstarttime = timemod.time()
@@ -850,6 +924,11 @@ class TriblerLaunchMany(TaskManager):
         # Stop network thread
         self.sessdoneflag.set()
 
+        # Write the checkpoints to disk before the libtorrent session is shut down
+        if self.checkpoint_store is not None:
+            self.checkpoint_store.close()
+        self.checkpoint_store = None
+
         # Shutdown libtorrent session after checkpoints have been made
         if self.ltmgr is not None:
             self.ltmgr.shutdown()
@@ -863,12 +942,6 @@ class TriblerLaunchMany(TaskManager):
         self.register_task("save_pstate %f" % timemod.clock(),
                            self.downloads[infohash].save_resume_data())
 
-    def load_download_pstate(self, filename):
-        """ Called by any thread """
-        pstate = CallbackConfigParser()
-        pstate.read_file(filename)
-        return pstate
-
     # Events from core meant for API user
     #
     def sessconfig_changed_callback(self, section, name, new_value, old_value):
@@ -5,6 +5,11 @@ Author(s): Jelle Roozenburg
 """
 import logging
 import threading
+from collections import defaultdict, deque
+from time import time
+
+from twisted.internet import reactor
+from twisted.python.threadable import isInIOThread
 
 from Tribler.Core.simpledefs import (NTFY_TORRENTS, NTFY_PLAYLISTS, NTFY_COMMENTS,
                                      NTFY_MODIFICATIONS, NTFY_MODERATIONS, NTFY_MARKINGS, NTFY_MYPREFERENCES,
@@ -16,8 +21,48 @@ from Tribler.Core.simpledefs import (NTFY_TORRENTS, NTFY_PLAYLISTS, NTFY_COMMENT
                                      NTFY_WATCH_FOLDER_CORRUPT_TORRENT, NTFY_NEW_VERSION, NTFY_TRIBLER,
                                      NTFY_UPGRADER_TICK, NTFY_TORRENT, NTFY_CHANNEL, SIGNAL_RESOURCE_CHECK)
 
+# The maximum number of events delivered to an observer per reactor iteration
+MAX_EVENTS_PER_ITERATION = 100
+# The maximum time a thread waits for room in the queue of an observer with the OVERFLOW_BLOCK policy
+BLOCK_TIMEOUT = 1.0
+
+# What happens with an event for an observer with a full queue, observers without a queue size never lose events
+OVERFLOW_DROP_OLDEST = u"drop_oldest"
+OVERFLOW_DROP_NEWEST = u"drop_newest"
+OVERFLOW_BLOCK = u"block"
+
+
+class NotifierObserver(object):
+    """
+    An observer function together with the events it is interested in and the events that still have to be delivered.
+    """
+
+    def __init__(self, func, subject, change_types, object_id, cache, queue_size, overflow):
+        self.func = func
+        self.subject = subject
+        self.change_types = change_types
+        self.object_id = object_id
+        self.cache = cache
+        self.queue_size = queue_size
+        self.overflow = overflow
+
+        # (event arguments, time of the notification) tuples
+        self.events = deque()
+        self.scheduled = False
+        self.active = True
+
+    def matches(self, change_type, object_id):
+        return change_type in self.change_types and (self.object_id is None or self.object_id == object_id)
+
 
 class Notifier(object):
+    """
+    Delivers events to the observers of a subject. Notify only queues the event for every interested observer, the
+    observers are called on the reactor thread, so a slow observer does not slow down the thread that notified.
+
+    Observers that are added with a cache time receive all their events of that period in one batch, identical events
+    within a batch are collapsed into one.
+    """
 
     SUBJECTS = [NTFY_TORRENTS, NTFY_PLAYLISTS, NTFY_COMMENTS, NTFY_MODIFICATIONS, NTFY_MODERATIONS, NTFY_MARKINGS,
                 NTFY_MYPREFERENCES, NTFY_ACTIVITIES, NTFY_REACHABLE, NTFY_CHANNELCAST, NTFY_CLOSE_TICK, NTFY_DISPERSY,
@@ -26,15 +71,22 @@ class Notifier(object):
                 SIGNAL_SEARCH_COMMUNITY, SIGNAL_TORRENT, NTFY_WATCH_FOLDER_CORRUPT_TORRENT, NTFY_NEW_VERSION,
                 NTFY_TRIBLER, NTFY_UPGRADER_TICK, NTFY_TORRENT, NTFY_CHANNEL, SIGNAL_RESOURCE_CHECK]
 
+    _reactor = reactor
+
     def __init__(self):
         self._logger = logging.getLogger(self.__class__.__name__)
 
         self.observers = []
-        self.observerscache = {}
+        self.observers_by_subject = defaultdict(list)
         self.observertimers = {}
         self.observerLock = threading.Lock()
+        self._queue_space = threading.Condition(self.observerLock)
+
+        self._statistics = defaultdict(lambda: {"notified": 0, "delivered": 0, "dropped": 0, "queued": 0,
+                                                "max_queue_length": 0, "total_latency": 0.0, "max_latency": 0.0})
 
-    def add_observer(self, func, subject, changeTypes=[NTFY_UPDATE, NTFY_INSERT, NTFY_DELETE], id=None, cache=0):
+    def add_observer(self, func, subject, changeTypes=[NTFY_UPDATE, NTFY_INSERT, NTFY_DELETE], id=None, cache=0,
+                     queue_size=None, overflow=OVERFLOW_DROP_OLDEST):
         """
         Add observer function which will be called upon certain event
         Example:
@@ -43,79 +95,186 @@ class Notifier(object):
         addObserver(NTFY_TORRENTS, [NTFY_SEARCH_RESULT], 'a_search_id') -> get
                     callbacks when peer-searchresults of of search
                     with id=='a_search_id' come in
+        :param queue_size: the maximum number of undelivered events of this observer, None for an unbounded queue.
+        :param overflow: what to do with new events when the queue is full, one of the OVERFLOW_* policies.
         """
         assert isinstance(changeTypes, list)
         assert subject in self.SUBJECTS, 'Subject %s not in SUBJECTS' % subject
+        assert overflow in (OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST, OVERFLOW_BLOCK), overflow
 
-        obs = (func, subject, changeTypes, id, cache)
-        self.observerLock.acquire()
-        self.observers.append(obs)
-        self.observerLock.release()
+        observer = NotifierObserver(func, subject, changeTypes, id, cache, queue_size, overflow)
+        with self.observerLock:
+            self.observers.append(observer)
+            self.observers_by_subject[subject].append(observer)
 
     def remove_observer(self, func):
         """ Remove all observers with function func
         """
         with self.observerLock:
-            i = 0
-            while i < len(self.observers):
-                ofunc = self.observers[i][0]
-                if ofunc == func:
-                    del self.observers[i]
-                else:
-                    i += 1
+            for observer in [observer for observer in self.observers if observer.func == func]:
+                self._remove(observer)
 
     def remove_observers(self):
         with self.observerLock:
-            for timer in self.observertimers.values():
-                timer.cancel()
-            self.observerscache = {}
+            for observer in list(self.observers):
+                self._remove(observer)
             self.observertimers = {}
             self.observers = []
+            self.observers_by_subject.clear()
+
+    def _remove(self, observer):
+        observer.active = False
+        self._statistics[observer.subject]["queued"] -= len(observer.events)
+        observer.events.clear()
+        self.observers.remove(observer)
+        self.observers_by_subject[observer.subject].remove(observer)
+        timer = self.observertimers.pop(observer, None)
+        if timer and timer.active():
+            timer.cancel()
+        self._queue_space.notify_all()
 
     def notify(self, subject, changeType, obj_id, *args):
         """
-        Notify all interested observers about an event with threads from the pool
+        Queue an event for all interested observers, the observers are called on the reactor thread.
         """
-        tasks = []
         assert subject in self.SUBJECTS, 'Subject %s not in SUBJECTS' % subject
 
         args = [subject, changeType, obj_id] + list(args)
+        now = time()
+
+        with self.observerLock:
+            statistics = self._statistics[subject]
+            statistics["notified"] += 1
+            # Blocking observers release the lock while waiting, so the observers could change
+            for observer in list(self.observers_by_subject.get(subject, ())):
+                try:
+                    if not observer.matches(changeType, obj_id):
+                        continue
+                except Exception:
+                    self._logger.exception("OIDs were %s %s", repr(observer.object_id), repr(obj_id))
+                    continue
+
+                if not self._make_room(observer, statistics):
+                    continue
+
+                observer.events.append((args, now))
+                statistics["queued"] += 1
+                statistics["max_queue_length"] = max(statistics["max_queue_length"], len(observer.events))
+
+                if not observer.scheduled:
+                    observer.scheduled = True
+                    self._reactor.callFromThread(self._schedule, observer)
+
+    def _make_room(self, observer, statistics):
+        """
+        Apply the overflow policy of an observer with a full queue. Called with the observer lock held.
+        :return: whether the new event should be queued.
+        """
+        if observer.queue_size is None:
+            return True
+
+        if observer.overflow == OVERFLOW_BLOCK and not isInIOThread():
+            # The reactor empties the queue, so only other threads can wait for it
+            deadline = time() + BLOCK_TIMEOUT
+            while observer.active and len(observer.events) >= observer.queue_size and time() < deadline:
+                self._queue_space.wait(deadline - time())
 
-        self.observerLock.acquire()
-        for ofunc, osubject, ochangeTypes, oid, cache in self.observers:
+        if not observer.active:
+            return False
+
+        if len(observer.events) < observer.queue_size:
+            return True
+
+        statistics["dropped"] += 1
+        if observer.overflow == OVERFLOW_DROP_NEWEST:
+            return False
+
+        observer.events.popleft()
+        statistics["queued"] -= 1
+        return True
+
+    def _schedule(self, observer):
+        with self.observerLock:
+            if not observer.active:
+                return
+            if observer.cache:
+                self.observertimers[observer] = self._reactor.callLater(observer.cache, self._deliver, observer)
+                return
+        self._deliver(observer)
+
+    def _deliver(self, observer):
+        """
+        Call an observer with its queued events. Observers without a cache time get at most MAX_EVENTS_PER_ITERATION
+        events per reactor iteration, the remaining events are delivered in the next iterations.
+        """
+        with self.observerLock:
+            self.observertimers.pop(observer, None)
+            if not observer.active:
+                return
+
+            num_events = len(observer.events) if observer.cache else min(len(observer.events),
+                                                                          MAX_EVENTS_PER_ITERATION)
+            events = [observer.events.popleft() for _ in xrange(num_events)]
+            statistics = self._statistics[observer.subject]
+            statistics["queued"] -= num_events
+            self._queue_space.notify_all()
+
+            observer.scheduled = bool(observer.events)
+            if observer.scheduled:
+                self._reactor.callLater(0, self._deliver, observer)
+
+            now = time()
+            for _, notify_time in events:
+                statistics["total_latency"] += now - notify_time
+                statistics["max_latency"] = max(statistics["max_latency"], now - notify_time)
+            statistics["delivered"] += num_events
+
+        if observer.cache:
+            self._call(observer, self._collapse([args for args, _ in events]))
+        else:
+            for args, _ in events:
+                self._call(observer, *args)
+
+    def _call(self, observer, *args):
+        try:
+            observer.func(*args)
+        except Exception:
+            self._logger.exception("Observer %s of %s failed", observer.func, observer.subject)
+
+    @staticmethod
+    def _collapse(events):
+        """
+        Remove the repeated events from a batch of events, keeping the order in which they were first notified.
+        """
+        batch = []
+        seen = set()
+        for args in events:
             try:
-                if (subject == osubject and
-                    changeType in ochangeTypes and
-                        (oid is None or oid == obj_id)):
-
-                    if not cache:
-                        tasks.append(ofunc)
-                    else:
-                        if ofunc not in self.observerscache:
-                            def doQueue(ofunc):
-                                self.observerLock.acquire()
-                                if ofunc in self.observerscache:
-                                    events = self.observerscache[ofunc]
-                                    del self.observerscache[ofunc]
-                                    del self.observertimers[ofunc]
-                                else:
-                                    events = []
-                                self.observerLock.release()
-
-                                if events:
-                                    ofunc(events)
-
-                            t = threading.Timer(cache, doQueue, (ofunc,))
-                            t.setName("Notifier-timer-%s" % subject)
-                            t.start()
-
-                            self.observerscache[ofunc] = []
-                            self.observertimers[ofunc] = t
-
-                        self.observerscache[ofunc].append(args)
-            except:
-                self._logger.exception("OIDs were %s %s", repr(oid), repr(obj_id))
-
-        self.observerLock.release()
-        for task in tasks:
-            task(*args)  # call observer function in this thread
+                key = tuple(args)
+                if key in seen:
+                    continue
+                seen.add(key)
+            except TypeError:
+                # Events with unhashable arguments are never collapsed
+                pass
+            batch.append(args)
+        return batch
+
+    def get_statistics(self):
+        """
+        Return the number of notified, delivered, dropped and queued events per subject, together with the longest
+        queue of an observer and the average and maximum time between a notification and its delivery.
+        """
+        with self.observerLock:
+            statistics = {}
+            for subject, subject_statistics in self._statistics.iteritems():
+                delivered = subject_statistics["delivered"]
+                statistics[subject] = {"notified": subject_statistics["notified"],
+                                       "delivered": delivered,
+                                       "dropped": subject_statistics["dropped"],
+                                       "queued": subject_statistics["queued"],
+                                       "max_queue_length": subject_statistics["max_queue_length"],
+                                       "average_latency": subject_statistics["total_latency"] / delivered
+                                                          if delivered else 0.0,
+                                       "max_latency": subject_statistics["max_latency"]}
+            return statistics
@@ -4,11 +4,12 @@ SqlitecacheDBHanler.
 Author(s): Jie Yang
 """
 import logging
-import math
 import os
 import threading
+from binascii import hexlify
 from collections import OrderedDict, defaultdict
 from copy import deepcopy
+from heapq import nlargest
 from itertools import chain
 from libtorrent import bencode
 from pprint import pformat
@@ -16,9 +17,12 @@ from struct import unpack_from
 from time import time
 from traceback import print_exc
 
+from twisted.internet.defer import inlineCallbacks
 from twisted.internet.task import LoopingCall
 
-from Tribler.Core.CacheDB.sqlitecachedb import bin2str, str2bin
+from Tribler.Core.CacheDB.channelcast_pool import ChannelcastPool
+from Tribler.Core.CacheDB.search_cache import SearchResultCache
+from Tribler.Core.CacheDB.sqlitecachedb import bin2blob, bin2str, blob2bin, str2bin
 from Tribler.Core.TorrentDef import TorrentDef
 import Tribler.Core.Utilities.json_util as json
 from Tribler.Core.Utilities.search_utils import split_into_keywords, filter_keywords
@@ -34,6 +38,42 @@ from Tribler.dispersy.taskmanager import TaskManager
 VOTECAST_FLUSH_DB_INTERVAL = 15
 
 DEFAULT_ID_CACHE_SIZE = 1024 * 5
+DEFAULT_CHANNEL_CACHE_SIZE = 1024
+
+# How often the pool of channel torrents that channelcast draws from is rebuilt from the database, in seconds
+CHANNELCAST_POOL_REFRESH_INTERVAL = 600
+
+# The number of torrents we return to a remote search query
+REMOTE_SEARCH_RESULTS = 25
+
+# SQLite refuses statements with more than 999 parameters, larger IN (...) lookups are split up
+MAX_SQL_PARAMETERS = 900
+
+# The maximum number of distinct file name keywords stored in the full text index of a torrent
+MAX_INDEXED_FILENAMES = 1000
+
+# The eviction weight of a collected torrent is lowered by one per day of age, up to this many days
+MAX_EVICTION_AGE_PENALTY = 500
+
+SECONDS_PER_DAY = 86400
+
+
+def split_into_chunks(items, size=MAX_SQL_PARAMETERS):
+    for index in xrange(0, len(items), size):
+        yield items[index:index + size]
+
+
+def get_eviction_weight(relevance=0, num_seeders=None, num_leechers=None, creation_date=None):
+    """
+    Return the eviction weight of a torrent, like the Torrent_eviction_weight_update trigger computes it.
+
+    Instead of subtracting the age of the torrent in days, the day it was created on is added, clamped to at most
+    MAX_EVICTION_AGE_PENALTY days before today. Today is the same for every torrent, so ordering by this weight gives
+    the same order as ordering by weight minus age penalty, without depending on the time of the query.
+    """
+    today = long(time()) // SECONDS_PER_DAY
+    creation_day = min(today, max(long(creation_date or 0) // SECONDS_PER_DAY, today - MAX_EVICTION_AGE_PENALTY))
+    return min(relevance or 0, 2500) + min(500, num_leechers or 0) + 4 * min(500, num_seeders or 0) + creation_day
 
 
 class LimitedOrderedDict(OrderedDict):
@@ -228,6 +268,9 @@ class TorrentDBHandler(BasicDBHandler):
         # to incoming remote torrents without doing a full text search.
         self.latest_matchinfo_torrent = None
 
+        # The responses to remote search queries, invalidated when matching torrents are indexed or updated
+        self.remote_search_cache = SearchResultCache()
+
     def initialize(self, *args, **kwargs):
         super(TorrentDBHandler, self).initialize(*args, **kwargs)
         self.category = self.session.lm.category
@@ -260,14 +303,16 @@ class TorrentDBHandler(BasicDBHandler):
             if infohash in self.infohash_id:
                 to_return[infohash] = self.infohash_id[infohash]
             else:
-                to_select.append(bin2str(infohash))
+                to_select.append(bin2blob(infohash))
 
-        parameters = '?,' * len(to_select)
-        parameters = parameters[:-1]
-        sql_stmt = u"SELECT torrent_id, infohash FROM Torrent WHERE infohash IN (%s)" % parameters
-        torrents = self._db.fetchall(sql_stmt, to_select)
-        for torrent_id, infohash in torrents:
-            self.infohash_id[str2bin(infohash)] = torrent_id
+        for chunk in split_into_chunks(to_select):
+            parameters = '?,' * len(chunk)
+            parameters = parameters[:-1]
+            sql_stmt = u"SELECT torrent_id, infohash FROM Torrent WHERE infohash IN (%s)" % parameters
+            torrents = self._db.fetchall(sql_stmt, chunk)
+            for torrent_id, infohash in torrents:
+                # the cache is bounded, so large lookups cannot rely on it
+                to_return[blob2bin(infohash)] = self.infohash_id[blob2bin(infohash)] = torrent_id
 
         for infohash in unique_infohashes:
             if infohash not in to_return:
@@ -278,7 +323,7 @@ class TorrentDBHandler(BasicDBHandler):
             self._logger.error("to_return:")
             self._logger.error(pformat(to_return))
             self._logger.error("infohashes:")
-            self._logger.error(pformat([bin2str(infohash) for infohash in unique_infohashes]))
+            self._logger.error(pformat([hexlify(infohash) for infohash in unique_infohashes]))
             assert len(to_return) == len(unique_infohashes), (len(to_return), len(unique_infohashes))
 
         return to_return
@@ -290,7 +335,7 @@ class TorrentDBHandler(BasicDBHandler):
         sql_get_infohash = "SELECT infohash FROM Torrent WHERE torrent_id==?"
         ret = self._db.fetchone(sql_get_infohash, (torrent_id,))
         if ret:
-            ret = str2bin(ret)
+            ret = blob2bin(ret)
         return ret
 
     def hasTorrent(self, infohash):
@@ -298,7 +343,7 @@ class TorrentDBHandler(BasicDBHandler):
         assert len(infohash) == INFOHASH_LENGTH, "INFOHASH has invalid length: %d" % len(infohash)
         if infohash in self.existed_torrents:  # to do: not thread safe
             return True
-        infohash_str = bin2str(infohash)
+        infohash_str = bin2blob(infohash)
         existed = self._db.getOne('CollectedTorrent', 'torrent_id', infohash=infohash_str)
         if existed is None:
             return False
@@ -356,13 +401,108 @@ class TorrentDBHandler(BasicDBHandler):
                 self._logger.exception("Could not create a TorrentDef instance %r %r %r %r %r %r",
                                        infohash, timestamp, name, files, trackers, extra_info)
 
+    def addExternalTorrentsNoDef(self, torrents):
+        """
+        Adds a batch of torrents of which only the name, files and trackers are known, like the torrents that are
+        received from channels. Compared to calling addExternalTorrentNoDef for every torrent, every table is written
+        with a single statement.
+        :param torrents: A list of (infohash, name, files, trackers, timestamp, extra_info) tuples.
+        :return: A list with the infohashes of the torrents that have been added.
+        """
+        # skip duplicates and torrents without files, like addExternalTorrentNoDef does
+        new_torrents = OrderedDict()
+        for torrent in torrents:
+            if torrent[2] and torrent[0] not in new_torrents:
+                new_torrents[torrent[0]] = torrent
+
+        # find the torrents we already know in one pass, collected torrents are left alone
+        existing_torrents = {}
+        for chunk in split_into_chunks([bin2blob(infohash) for infohash in new_torrents]):
+            sql = u"SELECT torrent_id, infohash, is_collected FROM Torrent WHERE infohash IN (%s)" % \
+                  ",".join("?" * len(chunk))
+            for torrent_id, infohash, is_collected in self._db.fetchall(sql, chunk):
+                existing_torrents[blob2bin(infohash)] = (torrent_id, is_collected)
+
+        inserts = defaultdict(list)
+        updates = defaultdict(list)
+        for infohash, (_, name, files, trackers, timestamp, extra_info) in new_torrents.items():
+            torrent_id, is_collected = existing_torrents.get(infohash, (None, 0))
+            if is_collected:
+                del new_torrents[infohash]
+                continue
+
+            try:
+                database_dict = self._get_database_dict_no_def(name, files, trackers, timestamp, extra_info)
+            except:
+                self._logger.exception("Could not add torrent %r %r %r %r %r %r",
+                                       infohash, timestamp, name, files, trackers, extra_info)
+                del new_torrents[infohash]
+                continue
+
+            # group the rows by their columns, so every group can be written with one statement
+            if torrent_id is None:
+                database_dict["infohash"] = bin2blob(infohash)
+                inserts[tuple(database_dict)].append(tuple(database_dict.values()))
+            else:
+                updates[tuple(database_dict)].append(tuple(database_dict.values()) + (torrent_id,))
+
+        for columns, values in inserts.iteritems():
+            self._db.executemany(u"INSERT INTO Torrent (%s) VALUES (%s)" % (",".join(columns),
+                                                                          ",".join("?" * len(columns))), values)
+        for columns, values in updates.iteritems():
+            self._db.executemany(u"UPDATE Torrent SET %s WHERE torrent_id = ?" % ",".join(u"%s = ?" % column
+                                                                                        for column in columns),
+                                 values)
+
+        torrent_ids = self.getTorrentIDS(new_torrents.keys())
+
+        index_values = []
+        index_terms = []
+        insert_files = []
+        torrent_trackers = {}
+        for infohash, (_, name, files, trackers, _, _) in new_torrents.iteritems():
+            torrent_id = torrent_ids[infohash]
+
+            # single file torrents are indexed by their name without extension
+            swarmname = name if len(files) > 1 else os.path.splitext(name)[0]
+            values, terms = self._get_index_values(torrent_id, swarmname,
+                                                   [path for path, _ in files] if len(files) > 1 else [name])
+            index_values.append(values)
+            index_terms.append(terms)
+
+            insert_files.extend((torrent_id, unicode(path), length) for path, length in files)
+            torrent_trackers[infohash] = self._get_tracker_set(trackers, False)
+
+        self.remote_search_cache.invalidate_terms(chain.from_iterable(index_terms))
+        try:
+            # INSERT OR REPLACE not working for fts3 table
+            self._db.executemany(u"DELETE FROM FullTextIndex WHERE rowid = ?",
+                                 [(torrent_values[0],) for torrent_values in index_values])
+            self._db.executemany(u"INSERT INTO FullTextIndex (rowid, swarmname, filenames, fileextensions)"
+                                 u" VALUES(?,?,?,?)", index_values)
+        except:
+            # this will fail if the fts3 module cannot be found
+            print_exc()
+
+        self.addTorrentsTrackerMappingInBatch([(torrent_ids[infohash], infohash, tracker_set)
+                                               for infohash, tracker_set in torrent_trackers.iteritems()])
+
+        self._db.executemany(u"INSERT OR IGNORE INTO TorrentFiles (torrent_id, path, length) VALUES (?,?,?)",
+                             insert_files)
+
+        if self._rtorrent_handler:
+            for infohash in new_torrents:
+                self._rtorrent_handler.notify_possible_torrent_infohash(infohash)
+
+        return new_torrents.keys()
+
     def addOrGetTorrentID(self, infohash):
         assert isinstance(infohash, str), "INFOHASH has invalid type: %s" % type(infohash)
         assert len(infohash) == INFOHASH_LENGTH, "INFOHASH has invalid length: %d" % len(infohash)
 
         torrent_id = self.getTorrentID(infohash)
         if torrent_id is None:
-            self._db.insert('Torrent', infohash=bin2str(infohash), status=u'unknown')
+            self._db.insert('Torrent', infohash=bin2blob(infohash), status=u'unknown')
             torrent_id = self.getTorrentID(infohash)
         return torrent_id
 
@@ -374,7 +514,7 @@ class TorrentDBHandler(BasicDBHandler):
                 to_be_inserted.add(infohash)
 
         sql = "INSERT INTO Torrent (infohash, status) VALUES (?, ?)"
-        self._db.executemany(sql, [(bin2str(infohash), u'unknown') for infohash in to_be_inserted])
+        self._db.executemany(sql, [(bin2blob(infohash), u'unknown') for infohash in to_be_inserted])
 
         torrent_id_results = self.getTorrentIDS(infohashes)
         torrent_ids = []
@@ -387,7 +527,7 @@ class TorrentDBHandler(BasicDBHandler):
         assert isinstance(torrentdef, TorrentDef), "TORRENTDEF has invalid type: %s" % type(torrentdef)
         assert torrentdef.is_finalized(), "TORRENTDEF is not finalized"
 
-        dict = {"infohash": bin2str(torrentdef.get_infohash()),
+        dict = {"infohash": bin2blob(torrentdef.get_infohash()),
                 "name": torrentdef.get_name_as_unicode(),
                 "length": torrentdef.get_length(),
                 "creation_date": torrentdef.get_creation_date(),
@@ -405,6 +545,44 @@ class TorrentDBHandler(BasicDBHandler):
             dict["num_seeders"] = extra_info["seeder"]
         if extra_info.get("leecher", -1) != -1:
             dict["num_leechers"] = extra_info["leecher"]
+        dict["eviction_weight"] = get_eviction_weight(dict["relevance"], dict.get("num_seeders"),
+                                                      dict.get("num_leechers"), dict["creation_date"])
+
+        return dict
+
+    def _get_database_dict_no_def(self, name, files, trackers, timestamp, extra_info={}):
+        """
+        Returns the same database dictionary as _get_database_dict, for a torrent of which we only know the name,
+        files and trackers. Used for batches, where creating a TorrentDef per torrent is too expensive.
+        """
+        # the category is based on the metainfo, addExternalTorrentNoDef would create the same dictionary
+        metainfo = {'info': {'name': name.encode('utf_8')}}
+        if len(files) > 1:
+            metainfo['info']['files'] = [{'path': [path.encode('utf_8')], 'length': length} for path, length in files]
+        else:
+            metainfo['info']['length'] = files[0][1]
+        if trackers:
+            metainfo['announce'] = trackers[0]
+
+        dict = {"name": name,
+                "length": sum(length for _, length in files),
+                "creation_date": timestamp,
+                "num_files": len(files),
+                "insert_time": long(time()),
+                "secret": 0,
+                "relevance": 0.0,
+                "category": self.category.calculateCategory(metainfo, name),
+                "status": extra_info.get("status", "unknown"),
+                "comment": None,
+                "is_collected": extra_info.get('is_collected', 0)
+                }
+
+        if extra_info.get("seeder", -1) != -1:
+            dict["num_seeders"] = extra_info["seeder"]
+        if extra_info.get("leecher", -1) != -1:
+            dict["num_leechers"] = extra_info["leecher"]
+        dict["eviction_weight"] = get_eviction_weight(dict["relevance"], dict.get("num_seeders"),
+                                                      dict.get("num_leechers"), dict["creation_date"])
 
         return dict
 
@@ -436,8 +614,23 @@ class TorrentDBHandler(BasicDBHandler):
 
     def _indexTorrent(self, torrent_id, swarmname, files):
         # Niels: new method for indexing, replaces invertedindex
+        values, terms = self._get_index_values(torrent_id, swarmname, files)
+        self.remote_search_cache.invalidate_terms(terms)
+        try:
+            # INSERT OR REPLACE not working for fts3 table
+            self._db.execute_write(u"DELETE FROM FullTextIndex WHERE rowid = ?", (torrent_id,))
+            self._db.execute_write(
+                u"INSERT INTO FullTextIndex (rowid, swarmname, filenames, fileextensions) VALUES(?,?,?,?)", values)
+        except:
+            # this will fail if the fts3 module cannot be found
+            print_exc()
+
+    def _get_index_values(self, torrent_id, swarmname, files):
+        """
+        Returns the row of a torrent in the full text index, together with the terms it can be found with.
+        """
         # Making sure that swarmname does not include extension for single file torrents
-        swarm_keywords = " ".join(split_into_keywords(swarmname))
+        swarm_keywords = split_into_keywords(swarmname)
 
         filedict = {}
         fileextensions = set()
@@ -449,21 +642,13 @@ class TorrentDBHandler(BasicDBHandler):
             fileextensions.add(extension[1:])
 
         filenames = filedict.keys()
-        if len(filenames) > 1000:
-            def popSort(a, b):
-                return filedict[a] - filedict[b]
-            filenames.sort(cmp=popSort, reverse=True)
-            filenames = filenames[:1000]
+        terms = chain(swarm_keywords, filenames, fileextensions)
+        if len(filenames) > MAX_INDEXED_FILENAMES:
+            # only index the most frequent keywords
+            filenames = nlargest(MAX_INDEXED_FILENAMES, filenames, key=filedict.get)
 
-        values = (torrent_id, swarm_keywords, " ".join(filenames), " ".join(fileextensions))
-        try:
-            # INSERT OR REPLACE not working for fts3 table
-            self._db.execute_write(u"DELETE FROM FullTextIndex WHERE rowid = ?", (torrent_id,))
-            self._db.execute_write(
-                u"INSERT INTO FullTextIndex (rowid, swarmname, filenames, fileextensions) VALUES(?,?,?,?)", values)
-        except:
-            # this will fail if the fts3 module cannot be found
-            print_exc()
+        values = (torrent_id, " ".join(swarm_keywords), " ".join(filenames), " ".join(fileextensions))
+        return values, terms
 
     # ------------------------------------------------------------
     # Adds the trackers of a given torrent into the database.
@@ -472,31 +657,28 @@ class TorrentDBHandler(BasicDBHandler):
         # Set add_all to True if you want to put all multi-trackers into db.
         # In the current version (4.2) only the main tracker is used.
 
-        announce = torrentdef.get_tracker()
-        announce_list = torrentdef.get_tracker_hierarchy()
+        trackers = [torrentdef.get_tracker()] + list(chain.from_iterable(torrentdef.get_tracker_hierarchy() or []))
+        new_tracker_set = self._get_tracker_set(trackers, torrentdef.is_private())
+
+        # add trackers in batch
+        self.addTorrentTrackerMappingInBatch(torrent_id, list(new_tracker_set))
 
+    @staticmethod
+    def _get_tracker_set(trackers, is_private):
         # check if to use DHT
         new_tracker_set = set()
-        if torrentdef.is_private():
+        if is_private:
             new_tracker_set.add(u'no-DHT')
         else:
             new_tracker_set.add(u'DHT')
 
         # get rid of junk trackers
-        # prepare the tracker list to add
-        if announce:
-            tracker_url = get_uniformed_tracker_url(announce)
-            if tracker_url:
-                new_tracker_set.add(tracker_url)
-        if announce_list:
-            for tier in announce_list:
-                for tracker in tier:
-                    tracker_url = get_uniformed_tracker_url(tracker)
-                    if tracker_url:
-                        new_tracker_set.add(tracker_url)
-
-        # add trackers in batch
-        self.addTorrentTrackerMappingInBatch(torrent_id, list(new_tracker_set))
+        for tracker in trackers:
+            if tracker:
+                tracker_url = get_uniformed_tracker_url(tracker)
+                if tracker_url:
+                    new_tracker_set.add(tracker_url)
+        return new_tracker_set
 
     def updateTorrent(self, infohash, notify=True, **kw):  # watch the schema of database
         if 'seeder' in kw:
@@ -509,15 +691,15 @@ class TorrentDBHandler(BasicDBHandler):
                 kw.pop(key)
 
         if len(kw) > 0:
-            infohash_str = bin2str(infohash)
-            where = "infohash='%s'" % infohash_str
+            where = "infohash=X'%s'" % hexlify(infohash)
             self._db.update(self.table_name, where, **kw)
+            self.remote_search_cache.invalidate_infohashes([infohash])
 
         if notify:
             self.notifier.notify(NTFY_TORRENTS, NTFY_UPDATE, infohash)
 
     def on_torrent_collect_response(self, infohashes):
-        infohash_list = [(bin2str(infohash)) for infohash in infohashes]
+        infohash_list = [(bin2blob(infohash)) for infohash in infohashes]
 
         i_parameters = u"?," * len(infohash_list)
         i_parameters = i_parameters[:-1]
@@ -543,7 +725,7 @@ class TorrentDBHandler(BasicDBHandler):
     def on_search_response(self, torrents):
         status = u'unknown'
 
-        torrents = [(bin2str(torrent[0]), torrent[1], torrent[2], torrent[3], torrent[4][0],
+        torrents = [(bin2blob(torrent[0]), torrent[1], torrent[2], torrent[3], torrent[4][0],
                      torrent[5]) for torrent in torrents]
         infohash = [(torrent[0],) for torrent in torrents]
 
@@ -555,8 +737,6 @@ class TorrentDBHandler(BasicDBHandler):
         tid_collected = set()
         tid_name = {}
         for torrent_id, infohash, is_collected, name in results:
-            infohash = str(infohash)
-
             if infohash:
                 infohash_tid[infohash] = torrent_id
             if is_collected:
@@ -616,8 +796,11 @@ class TorrentDBHandler(BasicDBHandler):
               u" status = ?, tracker_check_retries = ? WHERE torrent_id = ?"
 
         self._db.execute_write(sql, (seeders, leechers, last_check, next_check, status, retries, torrent_id))
+        self._db.execute_write(u"UPDATE TorrentTrackerMapping SET next_check = ? WHERE torrent_id = ?",
+                               (next_check, torrent_id))
+        self.remote_search_cache.invalidate_infohashes([infohash])
 
-        self._logger.debug(u"update result %d/%d for %s/%d", seeders, leechers, bin2str(infohash), torrent_id)
+        self._logger.debug(u"update result %d/%d for %s/%d", seeders, leechers, hexlify(infohash), torrent_id)
 
         # notify
         self.notifier.notify(NTFY_TORRENTS, NTFY_UPDATE, infohash)
@@ -629,18 +812,7 @@ class TorrentDBHandler(BasicDBHandler):
         if not tracker_list:
             return
 
-        parameters = u"?," * len(tracker_list)
-        parameters = parameters[:-1]
-        sql = u"SELECT tracker FROM TrackerInfo WHERE tracker IN (%s)" % parameters
-
-        found_tracker_list = self._db.fetchall(sql, tuple(tracker_list))
-        found_tracker_list = [tracker[0] for tracker in found_tracker_list]
-
-        # update tracker info
-        not_found_tracker_list = [tracker for tracker in tracker_list if tracker not in found_tracker_list]
-        for tracker in not_found_tracker_list:
-            if self.session.lm.tracker_manager is not None:
-                self.session.lm.tracker_manager.add_tracker(tracker)
+        self._add_unknown_trackers(tracker_list)
 
         # update torrent-tracker mapping
         sql = 'INSERT OR IGNORE INTO TorrentTrackerMapping(torrent_id, tracker_id)'\
@@ -654,7 +826,45 @@ class TorrentDBHandler(BasicDBHandler):
             return
 
         infohash = self.getInfohash(torrent_id)
-        if infohash and self.session.has_collected_torrent(infohash):
+        if infohash:
+            self._add_trackers_to_collected_torrent(infohash, tracker_list)
+
+    def addTorrentsTrackerMappingInBatch(self, torrent_tracker_list):
+        """
+        Adds the trackers of many torrents at once.
+        :param torrent_tracker_list: A list of (torrent_id, infohash, tracker_list) tuples.
+        """
+        self._add_unknown_trackers(set(chain.from_iterable(tracker_list
+                                                           for _, _, tracker_list in torrent_tracker_list)))
+
+        sql = 'INSERT OR IGNORE INTO TorrentTrackerMapping(torrent_id, tracker_id)'\
+            + ' VALUES(?, (SELECT tracker_id FROM TrackerInfo WHERE tracker = ?))'
+        self._db.executemany(sql, [(torrent_id, tracker) for torrent_id, _, tracker_list in torrent_tracker_list
+                                   for tracker in tracker_list])
+
+        if not self.session.get_torrent_store() or self.session.lm.torrent_store is None:
+            return
+
+        for _, infohash, tracker_list in torrent_tracker_list:
+            self._add_trackers_to_collected_torrent(infohash, tracker_list)
+
+    def _add_unknown_trackers(self, tracker_list):
+        tracker_list = list(tracker_list)
+        found_tracker_list = set()
+        for chunk in split_into_chunks(tracker_list):
+            parameters = u"?," * len(chunk)
+            parameters = parameters[:-1]
+            sql = u"SELECT tracker FROM TrackerInfo WHERE tracker IN (%s)" % parameters
+            found_tracker_list.update(tracker[0] for tracker in self._db.fetchall(sql, tuple(chunk)))
+
+        # update tracker info
+        not_found_tracker_list = [tracker for tracker in tracker_list if tracker not in found_tracker_list]
+        for tracker in not_found_tracker_list:
+            if self.session.lm.tracker_manager is not None:
+                self.session.lm.tracker_manager.add_tracker(tracker)
+
+    def _add_trackers_to_collected_torrent(self, infohash, tracker_list):
+        if self.session.has_collected_torrent(infohash):
             torrent_data = self.session.get_collected_torrent(infohash)
 
             try:
@@ -683,16 +893,26 @@ class TorrentDBHandler(BasicDBHandler):
                 self.session.save_collected_torrent(infohash, bencode(tdef.metainfo))
 
     def getTorrentsOnTracker(self, tracker, current_time, limit=30):
+        # The next check time of a torrent is kept in TorrentTrackerMapping as well, so the due torrents of a tracker
+        # are read from the (tracker_id, next_check, torrent_id) index instead of scanning the Torrent table.
         sql = """
             SELECT T.infohash
-              FROM Torrent T, TrackerInfo TI, TorrentTrackerMapping TTM
-              WHERE TI.tracker = ?
-              AND TI.tracker_id = TTM.tracker_id AND T.torrent_id = TTM.torrent_id
-              AND next_tracker_check < ?
-              ORDER BY next_tracker_check DESC
+              FROM TorrentTrackerMapping TTM, Torrent T
+              WHERE TTM.tracker_id = (SELECT tracker_id FROM TrackerInfo WHERE tracker = ?)
+              AND TTM.next_check < ?
+              AND T.torrent_id = TTM.torrent_id
+              ORDER BY TTM.next_check DESC
               LIMIT ?
             """
-        return [str2bin(tinfo[0]) for tinfo in self._db.fetchall(sql, (tracker, current_time, limit))]
+        return [blob2bin(tinfo[0]) for tinfo in self._db.fetchall(sql, (tracker, current_time, limit))]
+
+    def getNumberOfTorrentsDueOnTracker(self, tracker, current_time):
+        """
+        Returns the number of torrents on a tracker whose next tracker check is due.
+        """
+        sql = u"SELECT COUNT(*) FROM TorrentTrackerMapping" \
+              u" WHERE tracker_id = (SELECT tracker_id FROM TrackerInfo WHERE tracker = ?) AND next_check < ?"
+        return self._db.fetchone(sql, (tracker, current_time)) or 0
 
     def getTrackerListByTorrentID(self, torrent_id):
         sql = 'SELECT TR.tracker FROM TrackerInfo TR, TorrentTrackerMapping MP'\
@@ -745,7 +965,7 @@ class TorrentDBHandler(BasicDBHandler):
         else:
             keys = list(keys)
 
-        res = self._db.getOne('Torrent C', keys, infohash=bin2str(infohash))
+        res = self._db.getOne('Torrent C', keys, infohash=bin2blob(infohash))
 
         if not res:
             return None
@@ -781,7 +1001,7 @@ class TorrentDBHandler(BasicDBHandler):
                 for i in range(len(results)):
                     result = list(results[i])
                     if result[key_index]:
-                        result[key_index] = str2bin(result[key_index])
+                        result[key_index] = blob2bin(result[key_index])
                         results[i] = result
         fix_value('infohash')
         return results
@@ -798,7 +1018,7 @@ class TorrentDBHandler(BasicDBHandler):
              AND T.secret is not 1 ORDER BY CT.insert_time DESC LIMIT ?
              """
         results = self._db.fetchall(sql, (limit,))
-        return [[str2bin(result[0]), result[1], result[2], result[3] or 0, result[4]] for result in results]
+        return [[blob2bin(result[0]), result[1], result[2], result[3] or 0, result[4]] for result in results]
 
     def getRandomlyCollectedTorrents(self, insert_time, limit):
         sql = u"""
@@ -809,7 +1029,7 @@ class TorrentDBHandler(BasicDBHandler):
              AND T.secret is not 1 ORDER BY RANDOM() DESC LIMIT ?
             """
         results = self._db.fetchall(sql, (insert_time, limit))
-        return [[str2bin(result[0]), result[1], result[2], result[3] or 0] for result in results]
+        return [[blob2bin(result[0]), result[1], result[2], result[3] or 0] for result in results]
 
     def select_torrents_to_collect(self, hashes):
         parameters = '?,' * len(hashes)
@@ -818,118 +1038,84 @@ class TorrentDBHandler(BasicDBHandler):
         # TODO: bias according to votecast, popular first
 
         sql = u"SELECT infohash FROM Torrent WHERE is_collected == 0 AND infohash IN (%s)" % parameters
-        results = self._db.fetchall(sql, map(bin2str, hashes))
-        return [str2bin(infohash) for infohash, in results]
+        results = self._db.fetchall(sql, map(bin2blob, hashes))
+        return [blob2bin(infohash) for infohash, in results]
 
     def getTorrentsStats(self):
         return self._db.getOne('CollectedTorrent', ['count(torrent_id)', 'sum(length)', 'sum(num_files)'])
 
     def freeSpace(self, torrents2del):
-        if self.channelcast_db and self.channelcast_db._channel_id:
-            sql = U"""
-                SELECT name, torrent_id, infohash, relevance,
-                MIN(relevance, 2500) + MIN(500, num_leechers) + 4*MIN(500, num_seeders) - (MAX(0, MIN(500, (%d - creation_date)/86400)) ) AS weight
-                FROM CollectedTorrent
-                WHERE torrent_id NOT IN (SELECT torrent_id FROM MyPreference)
-                AND torrent_id NOT IN (SELECT torrent_id FROM ChannelTorrents WHERE channel_id == %d)
-                ORDER BY weight
-                LIMIT %d
-            """ % (int(time()), self.channelcast_db._channel_id, torrents2del)
-        else:
-            sql = u"""
-                SELECT name, torrent_id, infohash, relevance,
-                    min(relevance,2500) +  min(500,num_leechers) + 4*min(500,num_seeders) - (max(0,min(500,(%d-creation_date)/86400)) ) AS weight
-                FROM CollectedTorrent
-                WHERE torrent_id NOT IN (SELECT torrent_id FROM MyPreference)
-                ORDER BY weight
-                LIMIT %d
-            """ % (int(time()), torrents2del)
-
-        res_list = self._db.fetchall(sql)
+        """
+        Erase the collected data of the torrents with the lowest eviction weight, except for the torrents we
+        downloaded and the torrents in our own channel. The stored eviction weight already includes the age of the
+        torrent (see get_eviction_weight), so the torrents are read in order from the eviction index.
+        :return: the number of erased torrents.
+        """
+        sql = u"""
+            SELECT torrent_id, infohash FROM Torrent
+            WHERE is_collected == 1
+            AND NOT EXISTS (SELECT 1 FROM MyPreference P WHERE P.torrent_id = Torrent.torrent_id)
+            AND NOT EXISTS (SELECT 1 FROM ChannelTorrents C WHERE C.torrent_id = Torrent.torrent_id AND C.channel_id = ?)
+            ORDER BY eviction_weight
+            LIMIT ?
+        """
+        channel_id = self.channelcast_db._channel_id if self.channelcast_db else None
+        res_list = self._db.fetchall(sql, (channel_id, torrents2del))
         if len(res_list) == 0:
             return 0
 
-        # delete torrents from db
-        sql_del_torrent = u"UPDATE Torrent SET name = NULL, is_collected = 0 WHERE torrent_id = ?"
-        # sql_del_pref = "delete from Preference where torrent_id=?"
-
-        tids = []
-        for _name, torrent_id, infohash, _relevance, _weight in res_list:
-            tids.append((torrent_id,))
-            self.session.delete_collected_torrent(infohash)
+        # keep the infohash in the database to maintain consistency with the preference database
+        self._db.executemany(u"UPDATE Torrent SET name = NULL, is_collected = 0 WHERE torrent_id = ?",
+                             [(torrent_id,) for torrent_id, _ in res_list])
+        deleted = len(res_list)
 
-        self._db.executemany(sql_del_torrent, tids)
-        # self._db.executemany(sql_del_tracker, tids)
-        deleted = self._db.connection.changes()
-        # self._db.executemany(sql_del_pref, tids)
-
-        # but keep the infohash in db to maintain consistence with preference db
-        # torrent_id_infohashes = [(torrent_id,infohash_str,relevance) for torrent_file_name, torrent_id, infohash_str, relevance, weight in res_list]
-        # sql_insert =  "insert into Torrent (torrent_id, infohash, relevance) values (?,?,?)"
-        # self._db.executemany(sql_insert, torrent_id_infohashes)
+        infohashes = [blob2bin(infohash) for _, infohash in res_list]
+        self.session.delete_collected_torrents(infohashes)
+        self.remote_search_cache.invalidate_infohashes(infohashes)
 
         self._logger.info("Erased %d torrents", deleted)
         return deleted
 
-    def search_in_local_torrents_db(self, query, keys=None):
+    def search_in_local_torrents_db(self, query, keys=None, limit=None, offset=0):
         """
         Search in the local database for torrents matching a specific query. This method also assigns a relevance
-        score to each torrent, based on the name, files and file extensions.
-        The algorithm is based on BM25. The document length factor is regarded since our "documents" are very small
-        (often a few keywords).
-        See https://en.wikipedia.org/wiki/Okapi_BM25 for more information about BM25.
+        score to each torrent, based on the name, files and file extensions (see bm25_relevance in search_utils).
+        Scoring and ranking happen inside SQLite, so only the requested page of results is returned to Python.
+        :param limit: the maximum number of results to return, None to return all matching torrents.
+        :param offset: the number of best matching torrents to skip, for pagination.
+        :return: a list of results, ordered by descending relevance. Each result consists of the values of the keys
+                 followed by the relevance score.
         """
-        search_results = []
         keys_str = ", ".join(keys)
         keywords = split_into_keywords(query, to_filter_stopwords=True)
+        match_query = " OR ".join(keywords)
         infohash_index = keys.index('infohash')
+        seeders_column = 'T.num_seeders' if 'num_seeders' in keys else '0'
 
-        # This query gets torrents matching speciifc keywords. The matchinfo object is also returned. For more
-        # information about the returned matchinfo parameters, see https://www.sqlite.org/fts3.html#matchinfo.
-        results = self._db.fetchall("SELECT DISTINCT %s, Matchinfo(FullTextIndex, 'pcnalx') "
-                                    "FROM Torrent T, FullTextIndex "
+        # This query gets the torrents matching specific keywords, ranked by the bm25_relevance SQL function. For
+        # more information about the matchinfo parameters, see https://www.sqlite.org/fts3.html#matchinfo.
+        results = self._db.fetchall("SELECT DISTINCT %s, bm25_relevance(Matchinfo(FullTextIndex, 'pcnalx'), %s) "
+                                    "AS relevance FROM Torrent T, FullTextIndex "
                                     "LEFT OUTER JOIN _ChannelTorrents C ON T.torrent_id = C.torrent_id "
                                     "WHERE t.name IS NOT NULL AND t.torrent_id = FullTextIndex.rowid "
-                                    "AND C.deleted_at IS NULL AND FullTextIndex MATCH ?"
-                                    % keys_str, (" OR ".join(keywords),))
+                                    "AND C.deleted_at IS NULL AND FullTextIndex MATCH ? "
+                                    "ORDER BY relevance DESC LIMIT ? OFFSET ?"
+                                    % (keys_str, seeders_column),
+                                    (match_query, -1 if limit is None else limit, offset))
+        if not results:
+            return []
 
+        # The term statistics in the matchinfo are the same for every row, we keep them to assign a relevance
+        # score to incoming remote torrents.
+        matchinfo = self._db.fetchone("SELECT Matchinfo(FullTextIndex, 'pcnalx') FROM FullTextIndex "
+                                      "WHERE FullTextIndex MATCH ? LIMIT 1", (match_query,))
+        self.latest_matchinfo_torrent = matchinfo, keywords
+
+        search_results = []
         for result in results:
             result = list(result)  # We convert the result to a mutable list since we have to decode the infohash
-            result[infohash_index] = str2bin(result[infohash_index])
-            matchinfo = result[len(keys)]  # The matchinfo is the last element in the results tuple
-            self.latest_matchinfo_torrent = matchinfo, keywords
-            num_phrases, num_cols, num_rows = unpack_from('III', matchinfo)
-
-            unpack_str = 'I' * (3 * num_cols * num_phrases)
-            matchinfo = unpack_from('I' * 9 + unpack_str, matchinfo)[9:]
-
-            scores = []
-
-            for col_ind in xrange(num_cols):
-                score = 0
-                for phrase_ind in xrange(num_phrases):
-                    # Fetch info about the current matching term. This number is fetched from the matchinfo object.
-                    # See https://www.sqlite.org/fts3.html#matchinfo for info about the offset calculation.
-                    base_term_offset = 3 * (col_ind + phrase_ind * num_cols)
-                    rows_with_term = matchinfo[base_term_offset + 2]
-                    term_freq = matchinfo[base_term_offset]
-
-                    inv_doc_freq = math.log((num_rows - rows_with_term + 0.5) / (rows_with_term + 0.5), 2)
-                    right_side = ((term_freq * (1.2 + 1)) / (term_freq + 1.2))
-
-                    score += inv_doc_freq * right_side
-
-                scores.append(score)
-
-            # Our score is 80% dependent on matching in the name of the torrent, 10% on the names of the files in the
-            # torrent and 10% on the extensions of files in the torrent.
-            rel_score = 0.8 * scores[0] + 0.1 * scores[1] + 0.1 * scores[2]
-            if 'num_seeders' in keys and result[keys.index('num_seeders')] > 0:
-                # If this torrent has a non-zero amount of seeders, we make it more relevant
-                rel_score += result[keys.index('num_seeders')]
-
-            extended_result = result + [rel_score]
-            search_results.append(extended_result)
+            result[infohash_index] = blob2bin(result[infohash_index])
+            search_results.append(result)
 
         return search_results
 
@@ -938,11 +1124,19 @@ class TorrentDBHandler(BasicDBHandler):
         assert not doSort or ('num_seeders' in keys or 'T.num_seeders' in keys)
 
         infohash_index = keys.index('infohash')
-        num_seeders_index = keys.index('num_seeders') if 'num_seeders' in keys else -1
+        if 'num_seeders' in keys:
+            num_seeders_index = keys.index('num_seeders')
+        elif 'T.num_seeders' in keys:
+            num_seeders_index = keys.index('T.num_seeders')
+        else:
+            num_seeders_index = -1
 
         if num_seeders_index == -1:
             doSort = False
 
+        # Remote searches are only answered with the best torrents
+        limit = None if local else REMOTE_SEARCH_RESULTS
+
         values = ", ".join(keys)
         mainsql = "SELECT " + values + ", C.channel_id, Matchinfo(FullTextIndex) FROM"
         if local:
@@ -956,7 +1150,13 @@ class TorrentDBHandler(BasicDBHandler):
                     """
 
         if not local:
-            mainsql += "AND T.secret is not 1 LIMIT 250"
+            mainsql += "AND T.secret is not 1 "
+        if doSort:
+            # SQLite sorts on seeders (torrents without seeders end up last), so we can stop merging as soon as we
+            # have enough torrents.
+            mainsql += "ORDER BY T.num_seeders DESC "
+        if not local:
+            mainsql += "LIMIT 250"
 
         query = " ".join(filter_keywords(kws))
         not_negated = [kw for kw in filter_keywords(kws) if kw[0] != '-']
@@ -964,29 +1164,35 @@ class TorrentDBHandler(BasicDBHandler):
         results = self._db.fetchall(mainsql, (query,))
 
         channels = set()
-        channel_dict = {}
         for result in results:
             if result[-2]:
                 channels.add(result[-2])
 
+        # the channels are tuples of (id, str(dispersy_cid), name, description,
+        # nr_torrents, nr_favorites, nr_spam, my_vote, modified, id ==
+        # self._channel_id)
+        channel_dict = {}
         if len(channels) > 0:
-            # results are tuples of (id, str(dispersy_cid), name, description,
-            # nr_torrents, nr_favorites, nr_spam, my_vote, modified, id ==
-            # self._channel_id)
-            for channel in self.channelcast_db.getChannels(channels):
+            for channel_id, channel in self.channelcast_db.get_cached_channels(channels).iteritems():
                 if channel[1] != '-1':
-                    channel_dict[channel[0]] = channel
+                    channel_dict[channel_id] = channel
 
         myChannelId = self.channelcast_db._channel_id or 0
 
-        result_dict = {}
-
-        # step 1, merge torrents keep one with best channel
+        # step 1, merge torrents keep one with best channel. The OrderedDict keeps the order of the (sorted) results.
+        result_dict = OrderedDict()
+        last_num_seeders = None
         for result in results:
             channel_id = result[-2]
             channel = channel_dict.get(channel_id, None)
 
             infohash = result[infohash_index]
+            if limit and len(result_dict) >= limit and infohash not in result_dict:
+                # All torrents with less seeders than the ones we already have can be skipped
+                if doSort and result[num_seeders_index] < last_num_seeders:
+                    break
+                continue
+
             if channel:
                 # ignoring spam channels
                 if channel[7] < 0:
@@ -1015,14 +1221,13 @@ class TorrentDBHandler(BasicDBHandler):
             elif infohash not in result_dict:
                 result_dict[infohash] = result
 
+            if doSort:
+                last_num_seeders = result[num_seeders_index]
 
-        # step 2, fix all dict fields
-        dont_sort_list = []
-        results = [list(result) for result in result_dict.values()]
-        for index in xrange(len(results) - 1, -1, -1):
-            result = results[index]
-
-            result[infohash_index] = str2bin(result[infohash_index])
+        # step 2, fix the dict fields of the torrents we return
+        results = [list(result) for result in result_dict.itervalues()]
+        for result in results:
+            result[infohash_index] = blob2bin(result[infohash_index])
 
             matches = {'swarmname': set(), 'filenames': set(), 'fileextensions': set()}
 
@@ -1049,25 +1254,6 @@ class TorrentDBHandler(BasicDBHandler):
             channel = channel_dict.get(result[-2], (result[-2], None, '', '', 0, 0, 0, 0, 0, False))
             result.extend(channel)
 
-            if doSort and result[num_seeders_index] <= 0:
-                dont_sort_list.append((index, result))
-
-        if doSort:
-            # Remove the items with 0 seeders from the results list so the sort is faster, append them to the
-            # results list afterwards.
-            for index, result in dont_sort_list:
-                results.pop(index)
-
-            def compare(a, b):
-                return cmp(a[num_seeders_index], b[num_seeders_index])
-            results.sort(compare, reverse=True)
-
-            for index, result in dont_sort_list:
-                results.append(result)
-
-        if not local:
-            results = results[:25]
-
         return results
 
     def getAutoCompleteTerms(self, keyword, max_terms, limit=100):
@@ -1162,7 +1348,7 @@ class MyPreferenceDBHandler(BasicDBHandler):
 
         res = self._db.fetchall(sql)
         res = [item for sublist in res for item in sublist]
-        return [str2bin(p) if p else '' for p in res]
+        return [blob2bin(p) if p else '' for p in res]
 
     def getMyPrefStats(self, torrent_id=None):
         value_name = ('torrent_id', 'destination_path',)
@@ -1232,9 +1418,11 @@ class VoteCastDBHandler(BasicDBHandler):
         self.updatedChannels = set()
 
         self.channelcast_db = None
+        self.torrent_db = None
 
     def initialize(self, *args, **kwargs):
         self.channelcast_db = self.session.open_dbhandler(NTFY_CHANNELCAST)
+        self.torrent_db = self.session.open_dbhandler(NTFY_TORRENTS)
         self.session.sqlite_db.register_task(u"flush to database",
                                              LoopingCall(self._flush_to_database)).start(VOTECAST_FLUSH_DB_INTERVAL,
                                                                                          now=False)
@@ -1242,6 +1430,17 @@ class VoteCastDBHandler(BasicDBHandler):
     def close(self):
         super(VoteCastDBHandler, self).close()
         self.channelcast_db = None
+        self.torrent_db = None
+
+    def _invalidate_channels(self, channel_ids):
+        """
+        Drop the cached channel rows and remote search responses that depend on the votes on these channels.
+        """
+        if self.channelcast_db:
+            for channel_id in channel_ids:
+                self.channelcast_db.invalidate_channel_cache(channel_id)
+        if self.torrent_db:
+            self.torrent_db.remote_search_cache.invalidate_channels(channel_ids)
 
     def on_votes_from_dispersy(self, votes):
         insert_vote = "INSERT OR REPLACE INTO _ChannelVotes (channel_id, voter_id, dispersy_id, vote, time_stamp) VALUES (?,?,?,?,?)"
@@ -1252,6 +1451,7 @@ class VoteCastDBHandler(BasicDBHandler):
                 self.notifier.notify(NTFY_VOTECAST, NTFY_UPDATE, channel_id, voter_id is None)
                 if self.my_votes is not None:
                     self.my_votes[channel_id] = vote
+                self._invalidate_channels([channel_id])
             self.updatedChannels.add(channel_id)
 
     def on_remove_votes_from_dispersy(self, votes, contains_my_vote):
@@ -1261,6 +1461,7 @@ class VoteCastDBHandler(BasicDBHandler):
         if contains_my_vote:
             for _, channel_id, _ in votes:
                 self.notifier.notify(NTFY_VOTECAST, NTFY_UPDATE, channel_id, contains_my_vote)
+                self._invalidate_channels([channel_id])
 
         for _, channel_id, _ in votes:
             self.updatedChannels.add(channel_id)
@@ -1284,6 +1485,7 @@ class VoteCastDBHandler(BasicDBHandler):
                        for channel_id in channel_ids]
             self._db.executemany("UPDATE OR IGNORE _Channels SET nr_favorite = ?, nr_spam = ? WHERE id = ?", updates)
 
+            self._invalidate_channels(channel_ids)
             for channel_id in channel_ids:
                 self.notifier.notify(NTFY_VOTECAST, NTFY_UPDATE, channel_id)
 
@@ -1354,6 +1556,11 @@ class ChannelCastDBHandler(BasicDBHandler):
         self.votecast_db = None
         self.torrent_db = None
 
+        # LRU cache of the channel tuples returned by getChannels, used when answering searches
+        self._channel_cache = LimitedOrderedDict(DEFAULT_CHANNEL_CACHE_SIZE)
+        # The recent and random torrents of the channels that are included in channelcast messages
+        self.channelcast_pool = ChannelcastPool()
+
     def initialize(self, *args, **kwargs):
         self._channel_id = self.getMyChannelId()
         self._logger.debug(u"Channels: my channel is %s", self._channel_id)
@@ -1361,16 +1568,26 @@ class ChannelCastDBHandler(BasicDBHandler):
         self.votecast_db = self.session.open_dbhandler(NTFY_VOTECAST)
         self.torrent_db = self.session.open_dbhandler(NTFY_TORRENTS)
 
+        @inlineCallbacks
         def update_nr_torrents():
-            rows = self.getChannelNrTorrents(50)
-            update = "UPDATE _Channels SET nr_torrents = ? WHERE id = ?"
-            self._db.executemany(update, rows)
+            # These aggregates scan ChannelTorrents, so they run on the database executor instead of the reactor
+            try:
+                rows = yield self._db.fetchall_deferred(*self._get_channel_nr_torrents_query(50))
+                update = "UPDATE _Channels SET nr_torrents = ? WHERE id = ?"
+                yield self._db.executemany_deferred(update, rows)
 
-            rows = self.getChannelNrTorrentsLatestUpdate(50)
-            update = "UPDATE _Channels SET nr_torrents = ?, modified = ? WHERE id = ?"
-            self._db.executemany(update, rows)
+                rows = yield self._db.fetchall_deferred(*self._get_channel_nr_torrents_latest_update_query(50))
+                update = "UPDATE _Channels SET nr_torrents = ?, modified = ? WHERE id = ?"
+                yield self._db.executemany_deferred(update, rows)
+            except Exception:
+                # a failure would stop the LoopingCall, try again in the next round instead
+                self._logger.exception(u"Failed to update the number of torrents of the channels")
+            finally:
+                self.invalidate_channel_cache()
 
         self.register_task(u"update_nr_torrents", LoopingCall(update_nr_torrents)).start(300, now=False)
+        self.register_task(u"refresh_channelcast_pool",
+                           LoopingCall(self.refresh_channelcast_pool)).start(CHANNELCAST_POOL_REFRESH_INTERVAL)
 
     def close(self):
         super(ChannelCastDBHandler, self).close()
@@ -1379,6 +1596,39 @@ class ChannelCastDBHandler(BasicDBHandler):
 
         self.votecast_db = None
         self.torrent_db = None
+        self._channel_cache.clear()
+        self.channelcast_pool.clear()
+
+    def get_cached_channels(self, channel_ids):
+        """
+        Returns a dictionary from channel id to the channel tuple (see getChannels) for the given channel ids. Recently
+        used channels are served from a cache, which is invalidated whenever a channel or its votes change.
+        """
+        channels = {}
+        to_select = []
+        for channel_id in channel_ids:
+            channel = self._channel_cache.pop(channel_id, None)
+            if channel is None:
+                to_select.append(channel_id)
+            else:
+                # reinsert the channel to mark it as the most recently used one
+                self._channel_cache[channel_id] = channel
+                channels[channel_id] = channel
+
+        if to_select:
+            for channel in self.getChannels(to_select):
+                self._channel_cache[channel[0]] = channel
+                channels[channel[0]] = channel
+        return channels
+
+    def invalidate_channel_cache(self, channel_id=None):
+        """
+        Removes a channel from the channel cache, or clears the whole cache if no channel id is given.
+        """
+        if channel_id is None:
+            self._channel_cache.clear()
+        else:
+            self._channel_cache.pop(channel_id, None)
 
     def get_metadata_torrents(self, is_collected=True, limit=20):
         stmt = u"""
@@ -1396,7 +1646,7 @@ ORDER BY CMD.time_stamp DESC LIMIT ?;
         torrent_list = []
         for torrent_id, info_hash, name, length, category, status, num_seeders, num_leechers, metadata_json in result_list:
             torrent_dict = {'id': torrent_id,
-                            'info_hash': str2bin(info_hash),
+                            'info_hash': blob2bin(info_hash),
                             'name': name,
                             'length': length,
                             'category': category,
@@ -1472,8 +1722,11 @@ ORDER BY CMD.time_stamp DESC LIMIT ?;
 
             self.notifier.notify(NTFY_CHANNELCAST, NTFY_INSERT, channel_id)
 
+        self.invalidate_channel_cache(channel_id)
+
         if not self._channel_id and self._get_my_dispersy_cid() == dispersy_cid:
             self._channel_id = channel_id
+            self.channelcast_pool.set_own_channel(channel_id, str(dispersy_cid))
             self.notifier.notify(NTFY_CHANNELCAST, NTFY_CREATE, channel_id)
         return channel_id
 
@@ -1481,6 +1734,7 @@ ORDER BY CMD.time_stamp DESC LIMIT ?;
         if modification_type in ['name', 'description']:
             update_channel = "UPDATE _Channels Set " + modification_type + " = ?, modified = ? WHERE id = ?"
             self._db.execute_write(update_channel, (modification_value, long(time()), channel_id))
+            self.invalidate_channel_cache(channel_id)
 
             self.notifier.notify(NTFY_CHANNELCAST, NTFY_MODIFIED, channel_id)
 
@@ -1488,6 +1742,19 @@ ORDER BY CMD.time_stamp DESC LIMIT ?;
         infohashes = [torrent[3] for torrent in torrentlist]
         torrent_ids, inserted = self.torrent_db.addOrGetTorrentIDSReturn(infohashes)
 
+        # if new or not yet collected
+        self.torrent_db.addExternalTorrentsNoDef([(infohash, name, files, trackers, timestamp,
+                                                   {'dispersy_id': dispersy_id})
+                                                  for _, dispersy_id, _, infohash, timestamp, name, files, trackers
+                                                  in torrentlist if infohash in inserted])
+
+        # the channel torrents we already know are stored again, but must not be counted twice by the channelcast pool
+        known_channel_torrents = set()
+        for chunk in split_into_chunks(list(set(torrent_ids))):
+            sql = "SELECT channel_id, torrent_id FROM ChannelTorrents WHERE torrent_id IN (%s)" % \
+                  ",".join("?" * len(chunk))
+            known_channel_torrents.update(self._db.fetchall(sql, chunk))
+
         insert_data = []
         updated_channels = {}
 
@@ -1495,11 +1762,6 @@ ORDER BY CMD.time_stamp DESC LIMIT ?;
             channel_id, dispersy_id, peer_id, infohash, timestamp, name, files, trackers = torrent
             torrent_id = torrent_ids[i]
 
-            # if new or not yet collected
-            if infohash in inserted:
-                self.torrent_db.addExternalTorrentNoDef(
-                    infohash, name, files, trackers, timestamp, {'dispersy_id': dispersy_id})
-
             insert_data.append((dispersy_id, torrent_id, channel_id, peer_id, name, timestamp))
             updated_channels[channel_id] = updated_channels.get(channel_id, 0) + 1
 
@@ -1507,18 +1769,35 @@ ORDER BY CMD.time_stamp DESC LIMIT ?;
             sql_insert_torrent = "INSERT INTO _ChannelTorrents (dispersy_id, torrent_id, channel_id, peer_id, name, time_stamp) VALUES (?,?,?,?,?,?)"
             self._db.executemany(sql_insert_torrent, insert_data)
 
+        # look up the ids of the channel torrents in one pass instead of one query per torrent
+        channel_torrent_ids = {}
+        for chunk in split_into_chunks(list(set(torrent_ids))):
+            sql = "SELECT id, channel_id, torrent_id FROM ChannelTorrents WHERE torrent_id IN (%s)" % \
+                  ",".join("?" * len(chunk))
+            for channel_torrent_id, channel_id, torrent_id in self._db.fetchall(sql, chunk):
+                channel_torrent_ids.setdefault((channel_id, torrent_id), channel_torrent_id)
+
         updated_channel_torrent_dict = defaultdict(list)
-        for torrent in torrentlist:
-            channel_id, dispersy_id, peer_id, infohash, timestamp, name, files, trackers = torrent
-            channel_torrent_id = self.get_channel_torrent_id(channel_id, infohash)
+        for i, torrent in enumerate(torrentlist):
+            channel_id, infohash = torrent[0], torrent[3]
+            channel_torrent_id = channel_torrent_ids.get((channel_id, torrent_ids[i]))
             updated_channel_torrent_dict[channel_id].append({u'info_hash': infohash,
                                                              u'channel_torrent_id': channel_torrent_id})
 
         sql_update_channel = "UPDATE _Channels SET modified = strftime('%s','now'), nr_torrents = nr_torrents+? WHERE id = ?"
-        update_channels = [(new_torrents, channel_id) for channel_id, new_torrents in updated_channels.iteritems()]
+        update_channels = [(new_torrents, updated_channel_id)
+                           for updated_channel_id, new_torrents in updated_channels.iteritems()]
         self._db.executemany(sql_update_channel, update_channels)
 
+        modified = long(time())
+        for i, torrent in enumerate(torrentlist):
+            channel_id, dispersy_id, _, infohash, timestamp, _, _, _ = torrent
+            if dispersy_id != -1 and (channel_id, torrent_ids[i]) not in known_channel_torrents:
+                known_channel_torrents.add((channel_id, torrent_ids[i]))
+                self.channelcast_pool.add_torrent(channel_id, infohash, timestamp or 0, modified)
+
         for channel_id in updated_channels.keys():
+            self.invalidate_channel_cache(channel_id)
             self.notifier.notify(NTFY_CHANNELCAST, NTFY_UPDATE, channel_id)
 
         for channel_id, item in updated_channel_torrent_dict.items():
@@ -1543,8 +1822,10 @@ ORDER BY CMD.time_stamp DESC LIMIT ?;
         infohash, dispersy_cid = self._db.fetchone(sql, (channel_id, dispersy_id))
 
         if infohash:
+            if not redo:
+                self.channelcast_pool.remove_torrent(channel_id, blob2bin(infohash))
             self.notifier.notify(NTFY_TORRENTS, NTFY_DELETE, None,
-                                 {"infohash": str2bin(infohash).encode('hex'),
+                                 {"infohash": blob2bin(infohash).encode('hex'),
                                   "dispersy_cid": str(dispersy_cid).encode('hex')})
 
     def on_torrent_modification_from_dispersy(self, channeltorrent_id, modification_type, modification_value):
@@ -1556,7 +1837,7 @@ ORDER BY CMD.time_stamp DESC LIMIT ?;
             infohash = self._db.fetchone(sql, (channeltorrent_id,))
 
             if infohash:
-                infohash = str2bin(infohash)
+                infohash = blob2bin(infohash)
                 self.notifier.notify(NTFY_TORRENTS, NTFY_UPDATE, infohash)
 
     def addOrGetChannelTorrentID(self, channel_id, infohash):
@@ -1709,7 +1990,7 @@ ORDER BY CMD.time_stamp DESC LIMIT ?;
             get_channeltorent_id = """SELECT _ChannelTorrents.id FROM _ChannelTorrents, Torrent, _PlaylistTorrents
             WHERE _ChannelTorrents.torrent_id = Torrent.torrent_id AND _ChannelTorrents.id =
             _PlaylistTorrents.channeltorrent_id AND playlist_id = ? AND Torrent.infohash = ?"""
-            channeltorrent_id = self._db.fetchone(get_channeltorent_id, (playlist_id, bin2str(infohash)))
+            channeltorrent_id = self._db.fetchone(get_channeltorent_id, (playlist_id, bin2blob(infohash)))
 
             if channeltorrent_id:
                 sql = "UPDATE _PlaylistTorrents SET deleted_at = ? WHERE playlist_id = ? AND channeltorrent_id = ?"
@@ -1822,61 +2103,102 @@ ORDER BY CMD.time_stamp DESC LIMIT ?;
         WHERE MyPreference.torrent_id = ChannelTorrents.torrent_id and ChannelTorrents.channel_id = ? LIMIT 1"""
         return self._db.fetchone(sql, (channel_id,))
 
-    def getChannelNrTorrents(self, limit=None):
+    @staticmethod
+    def _get_channel_nr_torrents_query(limit=None):
         if limit:
             sql = """select count(torrent_id), channel_id from Channels, ChannelTorrents
             WHERE Channels.id = ChannelTorrents.channel_id AND dispersy_cid <> -1
             GROUP BY channel_id ORDER BY RANDOM() LIMIT ?"""
-            return self._db.fetchall(sql, (limit,))
+            return sql, (limit,)
 
         sql = """SELECT count(torrent_id), channel_id FROM Channels, ChannelTorrents
         WHERE Channels.id = ChannelTorrents.channel_id AND dispersy_cid <>  -1 GROUP BY channel_id"""
-        return self._db.fetchall(sql)
+        return sql, None
 
-    def getChannelNrTorrentsLatestUpdate(self, limit=None):
+    @staticmethod
+    def _get_channel_nr_torrents_latest_update_query(limit=None):
         if limit:
             sql = """SELECT count(CollectedTorrent.torrent_id), max(ChannelTorrents.time_stamp),
             channel_id from Channels, ChannelTorrents, CollectedTorrent
             WHERE ChannelTorrents.torrent_id = CollectedTorrent.torrent_id
             AND Channels.id = ChannelTorrents.channel_id AND dispersy_cid == -1
             GROUP BY channel_id ORDER BY RANDOM() LIMIT ?"""
-            return self._db.fetchall(sql, (limit,))
+            return sql, (limit,)
 
         sql = """SELECT count(CollectedTorrent.torrent_id), max(ChannelTorrents.time_stamp), channel_id from Channels,
         ChannelTorrents, CollectedTorrent
         WHERE ChannelTorrents.torrent_id = CollectedTorrent.torrent_id
         AND Channels.id = ChannelTorrents.channel_id AND dispersy_cid == -1 GROUP BY channel_id"""
-        return self._db.fetchall(sql)
+        return sql, None
+
+    def getChannelNrTorrents(self, limit=None):
+        return self._db.fetchall(*self._get_channel_nr_torrents_query(limit))
+
+    def getChannelNrTorrentsLatestUpdate(self, limit=None):
+        return self._db.fetchall(*self._get_channel_nr_torrents_latest_update_query(limit))
 
     def getNrChannels(self):
         sql = "select count(DISTINCT id) from Channels LIMIT 1"
         return self._db.fetchone(sql)
 
+    @inlineCallbacks
+    def refresh_channelcast_pool(self):
+        """
+        Rebuild the samples of the channels that channelcast draws torrents from: our own channel, the channels we
+        marked as favorite and the channels of the torrents we downloaded. The channel torrents are read on the
+        database executor, torrents that arrive in the meantime are added by the next refresh.
+        """
+        try:
+            own_channel_ids = [self._channel_id] if self._channel_id else []
+            rows = yield self._db.fetchall_deferred(
+                u"SELECT channel_id FROM ChannelVotes WHERE voter_id ISNULL AND vote = 2")
+            favorite_channel_ids = [channel_id for channel_id, in rows]
+            rows = yield self._db.fetchall_deferred(u"""SELECT DISTINCT channel_id FROM ChannelTorrents
+            WHERE torrent_id IN (SELECT torrent_id FROM MyPreference)""")
+            preferred_channel_ids = [channel_id for channel_id, in rows]
+
+            # read the channels and their torrents with one query per chunk of channels instead of one per channel
+            samples = {}
+            for chunk in split_into_chunks(list(set(own_channel_ids + favorite_channel_ids + preferred_channel_ids))):
+                parameters = ",".join("?" * len(chunk))
+                rows = yield self._db.fetchall_deferred(
+                    u"SELECT id, dispersy_cid, modified FROM Channels WHERE id IN (%s)" % parameters, chunk)
+                for channel_id, dispersy_cid, modified in rows:
+                    samples[channel_id] = self.channelcast_pool.create_sample(str(dispersy_cid), modified or 0)
+
+                rows = yield self._db.fetchall_deferred(u"""SELECT ChannelTorrents.channel_id, infohash,
+                IFNULL(time_stamp, 0) FROM ChannelTorrents, Torrent
+                WHERE ChannelTorrents.torrent_id = Torrent.torrent_id AND ChannelTorrents.channel_id IN (%s)
+                AND ChannelTorrents.dispersy_id <> -1""" % parameters, chunk)
+                for channel_id, infohash, timestamp in rows:
+                    if channel_id in samples:
+                        self.channelcast_pool.add_to_sample(samples[channel_id], blob2bin(infohash), timestamp)
+
+            self.channelcast_pool.replace(self._channel_id, favorite_channel_ids, preferred_channel_ids, samples)
+        except Exception:
+            # a failure would stop the LoopingCall, try again in the next round instead
+            self._logger.exception(u"Failed to refresh the channelcast pool")
+
     def getRecentAndRandomTorrents(self, NUM_OWN_RECENT_TORRENTS=15, NUM_OWN_RANDOM_TORRENTS=10,
                                    NUM_OTHERS_RECENT_TORRENTS=15, NUM_OTHERS_RANDOM_TORRENTS=10,
                                    NUM_OTHERS_DOWNLOADED=5):
+        """
+        Return the torrents for a channelcast message as a dictionary from dispersy cid to a set of infohashes. The
+        torrents are drawn from the channelcast pool, which is kept up to date by refresh_channelcast_pool.
+        """
+        pool = self.channelcast_pool
         torrent_dict = {}
 
+        own_channel_ids = [self._channel_id] if self._channel_id else []
         least_recent = -1
-        sql = """SELECT dispersy_cid, infohash, time_stamp from ChannelTorrents, Channels, Torrent
-        WHERE ChannelTorrents.torrent_id = Torrent.torrent_id AND Channels.id = ChannelTorrents.channel_id
-        AND ChannelTorrents.channel_id==? and ChannelTorrents.dispersy_id <> -1 order by time_stamp desc limit ?"""
-        myrecenttorrents = self._db.fetchall(sql, (self._channel_id, NUM_OWN_RECENT_TORRENTS))
-        for cid, infohash, timestamp in myrecenttorrents:
-            torrent_dict.setdefault(str(cid), set()).add(str2bin(infohash))
+        myrecenttorrents = pool.get_recent(own_channel_ids, NUM_OWN_RECENT_TORRENTS)
+        for timestamp, cid, infohash in myrecenttorrents:
+            torrent_dict.setdefault(cid, set()).add(infohash)
             least_recent = timestamp
 
         if len(myrecenttorrents) == NUM_OWN_RECENT_TORRENTS and least_recent != -1:
-            sql = """SELECT dispersy_cid, infohash from ChannelTorrents, Channels, Torrent
-            WHERE ChannelTorrents.torrent_id = Torrent.torrent_id AND Channels.id = ChannelTorrents.channel_id
-            AND ChannelTorrents.channel_id==? AND time_stamp<?
-            AND ChannelTorrents.dispersy_id <> -1 order by random() limit ?"""
-            myrandomtorrents = self._db.fetchall(sql, (self._channel_id, least_recent, NUM_OWN_RANDOM_TORRENTS))
-            for cid, infohash, _ in myrecenttorrents:
-                torrent_dict.setdefault(str(cid), set()).add(str2bin(infohash))
-
-            for cid, infohash in myrandomtorrents:
-                torrent_dict.setdefault(str(cid), set()).add(str2bin(infohash))
+            for cid, infohash in pool.get_random(own_channel_ids, NUM_OWN_RANDOM_TORRENTS, least_recent):
+                torrent_dict.setdefault(cid, set()).add(infohash)
 
         nr_records = sum(len(torrents) for torrents in torrent_dict.values())
         additionalSpace = (NUM_OWN_RECENT_TORRENTS + NUM_OWN_RANDOM_TORRENTS) - nr_records
@@ -1891,24 +2213,14 @@ ORDER BY CMD.time_stamp DESC LIMIT ?;
             NUM_OWN_RANDOM_TORRENTS -= additionalSpace - (additionalSpace / 2)
 
         least_recent = -1
-        sql = """SELECT dispersy_cid, infohash, time_stamp from ChannelTorrents, Channels, Torrent
-        WHERE ChannelTorrents.torrent_id = Torrent.torrent_id AND Channels.id = ChannelTorrents.channel_id
-        AND ChannelTorrents.channel_id in (select channel_id from ChannelVotes
-        WHERE voter_id ISNULL AND vote=2) and ChannelTorrents.dispersy_id <> -1 ORDER BY time_stamp desc limit ?"""
-        othersrecenttorrents = self._db.fetchall(sql, (NUM_OTHERS_RECENT_TORRENTS,))
-        for cid, infohash, timestamp in othersrecenttorrents:
-            torrent_dict.setdefault(str(cid), set()).add(str2bin(infohash))
+        othersrecenttorrents = pool.get_recent(pool.favorite_channel_ids, NUM_OTHERS_RECENT_TORRENTS)
+        for timestamp, cid, infohash in othersrecenttorrents:
+            torrent_dict.setdefault(cid, set()).add(infohash)
             least_recent = timestamp
 
         if othersrecenttorrents and len(othersrecenttorrents) == NUM_OTHERS_RECENT_TORRENTS and least_recent != -1:
-            sql = """SELECT dispersy_cid, infohash FROM ChannelTorrents, Channels, Torrent
-            WHERE ChannelTorrents.torrent_id = Torrent.torrent_id AND Channels.id = ChannelTorrents.channel_id
-            AND ChannelTorrents.channel_id in (select channel_id from ChannelVotes
-            WHERE voter_id ISNULL and vote=2) and time_stamp < ?
-            AND ChannelTorrents.dispersy_id <> -1 order by random() limit ?"""
-            othersrandomtorrents = self._db.fetchall(sql, (least_recent, NUM_OTHERS_RANDOM_TORRENTS))
-            for cid, infohash in othersrandomtorrents:
-                torrent_dict.setdefault(str(cid), set()).add(str2bin(infohash))
+            for cid, infohash in pool.get_random(pool.favorite_channel_ids, NUM_OTHERS_RANDOM_TORRENTS, least_recent):
+                torrent_dict.setdefault(cid, set()).add(infohash)
 
         twomonthsago = long(time() - 5259487)
         nr_records = sum(len(torrents) for torrents in torrent_dict.values())
@@ -1916,14 +2228,9 @@ ORDER BY CMD.time_stamp DESC LIMIT ?;
                            NUM_OTHERS_RECENT_TORRENTS + NUM_OTHERS_RANDOM_TORRENTS) - nr_records
         NUM_OTHERS_DOWNLOADED += additionalSpace
 
-        sql = """SELECT dispersy_cid, infohash from ChannelTorrents, Channels, Torrent
-        WHERE ChannelTorrents.torrent_id = Torrent.torrent_id AND Channels.id = ChannelTorrents.channel_id
-        AND ChannelTorrents.channel_id in (select distinct channel_id from ChannelTorrents
-        WHERE torrent_id in (select torrent_id from MyPreference))
-        AND ChannelTorrents.dispersy_id <> -1 and Channels.modified > ? order by time_stamp desc limit ?"""
-        interesting_records = self._db.fetchall(sql, (twomonthsago, NUM_OTHERS_DOWNLOADED))
-        for cid, infohash in interesting_records:
-            torrent_dict.setdefault(str(cid), set()).add(str2bin(infohash))
+        for _, cid, infohash in pool.get_recent(pool.preferred_channel_ids, NUM_OTHERS_DOWNLOADED,
+                                                modified_since=twomonthsago):
+            torrent_dict.setdefault(cid, set()).add(infohash)
 
         return torrent_dict
 
@@ -1933,20 +2240,20 @@ ORDER BY CMD.time_stamp DESC LIMIT ?;
 
         returnar = []
         for infohash, in self._db.fetchall(sql, (channel_id, limit)):
-            returnar.append(str2bin(infohash))
+            returnar.append(blob2bin(infohash))
         return returnar
 
     def getTorrentFromChannelId(self, channel_id, infohash, keys):
         sql = "SELECT " + ", ".join(keys) + """ FROM Torrent, ChannelTorrents
               WHERE Torrent.torrent_id = ChannelTorrents.torrent_id AND channel_id = ? AND infohash = ?"""
-        result = self._db.fetchone(sql, (channel_id, bin2str(infohash)))
+        result = self._db.fetchone(sql, (channel_id, bin2blob(infohash)))
 
         return self.__fixTorrent(keys, result)
 
     def getChannelTorrents(self, infohash, keys):
         sql = "SELECT " ", ".join(keys) + """ FROM Torrent, ChannelTorrents
               WHERE Torrent.torrent_id = ChannelTorrents.torrent_id AND infohash = ?"""
-        results = self._db.fetchall(sql, (bin2str(infohash),))
+        results = self._db.fetchall(sql, (bin2blob(infohash),))
 
         return self.__fixTorrents(keys, results)
 
@@ -1999,6 +2306,7 @@ ORDER BY CMD.time_stamp DESC LIMIT ?;
                 # use this possibility to update nrtorrent in channel
                 update = "UPDATE _Channels SET nr_torrents = ? WHERE id = ?"
                 self._db.execute_write(update, (len(results), channel_id))
+            self.invalidate_channel_cache(channel_id)
 
         return self.__fixTorrents(keys, results)
 
@@ -2054,7 +2362,7 @@ ORDER BY CMD.time_stamp DESC LIMIT ?;
               WHERE Torrent.torrent_id = ChannelTorrents.torrent_id
               AND ChannelTorrents.id = PlaylistTorrents.channeltorrent_id
               AND playlist_id = ? AND infohash = ?"""
-        result = self._db.fetchone(sql, (playlist_id, bin2str(infohash)))
+        result = self._db.fetchone(sql, (playlist_id, bin2blob(infohash)))
 
         return self.__fixTorrent(keys, result)
 
@@ -2151,14 +2459,14 @@ ORDER BY CMD.time_stamp DESC LIMIT ?;
     def __fixTorrent(self, keys, torrent):
         if len(keys) == 1:
             if keys[0] == 'infohash':
-                return str2bin(torrent)
+                return blob2bin(torrent)
             return torrent
 
         def fix_value(key, torrent):
             if key in keys:
                 key_index = keys.index(key)
                 if torrent[key_index]:
-                    torrent[key_index] = str2bin(torrent[key_index])
+                    torrent[key_index] = blob2bin(torrent[key_index])
         if torrent:
             torrent = list(torrent)
             fix_value('infohash', torrent)
@@ -2171,7 +2479,7 @@ ORDER BY CMD.time_stamp DESC LIMIT ?;
                 for i in range(len(results)):
                     result = list(results[i])
                     if result[key_index]:
-                        result[key_index] = str2bin(result[key_index])
+                        result[key_index] = blob2bin(result[key_index])
                         results[i] = result
         fix_value('infohash')
         return results
@@ -2275,7 +2583,7 @@ ORDER BY CMD.time_stamp DESC LIMIT ?;
                 dispersy_cid = str(dispersy_cid)
                 torrents = self._db.fetchall(select_torrents, (channel_id, limitTorrents))
                 for infohash, ChTname, CoTname, time_stamp in torrents:
-                    infohash = str2bin(infohash)
+                    infohash = blob2bin(infohash)
                     results.append((channel_id, dispersy_cid, name, infohash, ChTname or CoTname, time_stamp))
             return results
         return []
@@ -2487,7 +2795,7 @@ ORDER BY CMD.time_stamp DESC LIMIT ?;
               FROM Channels, ChannelTorrents, Torrent
               WHERE Channels.id = ChannelTorrents.channel_id
               AND ChannelTorrents.torrent_id = Torrent.torrent_id AND infohash = ?"""
-        channels = self._db.fetchall(sql, (bin2str(infohash),))
+        channels = self._db.fetchall(sql, (bin2blob(infohash),))
 
         if len(channels) > 0:
             channel_ids = set()
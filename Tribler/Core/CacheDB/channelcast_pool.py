@@ -0,0 +1,168 @@
+"""
+Pool of channel torrents that channelcast messages are composed from.
+"""
+import random
+from bisect import bisect_right
+from heapq import heappush, heappushpop, heapify, nlargest
+from itertools import chain
+
+DEFAULT_RECENT_SIZE = 50
+DEFAULT_RESERVOIR_SIZE = 100
+
+
+class ChannelSample(object):
+    """
+    The most recent torrents of a channel together with a uniform random sample of all its torrents.
+    """
+
+    def __init__(self, dispersy_cid, modified=0):
+        self.dispersy_cid = dispersy_cid
+        self.modified = modified
+
+        # min-heap of (time stamp, infohash) tuples, holding the most recent torrents of the channel
+        self.recent = []
+        # (time stamp, infohash) tuples, a reservoir sample of all torrents of the channel
+        self.reservoir = []
+        # the number of torrents the reservoir has been sampled from
+        self.seen = 0
+
+    def add(self, infohash, time_stamp, recent_size, reservoir_size, rand):
+        item = (time_stamp, infohash)
+        if len(self.recent) < recent_size:
+            heappush(self.recent, item)
+        elif item > self.recent[0]:
+            heappushpop(self.recent, item)
+
+        self.seen += 1
+        if len(self.reservoir) < reservoir_size:
+            self.reservoir.append(item)
+        else:
+            index = rand.randrange(self.seen)
+            if index < reservoir_size:
+                self.reservoir[index] = item
+
+    def remove(self, infohash):
+        """
+        Remove a torrent that was added to this sample. It no longer counts towards the number of torrents seen, whether
+        or not it ended up in the reservoir.
+        """
+        recent = [item for item in self.recent if item[1] != infohash]
+        if len(recent) != len(self.recent):
+            heapify(recent)
+            self.recent = recent
+
+        self.reservoir = [item for item in self.reservoir if item[1] != infohash]
+        self.seen = max(len(self.reservoir), self.seen - 1)
+
+
+class ChannelcastPool(object):
+    """
+    Keeps a ChannelSample of every channel that channelcast draws torrents from: our own channel, the channels we
+    marked as favorite and the channels of the torrents we downloaded. The recent and random torrents for a channelcast
+    message are taken from these samples instead of sorting the channel torrents in the database.
+
+    The samples are rebuilt from the database by refreshing the pool, and kept up to date in between by adding the
+    torrents of these channels as they arrive.
+    """
+
+    def __init__(self, recent_size=DEFAULT_RECENT_SIZE, reservoir_size=DEFAULT_RESERVOIR_SIZE, rand=None):
+        super(ChannelcastPool, self).__init__()
+        self.recent_size = recent_size
+        self.reservoir_size = reservoir_size
+        self._random = rand or random.Random()
+
+        self.own_channel_id = None
+        self.favorite_channel_ids = set()
+        self.preferred_channel_ids = set()
+        self._samples = {}
+
+    def __len__(self):
+        return len(self._samples)
+
+    def __contains__(self, channel_id):
+        return channel_id in self._samples
+
+    def get_sample(self, channel_id):
+        return self._samples.get(channel_id)
+
+    def create_sample(self, dispersy_cid, modified=0):
+        return ChannelSample(dispersy_cid, modified)
+
+    def add_to_sample(self, sample, infohash, time_stamp):
+        sample.add(infohash, time_stamp, self.recent_size, self.reservoir_size, self._random)
+
+    def replace(self, own_channel_id, favorite_channel_ids, preferred_channel_ids, samples):
+        """
+        Replace the contents of the pool by freshly built samples.
+        :param samples: a dictionary from channel id to ChannelSample.
+        """
+        self.own_channel_id = own_channel_id
+        self.favorite_channel_ids = set(favorite_channel_ids)
+        self.preferred_channel_ids = set(preferred_channel_ids)
+        self._samples = samples
+
+    def clear(self):
+        self.replace(None, [], [], {})
+
+    def set_own_channel(self, channel_id, dispersy_cid):
+        self.own_channel_id = channel_id
+        if channel_id not in self._samples:
+            self._samples[channel_id] = self.create_sample(dispersy_cid)
+
+    def add_torrent(self, channel_id, infohash, time_stamp, modified=None):
+        """
+        Add a torrent to the sample of its channel, if channelcast draws from that channel.
+        """
+        sample = self._samples.get(channel_id)
+        if sample is None:
+            return
+        self.add_to_sample(sample, infohash, time_stamp)
+        if modified is not None:
+            sample.modified = modified
+
+    def remove_torrent(self, channel_id, infohash):
+        sample = self._samples.get(channel_id)
+        if sample is not None:
+            sample.remove(infohash)
+
+    def get_recent(self, channel_ids, limit, modified_since=None):
+        """
+        Return the most recent torrents of a number of channels as (time stamp, dispersy cid, infohash) tuples, the
+        most recent torrent first.
+        :param modified_since: if given, only the torrents of channels modified after this time are returned.
+        """
+        samples = [self._samples[channel_id] for channel_id in channel_ids if channel_id in self._samples]
+        if modified_since is not None:
+            samples = [sample for sample in samples if sample.modified > modified_since]
+        return nlargest(limit, chain.from_iterable(((time_stamp, sample.dispersy_cid, infohash)
+                                                    for time_stamp, infohash in sample.recent)
+                                                   for sample in samples))
+
+    def get_random(self, channel_ids, limit, before):
+        """
+        Return at most limit distinct random torrents older than a time stamp from a number of channels, as
+        (dispersy cid, infohash) tuples. A channel is picked in proportion to its number of torrents, so every torrent
+        of these channels is about equally likely to be returned.
+        """
+        samples = [self._samples[channel_id] for channel_id in channel_ids
+                   if channel_id in self._samples and self._samples[channel_id].reservoir]
+        if not samples or limit <= 0:
+            return []
+
+        cumulative_weights = []
+        total = 0
+        for sample in samples:
+            total += sample.seen
+            cumulative_weights.append(total)
+
+        result = []
+        picked = set()
+        for _ in xrange(limit * 3):
+            sample = samples[min(bisect_right(cumulative_weights, self._random.randrange(total)), len(samples) - 1)]
+            time_stamp, infohash = self._random.choice(sample.reservoir)
+            if time_stamp < before and (sample.dispersy_cid, infohash) not in picked:
+                picked.add((sample.dispersy_cid, infohash))
+                result.append((sample.dispersy_cid, infohash))
+                if len(result) == limit:
+                    break
+        return result
@@ -0,0 +1,325 @@
+"""
+Threaded executor for SQLite statements that should not block the reactor.
+
+The executor owns the only connection that writes to the database. A writer thread coalesces queued writes into group
+commits that are bounded both by time and by the number of rows, and writes that have to finish before their caller
+continues run on the same connection, between two group commits. Reads are served by a small pool of read-only
+connections which, thanks to the WAL journal, never block on the writer and see every committed write. All Deferreds
+returned by the executor fire on the reactor thread.
+"""
+import logging
+from Queue import Queue, Empty
+from threading import Thread, Lock
+from time import time
+
+import apsw
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred
+from twisted.python.failure import Failure
+
+
+DEFAULT_NUM_READERS = 2
+DEFAULT_MAX_BATCH_ROWS = 1000
+DEFAULT_MAX_BATCH_DELAY = 0.05  # seconds
+
+_STOP = object()
+
+
+class _DBJob(object):
+    """
+    A single statement (or executemany) queued for one of the executor threads.
+    """
+
+    __slots__ = ['sql', 'args', 'many', 'deferred']
+
+    def __init__(self, sql, args, many):
+        self.sql = sql
+        self.args = args
+        self.many = many
+        self.deferred = Deferred()
+
+    @property
+    def num_rows(self):
+        return len(self.args) if self.many else 1
+
+    def run(self, cursor):
+        if self.many:
+            return list(cursor.executemany(self.sql, self.args))
+        return list(cursor.execute(self.sql, self.args))
+
+
+class SQLiteDBExecutor(object):
+    """
+    Runs SQL statements for a file based SQLite database on dedicated threads.
+
+    All writes go through the write connection of the executor: queued writes are committed in groups by the writer
+    thread, while run_write executes a write on the calling thread and commits it before returning. Both are committed
+    as soon as they have run, so every connection to the database sees them right away.
+    """
+
+    def __init__(self, db_path, busytimeout, num_readers=DEFAULT_NUM_READERS, max_batch_rows=DEFAULT_MAX_BATCH_ROWS,
+                 max_batch_delay=DEFAULT_MAX_BATCH_DELAY, setup_connection=None):
+        """
+        :param db_path: the path of the database file, the database should already be in WAL mode.
+        :param busytimeout: the busy timeout of the connections in milliseconds.
+        :param num_readers: the number of read-only connections (and threads) to use.
+        :param max_batch_rows: the maximum number of rows written in a single group commit.
+        :param max_batch_delay: the maximum time in seconds a write waits for other writes to join its commit.
+        :param setup_connection: an optional callable that is invoked with every new connection, i.e. to register
+                                 SQL functions.
+        """
+        super(SQLiteDBExecutor, self).__init__()
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+        self.db_path = db_path
+        self._busytimeout = busytimeout
+        self._num_readers = num_readers
+        self._max_batch_rows = max_batch_rows
+        self._max_batch_delay = max_batch_delay
+        self._setup_connection = setup_connection
+
+        self._lock = Lock()
+        self._write_queue = Queue()
+        self._read_queue = Queue()
+        self._writer = None
+        self._readers = []
+        self._stopped = False
+
+        # the write connection is shared by the writer thread and run_write, a transaction on it holds this lock
+        self._write_lock = Lock()
+        self._write_connection = self._open_connection(read_only=False)
+        self._write_cursor = self._write_connection.cursor()
+
+        # guards the counters below, which are updated from the reactor and the executor threads
+        self._stats_lock = Lock()
+        self.num_commits = 0
+        self.num_failed_commits = 0
+        self.num_failed_writes = 0
+        self.num_written_rows = 0
+        self.num_reads = 0
+
+    @property
+    def is_running(self):
+        return self._writer is not None or len(self._readers) > 0
+
+    def _open_connection(self, read_only):
+        flags = apsw.SQLITE_OPEN_READONLY if read_only else apsw.SQLITE_OPEN_READWRITE
+        connection = apsw.Connection(self.db_path, flags=flags)
+        connection.setbusytimeout(self._busytimeout)
+        if self._setup_connection:
+            self._setup_connection(connection)
+        return connection
+
+    def _start_thread(self, target, name):
+        thread = Thread(target=target, name=name)
+        thread.setDaemon(True)
+        thread.start()
+        return thread
+
+    def _ensure_writer(self):
+        with self._lock:
+            if self._stopped:
+                raise RuntimeError(u"Executor of %s has been stopped" % self.db_path)
+            if self._writer is None:
+                self._writer = self._start_thread(self._writer_loop, "SQLiteDBExecutor-writer")
+
+    def _ensure_readers(self):
+        with self._lock:
+            if self._stopped:
+                raise RuntimeError(u"Executor of %s has been stopped" % self.db_path)
+            if not self._readers:
+                self._readers = [self._start_thread(self._reader_loop, "SQLiteDBExecutor-reader-%d" % i)
+                                 for i in xrange(self._num_readers)]
+
+    def read(self, sql, args=None):
+        """
+        Execute a read-only statement on one of the reader connections.
+        :return: a Deferred that fires with the list of resulting rows.
+        """
+        self._ensure_readers()
+        job = _DBJob(sql, args, False)
+        self._read_queue.put(job)
+        return job.deferred
+
+    def write(self, sql, args=None):
+        """
+        Queue a statement for the writer thread.
+        :return: a Deferred that fires with the list of resulting rows once the statement has been committed.
+        """
+        self._ensure_writer()
+        job = _DBJob(sql, args, False)
+        self._write_queue.put(job)
+        return job.deferred
+
+    def write_many(self, sql, args_list):
+        """
+        Queue an executemany for the writer thread.
+        :return: a Deferred that fires once all rows have been committed.
+        """
+        self._ensure_writer()
+        job = _DBJob(sql, list(args_list), True)
+        self._write_queue.put(job)
+        return job.deferred
+
+    def run_write(self, sql, args=None, many=False):
+        """
+        Execute a write on the calling thread and commit it, for callers that need its result right away. A group
+        commit of the writer thread that is in progress is finished first.
+        :return: the list of resulting rows.
+        """
+        if self._stopped:
+            raise RuntimeError(u"Executor of %s has been stopped" % self.db_path)
+
+        job = _DBJob(sql, list(args) if many else args, many)
+        with self._write_lock:
+            self._write_cursor.execute(u"BEGIN IMMEDIATE;")
+            try:
+                result = job.run(self._write_cursor)
+            except:
+                self._write_cursor.execute(u"ROLLBACK;")
+                with self._stats_lock:
+                    self.num_failed_writes += 1
+                raise
+            self._write_cursor.execute(u"COMMIT;")
+
+        with self._stats_lock:
+            self.num_commits += 1
+            self.num_written_rows += job.num_rows
+        return result
+
+    def vacuum(self):
+        """
+        Rebuild the database file, this blocks the calling thread until it is done.
+        """
+        with self._write_lock:
+            self._write_cursor.execute(u"VACUUM;")
+
+    def stop(self):
+        """
+        Stop the executor. Writes that have been queued before this call are still committed, this method blocks
+        until that is done.
+        """
+        with self._lock:
+            self._stopped = True
+            writer, readers = self._writer, self._readers
+            self._writer, self._readers = None, []
+
+        if writer:
+            self._write_queue.put(_STOP)
+        for _ in readers:
+            self._read_queue.put(_STOP)
+
+        for thread in [writer] + readers:
+            if thread:
+                thread.join()
+
+        with self._write_lock:
+            self._write_connection.close()
+
+    def get_statistics(self):
+        with self._stats_lock:
+            return {"commits": self.num_commits,
+                    "failed_commits": self.num_failed_commits,
+                    "failed_writes": self.num_failed_writes,
+                    "written_rows": self.num_written_rows,
+                    "reads": self.num_reads,
+                    "pending_writes": self._write_queue.qsize(),
+                    "pending_reads": self._read_queue.qsize()}
+
+    @staticmethod
+    def _fire(job, result):
+        if isinstance(result, Failure):
+            reactor.callFromThread(job.deferred.errback, result)
+        else:
+            reactor.callFromThread(job.deferred.callback, result)
+
+    def _reader_loop(self):
+        connection = self._open_connection(read_only=True)
+        cursor = connection.cursor()
+        try:
+            while True:
+                job = self._read_queue.get()
+                if job is _STOP:
+                    break
+                try:
+                    result = job.run(cursor)
+                except Exception:
+                    self._logger.exception(u"Read failed: %s %s", job.sql, job.args)
+                    result = Failure()
+                with self._stats_lock:
+                    self.num_reads += 1
+                self._fire(job, result)
+        finally:
+            connection.close()
+
+    def _writer_loop(self):
+        stop = False
+        while not stop:
+            job = self._write_queue.get()
+            if job is _STOP:
+                break
+
+            # Keep collecting writes until either the row or the time budget of this commit is exhausted
+            batch = [job]
+            num_rows = job.num_rows
+            deadline = time() + self._max_batch_delay
+            while num_rows < self._max_batch_rows:
+                timeout = deadline - time()
+                if timeout <= 0:
+                    break
+                try:
+                    job = self._write_queue.get(timeout=timeout)
+                except Empty:
+                    break
+                if job is _STOP:
+                    stop = True
+                    break
+                batch.append(job)
+                num_rows += job.num_rows
+
+            with self._write_lock:
+                self._commit_batch(self._write_cursor, batch, num_rows)
+
+    def _commit_batch(self, cursor, batch, num_rows):
+        try:
+            cursor.execute(u"BEGIN IMMEDIATE;")
+        except Exception:
+            self._logger.exception(u"Failed to begin a write transaction")
+            with self._stats_lock:
+                self.num_failed_commits += 1
+            failure = Failure()
+            for job in batch:
+                self._fire(job, failure)
+            return
+
+        # A failing statement only rolls back itself, the other statements of the batch are still committed
+        results = []
+        num_failed = 0
+        for job in batch:
+            try:
+                results.append(job.run(cursor))
+            except Exception:
+                self._logger.exception(u"Write failed: %s %s", job.sql, job.args)
+                results.append(Failure())
+                num_failed += 1
+
+        try:
+            cursor.execute(u"COMMIT;")
+        except Exception:
+            self._logger.exception(u"Group commit of %d rows failed", num_rows)
+            failure = Failure()
+            try:
+                cursor.execute(u"ROLLBACK;")
+            except apsw.Error:
+                pass
+            results = [failure] * len(batch)
+            with self._stats_lock:
+                self.num_failed_commits += 1
+        else:
+            with self._stats_lock:
+                self.num_commits += 1
+                self.num_failed_writes += num_failed
+                self.num_written_rows += num_rows
+
+        for job, result in zip(batch, results):
+            self._fire(job, result)
@@ -0,0 +1,169 @@
+"""
+Cache of the responses to incoming remote search queries.
+"""
+from collections import OrderedDict, defaultdict
+from time import time
+
+from Tribler.Core.Utilities.search_utils import filter_keywords
+
+DEFAULT_SEARCH_CACHE_SIZE = 256
+DEFAULT_SEARCH_CACHE_TTL = 60
+
+
+class SearchResultCache(object):
+    """
+    Caches the results of remote search queries, keyed by the normalized set of keywords of the query.
+
+    Entries expire after a fixed time and the least recently used entries are evicted when the cache is full.
+    An entry is also invalidated when a torrent that could match its keywords is (re)indexed, or when one of the
+    torrents or channels in its results is updated.
+    """
+
+    def __init__(self, max_entries=DEFAULT_SEARCH_CACHE_SIZE, ttl=DEFAULT_SEARCH_CACHE_TTL):
+        super(SearchResultCache, self).__init__()
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        # key -> (insert time, results, infohashes, channel ids)
+        self._entries = OrderedDict()
+        self._keys_by_term = defaultdict(set)
+        self._keys_by_infohash = defaultdict(set)
+        self._keys_by_channel = defaultdict(set)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def get_key(keywords):
+        """
+        Normalize the keywords of a query: stopwords are removed, the order and case of keywords does not matter.
+        """
+        return frozenset(keyword.lower() for keyword in filter_keywords(keywords))
+
+    @staticmethod
+    def _get_positive_terms(key):
+        return [term for term in key if term[0] != '-']
+
+    def get(self, keywords):
+        """
+        Return the cached results for a query, or None if they are not available.
+        """
+        key = self.get_key(keywords)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] + self.ttl < time():
+            self._remove(key)
+            entry = None
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        # Mark this entry as the most recently used one
+        del self._entries[key]
+        self._entries[key] = entry
+        return entry[1]
+
+    def put(self, keywords, results, infohashes, channel_ids=()):
+        """
+        Store the results of a query.
+        :param keywords: the keywords of the query.
+        :param results: the results to cache.
+        :param infohashes: the infohashes of the torrents in the results.
+        :param channel_ids: the ids of the channels the torrents in the results were attributed to.
+        """
+        key = self.get_key(keywords)
+        if not key:
+            return
+
+        self._remove(key)
+        while len(self._entries) >= self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+        infohashes = frozenset(infohashes)
+        channel_ids = frozenset(channel_ids)
+        self._entries[key] = (time(), results, infohashes, channel_ids)
+        for term in self._get_positive_terms(key):
+            self._keys_by_term[term].add(key)
+        for infohash in infohashes:
+            self._keys_by_infohash[infohash].add(key)
+        for channel_id in channel_ids:
+            self._keys_by_channel[channel_id].add(key)
+
+    def invalidate_terms(self, terms):
+        """
+        Invalidate the queries that a torrent with the given (lower case) terms could match.
+        """
+        terms = set(terms)
+        keys = set()
+        for term in terms:
+            keys.update(self._keys_by_term.get(term, ()))
+
+        for key in keys:
+            if all(term in terms for term in self._get_positive_terms(key)):
+                self._remove(key)
+                self.invalidations += 1
+
+    def invalidate_infohashes(self, infohashes):
+        """
+        Invalidate the queries that have any of the given torrents in their results.
+        """
+        keys = set()
+        for infohash in infohashes:
+            keys.update(self._keys_by_infohash.get(infohash, ()))
+
+        for key in keys:
+            self._remove(key)
+            self.invalidations += 1
+
+    def invalidate_channels(self, channel_ids):
+        """
+        Invalidate the queries that have torrents attributed to any of the given channels in their results, i.e. when
+        the votes on these channels change.
+        """
+        keys = set()
+        for channel_id in channel_ids:
+            keys.update(self._keys_by_channel.get(channel_id, ()))
+
+        for key in keys:
+            self._remove(key)
+            self.invalidations += 1
+
+    def clear(self):
+        self._entries.clear()
+        self._keys_by_term.clear()
+        self._keys_by_infohash.clear()
+        self._keys_by_channel.clear()
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+
+        for term in self._get_positive_terms(key):
+            self._discard_from_index(self._keys_by_term, term, key)
+        for infohash in entry[2]:
+            self._discard_from_index(self._keys_by_infohash, infohash, key)
+        for channel_id in entry[3]:
+            self._discard_from_index(self._keys_by_channel, channel_id, key)
+
+    @staticmethod
+    def _discard_from_index(index, index_key, key):
+        keys = index.get(index_key)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del index[index_key]
+
+    def get_statistics(self):
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "size": len(self._entries)}
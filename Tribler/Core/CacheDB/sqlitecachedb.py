@@ -10,12 +10,15 @@ from threading import currentThread, RLock
 
 import apsw
 from apsw import CantOpenError, SQLError
+from twisted.internet.defer import maybeDeferred
 from twisted.python.threadable import isInIOThread
 
 from Tribler.dispersy.taskmanager import TaskManager
 from Tribler.dispersy.util import blocking_call_on_reactor_thread, call_on_reactor_thread
 
+from Tribler.Core.CacheDB.db_executor import SQLiteDBExecutor, DEFAULT_NUM_READERS
 from Tribler.Core.CacheDB.db_versions import LATEST_DB_VERSION
+from Tribler.Core.Utilities.search_utils import bm25_relevance
 
 
 DB_SCRIPT_NAME = "schema_sdb_v%s.sql" % str(LATEST_DB_VERSION)
@@ -45,9 +48,38 @@ def str2bin(str_data):
     return decodestring(str_data)
 
 
+def bin2blob(bin_data):
+    """
+    Infohashes are stored as BLOBs, apsw binds buffers as BLOBs and returns BLOBs as buffers.
+    """
+    return buffer(bin_data)
+
+
+def blob2bin(blob_data):
+    return str(blob_data)
+
+
+def register_sql_functions(connection):
+    """
+    Registers the Python functions that are used in our SQL statements on a connection.
+    """
+    connection.createscalarfunction(u"bm25_relevance", bm25_relevance, 2)
+
+
+def _first_row(rows):
+    """
+    Shapes a list of rows the same way SQLiteCacheDB.fetchone does.
+    """
+    if not rows:
+        return None
+    row = rows[0]
+    return row if len(row) > 1 else row[0]
+
+
 class SQLiteCacheDB(TaskManager):
 
-    def __init__(self, db_path, db_script_path=None, busytimeout=DEFAULT_BUSY_TIMEOUT):
+    def __init__(self, db_path, db_script_path=None, busytimeout=DEFAULT_BUSY_TIMEOUT,
+                 num_readers=DEFAULT_NUM_READERS):
         super(SQLiteCacheDB, self).__init__()
 
         self._logger = logging.getLogger(self.__class__.__name__)
@@ -59,6 +91,10 @@ class SQLiteCacheDB(TaskManager):
         self.sqlite_db_path = db_path
         self.db_script_path = db_script_path
         self._busytimeout = busytimeout  # busytimeout is in milliseconds
+        self._num_readers = num_readers
+
+        # Executor for the Deferred based API, only available for databases on disk
+        self._executor = None
 
         self._version = None
 
@@ -78,6 +114,14 @@ class SQLiteCacheDB(TaskManager):
         """
         return self._connection
 
+    @property
+    def executor(self):
+        """
+        Returns the executor that runs the Deferred based queries off the reactor thread, which is None for in-memory
+        databases.
+        """
+        return self._executor
+
     @blocking_call_on_reactor_thread
     def initialize(self):
         """ Initializes the database. If the database doesn't exist, we create a new one. Otherwise, we check the
@@ -87,12 +131,20 @@ class SQLiteCacheDB(TaskManager):
         # open a connection to the database
         self._open_connection()
 
+        # An in-memory database cannot be shared between connections
+        if self.sqlite_db_path != u":memory:":
+            self._executor = SQLiteDBExecutor(self.sqlite_db_path, self._busytimeout, num_readers=self._num_readers,
+                                              setup_connection=register_sql_functions)
+
     @blocking_call_on_reactor_thread
     def close(self):
         """
-        Cancels all pending tasks and closes all cursors. Then, it closes the connection.
+        Cancels all pending tasks, flushes the executor and closes all cursors. Then, it closes the connection.
         """
         self.cancel_all_pending_tasks()
+        if self._executor:
+            self._executor.stop()
+            self._executor = None
         with self._cursor_lock:
             for cursor in self._cursor_table.itervalues():
                 cursor.close()
@@ -122,6 +174,7 @@ class SQLiteCacheDB(TaskManager):
         try:
             self._connection = apsw.Connection(self.sqlite_db_path)
             self._connection.setbusytimeout(self._busytimeout)
+            register_sql_functions(self._connection)
         except CantOpenError as e:
             msg = u"Failed to open connection to %s: %s" % (self.sqlite_db_path, e)
             raise CantOpenError(msg)
@@ -206,6 +259,11 @@ class SQLiteCacheDB(TaskManager):
 
     @blocking_call_on_reactor_thread
     def initial_begin(self):
+        if self._executor:
+            # the executor commits every write right away, so connections that read from the database never miss
+            # writes that are still in an open transaction
+            return
+
         try:
             self._logger.info(u"Beginning the first transaction...")
             self.execute(u"BEGIN;")
@@ -227,7 +285,13 @@ class SQLiteCacheDB(TaskManager):
 
     @call_on_reactor_thread
     def commit_now(self, vacuum=False, exiting=False):
-        if self._should_commit and isInIOThread():
+        if self._executor:
+            # writes have been committed by the executor already
+            if vacuum:
+                self._logger.info(u"Start vacuuming...")
+                self._executor.vacuum()
+
+        elif self._should_commit and isInIOThread():
             try:
                 self._logger.info(u"Start committing...")
                 self.execute(u"COMMIT;")
@@ -293,6 +357,9 @@ class SQLiteCacheDB(TaskManager):
 
     @blocking_call_on_reactor_thread
     def executemany(self, sql, args=None):
+        if self._executor:
+            return iter(self._run_write(sql, args, True))
+
         self._should_commit = True
 
         cur = self.get_cursor()
@@ -314,13 +381,57 @@ class SQLiteCacheDB(TaskManager):
                                    thread_name, type(sql), sql, args)
             raise msg
 
+    # --------- Deferred based functions -------------
+    # These run on the threads of the executor so they never block the reactor, writes are committed in groups. Without
+    # an executor (i.e. for an in-memory database) they fall back to the reactor connection.
+
+    def fetchall_deferred(self, sql, args=None):
+        if self._executor is None:
+            return maybeDeferred(self.fetchall, sql, args)
+        return self._executor.read(sql, args)
+
+    def fetchone_deferred(self, sql, args=None):
+        if self._executor is None:
+            return maybeDeferred(self.fetchone, sql, args)
+        return self._executor.read(sql, args).addCallback(_first_row)
+
+    def execute_write_deferred(self, sql, args=None):
+        if self._executor is None:
+            return maybeDeferred(self._run_write, sql, args, False)
+        return self._executor.write(sql, args)
+
+    def executemany_deferred(self, sql, args):
+        if self._executor is None:
+            return maybeDeferred(self._run_write, sql, args, True)
+        return self._executor.write_many(sql, args)
+
+    @blocking_call_on_reactor_thread
+    def _run_write(self, sql, args, many):
+        """
+        Runs a write on the reactor thread. With an executor, it is committed on the write connection of the executor,
+        which is the only connection that writes to the database. Otherwise it runs in the open transaction of the
+        reactor connection.
+        """
+        if self._executor:
+            if self._show_execute:
+                self._logger.info(u"===%s===\n%s\n-----\n%s\n======\n", currentThread().getName(), sql, args)
+            try:
+                return self._executor.run_write(sql, args, many)
+            except Exception:
+                self._logger.exception(u"cachedb: ===%s===\nSQL Type: %s\n-----\n%s\n-----\n%s\n======\n",
+                                       currentThread().getName(), type(sql), sql, args)
+                raise
+
+        if many:
+            return list(self.executemany(sql, args))
+        self._should_commit = True
+        return list(self.execute(sql, args))
+
     def execute_read(self, sql, args=None):
         return self.execute(sql, args)
 
     def execute_write(self, sql, args=None):
-        self._should_commit = True
-
-        self.execute(sql, args)
+        self._run_write(sql, args, False)
 
     def insert_or_ignore(self, table_name, **argv):
         if len(argv) == 1:
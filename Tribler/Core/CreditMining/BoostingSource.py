@@ -23,7 +23,7 @@ from twisted.web.http_headers import Headers
 
 from Tribler.Core.CreditMining.credit_mining_util import ent2chr
 from Tribler.Core.TorrentDef import TorrentDef
-from Tribler.Core.simpledefs import NTFY_INSERT, NTFY_TORRENTS, NTFY_UPDATE
+from Tribler.Core.simpledefs import METAINFO_PRIORITY_CREDIT_MINING, NTFY_INSERT, NTFY_TORRENTS, NTFY_UPDATE
 from Tribler.Core.version import version_id
 from Tribler.community.allchannel.community import AllChannelCommunity
 from Tribler.community.channel.community import ChannelCommunity
@@ -288,7 +288,8 @@ class ChannelSource(BoostingSource):
             if not self.session.has_collected_torrent(infohash):
                 if self.session.has_download(infohash):
                     return
-                self.session.download_torrentfile(infohash, add_to_loaded, 0)
+                self.session.download_torrentfile(infohash, add_to_loaded, 0,
+                                                  metainfo_priority=METAINFO_PRIORITY_CREDIT_MINING)
 
         deferred_load = self.loaded_torrent[infohash]
 
@@ -6,6 +6,7 @@ Author(s): Arno Bakker
 import logging
 import sys
 
+from Tribler.Core.Utilities.bitfield import BitfieldCounter, bitfield_to_int, bitfield_to_string
 from Tribler.Core.simpledefs import (DLSTATUS_DOWNLOADING, DLSTATUS_SEEDING, DLSTATUS_STOPPED,
                                      DLSTATUS_STOPPED_ON_ERROR, DLSTATUS_WAITING4HASHCHECK, UPLOAD)
 
@@ -99,25 +100,12 @@ class DownloadState(object):
 
                 selected_files = self.download.get_selected_files()
                 # Show only pieces complete for the selected ranges of files
-                totalpieces = 0
+                haveslice = []
                 for t, tl, o, f in self.filepieceranges:
                     if f in selected_files or not selected_files:
-                        diff = tl - t
-                        totalpieces += diff
-
-                haveslice = [False] * totalpieces
-                have = 0
-                index = 0
-                for t, tl, o, f in self.filepieceranges:
-                    if f in selected_files or not selected_files:
-                        for piece in range(t, tl):
-                            haveslice[index] = stats['stats'].have[piece]
-                            if haveslice[index]:
-                                have += 1
-
-                            index += 1
+                        haveslice.extend(self.haveslice_total[t:tl])
                 self.haveslice = haveslice
-                if have == len(haveslice) and self.status == DLSTATUS_DOWNLOADING:
+                if all(haveslice) and self.status == DLSTATUS_DOWNLOADING:
                     # we have all pieces of the selected files
                     self.status = DLSTATUS_SEEDING
                     self.progress = 1.0
@@ -290,19 +278,16 @@ class DownloadState(object):
 
         completion = []
         if self.filepieceranges:
+            # The pieces we have as a string of '0' and '1' characters, the pieces of a file are counted in one go
+            have = bitfield_to_string(self.haveslice_total) if getattr(self, 'haveslice_total', False) else None
             for t, tl, o, f in self.filepieceranges:
                 if f in files and self.progress == 1.0:
                     completion.append((f, 1.0))
                 else:
                     # niels: ranges are from-to (inclusive ie if a file consists one piece t and tl will be the same)
                     total_pieces = tl - t
-                    if total_pieces and getattr(self, 'haveslice_total', False):
-                        completed = 0
-                        for index in range(t, tl):
-                            if self.haveslice_total[index]:
-                                completed += 1
-
-                        completion.append((f, completed / (total_pieces * 1.0)))
+                    if total_pieces and have:
+                        completion.append((f, have.count('1', t, tl) / (total_pieces * 1.0)))
                     elif f in files:
                         completion.append((f, 0.0))
         elif files:
@@ -344,19 +329,16 @@ class DownloadState(object):
                 nr_seeders_complete += 1
             else:
                 if merged_bitfields is None:
-                    merged_bitfields = [0] * len(have)
-
-                for i in range(len(have)):
-                    if have[i]:
-                        merged_bitfields[i] += 1
+                    merged_bitfields = BitfieldCounter(len(have))
+                merged_bitfields.add(bitfield_to_int(have))
 
-        if merged_bitfields:
+        if merged_bitfields and merged_bitfields.num_pieces:
             # count the number of complete copies due to overlapping leecher bitfields
-            nr_leechers_complete = min(merged_bitfields)
+            nr_leechers_complete, nr_min = merged_bitfields.get_minimum()
 
             # detect remainder of bitfields which are > 0
-            nr_more_than_min = len([x for x in merged_bitfields if x > nr_leechers_complete])
-            fraction_additonal = float(nr_more_than_min) / len(merged_bitfields)
+            nr_more_than_min = merged_bitfields.num_pieces - nr_min
+            fraction_additonal = float(nr_more_than_min) / merged_bitfields.num_pieces
 
             return nr_seeders_complete + nr_leechers_complete + fraction_additonal
         return nr_seeders_complete
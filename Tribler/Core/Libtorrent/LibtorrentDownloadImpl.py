@@ -23,6 +23,7 @@ from Tribler.Core.DownloadState import DownloadState
 from Tribler.Core.Libtorrent import checkHandleAndSynchronize
 from Tribler.Core.TorrentDef import TorrentDefNoMetainfo, TorrentDef
 from Tribler.Core.Utilities import maketorrent
+from Tribler.Core.Utilities.bitfield import bitfield_to_bytes
 from Tribler.Core.Utilities.torrent_utils import get_info_from_handle
 from Tribler.Core.exceptions import SaveResumeDataError
 from Tribler.Core.osutils import fix_filebasename
@@ -32,6 +33,14 @@ from Tribler.Core.simpledefs import (DLSTATUS_WAITING4HASHCHECK, DLSTATUS_HASHCH
                                      UPLOAD, DOWNLOAD, DLMODE_NORMAL, PERSISTENTSTATE_CURRENTVERSION, dlstatus_strings)
 from Tribler.dispersy.taskmanager import TaskManager
 
+# The alerts that are handled by a download, mapped to the name of their handler. The stats of a download are not
+# updated on its other alerts, but on the status snapshots of the state update alerts of the libtorrent manager.
+ALERT_HANDLERS = dict((alert_type, 'on_' + alert_type) for alert_type in (
+    'tracker_reply_alert', 'tracker_error_alert', 'tracker_warning_alert', 'metadata_received_alert',
+    'file_renamed_alert', 'performance_alert', 'torrent_checked_alert', 'torrent_finished_alert',
+    'save_resume_data_alert', 'save_resume_data_failed_alert'))
+LOGGED_ALERT_CATEGORIES = (lt.alert.category_t.error_notification, lt.alert.category_t.performance_warning)
+
 if sys.platform == "win32":
     try:
         import ctypes
@@ -91,7 +100,7 @@ class VODFile(object):
 
         self._logger.debug('VODFile: seek, get pieces %s', self._download.handle.piece_priorities())
         self._logger.debug('VODFile: seek, got pieces %s', [
-                           int(piece) for piece in self._download.handle.status().pieces])
+                           int(piece) for piece in self._download.get_lt_status().pieces])
 
     def close(self, *args):
         self._file.close(*args)
@@ -114,6 +123,10 @@ class LibtorrentDownloadImpl(DownloadConfigInterface, TaskManager):
         self.session = session
         self.tdef = tdef
         self.handle = None
+        # The last torrent_status of the handle, refreshed by the state update alerts of the libtorrent manager
+        self.lt_status = None
+        # Increased whenever libtorrent reports a change in the status or the tracker status of this download
+        self.state_version = 0
         self.vod_index = None
         self.orig_files = None
 
@@ -338,6 +351,7 @@ class LibtorrentDownloadImpl(DownloadConfigInterface, TaskManager):
                 atp["url"] = self.tdef.get_url() or "magnet:?xt=urn:btih:" + hexlify(self.tdef.get_infohash())
                 atp["name"] = self.tdef.get_name_as_unicode()
 
+            self.lt_status = None
             self.handle = self.ltmgr.add_torrent(self, atp)
             # assert self.handle.status().share_mode == share_mode
             if self.handle.is_valid():
@@ -422,7 +436,7 @@ class LibtorrentDownloadImpl(DownloadConfigInterface, TaskManager):
         elif consecutive:
             pieces.sort()
 
-        status = self.handle.status()
+        status = self.get_lt_status()
         if status:
             pieces_have = 0
             pieces_all = len(pieces)
@@ -440,14 +454,7 @@ class LibtorrentDownloadImpl(DownloadConfigInterface, TaskManager):
         """
         Returns a base64 encoded bitmask of the pieces that we have.
         """
-        bitstr = ""
-        for bit in self.handle.status().pieces:
-            bitstr += '1' if bit else '0'
-
-        encoded_str = ""
-        for i in range(0, len(bitstr), 8):
-            encoded_str += chr(int(bitstr[i:i+8].ljust(8, '0'), 2))
-        return base64.b64encode(encoded_str)
+        return base64.b64encode(bitfield_to_bytes(self.get_lt_status().pieces))
 
     @checkHandleAndSynchronize(0)
     def get_num_pieces(self):
@@ -483,7 +490,7 @@ class LibtorrentDownloadImpl(DownloadConfigInterface, TaskManager):
     @checkHandleAndSynchronize()
     def set_piece_priority(self, pieces_need, priority):
         do_prio = False
-        pieces_have = self.handle.status().pieces
+        pieces_have = self.get_lt_status().pieces
         piecepriorities = self.handle.piece_priorities()
         for piece in pieces_need:
             if piece < len(piecepriorities):
@@ -522,24 +529,48 @@ class LibtorrentDownloadImpl(DownloadConfigInterface, TaskManager):
             pieces = list(set(pieces))
             self.set_piece_priority(pieces, priority)
 
-    @checkHandleAndSynchronize()
     def process_alert(self, alert, alert_type):
-        if alert.category() in [lt.alert.category_t.error_notification, lt.alert.category_t.performance_warning]:
-            self._logger.debug("LibtorrentDownloadImpl: alert %s with message %s", alert_type, alert)
+        self.process_alerts([(alert, alert_type)])
+
+    @checkHandleAndSynchronize()
+    def process_alerts(self, alerts):
+        """
+        Process a list of (alert, alert type) tuples of this download.
+        """
+        for alert, alert_type in alerts:
+            if alert.category() in LOGGED_ALERT_CATEGORIES:
+                self._logger.debug("LibtorrentDownloadImpl: alert %s with message %s", alert_type, alert)
 
-        alert_types = ('tracker_reply_alert', 'tracker_error_alert', 'tracker_warning_alert', 'metadata_received_alert',
-                       'file_renamed_alert', 'performance_alert', 'torrent_checked_alert', 'torrent_finished_alert',
-                       'save_resume_data_alert', 'save_resume_data_failed_alert')
+            handler_name = ALERT_HANDLERS.get(alert_type)
+            if handler_name:
+                getattr(self, handler_name)(alert)
 
-        if alert_type in alert_types:
-            getattr(self, 'on_' + alert_type)(alert)
-        else:
-            self.update_lt_stats()
+    @checkHandleAndSynchronize()
+    def update_lt_status(self, lt_status):
+        """
+        Replace the status snapshot of this download by a torrent_status from a state update alert and update the
+        libtorrent stats.
+        """
+        self.lt_status = lt_status
+        self.update_lt_stats()
+
+    def get_state_version(self):
+        """
+        Return a number that changes whenever libtorrent reports a change in the state of this download.
+        """
+        return self.state_version
+
+    def get_lt_status(self):
+        """
+        Return the last status snapshot of the handle. Until libtorrent has posted the first state update of this
+        download, the status is queried from the handle.
+        """
+        return self.lt_status if self.lt_status is not None else self.handle.status()
 
     def on_save_resume_data_alert(self, alert):
         """
         Callback for the alert that contains the resume data of a specific download.
-        This resume data will be written to a file on disk.
+        This resume data will be stored in the checkpoint store.
         """
         if self._checkpoint_disabled:
             return
@@ -550,13 +581,10 @@ class LibtorrentDownloadImpl(DownloadConfigInterface, TaskManager):
         self.pstate_for_restart.set('state', 'engineresumedata', resume_data)
         self._logger.debug("%s get resume data %s", hexlify(resume_data['info-hash']), resume_data)
 
-        # save it to file
-        basename = hexlify(resume_data['info-hash']) + '.state'
-        filename = os.path.join(self.session.get_downloads_pstate_dir(), basename)
-
-        self._logger.debug("tlm: network checkpointing: to file %s", filename)
-
-        self.pstate_for_restart.write_file(filename)
+        # The checkpoint store is closed during shutdown
+        if self.session.lm.checkpoint_store is not None:
+            self._logger.debug("tlm: network checkpointing: %s", hexlify(resume_data['info-hash']))
+            self.session.lm.checkpoint_store.put(resume_data['info-hash'], self.pstate_for_restart)
 
         # fire callback for all deferreds_resume
         for deferred_r in self.deferreds_resume:
@@ -575,6 +603,7 @@ class LibtorrentDownloadImpl(DownloadConfigInterface, TaskManager):
 
     def on_tracker_reply_alert(self, alert):
         self.tracker_status[alert.url] = [alert.num_peers, 'Working']
+        self.state_version += 1
 
     def on_tracker_error_alert(self, alert):
         peers = self.tracker_status[alert.url][0] if alert.url in self.tracker_status else 0
@@ -588,12 +617,14 @@ class LibtorrentDownloadImpl(DownloadConfigInterface, TaskManager):
             status = 'Not working'
 
         self.tracker_status[alert.url] = [peers, status]
+        self.state_version += 1
 
     def on_tracker_warning_alert(self, alert):
         peers = self.tracker_status[alert.url][0] if alert.url in self.tracker_status else 0
         status = 'Warning: ' + str(alert.message())
 
         self.tracker_status[alert.url] = [peers, status]
+        self.state_version += 1
 
     def on_metadata_received_alert(self, alert):
         torrent_info = get_info_from_handle(self.handle)
@@ -685,7 +716,7 @@ class LibtorrentDownloadImpl(DownloadConfigInterface, TaskManager):
                 def reset_priorities():
                     if not self:
                         return
-                    if self.handle.status().progress == 1.0:
+                    if self.get_lt_status().progress == 1.0:
                         self.set_byte_priority([(self.get_vod_fileindex(), 0, -1)], 1)
                 random_id = ''.join(random.choice('0123456789abcdef') for _ in xrange(30))
                 self.register_task("reset_priorities_%s" % random_id, reactor.callLater(5, reset_priorities))
@@ -696,7 +727,8 @@ class LibtorrentDownloadImpl(DownloadConfigInterface, TaskManager):
 
     def update_lt_stats(self):
         """ Update libtorrent stats and check if the download should be stopped."""
-        status = self.handle.status()
+        self.state_version += 1
+        status = self.get_lt_status()
         self.dlstate = self.dlstates[status.state] if not status.paused else DLSTATUS_STOPPED
         self.dlstate = DLSTATUS_STOPPED_ON_ERROR if self.dlstate == DLSTATUS_STOPPED and status.error else self.dlstate
         if self.get_mode() == DLMODE_VOD:
@@ -907,7 +939,7 @@ class LibtorrentDownloadImpl(DownloadConfigInterface, TaskManager):
 
     @checkHandleAndSynchronize()
     def network_create_statistics_reponse(self):
-        status = self.handle.status()
+        status = self.get_lt_status()
         numTotSeeds = status.num_complete if status.num_complete >= 0 else status.list_seeds
         numTotPeers = status.num_incomplete if status.num_incomplete >= 0 else status.list_peers
         numleech = max(status.num_peers - status.num_seeds, 0)  # When anon downloading, this might become negative
@@ -1082,6 +1114,7 @@ class LibtorrentDownloadImpl(DownloadConfigInterface, TaskManager):
                 if removestate:
                     out = self.ltmgr.remove_torrent(self, removecontent)
                     self.handle = None
+                    self.lt_status = None
                 else:
                     self.set_vod_mode(False)
                     self.handle.pause()
@@ -1177,9 +1210,8 @@ class LibtorrentDownloadImpl(DownloadConfigInterface, TaskManager):
         if not self.handle or not self.handle.is_valid():
             # Libtorrent hasn't received or initialized this download yet
             # 1. Check if we have data for this infohash already (don't overwrite it if we do!)
-            basename = hexlify(self.tdef.get_infohash()) + '.state'
-            filename = os.path.join(self.session.get_downloads_pstate_dir(), basename)
-            if not os.path.isfile(filename):
+            checkpoint_store = self.session.lm.checkpoint_store
+            if checkpoint_store is not None and self.tdef.get_infohash() not in checkpoint_store:
                 # 2. If there is no saved data for this infohash, checkpoint it without data so we do not
                 #    lose it when we crash or restart before the download becomes known.
                 resume_data = {
@@ -1258,7 +1290,7 @@ class LibtorrentDownloadImpl(DownloadConfigInterface, TaskManager):
 
     @checkHandleAndSynchronize()
     def get_share_mode(self):
-        return self.handle.status().share_mode
+        return self.get_lt_status().share_mode
 
     def set_share_mode(self, share_mode):
         self.get_handle().addCallback(lambda handle: handle.set_share_mode(share_mode))
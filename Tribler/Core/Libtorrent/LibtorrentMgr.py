@@ -6,13 +6,16 @@ Author(s): Egbert Bouman
 import binascii
 import logging
 import random
+import sys
 from urllib import url2pathname
 import tempfile
 import threading
 import os
 import time
 from binascii import hexlify
-from copy import deepcopy
+from collections import OrderedDict, deque
+from heapq import heappop, heappush
+from math import ceil
 from distutils.version import LooseVersion
 from shutil import rmtree
 
@@ -21,21 +24,42 @@ from twisted.internet.defer import succeed, fail
 from twisted.python.failure import Failure
 
 import libtorrent as lt
+from Tribler.Core.Libtorrent.metainfo_cache import MetainfoCache
 from Tribler.Core.Utilities.torrent_utils import get_info_from_handle
 from Tribler.Core.TorrentDef import TorrentDef, TorrentDefNoMetainfo
 from Tribler.Core.Utilities.utilities import parse_magnetlink, fix_torrent
 from Tribler.Core.exceptions import DuplicateDownloadException, TorrentFileException
 from Tribler.Core.simpledefs import (NTFY_INSERT, NTFY_MAGNET_CLOSE, NTFY_MAGNET_GOT_PEERS, NTFY_MAGNET_STARTED,
-                                     NTFY_REACHABLE, NTFY_TORRENTS)
+                                     NTFY_REACHABLE, NTFY_TORRENTS, METAINFO_PRIORITY_USER)
 from Tribler.Core.version import version_id
 from Tribler.Core.DownloadConfig import DefaultDownloadStartupConfig
 from Tribler.dispersy.taskmanager import LoopingCall, TaskManager
 from Tribler.dispersy.util import blocking_call_on_reactor_thread, call_on_reactor_thread
 
 LTSTATE_FILENAME = "lt.state"
-METAINFO_CACHE_PERIOD = 5 * 60
 DHT_CHECK_RETRIES = 1
 
+METAINFO_MAX_LOOKUPS = 10  # the maximum number of metainfo lookups at the same time
+METAINFO_MAX_LOOKUPS_MAC = 5  # Mac has just 256 fds per process, be less aggressive
+METAINFO_DHT_NOT_READY_GRACE = 5  # while the DHT is not ready, lookups are started this long before they time out
+METAINFO_LATENCY_SAMPLES = 200  # the number of successful lookups the adaptive timeout is based on
+METAINFO_MIN_LATENCY_SAMPLES = 20
+METAINFO_TIMEOUT_FACTOR = 2  # lookups get twice the time in which 90% of the earlier lookups succeeded
+METAINFO_MIN_TIMEOUT = 10
+METAINFO_MAX_TIMEOUT = 30
+
+MAX_ALERTS_PER_TICK = 1000  # the maximum number of alerts processed in one go, before giving the reactor a turn
+ALERT_STATISTICS_WINDOW = 10  # the number of seconds over which the rate of alerts is determined
+
+
+def _percentile(sorted_values, percent):
+    """
+    Return the nearest-rank percentile of a sorted list, or None if the list is empty.
+    """
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, int(ceil(percent / 100.0 * len(sorted_values))) - 1)]
+
 
 class LibtorrentMgr(TaskManager):
 
@@ -61,7 +85,25 @@ class LibtorrentMgr(TaskManager):
         self.metadata_tmpdir = None
         self.metainfo_requests = {}
         self.metainfo_lock = threading.RLock()
-        self.metainfo_cache = {}
+
+        # Queued metainfo lookups by hex infohash, and a heap of (priority, sequence number, infohash) to start them
+        self.metainfo_queue = {}
+        self.metainfo_queue_heap = []
+        self.metainfo_sequence = 0
+        self.max_metainfo_lookups = METAINFO_MAX_LOOKUPS_MAC if sys.platform == "darwin" else METAINFO_MAX_LOOKUPS
+        self.metainfo_latencies = deque(maxlen=METAINFO_LATENCY_SAMPLES)
+        self.metainfo_stats = {"started": 0, "succeeded": 0, "timed_out": 0, "expired": 0}
+        self.metainfo_cache = MetainfoCache(spill_callback=self._save_spilled_metainfo)
+
+        # Alerts that have been popped from the libtorrent sessions but have not been processed yet
+        self.alert_queue = deque()
+        self.alert_type_names = {}
+        self.alert_handlers = {'torrent_removed_alert': self.on_torrent_removed_alert,
+                               'state_update_alert': self.on_state_update_alert}
+        self.alert_counts = {}
+        self.alert_rates = {}
+        self.alert_window_start = time.time()
+        self.alerts_processed = 0
 
         self.process_alerts_lc = self.register_task("process_alerts", LoopingCall(self._task_process_alerts))
         self.check_reachability_lc = self.register_task("check_reachability", LoopingCall(self._check_reachability))
@@ -82,11 +124,17 @@ class LibtorrentMgr(TaskManager):
 
         self.register_task(u'task_cleanup_metacache',
                            LoopingCall(self._task_cleanup_metainfo_cache)).start(60, now=True)
+        self.register_task(u'task_process_metainfo_queue',
+                           LoopingCall(self._process_metainfo_queue)).start(METAINFO_DHT_NOT_READY_GRACE, now=False)
 
     @blocking_call_on_reactor_thread
     def shutdown(self):
         self.cancel_all_pending_tasks()
 
+        with self.metainfo_lock:
+            self.metainfo_queue.clear()
+            self.metainfo_queue_heap = []
+
         # remove all upnp mapping
         for upnp_handle in self.upnp_mapping_dict.itervalues():
             self.get_session().delete_port_mapping(upnp_handle)
@@ -152,8 +200,7 @@ class LibtorrentMgr(TaskManager):
             ltsession.add_extension(lt.create_smart_ban_plugin)
 
         ltsession.set_settings(settings)
-        ltsession.set_alert_mask(lt.alert.category_t.stats_notification |
-                                 lt.alert.category_t.error_notification |
+        ltsession.set_alert_mask(lt.alert.category_t.error_notification |
                                  lt.alert.category_t.status_notification |
                                  lt.alert.category_t.storage_notification |
                                  lt.alert.category_t.performance_warning |
@@ -293,12 +340,11 @@ class LibtorrentMgr(TaskManager):
             else:
                 raise ValueError('No ti or url key in add_torrent_params')
 
-            # Check if we added this torrent before
-            known = [str(h.info_hash()) for h in ltsession.get_torrents()]
-            if infohash in known:
+            # Check if we added this torrent before, without walking all torrents in the session
+            known_handle = ltsession.find_torrent(lt.big_number(binascii.unhexlify(infohash)))
+            if known_handle.is_valid():
                 self.torrents[infohash] = (torrentdl, ltsession)
-                infohash_bin = binascii.unhexlify(infohash)
-                return ltsession.find_torrent(lt.big_number(infohash_bin))
+                return known_handle
 
             # Otherwise, add it anew
             torrent_handle = ltsession.add_torrent(encode_atp(atp))
@@ -347,39 +393,84 @@ class LibtorrentMgr(TaskManager):
         else:
             self._logger.warning("port mapping method not exposed in libtorrent")
 
+    def get_alert_type(self, alert):
+        """
+        Return the name of the type of a libtorrent alert, e.g. 'torrent_removed_alert'.
+        """
+        alert_class = type(alert)
+        alert_type = self.alert_type_names.get(alert_class)
+        if alert_type is None:
+            alert_type = self.alert_type_names[alert_class] = alert_class.__name__.split(".")[-1]
+        return alert_type
+
     def process_alert(self, alert):
-        alert_type = str(type(alert)).split("'")[1].split(".")[-1]
-        handle = getattr(alert, 'handle', None)
-        if handle and handle.is_valid():
-            infohash = str(handle.info_hash())
-            if infohash in self.torrents:
-                self.torrents[infohash][0].process_alert(alert, alert_type)
-            else:
-                self._logger.debug("LibtorrentMgr: could not find torrent %s", infohash)
-
-        if alert_type == 'torrent_removed_alert':
-            info_hash = str(alert.info_hash)
-            if info_hash in self.torrents:
-                deferred = self.torrents[info_hash][0].deferred_removed
-                del self.torrents[info_hash]
-                deferred.callback(None)
-                self._logger.debug("LibtorrentMgr: ['torrent_removed_alert'] removed torrent %s", info_hash)
-            else:
-                self._logger.debug("LibtorrentMgr: ['torrent_removed_alert'] invalid torrent %s", info_hash)
+        self.process_alerts([alert])
 
-    def get_metainfo(self, infohash_or_magnet, callback, timeout=30, timeout_callback=None, notify=True):
-        if not self.is_dht_ready() and timeout > 5:
-            self._logger.info("DHT not ready, rescheduling get_metainfo")
+    def process_alerts(self, alerts):
+        """
+        Process a batch of alerts. The alerts of every download are handed to that download in one call, in the order
+        in which libtorrent raised them.
+        """
+        download_alerts = OrderedDict()
+        for alert in alerts:
+            alert_type = self.get_alert_type(alert)
+            self.alert_counts[alert_type] = self.alert_counts.get(alert_type, 0) + 1
+
+            handle = getattr(alert, 'handle', None)
+            if handle and handle.is_valid():
+                infohash = str(handle.info_hash())
+                if infohash in download_alerts:
+                    download_alerts[infohash][1].append((alert, alert_type))
+                elif infohash in self.torrents:
+                    download_alerts[infohash] = (self.torrents[infohash][0], [(alert, alert_type)])
+                else:
+                    self._logger.debug("LibtorrentMgr: could not find torrent %s", infohash)
 
-            def schedule_call():
-                random_id = ''.join(random.choice('0123456789abcdef') for _ in xrange(30))
-                self.register_task("schedule_metainfo_lookup_%s" % random_id,
-                                   reactor.callLater(5, lambda i=infohash_or_magnet, c=callback, t=timeout - 5,
-                                                  tcb=timeout_callback, n=notify: self.get_metainfo(i, c, t, tcb, n)))
+            handler = self.alert_handlers.get(alert_type)
+            if handler:
+                handler(alert)
 
-            reactor.callFromThread(schedule_call)
-            return
+        for download, alerts_of_download in download_alerts.itervalues():
+            download.process_alerts(alerts_of_download)
+
+        self.alerts_processed += len(alerts)
+
+    def on_torrent_removed_alert(self, alert):
+        info_hash = str(alert.info_hash)
+        if info_hash in self.torrents:
+            deferred = self.torrents[info_hash][0].deferred_removed
+            del self.torrents[info_hash]
+            deferred.callback(None)
+            self._logger.debug("LibtorrentMgr: ['torrent_removed_alert'] removed torrent %s", info_hash)
+        else:
+            self._logger.debug("LibtorrentMgr: ['torrent_removed_alert'] invalid torrent %s", info_hash)
+
+    def on_state_update_alert(self, alert):
+        """
+        Hand the status snapshots of the torrents that changed since the previous state update to their downloads.
+        """
+        for status in alert.status:
+            handle = status.handle
+            if not handle.is_valid():
+                continue
+            infohash = str(handle.info_hash())
+            if infohash in self.torrents:
+                self.torrents[infohash][0].update_lt_status(status)
 
+    def get_metainfo(self, infohash_or_magnet, callback, timeout=30, timeout_callback=None, notify=True,
+                     priority=METAINFO_PRIORITY_USER):
+        """
+        Fetch the metainfo of a torrent through the DHT and the trackers in the magnet link.
+
+        Lookups are queued and at most max_metainfo_lookups are in flight at the same time. Queued lookups are started
+        in order of priority, requests for a torrent that is already queued or being looked up share one lookup.
+        :param infohash_or_magnet: a binary infohash or a magnet link.
+        :param callback: called with the metainfo dict when it has been fetched.
+        :param timeout: the maximum number of seconds to wait in the queue and for the lookup itself.
+        :param timeout_callback: called with the binary infohash when the metainfo could not be fetched in time.
+        :param notify: whether to notify the progress of the lookup.
+        :param priority: one of the METAINFO_PRIORITY_* values, lower values are looked up first.
+        """
         magnet = infohash_or_magnet if infohash_or_magnet.startswith('magnet') else None
         infohash_bin = infohash_or_magnet if not magnet else parse_magnetlink(magnet)[1]
         infohash = binascii.hexlify(infohash_bin)
@@ -390,55 +481,164 @@ class LibtorrentMgr(TaskManager):
         with self.metainfo_lock:
             self._logger.debug('get_metainfo %s %s %s', infohash_or_magnet, callback, timeout)
 
-            cache_result = self._get_cached_metainfo(infohash)
+            cache_result = self.metainfo_cache.get(infohash)
             if cache_result:
-                callback(deepcopy(cache_result))
-
-            elif infohash not in self.metainfo_requests:
-                # Flags = 4 (upload mode), should prevent libtorrent from creating files
-                atp = {'save_path': self.metadata_tmpdir,
-                       'flags': (lt.add_torrent_params_flags_t.flag_upload_mode)}
-                if magnet:
-                    atp['url'] = magnet
-                else:
-                    atp['info_hash'] = lt.big_number(infohash_bin)
-                try:
-                    handle = self.ltsession_metainfo.add_torrent(encode_atp(atp))
-                except TypeError as e:
-                    self._logger.warning("Failed to add torrent with infohash %s, "
-                                         "attempting to use it as it is and hoping for the best",
-                                         hexlify(infohash_bin))
-                    self._logger.warning("Error was: %s", e)
-                    atp['info_hash'] = infohash_bin
-                    handle = self.ltsession_metainfo.add_torrent(encode_atp(atp))
-
-                if notify:
+                callback(cache_result)
+                return
+
+            request = self.metainfo_requests.get(infohash) or self.metainfo_queue.get(infohash)
+            if request is None:
+                self.metainfo_sequence += 1
+                request = {'magnet': magnet,
+                           'infohash_bin': infohash_bin,
+                           'callbacks': [],
+                           'timeout_callbacks': [],
+                           'notify': notify,
+                           'priority': priority,
+                           'sequence': self.metainfo_sequence,
+                           'deadline': time.time() + timeout}
+                self.metainfo_queue[infohash] = request
+                heappush(self.metainfo_queue_heap, (priority, self.metainfo_sequence, infohash))
+            elif infohash in self.metainfo_requests:
+                if notify and not request['notify']:
+                    # the lookup was started without notifications, so its start has not been announced yet
+                    request['notify'] = True
                     self.notifier.notify(NTFY_TORRENTS, NTFY_MAGNET_STARTED, infohash_bin)
+            else:
+                request['notify'] = request['notify'] or notify
+                if magnet and not request['magnet']:
+                    request['magnet'] = magnet
+                request['deadline'] = max(request['deadline'], time.time() + timeout)
+                if priority < request['priority']:
+                    # the old entry in the heap is skipped because its sequence number does not match anymore
+                    self.metainfo_sequence += 1
+                    request['priority'] = priority
+                    request['sequence'] = self.metainfo_sequence
+                    heappush(self.metainfo_queue_heap, (priority, self.metainfo_sequence, infohash))
+
+            if callback in request['callbacks']:
+                self._logger.debug('get_metainfo duplicate detected, ignoring')
+            else:
+                request['callbacks'].append(callback)
+            if timeout_callback and timeout_callback not in request['timeout_callbacks']:
+                request['timeout_callbacks'].append(timeout_callback)
 
-                self.metainfo_requests[infohash] = {'handle': handle,
-                                                    'callbacks': [callback],
-                                                    'timeout_callbacks': [timeout_callback] if timeout_callback else [],
-                                                    'notify': notify}
+            self._process_metainfo_queue()
 
-                # if the handle is valid and already has metadata which is the case when torrent already exists in
-                # session then metadata_received_alert is not fired so we call self.got_metainfo() directly here
-                if handle.is_valid() and handle.has_metadata():
-                    self.got_metainfo(infohash, timeout=False)
-                    return
+    def _process_metainfo_queue(self):
+        """
+        Start the queued metainfo lookups with the highest priority, as long as there are free lookup slots. While the
+        DHT is not ready, only the lookups that are about to time out in the queue are started. Lookups that have
+        waited in the queue longer than their timeout are not started, their timeout callbacks are called instead.
+        """
+        with self.metainfo_lock:
+            if not self.ltsession_metainfo:
+                return
+
+            current_time = time.time()
+            dht_ready = self.is_dht_ready()
+            postponed = []
+            while self.metainfo_queue_heap and len(self.metainfo_requests) < self.max_metainfo_lookups:
+                entry = heappop(self.metainfo_queue_heap)
+                infohash = entry[2]
+                request = self.metainfo_queue.get(infohash)
+                if request is None or request['sequence'] != entry[1]:
+                    continue
+
+                if not dht_ready and request['deadline'] - current_time > METAINFO_DHT_NOT_READY_GRACE:
+                    postponed.append(entry)
+                    continue
+
+                del self.metainfo_queue[infohash]
+                if request['deadline'] <= current_time:
+                    self.metainfo_stats['expired'] += 1
+                    for callback in request['timeout_callbacks']:
+                        callback(request['infohash_bin'])
+                    continue
+
+                self._start_metainfo_lookup(infohash, request)
+
+            for entry in postponed:
+                heappush(self.metainfo_queue_heap, entry)
+
+    def _start_metainfo_lookup(self, infohash, request):
+        infohash_bin = request['infohash_bin']
+
+        # Flags = 4 (upload mode), should prevent libtorrent from creating files
+        atp = {'save_path': self.metadata_tmpdir,
+               'flags': (lt.add_torrent_params_flags_t.flag_upload_mode)}
+        if request['magnet']:
+            atp['url'] = request['magnet']
+        else:
+            atp['info_hash'] = lt.big_number(infohash_bin)
+        try:
+            handle = self.ltsession_metainfo.add_torrent(encode_atp(atp))
+        except TypeError as e:
+            self._logger.warning("Failed to add torrent with infohash %s, "
+                                 "attempting to use it as it is and hoping for the best",
+                                 hexlify(infohash_bin))
+            self._logger.warning("Error was: %s", e)
+            atp['info_hash'] = infohash_bin
+            handle = self.ltsession_metainfo.add_torrent(encode_atp(atp))
+
+        if request['notify']:
+            self.notifier.notify(NTFY_TORRENTS, NTFY_MAGNET_STARTED, infohash_bin)
+
+        request['handle'] = handle
+        request['start_time'] = time.time()
+        self.metainfo_requests[infohash] = request
+        self.metainfo_stats['started'] += 1
+
+        # if the handle is valid and already has metadata which is the case when torrent already exists in
+        # session then metadata_received_alert is not fired so we call self.got_metainfo() directly here
+        if handle.is_valid() and handle.has_metadata():
+            self.got_metainfo(infohash, timeout=False)
+            return
 
-                def schedule_call():
-                    random_id = ''.join(random.choice('0123456789abcdef') for _ in xrange(30))
-                    self.register_task("schedule_got_metainfo_lookup_%s" % random_id,
-                                       reactor.callLater(timeout, lambda: self.got_metainfo(infohash, timeout=True)))
+        # the time the lookup has waited in the queue counts towards its timeout
+        timeout = self.get_metainfo_lookup_timeout(max(0, request['deadline'] - time.time()))
 
-                reactor.callFromThread(schedule_call)
-            else:
-                self.metainfo_requests[infohash]['notify'] = self.metainfo_requests[infohash]['notify'] and notify
-                callbacks = self.metainfo_requests[infohash]['callbacks']
-                if callback not in callbacks:
-                    callbacks.append(callback)
-                else:
-                    self._logger.debug('get_metainfo duplicate detected, ignoring')
+        def on_timeout():
+            # a later lookup of the same torrent should not be stopped by the timeout of this one
+            if self.metainfo_requests.get(infohash) is request:
+                self.got_metainfo(infohash, timeout=True)
+
+        def schedule_call():
+            random_id = ''.join(random.choice('0123456789abcdef') for _ in xrange(30))
+            self.register_task("schedule_got_metainfo_lookup_%s" % random_id, reactor.callLater(timeout, on_timeout))
+
+        reactor.callFromThread(schedule_call)
+
+    def get_metainfo_lookup_timeout(self, timeout):
+        """
+        Return the timeout of a metainfo lookup. Once enough lookups have succeeded, lookups are given a multiple of
+        the time in which most earlier lookups succeeded, bounded by the timeout that was requested.
+        """
+        if len(self.metainfo_latencies) < METAINFO_MIN_LATENCY_SAMPLES:
+            return timeout
+        latency = _percentile(sorted(self.metainfo_latencies), 90)
+        return min(timeout, max(METAINFO_MIN_TIMEOUT, METAINFO_TIMEOUT_FACTOR * latency))
+
+    def get_metainfo_lookup_statistics(self):
+        """
+        Return statistics on the metainfo lookups: the number of queued lookups per priority, the number of lookups
+        in flight, counters and percentiles of the time it took to fetch metainfo.
+        """
+        with self.metainfo_lock:
+            queued = {}
+            for request in self.metainfo_queue.itervalues():
+                queued[request['priority']] = queued.get(request['priority'], 0) + 1
+            latencies = sorted(self.metainfo_latencies)
+
+            statistics = {"queued": queued,
+                          "in_flight": len(self.metainfo_requests),
+                          "max_in_flight": self.max_metainfo_lookups,
+                          "latency_p50": _percentile(latencies, 50),
+                          "latency_p90": _percentile(latencies, 90),
+                          "latency_p99": _percentile(latencies, 99),
+                          "timeout": self.get_metainfo_lookup_timeout(METAINFO_MAX_TIMEOUT)}
+            statistics.update(self.metainfo_stats)
+            return statistics
 
     def got_metainfo(self, infohash, timeout=False):
         with self.metainfo_lock:
@@ -480,15 +680,16 @@ class LibtorrentMgr(TaskManager):
                         metainfo["leechers"] = leechers
                         metainfo["seeders"] = seeders
 
-                        self._add_cached_metainfo(infohash, metainfo)
+                        self.metainfo_cache.put(infohash, metainfo)
 
+                        # every callback gets its own copy of the metainfo
+                        metainfo_data = lt.bencode(metainfo)
                         for callback in callbacks:
-                            callback(deepcopy(metainfo))
+                            callback(lt.bdecode(metainfo_data))
 
                         # let's not print the hashes of the pieces
-                        debuginfo = deepcopy(metainfo)
-                        del debuginfo['info']['pieces']
-                        self._logger.debug('got_metainfo result %s', debuginfo)
+                        self._logger.debug('got_metainfo result %s',
+                                           dict((key, value) for key, value in metainfo.iteritems() if key != 'info'))
 
                     elif timeout_callbacks and timeout:
                         for callback in timeout_callbacks:
@@ -499,27 +700,45 @@ class LibtorrentMgr(TaskManager):
                     if notify:
                         self.notifier.notify(NTFY_TORRENTS, NTFY_MAGNET_CLOSE, infohash_bin)
 
-    def _get_cached_metainfo(self, infohash):
-        if infohash in self.metainfo_cache:
-            return self.metainfo_cache[infohash]['meta_info']
+                if timeout:
+                    self.metainfo_stats['timed_out'] += 1
+                else:
+                    self.metainfo_stats['succeeded'] += 1
+                    if 'start_time' in request_dict:
+                        self.metainfo_latencies.append(time.time() - request_dict['start_time'])
 
-    def _add_cached_metainfo(self, infohash, metainfo):
-        self.metainfo_cache[infohash] = {'time': time.time(),
-                                         'meta_info': metainfo}
+                # a lookup slot is free again
+                self._process_metainfo_queue()
 
     def _task_cleanup_metainfo_cache(self):
-        oldest_time = time.time() - METAINFO_CACHE_PERIOD
+        with self.metainfo_lock:
+            self.metainfo_cache.expire()
+
+    def _save_spilled_metainfo(self, infohash, torrent_data):
+        """
+        Save a torrent that is evicted from the metainfo cache as a collected torrent. This marks it as collected in
+        the database, so it is cleaned up from the torrent store together with the other collected torrents.
+        """
+        rtorrent_handler = self.trsession.lm.rtorrent_handler
+        if rtorrent_handler is None:
+            return
 
-        for info_hash, values in self.metainfo_cache.items():
-            last_time, metainfo = values
-            if last_time < oldest_time:
-                del self.metainfo_cache[info_hash]
+        try:
+            tdef = TorrentDef.load_from_dict(lt.bdecode(torrent_data))
+        except ValueError as e:
+            self._logger.warning("Not saving invalid metainfo of %s: %s", infohash, e)
+            return
+        rtorrent_handler.save_torrent(tdef)
 
     def _task_process_alerts(self):
-        for ltsession in self.ltsessions.itervalues():
-            if ltsession:
-                for alert in ltsession.pop_alerts():
-                    self.process_alert(alert)
+        # Popping alerts frees the alerts of the previous pop, so new alerts are only popped once the queue is drained
+        if not self.alert_queue:
+            for ltsession in self.ltsessions.itervalues():
+                if ltsession:
+                    self.alert_queue.extend(ltsession.pop_alerts())
+                    # The status of the torrents that changed arrives in a state_update_alert with the next alerts
+                    ltsession.post_torrent_updates()
+            self._process_alert_queue()
 
         # We have a separate session for metainfo requests.
         # For this session we are only interested in the metadata_received_alert.
@@ -528,6 +747,33 @@ class LibtorrentMgr(TaskManager):
                 if isinstance(alert, lt.metadata_received_alert):
                     self.got_metainfo(str(alert.handle.info_hash()))
 
+    def _process_alert_queue(self):
+        """
+        Process at most MAX_ALERTS_PER_TICK queued alerts, the remaining alerts are processed in the next reactor tick.
+        """
+        alerts = [self.alert_queue.popleft() for _ in xrange(min(len(self.alert_queue), MAX_ALERTS_PER_TICK))]
+        self.process_alerts(alerts)
+
+        current_time = time.time()
+        if current_time - self.alert_window_start >= ALERT_STATISTICS_WINDOW:
+            elapsed = current_time - self.alert_window_start
+            self.alert_rates = dict((alert_type, count / elapsed) for alert_type, count in self.alert_counts.iteritems())
+            self.alert_counts = {}
+            self.alert_window_start = current_time
+
+        if self.alert_queue and not self.is_pending_task_active(u"process_alert_queue"):
+            self.register_task(u"process_alert_queue", reactor.callLater(0, self._process_alert_queue))
+
+    def get_alert_statistics(self):
+        """
+        Return the number of alerts per second of every alert type, the number of alerts waiting to be processed and
+        the total number of processed alerts.
+        """
+        return {"alerts_per_second": self.alert_rates,
+                "queued": len(self.alert_queue),
+                "processed": self.alerts_processed,
+                "max_alerts_per_tick": MAX_ALERTS_PER_TICK}
+
     def _check_reachability(self):
         if self.get_session() and self.get_session().status().has_incoming_connections:
             self.notifier.notify(NTFY_REACHABLE, NTFY_INSERT, None, '')
@@ -0,0 +1,166 @@
+"""
+Store of the persistent state of downloads.
+"""
+import binascii
+import glob
+import logging
+import os
+from hashlib import sha1
+from StringIO import StringIO
+
+from libtorrent import bdecode, bencode
+from twisted.internet.task import LoopingCall
+
+from Tribler.Core.Utilities.configparser import CallbackConfigParser
+from Tribler.Core.leveldbstore import LevelDbStore
+from Tribler.dispersy.taskmanager import TaskManager
+
+CHECKPOINT_FLUSH_INTERVAL = 10
+
+# The options of a pstate that are stored bencoded instead of as text
+BINARY_PSTATE_OPTIONS = ('metainfo', 'engineresumedata')
+
+# Stored for checkpoints that could not be parsed, LevelDB does not distinguish empty values from missing keys
+INVALID_CHECKPOINT = 'de'
+
+
+class CheckpointStore(TaskManager):
+    """
+    Keeps the pstate of every download in a single LevelDB database, keyed by binary infohash.
+
+    The download config is stored as text, the metainfo and the libtorrent resume data are stored bencoded. Checkpoints
+    are collected in memory and written to the database in one atomic batch every CHECKPOINT_FLUSH_INTERVAL seconds.
+    Checkpoints that did not change since they were last stored are not written again.
+    """
+
+    def __init__(self, store_dir):
+        super(CheckpointStore, self).__init__()
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self._store = LevelDbStore(store_dir)
+        # The infohashes of all checkpoints, so counting and listing them does not need to scan the database
+        self._infohashes = set(self._store.keys())
+        # The digests of the stored checkpoints, to skip writing checkpoints that did not change
+        self._digests = {}
+
+        self.register_task("flush checkpoints", LoopingCall(self.flush)).start(CHECKPOINT_FLUSH_INTERVAL, now=False)
+
+    def __contains__(self, infohash):
+        return infohash in self._infohashes
+
+    def __len__(self):
+        return len(self._infohashes)
+
+    def get_infohashes(self):
+        """
+        Return the infohashes of all stored checkpoints.
+        """
+        return list(self._infohashes)
+
+    def get(self, infohash):
+        """
+        Return the pstate of a download as a CallbackConfigParser. Returns None if there is no valid checkpoint of
+        the download. Called by any thread.
+        """
+        try:
+            data = self._store[infohash]
+        except KeyError:
+            return None
+
+        self._digests[infohash] = sha1(data).digest()
+        if data == INVALID_CHECKPOINT:
+            return None
+
+        try:
+            return self._decode_pstate(data)
+        except Exception:
+            self._logger.exception("Could not decode the checkpoint of %s", binascii.hexlify(infohash))
+            return None
+
+    def put(self, infohash, pstate):
+        """
+        Store the pstate of a download, the checkpoint is written to disk with the next flush.
+        """
+        self._put_data(infohash, self._encode_pstate(pstate))
+
+    def _put_data(self, infohash, data):
+        digest = sha1(data).digest()
+        if self._digests.get(infohash) != digest:
+            self._digests[infohash] = digest
+            self._store[infohash] = data
+            self._infohashes.add(infohash)
+
+    def delete(self, infohash):
+        self._digests.pop(infohash, None)
+        if infohash in self._infohashes:
+            self._infohashes.discard(infohash)
+            del self._store[infohash]
+
+    def flush(self):
+        """
+        Write all pending checkpoints to the database in one batch.
+        """
+        return self._store.flush()
+
+    def close(self):
+        self.cancel_all_pending_tasks()
+        return self._store.close()
+
+    def migrate(self, pstate_dir):
+        """
+        Move the .state files of the downloads in a directory into the store. Checkpoints that cannot be parsed are
+        stored without a pstate, so the download can still be resumed from the torrent store.
+        :return: the number of migrated checkpoints.
+        """
+        filenames = glob.glob(os.path.join(pstate_dir, '*.state'))
+        for filename in filenames:
+            try:
+                infohash = binascii.unhexlify(os.path.basename(filename)[:-6])
+            except TypeError:
+                self._logger.warning("Ignoring checkpoint with an invalid name %s", filename)
+                continue
+
+            if infohash in self:
+                continue
+
+            try:
+                pstate = CallbackConfigParser()
+                pstate.read_file(filename)
+                data = self._encode_pstate(pstate)
+            except Exception:
+                self._logger.warning("Could not parse checkpoint %s, storing it without pstate", filename)
+                data = INVALID_CHECKPOINT
+            self._put_data(infohash, data)
+
+        self.flush()
+        for filename in filenames:
+            os.remove(filename)
+
+        if filenames:
+            self._logger.info("Migrated %d checkpoints from %s", len(filenames), pstate_dir)
+        return len(filenames)
+
+    @staticmethod
+    def _encode_pstate(pstate):
+        binary_options = {}
+        config = pstate.copy()
+        for option in BINARY_PSTATE_OPTIONS:
+            value = config.get('state', option)
+            # The metainfo of a torrent without metainfo is not bencodable, it stays in the config
+            if isinstance(value, dict) and (option != 'metainfo' or 'info' in value):
+                binary_options[option] = value
+                config.remove_option('state', option)
+
+        config_file = StringIO()
+        config.write(config_file)
+        binary_options['config'] = config_file.getvalue().encode('utf-8')
+        return bencode(binary_options)
+
+    @staticmethod
+    def _decode_pstate(data):
+        checkpoint = bdecode(data)
+        pstate = CallbackConfigParser()
+        pstate.readfp(StringIO(checkpoint['config'].decode('utf-8')))
+        for option in BINARY_PSTATE_OPTIONS:
+            if option in checkpoint:
+                pstate.set('state', option, checkpoint[option])
+        return pstate
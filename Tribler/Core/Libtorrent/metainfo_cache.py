@@ -0,0 +1,128 @@
+"""
+Cache of the metainfo that is fetched by the LibtorrentMgr.
+"""
+from collections import OrderedDict
+from time import time
+
+from libtorrent import bdecode, bencode
+
+DEFAULT_METAINFO_CACHE_SIZE = 16 * 1024 * 1024
+DEFAULT_METAINFO_CACHE_TTL = 5 * 60
+
+# The keys of a metainfo dict that describe the swarm at the time of the lookup, rather than the torrent itself
+VOLATILE_METAINFO_KEYS = ("initial peers", "leechers", "seeders")
+
+
+class MetainfoCache(object):
+    """
+    Caches fetched metainfo by hex encoded infohash. The torrent part of the metainfo is kept bencoded and is decoded
+    into a new dict on every hit, so callers are free to modify the metainfo they are handed.
+
+    The cache is bounded by the number of bencoded bytes, the least recently used entries are evicted when it is full.
+    Evicted and expired entries are handed to the spill callback if one is given, with the hex encoded infohash and
+    the bencoded torrent, so the torrent is not lost.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_METAINFO_CACHE_SIZE, ttl=DEFAULT_METAINFO_CACHE_TTL, spill_callback=None):
+        super(MetainfoCache, self).__init__()
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.spill_callback = spill_callback
+
+        # infohash -> (insert time, bencoded torrent, volatile metainfo)
+        self._entries = OrderedDict()
+        self._size = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.spills = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, infohash):
+        return infohash in self._entries
+
+    def get(self, infohash):
+        """
+        Return a copy of the cached metainfo of a torrent, or None if it is not available.
+        """
+        entry = self._entries.get(infohash)
+        if entry is not None and entry[0] + self.ttl < time():
+            self._remove(infohash, spill=True)
+            self.expirations += 1
+            entry = None
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        # Mark this entry as the most recently used one
+        del self._entries[infohash]
+        self._entries[infohash] = entry
+
+        metainfo = bdecode(entry[1])
+        metainfo.update((key, list(value) if isinstance(value, list) else value)
+                        for key, value in entry[2].iteritems())
+        return metainfo
+
+    def put(self, infohash, metainfo):
+        """
+        Store the metainfo of a torrent.
+        """
+        self._remove(infohash)
+
+        torrent = dict((key, value) for key, value in metainfo.iteritems() if key not in VOLATILE_METAINFO_KEYS)
+        volatile = dict((key, value) for key, value in metainfo.iteritems() if key in VOLATILE_METAINFO_KEYS)
+        torrent_data = bencode(torrent)
+        if len(torrent_data) > self.max_bytes:
+            self._spill(infohash, torrent_data)
+            return
+
+        while self._entries and self._size + len(torrent_data) > self.max_bytes:
+            self._remove(next(iter(self._entries)), spill=True)
+            self.evictions += 1
+
+        self._entries[infohash] = (time(), torrent_data, volatile)
+        self._size += len(torrent_data)
+
+    def expire(self):
+        """
+        Remove all entries that are older than the TTL of the cache.
+        """
+        oldest_time = time() - self.ttl
+        for infohash, entry in self._entries.items():
+            if entry[0] < oldest_time:
+                self._remove(infohash, spill=True)
+                self.expirations += 1
+
+    def clear(self):
+        self._entries.clear()
+        self._size = 0
+
+    def _remove(self, infohash, spill=False):
+        entry = self._entries.pop(infohash, None)
+        if entry is None:
+            return
+
+        self._size -= len(entry[1])
+        if spill:
+            self._spill(infohash, entry[1])
+
+    def _spill(self, infohash, torrent_data):
+        if self.spill_callback is not None:
+            self.spill_callback(infohash, torrent_data)
+            self.spills += 1
+
+    def get_statistics(self):
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "spills": self.spills,
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes}
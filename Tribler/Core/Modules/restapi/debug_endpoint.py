@@ -35,7 +35,8 @@ class DebugEndpoint(resource.Resource):
         child_handler_dict = {"circuits": DebugCircuitsEndpoint, "open_files": DebugOpenFilesEndpoint,
                               "open_sockets": DebugOpenSocketsEndpoint, "threads": DebugThreadsEndpoint,
                               "cpu": DebugCPUEndpoint, "memory": DebugMemoryEndpoint,
-                              "log": DebugLogEndpoint}
+                              "log": DebugLogEndpoint, "metainfo_cache": DebugMetainfoCacheEndpoint,
+                              "metainfo_lookups": DebugMetainfoLookupsEndpoint, "alerts": DebugAlertsEndpoint}
 
         for path, child_cls in child_handler_dict.iteritems():
             self.putChild(path, child_cls(session))
@@ -464,3 +465,143 @@ class DebugLogEndpoint(resource.Resource):
             block_counter -= 1
 
         return ''.join(lines_found[-lines:])
+
+
+class DebugMetainfoCacheEndpoint(resource.Resource):
+    """
+    This class handles requests for statistics about the metainfo cache of the libtorrent manager.
+    """
+
+    def __init__(self, session):
+        resource.Resource.__init__(self)
+        self.session = session
+
+    def render_GET(self, request):
+        """
+        .. http:get:: /debug/metainfo_cache
+
+        A GET request to this endpoint returns the hit, miss and eviction counters and the size of the metainfo cache.
+
+            **Example request**:
+
+            .. sourcecode:: none
+
+                curl -X GET http://localhost:8085/debug/metainfo_cache
+
+            **Example response**:
+
+            .. sourcecode:: javascript
+
+                {
+                    "metainfo_cache": {
+                        "hits": 12,
+                        "misses": 140,
+                        "evictions": 3,
+                        "expirations": 98,
+                        "spills": 101,
+                        "entries": 39,
+                        "bytes": 2384923,
+                        "max_bytes": 16777216
+                    }
+                }
+        """
+        if not self.session.lm.ltmgr:
+            request.setResponseCode(http.NOT_FOUND)
+            return json.dumps({"error": "libtorrent is not enabled"})
+
+        return json.dumps({"metainfo_cache": self.session.lm.ltmgr.metainfo_cache.get_statistics()})
+
+
+class DebugMetainfoLookupsEndpoint(resource.Resource):
+    """
+    This class handles requests for statistics about the metainfo lookups of the libtorrent manager.
+    """
+
+    def __init__(self, session):
+        resource.Resource.__init__(self)
+        self.session = session
+
+    def render_GET(self, request):
+        """
+        .. http:get:: /debug/metainfo_lookups
+
+        A GET request to this endpoint returns the number of queued metainfo lookups per priority, the number of
+        lookups in flight, counters of the finished lookups and the percentiles of the time it took to fetch metainfo
+        (in seconds). The timeout is the time a new lookup currently gets at most.
+
+            **Example request**:
+
+            .. sourcecode:: none
+
+                curl -X GET http://localhost:8085/debug/metainfo_lookups
+
+            **Example response**:
+
+            .. sourcecode:: javascript
+
+                {
+                    "metainfo_lookups": {
+                        "queued": {"1": 12, "2": 3},
+                        "in_flight": 10,
+                        "max_in_flight": 10,
+                        "started": 534,
+                        "succeeded": 341,
+                        "timed_out": 183,
+                        "expired": 20,
+                        "latency_p50": 3.2,
+                        "latency_p90": 9.8,
+                        "latency_p99": 24.1,
+                        "timeout": 19.6
+                    }
+                }
+        """
+        if not self.session.lm.ltmgr:
+            request.setResponseCode(http.NOT_FOUND)
+            return json.dumps({"error": "libtorrent is not enabled"})
+
+        return json.dumps({"metainfo_lookups": self.session.lm.ltmgr.get_metainfo_lookup_statistics()})
+
+
+class DebugAlertsEndpoint(resource.Resource):
+    """
+    This class handles requests for statistics about the libtorrent alerts processed by the libtorrent manager.
+    """
+
+    def __init__(self, session):
+        resource.Resource.__init__(self)
+        self.session = session
+
+    def render_GET(self, request):
+        """
+        .. http:get:: /debug/alerts
+
+        A GET request to this endpoint returns the number of libtorrent alerts per second of every alert type, the
+        number of alerts waiting to be processed and the total number of processed alerts.
+
+            **Example request**:
+
+            .. sourcecode:: none
+
+                curl -X GET http://localhost:8085/debug/alerts
+
+            **Example response**:
+
+            .. sourcecode:: javascript
+
+                {
+                    "alerts": {
+                        "alerts_per_second": {
+                            "stats_alert": 412.3,
+                            "state_changed_alert": 1.2
+                        },
+                        "queued": 0,
+                        "processed": 832421,
+                        "max_alerts_per_tick": 1000
+                    }
+                }
+        """
+        if not self.session.lm.ltmgr:
+            request.setResponseCode(http.NOT_FOUND)
+            return json.dumps({"error": "libtorrent is not enabled"})
+
+        return json.dumps({"alerts": self.session.lm.ltmgr.get_alert_statistics()})
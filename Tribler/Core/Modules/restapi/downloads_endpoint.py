@@ -1,6 +1,9 @@
-import os
-
 import logging
+import threading
+from collections import OrderedDict
+from time import time
+
+from twisted.internet import reactor
 from twisted.web import http, resource
 from twisted.web.server import NOT_DONE_YET
 from Tribler.Core.DownloadConfig import DownloadStartupConfig
@@ -9,7 +12,10 @@ from Tribler.Core.Modules.restapi.util import return_handled_exception
 from Tribler.Core.TorrentDef import TorrentDef, TorrentDefNoMetainfo
 import Tribler.Core.Utilities.json_util as json
 
-from Tribler.Core.simpledefs import DOWNLOAD, UPLOAD, dlstatus_strings, NTFY_TORRENTS, DLMODE_VOD
+from Tribler.Core.simpledefs import DOWNLOAD, UPLOAD, dlstatus_strings, NTFY_TORRENT, DLMODE_VOD, NTFY_STATE
+
+# The number of removed downloads that is remembered, clients with an older token get all downloads again
+MAX_REMOVED_DOWNLOADS = 1000
 
 
 def _safe_extended_peer_info(ext_peer_info):
@@ -88,18 +94,115 @@ class DownloadBaseEndpoint(resource.Resource):
         return download_config, None
 
 
+class DownloadChangeTracker(object):
+    """
+    Keeps track of the JSON representation of the downloads, so clients can fetch the downloads that have changed
+    since an earlier response instead of all downloads. Every update in which something changed gets a new token and
+    every field of a download remembers the token of the update in which it last changed.
+    """
+
+    def __init__(self, max_removed=MAX_REMOVED_DOWNLOADS):
+        self.lock = threading.Lock()
+        # Tokens start at the current time in milliseconds, so tokens of a previous run are older than oldest_token
+        self.token = int(time() * 1000)
+        self.oldest_token = self.token
+        self.max_removed = max_removed
+        self.downloads = {}
+        self.removed = OrderedDict()
+
+    def update(self, downloads_json, infohashes=None):
+        """
+        Compare the JSON representation of downloads with the previous one.
+        :param downloads_json: A list with the JSON representation of the downloads that may have changed.
+        :param infohashes: The hex encoded infohashes of all current downloads, the other downloads have been removed.
+        By default, these are the infohashes of the downloads in downloads_json.
+        :return: A tuple with the current token, the changed fields of every changed download and the infohashes of
+        the removed downloads.
+        """
+        if infohashes is None:
+            infohashes = [download_json["infohash"] for download_json in downloads_json]
+
+        with self.lock:
+            token = self.token + 1
+            changed_downloads = []
+            for download_json in downloads_json:
+                infohash = download_json["infohash"]
+                self.removed.pop(infohash, None)
+                fields = self.downloads.setdefault(infohash, {})
+
+                changed_fields = {}
+                for field, value in download_json.iteritems():
+                    if field not in fields or fields[field][0] != value:
+                        fields[field] = (value, token)
+                        changed_fields[field] = value
+                if changed_fields:
+                    changed_fields["infohash"] = infohash
+                    changed_downloads.append(changed_fields)
+
+            current_infohashes = set(infohashes)
+            removed = [removed_infohash for removed_infohash in self.downloads
+                       if removed_infohash not in current_infohashes]
+            for removed_infohash in removed:
+                del self.downloads[removed_infohash]
+                self.removed[removed_infohash] = token
+            while len(self.removed) > self.max_removed:
+                _, self.oldest_token = self.removed.popitem(last=False)
+
+            if changed_downloads or removed:
+                self.token = token
+            return self.token, changed_downloads, removed
+
+    def get_changes(self, since):
+        """
+        Return the changes since the update with the given token.
+        :param since: A token returned by update.
+        :return: A tuple with the changed fields of every changed download and the infohashes of the removed downloads,
+        or None when the changes since this token are not known anymore.
+        """
+        with self.lock:
+            if since is None or not self.oldest_token <= since <= self.token:
+                return None
+
+            changed_downloads = []
+            for infohash, fields in self.downloads.iteritems():
+                changed_fields = dict((field, value) for field, (value, token) in fields.iteritems() if token > since)
+                if changed_fields:
+                    changed_fields["infohash"] = infohash
+                    changed_downloads.append(changed_fields)
+            return changed_downloads, [removed_infohash for removed_infohash, token in self.removed.iteritems()
+                                       if token > since]
+
+    def get_downloads(self):
+        """
+        Return the JSON representation of all downloads, as of the last update.
+        """
+        with self.lock:
+            return [dict((field, value) for field, (value, _) in fields.iteritems())
+                    for fields in self.downloads.itervalues()]
+
+
 class DownloadsEndpoint(DownloadBaseEndpoint):
     """
     This endpoint is responsible for all requests regarding downloads. Examples include getting all downloads,
     starting, pausing and stopping downloads.
     """
 
+    def __init__(self, session):
+        DownloadBaseEndpoint.__init__(self, session)
+        self.events_endpoint = None
+        self.static_download_info = {}
+        self.download_state_keys = {}
+        self.download_changes = DownloadChangeTracker()
+        self.update_lock = threading.Lock()
+        self.last_event_token = None
+        self.session.add_observer(self.on_download_states, NTFY_TORRENT, [NTFY_STATE])
+
     def getChild(self, path, request):
         return DownloadSpecificEndpoint(self.session, path)
 
     def render_GET(self, request):
         """
-        .. http:get:: /downloads?get_peers=(boolean: get_peers)&get_pieces=(boolean: get_pieces)
+        .. http:get:: /downloads?get_peers=(boolean: get_peers)&get_pieces=(boolean: get_pieces)&since=(int: token)
 
         A GET request to this endpoint returns all downloads in Tribler, both active and inactive. The progress is a
         number ranging from 0 to 1, indicating the progress of the specific state (downloading, checking etc). The
@@ -110,6 +213,15 @@ class DownloadsEndpoint(DownloadBaseEndpoint):
         Note that setting this flag has a negative impact on performance and should only be used in situations
         where this data is required.
 
+        Clients that fetch the downloads regularly can pass the token of their previous response in the since
+        parameter. The response then only contains the downloads that changed since that response, with only the
+        fields that changed and the infohash, together with the infohashes of the downloads that have been removed.
+        These responses are served from the download states that are collected periodically, only downloads of which
+        the state changed are looked at again.
+        Pass since=0 to get all downloads and a first token. If the changes since a token are not known anymore, all
+        downloads are returned and full is set to True. The same changes are pushed as downloads_changed events over
+        the events endpoint.
+
             **Example request**:
 
             .. sourcecode:: none
@@ -170,6 +282,27 @@ class DownloadsEndpoint(DownloadBaseEndpoint):
                         "time_added": 1484819242,
                     }
                 }, ...]
+
+            **Example request**:
+
+            .. sourcecode:: none
+
+                curl -X GET http://localhost:8085/downloads?since=1484819242000
+
+            **Example response**:
+
+            .. sourcecode:: javascript
+
+                {
+                    "token": 1484819242042,
+                    "full": False,
+                    "downloads": [{
+                        "infohash": "4344503b7e797ebf31582327a5baae35b11bda01",
+                        "progress": 0.31459265,
+                        "speed_down": 4938.83
+                    }, ...],
+                    "removed": ["0b9a6e6dbb2b83e4eaed4e2b3c3a1e7e0a7e2cbe"]
+                }
         """
         get_peers = False
         if 'get_peers' in request.args and len(request.args['get_peers']) > 0 \
@@ -181,68 +314,176 @@ class DownloadsEndpoint(DownloadBaseEndpoint):
                 and request.args['get_pieces'][0] == "1":
             get_pieces = True
 
-        downloads_json = []
+        since = None
+        if 'since' in request.args and len(request.args['since']) > 0:
+            if not request.args['since'][0].isdigit():
+                request.setResponseCode(http.BAD_REQUEST)
+                return json.dumps({"error": "since parameter should be a token returned by this endpoint"})
+            since = int(request.args['since'][0])
+
+        if since is None:
+            downloads_json = []
+            for download in self.session.get_downloads():
+                state = download.network_get_state(None, get_peers)
+                download_json = self.get_download_json(download, state)
+                self.add_peers_and_pieces(download, state, download_json, get_peers, get_pieces)
+                downloads_json.append(download_json)
+            return json.dumps({"downloads": downloads_json})
+
         downloads = self.session.get_downloads()
-        for download in downloads:
-            stats = download.network_create_statistics_reponse() or LibtorrentStatisticsResponse(0, 0, 0, 0, 0, 0, 0)
-            state = download.network_get_state(None, get_peers)
-
-            # Create files information of the download
-            files_completion = dict((name, progress) for name, progress in state.get_files_completion())
-            selected_files = download.get_selected_files()
-            files_array = []
-            file_index = 0
-            for file, size in download.get_def().get_files_with_length():
-                files_array.append({"index": file_index, "name": file, "size": size,
-                                    "included": (file in selected_files or not selected_files),
-                                    "progress": files_completion.get(file, 0.0)})
-                file_index += 1
-
-            # Create tracker information of the download
-            tracker_info = []
-            for url, url_info in download.network_tracker_status().iteritems():
-                tracker_info.append({"url": url, "peers": url_info[0], "status": url_info[1]})
-
-            ratio = 0.0
-            if stats.downTotal > 0:
-                ratio = stats.upTotal / float(stats.downTotal)
-
-            download_json = {"name": download.get_def().get_name(), "progress": download.get_progress(),
-                             "infohash": download.get_def().get_infohash().encode('hex'),
-                             "speed_down": download.get_current_speed(DOWNLOAD),
-                             "speed_up": download.get_current_speed(UPLOAD),
-                             "status": dlstatus_strings[download.get_status()],
-                             "size": download.get_def().get_length(), "eta": download.network_calc_eta(),
-                             "num_peers": stats.numPeers, "num_seeds": stats.numSeeds, "total_up": stats.upTotal,
-                             "total_down": stats.downTotal, "ratio": ratio,
-                             "files": files_array, "trackers": tracker_info, "hops": download.get_hops(),
-                             "anon_download": download.get_anon_mode(), "safe_seeding": download.get_safe_seeding(),
-                             "max_upload_speed": download.get_max_speed(UPLOAD),
-                             "max_download_speed": download.get_max_speed(DOWNLOAD),
-                             "destination": download.get_dest_dir(), "availability": state.get_availability(),
-                             "total_pieces": download.get_num_pieces(), "vod_mode": download.get_mode() == DLMODE_VOD,
-                             "vod_prebuffering_progress": state.get_vod_prebuffering_progress(),
-                             "vod_prebuffering_progress_consec": state.get_vod_prebuffering_progress_consec(),
-                             "error": repr(state.get_error()) if state.get_error() else "",
-                             "time_added": download.get_time_added()}
-
-            # Add peers information if requested
-            if get_peers:
-                peer_list = state.get_peerlist()
-                for peer_info in peer_list:  # Remove have field since it is very large to transmit.
-                    del peer_info['have']
-                    if 'extended_version' in peer_info:
-                        peer_info['extended_version'] = _safe_extended_peer_info(peer_info['extended_version'])
-                    peer_info['id'] = peer_info['id'].encode('hex')
-
-                download_json["peers"] = peer_list
-
-            # Add piece information if requested
-            if get_pieces:
-                download_json["pieces"] = download.get_pieces_base64()
-
-            downloads_json.append(download_json)
-        return json.dumps({"downloads": downloads_json})
+        token = self.update_download_changes(downloads)
+        changes = self.download_changes.get_changes(since)
+        full = changes is None
+        changed_downloads, removed = (self.download_changes.get_downloads(), []) if full else changes
+
+        # Peers and pieces change all the time, they are added to the downloads in the response without comparing them
+        if get_peers or get_pieces:
+            downloads_by_infohash = dict((download.get_def().get_infohash().encode('hex'), download)
+                                         for download in downloads)
+            for download_json in changed_downloads:
+                download = downloads_by_infohash.get(download_json["infohash"])
+                if download:
+                    state = download.network_get_state(None, True) if get_peers else None
+                    self.add_peers_and_pieces(download, state, download_json, get_peers, get_pieces)
+
+        return json.dumps({"token": token, "full": full, "downloads": changed_downloads, "removed": removed})
+
+    def update_download_changes(self, downloads, states=None):
+        """
+        Update the change tracker with the current downloads and return its token. The JSON representation of a
+        download is only created again when the state key of the download changed.
+        :param downloads: All current downloads.
+        :param states: An optional dictionary with already collected download states, by binary infohash.
+        """
+        with self.update_lock:
+            changed_downloads = []
+            state_keys = {}
+            for download in downloads:
+                infohash = download.get_def().get_infohash()
+                state_keys[infohash] = state_key = self.get_download_state_key(download)
+                if self.download_state_keys.get(infohash) != state_key:
+                    state = (states or {}).get(infohash) or download.network_get_state(None, False)
+                    changed_downloads.append(self.get_download_json(download, state))
+            self.download_state_keys = state_keys
+            self.prune_static_download_info(state_keys)
+
+            token, _, _ = self.download_changes.update(changed_downloads,
+                                                       [key.encode('hex') for key in state_keys])
+            return token
+
+    @staticmethod
+    def get_download_state_key(download):
+        """
+        Return the values that tell whether the JSON representation of a download has to be created again. Anything
+        reported by libtorrent is covered by the state version of the download, the rest are settings of the download.
+        """
+        return (download.get_state_version(), download.get_def(), download.get_status(), download.get_mode(),
+                download.get_hops(), download.get_anon_mode(), download.get_safe_seeding(),
+                download.get_max_speed(UPLOAD), download.get_max_speed(DOWNLOAD), download.get_dest_dir(),
+                tuple(download.get_selected_files()))
+
+    def get_static_download_info(self, download):
+        """
+        Return the parts of the JSON representation of a download that only depend on its torrent definition. These
+        are computed once for every TorrentDef, the definition of a download is replaced when its metainfo arrives.
+        """
+        tdef = download.get_def()
+        infohash = tdef.get_infohash()
+        cached_tdef, static_info = self.static_download_info.get(infohash, (None, None))
+        if cached_tdef is not tdef:
+            static_info = {"name": tdef.get_name(), "infohash": infohash.encode('hex'), "size": tdef.get_length(),
+                           "files": list(enumerate(tdef.get_files_with_length()))}
+            self.static_download_info[infohash] = (tdef, static_info)
+        return static_info
+
+    def prune_static_download_info(self, infohashes):
+        """
+        Forget the static information of the downloads that are not in the given collection of binary infohashes.
+        """
+        for infohash in self.static_download_info.keys():
+            if infohash not in infohashes:
+                self.static_download_info.pop(infohash, None)
+
+    def get_download_json(self, download, state):
+        """
+        Create the JSON representation of a download, without the peer and piece information.
+        """
+        static_info = self.get_static_download_info(download)
+        stats = download.network_create_statistics_reponse() or LibtorrentStatisticsResponse(0, 0, 0, 0, 0, 0, 0)
+
+        # Create files information of the download
+        files_completion = dict((name, progress) for name, progress in state.get_files_completion())
+        selected_files = set(download.get_selected_files())
+        files_array = [{"index": file_index, "name": file, "size": size,
+                        "included": (file in selected_files or not selected_files),
+                        "progress": files_completion.get(file, 0.0)}
+                       for file_index, (file, size) in static_info["files"]]
+
+        # Create tracker information of the download
+        tracker_info = []
+        for url, url_info in download.network_tracker_status().iteritems():
+            tracker_info.append({"url": url, "peers": url_info[0], "status": url_info[1]})
+
+        ratio = 0.0
+        if stats.downTotal > 0:
+            ratio = stats.upTotal / float(stats.downTotal)
+
+        return {"name": static_info["name"], "progress": download.get_progress(),
+                "infohash": static_info["infohash"],
+                "speed_down": download.get_current_speed(DOWNLOAD),
+                "speed_up": download.get_current_speed(UPLOAD),
+                "status": dlstatus_strings[download.get_status()],
+                "size": static_info["size"], "eta": download.network_calc_eta(),
+                "num_peers": stats.numPeers, "num_seeds": stats.numSeeds, "total_up": stats.upTotal,
+                "total_down": stats.downTotal, "ratio": ratio,
+                "files": files_array, "trackers": tracker_info, "hops": download.get_hops(),
+                "anon_download": download.get_anon_mode(), "safe_seeding": download.get_safe_seeding(),
+                "max_upload_speed": download.get_max_speed(UPLOAD),
+                "max_download_speed": download.get_max_speed(DOWNLOAD),
+                "destination": download.get_dest_dir(), "availability": state.get_availability(),
+                "total_pieces": download.get_num_pieces(), "vod_mode": download.get_mode() == DLMODE_VOD,
+                "vod_prebuffering_progress": state.get_vod_prebuffering_progress(),
+                "vod_prebuffering_progress_consec": state.get_vod_prebuffering_progress_consec(),
+                "error": repr(state.get_error()) if state.get_error() else "",
+                "time_added": download.get_time_added()}
+
+    @staticmethod
+    def add_peers_and_pieces(download, state, download_json, get_peers, get_pieces):
+        """
+        Add the peer and piece information of a download to its JSON representation, if requested.
+        """
+        # Add peers information if requested
+        if get_peers:
+            peer_list = state.get_peerlist()
+            for peer_info in peer_list:  # Remove have field since it is very large to transmit.
+                del peer_info['have']
+                if 'extended_version' in peer_info:
+                    peer_info['extended_version'] = _safe_extended_peer_info(peer_info['extended_version'])
+                peer_info['id'] = peer_info['id'].encode('hex')
+
+            download_json["peers"] = peer_list
+
+        # Add piece information if requested
+        if get_pieces:
+            download_json["pieces"] = download.get_pieces_base64()
+
+    def on_download_states(self, subject, changetype, objectID, states_list):
+        """
+        Update the downloads of which the state changed with the download states that are periodically collected by
+        the session, and push the changes since the previous downloads_changed event over the events endpoint.
+        """
+        states = dict((state.get_download().get_def().get_infohash(), state) for state in states_list)
+        token = self.update_download_changes([state.get_download() for state in states_list], states)
+        if not self.events_endpoint or not self.events_endpoint.events_requests or token == self.last_event_token:
+            return
+
+        changes = self.download_changes.get_changes(self.last_event_token)
+        full = changes is None
+        changed_downloads, removed = (self.download_changes.get_downloads(), []) if full else changes
+        self.last_event_token = token
+
+        reactor.callFromThread(self.events_endpoint.write_data, {"type": "downloads_changed", "event": {
+            "token": token, "full": full, "downloads": changed_downloads, "removed": removed}})
 
     def render_PUT(self, request):
         """
@@ -41,6 +41,9 @@ class EventsEndpoint(resource.Resource):
     - torrent_error: An error has occurred during the download process of a specific torrent. The event includes the
       infohash and a readable string of the error message.
     - tribler_exception: An exception has occurred in Tribler. The event includes a readable string of the error.
+    - downloads_changed: The downloads have changed since the previous downloads_changed event. The event includes a
+      token and the changed downloads and removed infohashes, in the same format as a GET request to /downloads with
+      the since parameter.
     """
 
     def __init__(self, session):
@@ -52,3 +52,4 @@ class RootEndpoint(resource.Resource):
             self.putChild(path, child_cls(self.session))
 
         self.getChildWithDefault("search", None).events_endpoint = self.events_endpoint
+        self.getChildWithDefault("downloads", None).events_endpoint = self.events_endpoint
@@ -7,6 +7,9 @@ from Tribler.Core.simpledefs import NTFY_CHANNELCAST, NTFY_TORRENTS, SIGNAL_TORR
     SIGNAL_CHANNEL
 import Tribler.Core.Utilities.json_util as json
 
+# The maximum number of (best ranked) local torrents that are pushed over the events endpoint for a query
+MAX_LOCAL_TORRENT_RESULTS = 250
+
 
 class SearchEndpoint(resource.Resource):
     """
@@ -75,7 +78,8 @@ class SearchEndpoint(resource.Resource):
 
         torrent_db_columns = ['T.torrent_id', 'infohash', 'T.name', 'length', 'category',
                               'num_seeders', 'num_leechers', 'last_tracker_check']
-        results_local_torrents = self.torrent_db_handler.search_in_local_torrents_db(query, keys=torrent_db_columns)
+        results_local_torrents = self.torrent_db_handler.search_in_local_torrents_db(
+            query, keys=torrent_db_columns, limit=MAX_LOCAL_TORRENT_RESULTS)
         results_dict = {"keywords": keywords, "result_list": results_local_torrents}
         self.session.notifier.notify(SIGNAL_TORRENT, SIGNAL_ON_SEARCH_RESULTS, None, results_dict)
 
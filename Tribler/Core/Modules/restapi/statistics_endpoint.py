@@ -48,12 +48,54 @@ class StatisticsTriblerEndpoint(resource.Resource):
                     "tribler_statistics": {
                         "num_channels": 1234,
                         "database_size": 384923,
+                        "remote_search_cache": {
+                            "hits": 34,
+                            "misses": 12,
+                            "evictions": 0,
+                            "invalidations": 3,
+                            "size": 9
+                        },
+                        "resume": {
+                            "checkpoints": 5120,
+                            "parsed": 5120,
+                            "resumed": 5120,
+                            "parse_time": 4.38,
+                            "resume_time": 21.7
+                        },
+                        "notifier": {
+                            "torrents": {
+                                "notified": 5230,
+                                "delivered": 5230,
+                                "dropped": 0,
+                                "queued": 0,
+                                "max_queue_length": 84,
+                                "average_latency": 0.0021,
+                                "max_latency": 0.31
+                            }
+                        },
+                        "torrent_store": {
+                            "pending": 12,
+                            "pending_bytes": 302144,
+                            "cached": 418,
+                            "cached_bytes": 8388480
+                        },
+                        "torrent_checker": {
+                            "torrents_checked_per_minute": 150,
+                            "active_tracker_checks": 5,
+                            "trackers_queued": 83,
+                            "trackers_due": 12,
+                            "torrents_due": 20583
+                        },
                         "torrent_queue_stats": [{
                             "failed": 2,
                             "total": 9,
                             "type": "TFTP",
                             "pending": 1,
-                            "success": 6
+                            "success": 6,
+                            "running": 1,
+                            "expired": 0,
+                            "age_histogram": [{"max_age": 10, "count": 1}, ..., {"max_age": null, "count": 0}],
+                            "depth_histogram": [{"max_depth": 1, "sources": 1}, ..., {"max_depth": null, "sources": 0}]
                         }, ...]
                     }
                 }
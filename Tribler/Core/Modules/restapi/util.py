@@ -2,11 +2,11 @@
 This file contains some utility methods that are used by the API.
 """
 from struct import unpack_from
-import math
 
 from twisted.web import http
 
 from Tribler.Core.Modules.restapi import VOTE_SUBSCRIBE
+from Tribler.Core.Utilities.search_utils import bm25_inverse_document_frequency, bm25_term_frequency
 from Tribler.Core.simpledefs import NTFY_TORRENTS
 import Tribler.Core.Utilities.json_util as json
 from Tribler.community.channel.community import ChannelCommunity
@@ -118,7 +118,7 @@ def relevance_score_remote_torrent(torrent_name):
     """
     Calculate the relevance score of a remote torrent, based on the name and the matchinfo object
     of the last torrent from the database.
-    The algorithm used is the same one as in search_in_local_torrents_db in SqliteCacheDBHandler.py.
+    The algorithm used is the same one as in bm25_relevance in search_utils.py.
     """
     from Tribler.Core.Session import Session
     torrent_db = Session.get_instance().open_dbhandler(NTFY_TORRENTS)
@@ -135,10 +135,7 @@ def relevance_score_remote_torrent(torrent_name):
         rows_with_term = matchinfo[3 * (phrase_ind * num_cols) + 2]
         term_freq = torrent_name.lower().count(keywords[phrase_ind])
 
-        inv_doc_freq = math.log((num_rows - rows_with_term + 0.5) / (rows_with_term + 0.5), 2)
-        right_side = ((term_freq * (1.2 + 1)) / (term_freq + 1.2))
-
-        score += inv_doc_freq * right_side
+        score += bm25_inverse_document_frequency(num_rows, rows_with_term) * bm25_term_frequency(term_freq)
 
     return score
 
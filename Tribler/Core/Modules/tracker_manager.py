@@ -101,3 +101,14 @@ class TrackerManager(object):
             return None
 
         return result[0]
+
+    @blocking_call_on_reactor_thread
+    def get_trackers_for_auto_check(self):
+        """
+        Gets all trackers that are eligible for automatic tracker-checking, together with the time at which they are
+        due to be checked again.
+        :return: A list of (tracker URL, next check time) tuples.
+        """
+        sql_stmt = u"SELECT tracker, last_check + ? FROM TrackerInfo WHERE tracker != 'no-DHT' AND tracker != 'DHT' " \
+                   u"AND is_alive = 1"
+        return list(self._session.sqlite_db.execute(sql_stmt, (TRACKER_RETRY_INTERVAL,)))
@@ -9,7 +9,9 @@ import sys
 import urllib
 from abc import ABCMeta, abstractmethod
 from binascii import hexlify, unhexlify
-from collections import deque
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from time import time
 
 from decorator import decorator
 from twisted.internet import reactor
@@ -17,7 +19,8 @@ from twisted.internet.task import LoopingCall
 
 from Tribler.Core.TFTP.handler import METADATA_PREFIX
 from Tribler.Core.TorrentDef import TorrentDef
-from Tribler.Core.simpledefs import INFOHASH_LENGTH, NTFY_TORRENTS
+from Tribler.Core.simpledefs import (INFOHASH_LENGTH, METAINFO_PRIORITY_COLLECTING, METAINFO_PRIORITY_USER,
+                                     NTFY_TORRENTS)
 from Tribler.dispersy.taskmanager import TaskManager
 from Tribler.dispersy.util import call_on_reactor_thread
 
@@ -27,6 +30,19 @@ LOW_PRIO_COLLECTING = 0
 MAGNET_TIMEOUT = 5.0
 MAX_PRIORITY = 1
 
+# the number of collected torrents erased per reactor iteration when the collection is full
+EVICTION_BATCH_SIZE = 50
+EVICTION_BATCH_INTERVAL = 0.1
+
+# the number of seconds a request may wait in the queue of a requester before it is dropped, unless the user is waiting
+# for it
+REQUEST_QUEUE_TIMEOUT = 30 * 60
+# the upper bounds of the buckets of the histograms of the age of queued requests (in seconds) and of the number of
+# queued requests per source, the last bucket holds everything above the last bound
+QUEUE_AGE_BUCKETS = (10, 60, 300, 1800)
+QUEUE_DEPTH_BUCKETS = (1, 10, 100, 1000)
+
+
 @decorator
 def pass_when_stopped(f, self, *argv, **kwargs):
     if self.running:
@@ -89,28 +105,28 @@ class RemoteTorrentHandler(TaskManager):
 
     @call_on_reactor_thread
     def __check_overflow(self):
-        def clean_until_done(num_delete, deletions_per_step):
+        def clean_until_done(num_delete):
             """
-            Delete torrents in steps to avoid too much IO at once.
+            Erase torrents in small batches spread over reactor iterations to avoid too much IO at once.
             """
-            if num_delete > 0:
-                to_remove = min(num_delete, deletions_per_step)
-                num_delete -= to_remove
-                self.torrent_db.freeSpace(to_remove)
+            if num_delete > 0 and self.torrent_db.freeSpace(min(num_delete, EVICTION_BATCH_SIZE)):
                 self.register_task(u"remote_torrent clean_until_done",
-                                   reactor.callLater(5, clean_until_done, num_delete, deletions_per_step))
+                                   reactor.callLater(EVICTION_BATCH_INTERVAL, clean_until_done,
+                                                     num_delete - EVICTION_BATCH_SIZE))
 
         def torrent_overflow_check():
             """
             Check if we have reached the collected torrent limit and throttle its collection if so.
             """
+            if self.is_pending_task_active(u"remote_torrent clean_until_done"):
+                return
+
             self.num_torrents = self.torrent_db.getNumberCollectedTorrents()
             self._logger.debug(u"check overflow: current %d max %d", self.num_torrents, self.max_num_torrents)
 
             if self.num_torrents > self.max_num_torrents:
                 num_delete = int(self.num_torrents - self.max_num_torrents * 0.95)
-                deletions_per_step = max(25, num_delete / 180)
-                clean_until_done(num_delete, deletions_per_step)
+                clean_until_done(num_delete)
                 self._logger.info(u"** limit space:: %d %d %d", self.num_torrents, self.max_num_torrents, num_delete)
 
         self.register_task(u"remote_torrent overflow_check",
@@ -120,7 +136,8 @@ class RemoteTorrentHandler(TaskManager):
         self.register_task(name, reactor.callLater(delay_time, task, *args, **kwargs))
 
     @call_on_reactor_thread
-    def download_torrent(self, candidate, infohash, user_callback=None, priority=1, timeout=None):
+    def download_torrent(self, candidate, infohash, user_callback=None, priority=1, timeout=None,
+                         metainfo_priority=METAINFO_PRIORITY_COLLECTING):
         assert isinstance(infohash, str), u"infohash has invalid type: %s" % type(infohash)
         assert len(infohash) == INFOHASH_LENGTH, u"infohash has invalid length: %s" % len(infohash)
 
@@ -131,7 +148,7 @@ class RemoteTorrentHandler(TaskManager):
         if candidate:
             self.torrent_requesters[priority].add_request(infohash, candidate, timeout)
         else:
-            self.magnet_requesters[priority].add_request(infohash)
+            self.magnet_requesters[priority].add_request(infohash, metainfo_priority=metainfo_priority)
 
         if user_callback:
             callback = lambda ih = infohash: user_callback(ih)
@@ -224,6 +241,29 @@ class RemoteTorrentHandler(TaskManager):
 
             del self.metadata_callbacks[thumb_hash]
 
+    def is_requested(self, key, is_metadata=False):
+        """
+        Return whether any requester still has a request for a torrent or for metadata, queued or in progress.
+        """
+        if is_metadata:
+            return self.metadata_requester.has_request(key, is_metadata=True)
+        return any(requester.has_request(key) for requesters in (self.torrent_requesters, self.magnet_requesters,
+                                                                 self.torrent_message_requesters)
+                   for requester in requesters.itervalues())
+
+    def on_request_expired(self, key, is_metadata=False):
+        """
+        Drop the callbacks of a torrent or metadata whose request expired, unless another request for it is still
+        pending. Without a request, these callbacks would never be called nor removed.
+        """
+        if self.is_requested(key, is_metadata):
+            return
+
+        if is_metadata:
+            self.metadata_callbacks.pop(key, None)
+        else:
+            self.torrent_callbacks.pop(key, None)
+
     def notify_possible_torrent_infohash(self, infohash):
         if infohash not in self.torrent_callbacks:
             return
@@ -248,15 +288,26 @@ class RemoteTorrentHandler(TaskManager):
 
     def get_queue_stats(self):
         def get_queue_stats(qname, requesters):
-            pending_requests = success = failed = 0
+            pending_requests = running = success = failed = expired = 0
+            age_histogram = [0] * (len(QUEUE_AGE_BUCKETS) + 1)
+            depth_histogram = [0] * (len(QUEUE_DEPTH_BUCKETS) + 1)
             for requester in requesters.itervalues():
                 pending_requests += requester.pending_request_queue_size
+                running += requester.running_request_count
                 success += requester.requests_succeeded
                 failed += requester.requests_failed
+                expired += requester.requests_expired
+                ages, depths = requester.get_queue_histograms()
+                age_histogram = [total + count for total, count in zip(age_histogram, ages)]
+                depth_histogram = [total + count for total, count in zip(depth_histogram, depths)]
             total_requests = pending_requests + success + failed
 
             return {"type": qname, "total": total_requests, "success": success,
-                    "pending": pending_requests, "failed": failed}
+                    "pending": pending_requests, "failed": failed, "running": running, "expired": expired,
+                    "age_histogram": [{"max_age": max_age, "count": count} for max_age, count
+                                      in zip(QUEUE_AGE_BUCKETS + (None,), age_histogram)],
+                    "depth_histogram": [{"max_depth": max_depth, "sources": count} for max_depth, count
+                                        in zip(QUEUE_DEPTH_BUCKETS + (None,), depth_histogram)]}
 
         return [stats_dict for stats_dict in [get_queue_stats("TFTP", self.torrent_requesters),
                                               get_queue_stats("DHT", self.magnet_requesters),
@@ -272,19 +323,162 @@ class RemoteTorrentHandler(TaskManager):
                                               get_bandwidth_stats("DQueue", self.magnet_requesters)]]
 
 
+class PendingRequest(object):
+    """
+    A request for a torrent or metadata, together with the candidates it can be requested from.
+    """
+
+    __slots__ = ('key', 'source', 'added', 'deadline', 'sources', 'tried_sources', 'metainfo_priority')
+
+    def __init__(self, key, source, added, deadline):
+        self.key = key
+        # the source whose turn it is when this request is served
+        self.source = source
+        self.added = added
+        # the time after which the request is dropped when it is still queued, None if it never expires
+        self.deadline = deadline
+
+        self.sources = deque()
+        self.tried_sources = deque()
+        self.metainfo_priority = METAINFO_PRIORITY_COLLECTING
+
+    def has_source(self, candidate):
+        return candidate in self.sources or candidate in self.tried_sources
+
+
+class RequestQueue(object):
+    """
+    The pending requests of a requester: an ordered set of requests with O(1) lookups by key.
+
+    The requests of every source are served in order of arrival and the sources take turns, so a peer that sends us
+    many torrents cannot delay the requests for everyone else. Requests that are still queued after their deadline are
+    dropped when their turn comes, and handed to the expired callback.
+    """
+
+    def __init__(self, timeout=REQUEST_QUEUE_TIMEOUT, expired_callback=None):
+        self.timeout = timeout
+        self.expired = 0
+        self.expired_callback = expired_callback
+
+        self._requests = {}
+        # requests that are served before the other requests, like retries from another candidate
+        self._retries = deque()
+        # source -> deque of the requests of that source, in the order in which the sources take turns
+        self._queues_per_source = OrderedDict()
+
+    def __len__(self):
+        return len(self._requests)
+
+    def __contains__(self, key):
+        return key in self._requests
+
+    def get(self, key):
+        return self._requests.get(key)
+
+    def push(self, key, source=None, timeout=None, expires=True):
+        """
+        Queue a request for a key, unless a request for it is queued already.
+        :param source: the source whose turn it is when the request is served.
+        :param timeout: the number of seconds the request may be queued, the timeout of the queue by default.
+        :param expires: whether the request is dropped after its timeout. A queued request that should no longer expire
+        keeps its place in the queue.
+        :return: a (request, is_new) tuple.
+        """
+        request = self._requests.get(key)
+        if request is not None:
+            if not expires:
+                request.deadline = None
+            return request, False
+
+        now = time()
+        request = PendingRequest(key, source, now, now + (timeout or self.timeout) if expires else None)
+        self._requests[key] = request
+        queue = self._queues_per_source.get(source)
+        if queue is None:
+            queue = self._queues_per_source[source] = deque()
+        queue.append(request)
+        return request, True
+
+    def push_front(self, request):
+        """
+        Queue a request again, in front of all other requests.
+        """
+        self._requests[request.key] = request
+        self._retries.append(request)
+
+    def remove(self, key):
+        return self._requests.pop(key, None)
+
+    def pop(self):
+        """
+        Return the next request, or None if there are no requests left. Requests that passed their deadline are
+        dropped on the way.
+        """
+        now = time()
+        while self._retries:
+            request = self._retries.popleft()
+            if self._take(request, now):
+                return request
+
+        while self._queues_per_source:
+            source, queue = self._queues_per_source.popitem(last=False)
+            request = queue.popleft()
+            if queue:
+                # this source gets its next turn after all other sources
+                self._queues_per_source[source] = queue
+            if self._take(request, now):
+                return request
+        return None
+
+    def _take(self, request, now):
+        if self._requests.get(request.key) is not request:
+            # removed, or replaced by a newer request for the same key
+            return False
+
+        del self._requests[request.key]
+        if request.deadline is not None and request.deadline < now:
+            self.expired += 1
+            if self.expired_callback:
+                self.expired_callback(request)
+            return False
+        return True
+
+    def get_histograms(self):
+        """
+        Return the number of queued requests per QUEUE_AGE_BUCKETS age bucket and the number of sources per
+        QUEUE_DEPTH_BUCKETS bucket of queued requests.
+        """
+        now = time()
+        ages = [0] * (len(QUEUE_AGE_BUCKETS) + 1)
+        requests_per_source = {}
+        for request in self._requests.itervalues():
+            ages[bisect_left(QUEUE_AGE_BUCKETS, now - request.added)] += 1
+            requests_per_source[request.source] = requests_per_source.get(request.source, 0) + 1
+
+        depths = [0] * (len(QUEUE_DEPTH_BUCKETS) + 1)
+        for depth in requests_per_source.itervalues():
+            depths[bisect_left(QUEUE_DEPTH_BUCKETS, depth)] += 1
+        return ages, depths
+
+
 class Requester(object):
     __metaclass__ = ABCMeta
 
     REQUEST_INTERVAL = 0.5
+    # the number of requests that may be in progress at the same time
+    MAX_CONCURRENT = 1
 
-    def __init__(self, name, session, remote_torrent_handler, priority):
+    def __init__(self, name, session, remote_torrent_handler, priority, max_concurrent=None):
         self._logger = logging.getLogger(self.__class__.__name__)
         self._name = name
         self._session = session
         self._remote_torrent_handler = remote_torrent_handler
         self._priority = priority
+        self.max_concurrent = max_concurrent or self.MAX_CONCURRENT
 
-        self._pending_request_queue = deque()
+        self._pending_request_queue = RequestQueue(expired_callback=self._on_request_expired)
+        # key -> PendingRequest of the requests that are in progress
+        self._running_requests = {}
 
         self._requests_succeeded = 0
         self._requests_failed = 0
@@ -304,6 +498,14 @@ class Requester(object):
     def pending_request_queue_size(self):
         return len(self._pending_request_queue)
 
+    @property
+    def running_request_count(self):
+        return len(self._running_requests)
+
+    @property
+    def requests_expired(self):
+        return self._pending_request_queue.expired
+
     @property
     def requests_succeeded(self):
         return self._requests_succeeded
@@ -316,6 +518,19 @@ class Requester(object):
     def total_bandwidth(self):
         return self._total_bandwidth
 
+    def get_queue_histograms(self):
+        return self._pending_request_queue.get_histograms()
+
+    def has_request(self, key):
+        """
+        Return whether a request for a key is queued or in progress.
+        """
+        return key in self._pending_request_queue or key in self._running_requests
+
+    def _on_request_expired(self, request):
+        self._logger.debug(u"dropped expired request %s", hexlify(request.key))
+        self._remote_torrent_handler.on_request_expired(request.key)
+
     @pass_when_stopped
     def schedule_task(self, task, delay_time=0.0, *args, **kwargs):
         """
@@ -351,14 +566,16 @@ class Requester(object):
 
 class TorrentMessageRequester(Requester):
 
-    def __init__(self, session, remote_torrent_handler, priority):
+    # the number of torrent messages requested per iteration of the reactor
+    MAX_CONCURRENT = 50
+
+    def __init__(self, session, remote_torrent_handler, priority, max_concurrent=None):
         super(TorrentMessageRequester, self).__init__(u"torrent_message_requester",
-                                                      session, remote_torrent_handler, priority)
+                                                      session, remote_torrent_handler, priority, max_concurrent)
         if sys.platform == "darwin":
             # Mac has just 256 fds per process, be less aggressive
             self.REQUEST_INTERVAL = 1.0
 
-        self._source_dict = {}
         self._search_community = None
 
     @pass_when_stopped
@@ -366,18 +583,13 @@ class TorrentMessageRequester(Requester):
         addr = candidate.sock_addr
         queue_was_empty = len(self._pending_request_queue) == 0
 
-        if infohash in self._source_dict and candidate in self._source_dict[infohash]:
-            self._logger.debug(u"already has request %s from %s:%s, skip", hexlify(infohash), addr[0], addr[1])
-
-        if infohash not in self._pending_request_queue:
-            self._pending_request_queue.append(infohash)
-            self._source_dict[infohash] = []
-        if candidate in self._source_dict[infohash]:
-            self._logger.warn(u"ignore duplicate torrent message request %s from %s:%s",
-                              hexlify(infohash), addr[0], addr[1])
+        request, _ = self._pending_request_queue.push(infohash, addr, timeout)
+        if request.has_source(candidate):
+            self._logger.debug(u"ignore duplicate torrent message request %s from %s:%s",
+                               hexlify(infohash), addr[0], addr[1])
             return
 
-        self._source_dict[infohash].append(candidate)
+        request.sources.append(candidate)
         self._logger.debug(u"added request %s from %s:%s", hexlify(infohash), addr[0], addr[1])
 
         # start scheduling tasks if the queue was empty, which means there was no task running previously
@@ -397,41 +609,48 @@ class TorrentMessageRequester(Requester):
             self._logger.error(u"no SearchCommunity found.")
             return
 
-        # requesting messages
-        while self._pending_request_queue:
-            infohash = self._pending_request_queue.popleft()
+        # requesting messages, a window at a time
+        for _ in xrange(self.max_concurrent):
+            request = self._pending_request_queue.pop()
+            if request is None:
+                return
 
-            for candidate in self._source_dict[infohash]:
+            for candidate in request.sources:
                 self._logger.debug(u"requesting torrent message %s from %s:%s",
-                                   hexlify(infohash), candidate.sock_addr[0], candidate.sock_addr[1])
-                self._search_community.create_torrent_request(infohash, candidate)
+                                   hexlify(request.key), candidate.sock_addr[0], candidate.sock_addr[1])
+                self._search_community.create_torrent_request(request.key, candidate)
 
-            del self._source_dict[infohash]
+        if self._pending_request_queue:
+            self.schedule_task(self._do_request)
 
 
 class MagnetRequester(Requester):
 
-    MAX_CONCURRENT = 1
     TIMEOUT = 30.0
 
-    def __init__(self, session, remote_torrent_handler, priority):
-        super(MagnetRequester, self).__init__(u"magnet_requester", session, remote_torrent_handler, priority)
+    def __init__(self, session, remote_torrent_handler, priority, max_concurrent=None):
+        if max_concurrent is None and priority <= 1 and not sys.platform == "darwin":
+            max_concurrent = 3
+        super(MagnetRequester, self).__init__(u"magnet_requester", session, remote_torrent_handler, priority,
+                                              max_concurrent)
         if sys.platform == "darwin":
             # Mac has just 256 fds per process, be less aggressive
             self.REQUEST_INTERVAL = 15.0
 
-        if priority <= 1 and not sys.platform == "darwin":
-            self.MAX_CONCURRENT = 3
-
         self._torrent_db_handler = session.open_dbhandler(NTFY_TORRENTS)
 
-        self._running_requests = []
-
     @pass_when_stopped
-    def add_request(self, infohash, candidate=None, timeout=None):
+    def add_request(self, infohash, candidate=None, timeout=None, metainfo_priority=METAINFO_PRIORITY_COLLECTING):
         queue_was_empty = len(self._pending_request_queue) == 0
-        if infohash not in self._pending_request_queue and infohash not in self._running_requests:
-            self._pending_request_queue.append(infohash)
+        if infohash in self._running_requests:
+            return
+
+        # the user is waiting for the torrents with the user priority, so these requests do not expire
+        request, is_new = self._pending_request_queue.push(infohash, timeout=timeout,
+                                                           expires=metainfo_priority != METAINFO_PRIORITY_USER)
+        # the priority of the metainfo lookup in the LibtorrentMgr
+        request.metainfo_priority = metainfo_priority if is_new else min(request.metainfo_priority,
+                                                                          metainfo_priority)
 
         # start scheduling tasks if the queue was empty, which means there was no task running previously
         if queue_was_empty:
@@ -440,11 +659,14 @@ class MagnetRequester(Requester):
     @pass_when_stopped
     def _do_request(self):
         while self._pending_request_queue and self.running:
-            if len(self._running_requests) >= self.MAX_CONCURRENT:
-                self._logger.debug(u"max concurrency %s reached, request later", self.MAX_CONCURRENT)
+            if len(self._running_requests) >= self.max_concurrent:
+                self._logger.debug(u"max concurrency %s reached, request later", self.max_concurrent)
                 return
 
-            infohash = self._pending_request_queue.popleft()
+            request = self._pending_request_queue.pop()
+            if request is None:
+                return
+            infohash = request.key
             infohash_str = hexlify(infohash)
 
             # try magnet link
@@ -459,9 +681,10 @@ class MagnetRequester(Requester):
             self._logger.debug(u"requesting %s priority %s through magnet link %s",
                                infohash_str, self._priority, magnetlink)
 
+            self._running_requests[infohash] = request
             self._session.lm.ltmgr.get_metainfo(magnetlink, self._success_callback,
-                                                timeout=self.TIMEOUT, timeout_callback=self._failure_callback)
-            self._running_requests.append(infohash)
+                                                timeout=self.TIMEOUT, timeout_callback=self._failure_callback,
+                                                priority=request.metainfo_priority)
 
     @call_on_reactor_thread
     def _success_callback(self, meta_info):
@@ -475,7 +698,7 @@ class MagnetRequester(Requester):
         self._logger.debug(u"received torrent %s through magnet", hexlify(infohash))
 
         self._remote_torrent_handler.save_torrent(tdef)
-        self._running_requests.remove(infohash)
+        self._running_requests.pop(infohash, None)
 
         self._requests_succeeded += 1
         self._total_bandwidth += tdef.get_torrent_size()
@@ -493,7 +716,7 @@ class MagnetRequester(Requester):
                 self._logger.debug(u"++ INFOHASH in running_requests: %s", hexlify(ih))
 
         self._logger.debug(u"failed to retrieve torrent %s through magnet", hexlify(infohash))
-        self._running_requests.remove(infohash)
+        self._running_requests.pop(infohash, None)
 
         self._requests_failed += 1
 
@@ -502,83 +725,89 @@ class MagnetRequester(Requester):
 
 class TftpRequester(Requester):
 
-    def __init__(self, name, session, remote_torrent_handler, priority):
-        super(TftpRequester, self).__init__(name, session, remote_torrent_handler, priority)
+    def __init__(self, name, session, remote_torrent_handler, priority, max_concurrent=None):
+        super(TftpRequester, self).__init__(name, session, remote_torrent_handler, priority, max_concurrent)
 
         self.REQUEST_INTERVAL = 5.0
 
-        self._active_request_list = []
-        self._untried_sources = {}
-        self._tried_sources = {}
+    @staticmethod
+    def _get_request_key(key, is_metadata=False):
+        # no binary for keys
+        if is_metadata:
+            return "%s%s" % (METADATA_PREFIX, hexlify(key))
+        return hexlify(key)
+
+    def has_request(self, key, is_metadata=False):
+        return super(TftpRequester, self).has_request(self._get_request_key(key, is_metadata))
+
+    def _on_request_expired(self, request):
+        self._logger.debug(u"dropped expired request %s", request.key)
+        if request.key.startswith(METADATA_PREFIX):
+            self._remote_torrent_handler.on_request_expired(unhexlify(request.key[len(METADATA_PREFIX):]),
+                                                            is_metadata=True)
+        else:
+            self._remote_torrent_handler.on_request_expired(unhexlify(request.key))
 
     @pass_when_stopped
     def add_request(self, key, candidate, timeout=None, is_metadata=False):
         ip, port = candidate.sock_addr
-        # no binary for keys
-        if is_metadata:
-            key = "%s%s" % (METADATA_PREFIX, hexlify(key))
-            key_str = key
-        else:
-            key = hexlify(key)
-            key_str = hexlify(key)
+        key = self._get_request_key(key, is_metadata)
+        key_str = key if is_metadata else hexlify(key)
 
-        if key in self._pending_request_queue or key in self._active_request_list:
-            # append to the active one
-            if candidate in self._untried_sources[key] or candidate in self._tried_sources[key]:
+        request = self._running_requests.get(key) or self._pending_request_queue.get(key)
+        if request is not None:
+            # append to the existing one
+            if request.has_source(candidate):
                 self._logger.debug(u"already has request %s from %s:%s, skip", key_str, ip, port)
                 return
 
-            self._untried_sources[key].append(candidate)
+            request.sources.append(candidate)
             self._logger.debug(u"appending to existing request: %s from %s:%s", key_str, ip, port)
 
         else:
             # new request
             self._logger.debug(u"adding new request: %s from %s:%s", key_str, ip, port)
-            self._pending_request_queue.append(key)
-            self._untried_sources[key] = deque([candidate])
-            self._tried_sources[key] = deque()
+            request, _ = self._pending_request_queue.push(key, candidate.sock_addr, timeout)
+            request.sources.append(candidate)
 
-        # start pending tasks if there is no task running
-        if not self._active_request_list:
+        # start pending tasks if there is room for another download
+        if len(self._running_requests) < self.max_concurrent:
             self._start_pending_requests()
 
     @pass_when_stopped
     def _do_request(self):
-        assert not self._active_request_list, "active_request_list is not empty = %s" % repr(self._active_request_list)
-
-        # starts to download a torrent
-        key = self._pending_request_queue.popleft()
-
-        candidate = self._untried_sources[key].popleft()
-        self._tried_sources[key].append(candidate)
+        while len(self._running_requests) < self.max_concurrent:
+            # starts to download a torrent
+            request = self._pending_request_queue.pop()
+            if request is None:
+                return
+            key = request.key
 
-        ip, port = candidate.sock_addr
+            candidate = request.sources.popleft()
+            request.tried_sources.append(candidate)
 
-        if key.startswith(METADATA_PREFIX):
-            # metadata requests has a METADATA_PREFIX prefix
-            thumb_hash = unhexlify(key[len(METADATA_PREFIX):])
-            file_name = key
-            extra_info = {u'key': key, u'thumb_hash': thumb_hash}
-        else:
-            # key is the hexlified info hash
-            info_hash = unhexlify(key)
-            file_name = hexlify(info_hash) + u'.torrent'
-            extra_info = {u'key': key, u'info_hash': info_hash}
+            ip, port = candidate.sock_addr
 
-        self._logger.debug(u"start TFTP download for %s from %s:%s", file_name, ip, port)
+            if key.startswith(METADATA_PREFIX):
+                # metadata requests has a METADATA_PREFIX prefix
+                thumb_hash = unhexlify(key[len(METADATA_PREFIX):])
+                file_name = key
+                extra_info = {u'key': key, u'thumb_hash': thumb_hash}
+            else:
+                # key is the hexlified info hash
+                info_hash = unhexlify(key)
+                file_name = hexlify(info_hash) + u'.torrent'
+                extra_info = {u'key': key, u'info_hash': info_hash}
 
-        # do not download if TFTP has been shutdown
-        if self._session.lm.tftp_handler is None:
-            return
-        self._session.lm.tftp_handler.download_file(file_name, ip, port, extra_info=extra_info,
-                                                    success_callback=self._on_download_successful,
-                                                    failure_callback=self._on_download_failed)
-        self._active_request_list.append(key)
+            self._logger.debug(u"start TFTP download for %s from %s:%s", file_name, ip, port)
 
-    def _clear_active_request(self, key):
-        del self._untried_sources[key]
-        del self._tried_sources[key]
-        self._active_request_list.remove(key)
+            # do not download if TFTP has been shutdown
+            if self._session.lm.tftp_handler is None:
+                return
+            self._running_requests[key] = request
+            self._session.lm.tftp_handler.download_file(file_name, ip, port, extra_info=extra_info,
+                                                        success_callback=self._on_download_successful,
+                                                        failure_callback=self._on_download_failed)
 
     @call_on_reactor_thread
     def _on_download_successful(self, address, file_name, file_data, extra_info):
@@ -588,8 +817,8 @@ class TftpRequester(Requester):
         info_hash = extra_info.get(u"info_hash")
         thumb_hash = extra_info.get(u"thumb_hash")
 
-        assert key in self._active_request_list, u"key = %s, active_request_list = %s" % (repr(key),
-                                                                                          self._active_request_list)
+        assert key in self._running_requests, u"key = %s, running_requests = %s" % (repr(key),
+                                                                                    self._running_requests.keys())
 
         self._requests_succeeded += 1
         self._total_bandwidth += len(file_data)
@@ -607,7 +836,7 @@ class TftpRequester(Requester):
             self._logger.warning("Remote peer sent us invalid (torrent) content over TFTP socket, ignoring it.")
         finally:
             # start the next request
-            self._clear_active_request(key)
+            self._running_requests.pop(key, None)
             self._start_pending_requests()
 
     @call_on_reactor_thread
@@ -615,20 +844,20 @@ class TftpRequester(Requester):
         self._logger.debug(u"failed to download %s from %s:%s: %s", file_name, address[0], address[1], error_msg)
 
         key = extra_info[u'key']
-        assert key in self._active_request_list, u"key = %s, active_request_list = %s" % (repr(key),
-                                                                                          self._active_request_list)
+        assert key in self._running_requests, u"key = %s, running_requests = %s" % (repr(key),
+                                                                                    self._running_requests.keys())
 
         self._requests_failed += 1
 
-        if self._untried_sources[key]:
+        request = self._running_requests.pop(key)
+        if request.sources:
             # try to download this data from another candidate
             self._logger.debug(u"scheduling next try for %s", repr(key))
 
-            self._pending_request_queue.appendleft(key)
-            self._active_request_list.remove(key)
-            self.schedule_task(self._do_request)
+            self._pending_request_queue.push_front(request)
+            if not self._remote_torrent_handler.is_pending_task_active(self._name):
+                self.schedule_task(self._do_request)
 
         else:
             # no more available candidates, download the next requested infohash
-            self._clear_active_request(key)
             self._start_pending_requests()
@@ -23,7 +23,7 @@ from Tribler.Core.DownloadConfig import DefaultDownloadStartupConfig, get_defaul
 from Tribler.Core.Utilities import torrent_utils
 from Tribler.Core import NoDispersyRLock
 from Tribler.Core.APIImplementation.LaunchManyCore import TriblerLaunchMany
-from Tribler.Core.CacheDB.Notifier import Notifier
+from Tribler.Core.CacheDB.Notifier import OVERFLOW_DROP_OLDEST, Notifier
 from Tribler.Core.CacheDB.sqlitecachedb import SQLiteCacheDB, DB_FILE_RELATIVE_PATH, DB_SCRIPT_NAME
 from Tribler.Core.Config.tribler_config import TriblerConfig
 from Tribler.Core.Modules.restapi.rest_manager import RESTManager
@@ -35,9 +35,10 @@ from Tribler.Core.Utilities.install_dir import get_lib_path
 from Tribler.Core.defaults import tribler_defaults, dldefaults
 from Tribler.Core.exceptions import NotYetImplementedException, OperationNotEnabledByConfigurationException, \
     DuplicateTorrentFileError
-from Tribler.Core.simpledefs import (NTFY_CHANNELCAST, NTFY_DELETE, NTFY_INSERT, NTFY_MYPREFERENCES,
-                                     NTFY_PEERS, NTFY_TORRENTS, NTFY_UPDATE, NTFY_VOTECAST, STATEDIR_DLPSTATE_DIR,
-                                     STATEDIR_METADATA_STORE_DIR, STATEDIR_PEERICON_DIR, STATEDIR_TORRENT_STORE_DIR,
+from Tribler.Core.simpledefs import (METAINFO_PRIORITY_USER, NTFY_CHANNELCAST, NTFY_DELETE, NTFY_INSERT,
+                                     NTFY_MYPREFERENCES, NTFY_PEERS, NTFY_TORRENTS, NTFY_UPDATE, NTFY_VOTECAST,
+                                     STATEDIR_CHECKPOINT_STORE_DIR, STATEDIR_DLPSTATE_DIR, STATEDIR_METADATA_STORE_DIR,
+                                     STATEDIR_PEERICON_DIR, STATEDIR_TORRENT_STORE_DIR,
                                      DLSTATUS_STOPPED, STATEDIR_GUICONFIG, STATE_OPEN_DB, STATE_START_API,
                                      STATE_UPGRADING_READABLE, STATE_LOAD_CHECKPOINTS, STATE_STARTED,
                                      STATE_READABLE_STARTED)
@@ -438,13 +439,14 @@ class Session(SessionConfigInterface):
     #
     # Notification of events in the Session
     #
-    def add_observer(self, func, subject, changeTypes=[NTFY_UPDATE, NTFY_INSERT, NTFY_DELETE], objectID=None, cache=0):
+    def add_observer(self, func, subject, changeTypes=[NTFY_UPDATE, NTFY_INSERT, NTFY_DELETE], objectID=None, cache=0,
+                     queue_size=None, overflow=OVERFLOW_DROP_OLDEST):
         """ Add an observer function function to the Session. The observer
         function will be called when one of the specified events (changeTypes)
         occurs on the specified subject.
 
-        The function will be called by a popup thread which can be used
-        indefinitely (within reason) by the higher level code.
+        The function will be called on the reactor thread, after the thread
+        that notified the event has moved on.
 
         @param func The observer function. It should accept as its first argument
         the subject, as second argument the changeType, as third argument an
@@ -457,12 +459,18 @@ class Session(SessionConfigInterface):
         @param objectID The specific object in the subject to monitor (e.g. a
         specific primary key in a database to monitor for updates.)
         @param cache The time to bundle/cache events matching this function
+        @param queue_size The maximum number of events waiting to be delivered
+        to this function. By default the queue is unbounded and no events are
+        lost.
+        @param overflow What to do with new events when queue_size events are
+        waiting, one of the OVERFLOW_* policies of the Notifier.
 
         TODO: Jelle will add per-subject/event description here ;o)
 
         """
         # Called by any thread
-        self.notifier.add_observer(func, subject, changeTypes, objectID, cache=cache)  # already threadsafe
+        self.notifier.add_observer(func, subject, changeTypes, objectID, cache=cache, queue_size=queue_size,
+                                   overflow=overflow)  # already threadsafe
 
     def remove_observer(self, func):
         """ Remove observer function. No more callbacks will be made.
@@ -624,7 +632,13 @@ class Session(SessionConfigInterface):
         # Called by network thread
         return os.path.join(self.get_state_dir(), STATEDIR_DLPSTATE_DIR)
 
-    def download_torrentfile(self, infohash=None, usercallback=None, prio=0):
+    def get_downloads_checkpoint_store_dir(self):
+        """ Returns the directory of the database in which the Downloads in this
+        Session are checkpointed. """
+        return os.path.join(self.get_state_dir(), STATEDIR_CHECKPOINT_STORE_DIR)
+
+    def download_torrentfile(self, infohash=None, usercallback=None, prio=0,
+                             metainfo_priority=METAINFO_PRIORITY_USER):
         """ Try to download the torrentfile without a known source.
         A possible source could be the DHT.
         If the torrent is succesfully
@@ -635,11 +649,15 @@ class Session(SessionConfigInterface):
         at the time of the call.
         @param infohash The infohash of the torrent.
         @param usercallback A function adhering to the above spec.
+        @param metainfo_priority The METAINFO_PRIORITY_* of the lookup of the torrent in the DHT. Requests
+        of the user (METAINFO_PRIORITY_USER) wait in the queue until they are looked up, others are dropped
+        after a while.
         """
         if not self.lm.rtorrent_handler:
             raise OperationNotEnabledByConfigurationException()
 
-        self.lm.rtorrent_handler.download_torrent(None, infohash, user_callback=usercallback, priority=prio)
+        self.lm.rtorrent_handler.download_torrent(None, infohash, user_callback=usercallback, priority=prio,
+                                                  metainfo_priority=metainfo_priority)
 
     def download_torrentfile_from_peer(self, candidate, infohash=None, usercallback=None, prio=0):
         """ Ask the designated peer to send us the torrentfile for the torrent
@@ -753,6 +771,16 @@ class Session(SessionConfigInterface):
 
         del self.lm.torrent_store[hexlify(infohash)]
 
+    def delete_collected_torrents(self, infohashes):
+        """
+        Deletes the given torrents from the torrent_store database in a single batch.
+        :param infohashes: The given binary infohashes.
+        """
+        if not self.get_torrent_store():
+            raise OperationNotEnabledByConfigurationException("torrent_store is not enabled")
+
+        self.lm.torrent_store.multi_delete([hexlify(infohash) for infohash in infohashes])
+
     def search_remote_torrents(self, keywords):
         """
         Searches for remote torrents through SearchCommunity with the given keywords.
@@ -858,6 +886,6 @@ class Session(SessionConfigInterface):
         :param thumb_hash: The thumbnail SHA1 hash.
         :return: The thumbnail data.
         """
-        if not self.lm.metadata_store:
+        if self.lm.metadata_store is None:
             raise OperationNotEnabledByConfigurationException("libtorrent is not enabled")
         return self.lm.rtorrent_handler.get_metadata(thumb_hash)
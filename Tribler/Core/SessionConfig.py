@@ -502,6 +502,17 @@ class SessionConfigInterface(object):
         @return Boolean. """
         return self.sessconfig.get(u'torrent_checking', u'enabled')
 
+    def set_torrent_checking_max_parallel_sessions(self, value):
+        """ Set the maximum number of trackers that are checked automatically at the same time.
+        @param value An integer.
+        """
+        self.sessconfig.set(u'torrent_checking', u'max_parallel_sessions', value)
+
+    def get_torrent_checking_max_parallel_sessions(self):
+        """ Returns the maximum number of trackers that are checked automatically at the same time.
+        @return An integer. """
+        return self.sessconfig.get(u'torrent_checking', u'max_parallel_sessions')
+
     def set_stop_collecting_threshold(self, value):
         """ Stop collecting more torrents if the disk has less than this limit
         @param value A limit in MB.
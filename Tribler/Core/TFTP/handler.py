@@ -12,7 +12,7 @@ from Tribler.dispersy.taskmanager import TaskManager, LoopingCall
 from Tribler.dispersy.candidate import Candidate
 from Tribler.dispersy.util import (call_on_reactor_thread, blocking_call_on_reactor_thread, attach_runtime_statistics,
                                    is_valid_address)
-from .session import Session, DEFAULT_BLOCK_SIZE, DEFAULT_TIMEOUT
+from .session import Session, DEFAULT_BLOCK_SIZE, DEFAULT_TIMEOUT, MAX_BLOCK_SIZE, MAX_WINDOW_SIZE
 from .packet import (encode_packet, decode_packet, OPCODE_RRQ, OPCODE_WRQ, OPCODE_ACK, OPCODE_DATA, OPCODE_OACK,
                      OPCODE_ERROR, ERROR_DICT)
 from .exception import InvalidPacketException, FileNotFound
@@ -33,7 +33,7 @@ class TftpHandler(TaskManager):
     """
 
     def __init__(self, session, endpoint, prefix, block_size=DEFAULT_BLOCK_SIZE, timeout=DEFAULT_TIMEOUT,
-                 max_retries=DEFAULT_RETIES):
+                 max_retries=DEFAULT_RETIES, window_size=1):
         """ The constructor.
         :param session:     The tribler session.
         :param endpoint:    The endpoint to use.
@@ -41,6 +41,7 @@ class TftpHandler(TaskManager):
         :param block_size:  Transmission block size.
         :param timeout:     Transmission timeout.
         :param max_retries: Transmission maximum retries.
+        :param window_size: Number of blocks that are sent before waiting for an ACK.
         """
         super(TftpHandler, self).__init__()
         self._logger = logging.getLogger(self.__class__.__name__)
@@ -53,8 +54,10 @@ class TftpHandler(TaskManager):
         self._block_size = block_size
         self._timeout = timeout
         self._max_retries = max_retries
+        self._window_size = window_size
 
-        self._timeout_check_interval = 0.5
+        # the retransmission timeout follows the round trip time, so it is checked more often than the timeout itself
+        self._timeout_check_interval = 0.1
 
         self._session_id_dict = {}
         self._session_dict = {}
@@ -127,7 +130,8 @@ class TftpHandler(TaskManager):
         self._logger.debug(u"start downloading %s from %s:%s, sid = %s", file_name, ip, port, session_id)
         session = Session(True, session_id, (ip, port), OPCODE_RRQ, file_name, '', None, None,
                           extra_info=extra_info, block_size=self._block_size, timeout=self._timeout,
-                          success_callback=success_callback, failure_callback=failure_callback)
+                          window_size=self._window_size, success_callback=success_callback,
+                          failure_callback=failure_callback)
 
         self._add_new_session(session)
         self._send_request_packet(session)
@@ -165,11 +169,24 @@ class TftpHandler(TaskManager):
         :return: True or False indicating if the session has failed.
         """
         has_failed = False
-        timeout = session.timeout * (2**session.retries)
+        timeout = session.rto * (2**session.retries)
         if session.last_contact_time + timeout < time():
             # we do NOT resend packets that are not data-related
-            if session.retries < self._max_retries and session.last_sent_packet['opcode'] in (OPCODE_ACK, OPCODE_DATA):
-                self._send_packet(session, session.last_sent_packet)
+            if session.retries >= self._max_retries:
+                has_failed = True
+            elif session.last_sent_packet['opcode'] == OPCODE_DATA:
+                # only resend the blocks of the window that have not been acknowledged yet
+                self._send_data_blocks(session, session.ack_block_number + 1, session.block_number)
+                session.retries += 1
+            elif session.last_sent_packet['opcode'] == OPCODE_ACK:
+                self._send_packet(session, session.last_sent_packet, is_retransmission=True)
+                session.retries += 1
+            elif session.last_sent_packet['opcode'] == OPCODE_RRQ:
+                # the remote peer may not understand the windowsize option, retry without it
+                if session.window_size > 1:
+                    self._logger.info(u"%s no response to windowed request, falling back to window size 1", session)
+                    session.window_size = 1
+                self._send_request_packet(session, is_retransmission=True)
                 session.retries += 1
             else:
                 has_failed = True
@@ -283,8 +300,17 @@ class TftpHandler(TaskManager):
             return
 
         file_name = packet['file_name'].decode('utf8')
-        block_size = packet['options']['blksize']
+        # we never send blocks that do not fit in a single UDP packet, or windows larger than we allow
+        block_size = min(packet['options']['blksize'], MAX_BLOCK_SIZE)
         timeout = packet['options']['timeout']
+        window_size = min(packet['options'].get('windowsize', 1), MAX_WINDOW_SIZE)
+
+        # a retransmitted request replaces the session if the transfer has not started yet
+        existing_session = self._session_dict.get((ip, port, packet['session_id']))
+        if existing_session and not existing_session.is_client \
+                and existing_session.last_sent_packet['opcode'] == OPCODE_OACK:
+            self._logger.debug(u"%s got retransmitted request", existing_session)
+            self._cleanup_session((ip, port, packet['session_id']))
 
         # check session_id
         if (ip, port, packet['session_id']) in self._session_dict:
@@ -294,6 +320,13 @@ class TftpHandler(TaskManager):
             self._handle_error(dummy_session, 50)
             return
 
+        if block_size <= 0 or window_size <= 0:
+            self._logger.warn(u"Invalid options from %s:%s, packet=%s", ip, port, repr(packet))
+            dummy_session = Session(False, packet['session_id'], (ip, port), packet['opcode'],
+                                    file_name, None, None, None, block_size=block_size, timeout=timeout)
+            self._handle_error(dummy_session, 8)
+            return
+
         # read the file/directory into memory
         try:
             if file_name.startswith(METADATA_PREFIX):
@@ -320,7 +353,8 @@ class TftpHandler(TaskManager):
 
         # create a session object
         session = Session(False, packet['session_id'], (ip, port), packet['opcode'],
-                          file_name, file_data, file_size, checksum, block_size=block_size, timeout=timeout)
+                          file_name, file_data, file_size, checksum, block_size=block_size, timeout=timeout,
+                          window_size=window_size)
 
         # insert session_id and session
         self._add_new_session(session)
@@ -355,26 +389,37 @@ class TftpHandler(TaskManager):
 
         return file_data, len(file_data)
 
-    def _get_next_data(self, session):
-        """ Gets the next block of data to be uploaded. This method is only used for data uploading.
+    def _get_block_data(self, session, block_number):
+        """ Gets a block of data to be uploaded. This method is only used for data uploading.
+        :param block_number: The number of the block, the first block is 1.
         :return The data to transfer.
         """
-        start_idx = session.block_number * session.block_size
-        end_idx = start_idx + session.block_size
-        data = session.file_data[start_idx:end_idx]
-        session.block_number += 1
+        start_idx = (block_number - 1) * session.block_size
+        return session.file_data[start_idx:start_idx + session.block_size]
 
+    def _send_data_blocks(self, session, first_block_number, last_block_number):
+        """ Sends a range of blocks. Blocks that have been sent before are retransmissions.
+        :param first_block_number: The first block to send.
+        :param last_block_number: The last block to send.
+        """
+        for block_number in xrange(first_block_number, last_block_number + 1):
+            self._send_data_packet(session, block_number, self._get_block_data(session, block_number),
+                                   is_retransmission=block_number <= session.block_number)
+
+        session.block_number = max(session.block_number, last_block_number)
         # check if we are done
-        if len(data) < session.block_size:
+        if session.block_number == session.num_blocks:
             session.is_waiting_for_last_ack = True
 
-        return data
-
     def _process_packet(self, session, packet):
         """ processes an incoming packet.
         :param packet: The incoming packet dictionary.
         """
         session.last_contact_time = time()
+        session.retries = 0
+        if session.rtt_start_time is not None:
+            session.update_rtt(session.last_contact_time - session.rtt_start_time)
+            session.rtt_start_time = None
         # check if it is an ERROR packet
         if packet['opcode'] == OPCODE_ERROR:
             self._logger.warning(u"%s got ERROR message: code = %s, msg = %s",
@@ -410,6 +455,16 @@ class TftpHandler(TaskManager):
                     self._handle_error(session, 0, error_msg=msg)  # Error: timeout mismatch
                     return
 
+                # the sender may choose a smaller window, peers that do not support windows leave it out
+                window_size = packet['options'].get('windowsize', 1)
+                if not 0 < window_size <= session.window_size:
+                    msg = "%s OACK windowsize mismatch: %s > %s (expected)" %\
+                          (session, window_size, session.window_size)
+                    self._logger.error(msg)
+                    self._handle_error(session, 8, error_msg=msg)  # Error: windowsize mismatch
+                    return
+
+                session.window_size = window_size
                 session.file_size = packet['options']['tsize']
                 session.checksum = packet['options']['checksum']
 
@@ -437,22 +492,35 @@ class TftpHandler(TaskManager):
         if packet['block_number'] < session.block_number:
             self._logger.warn(u"%s ignore old block number DATA %s < %s",
                               session, packet['block_number'], session.block_number)
+            # the sender retransmits the window if our last ACK got lost, so acknowledge it again
+            if packet['block_number'] == session.ack_block_number:
+                self._send_ack_packet(session, session.ack_block_number, is_retransmission=True)
             return
 
         if packet['block_number'] != session.block_number:
+            if session.window_size > 1:
+                # a block of the window got lost, let the sender continue from the last block we have
+                self._logger.debug(u"%s got DATA %s while expecting %s",
+                                   session, packet['block_number'], session.block_number)
+                if session.ack_block_number != session.block_number - 1:
+                    self._send_ack_packet(session, session.block_number - 1)
+                return
+
             msg = "%s Got ACK with block# %s while expecting %s" %\
                   (session, packet['block_number'], session.block_number)
             self._logger.error(msg)
             self._handle_error(session, 0, error_msg=msg)  # Error: block_number mismatch
             return
 
-        # save data
+        # save data, only acknowledge full windows and the last block
         session.file_data += packet['data']
-        self._send_ack_packet(session, session.block_number)
+        is_last_block = len(packet['data']) < session.block_size
+        if is_last_block or session.block_number - session.ack_block_number >= session.window_size:
+            self._send_ack_packet(session, session.block_number)
         session.block_number += 1
 
         # check if it is the end
-        if len(packet['data']) < session.block_size:
+        if is_last_block:
             self._logger.info(u"%s transfer finished. checking data integrity...", session)
             # check file size and checksum
             if session.file_size != len(session.file_data):
@@ -483,25 +551,26 @@ class TftpHandler(TaskManager):
 
         # check block number
         # ignore old ones, they may be retransmissions
-        if packet['block_number'] < session.block_number:
-            self._logger.warn(u"%s ignore old block number ACK %s < %s",
-                              session, packet['block_number'], session.block_number)
+        if packet['block_number'] <= session.ack_block_number:
+            self._logger.warn(u"%s ignore old block number ACK %s <= %s",
+                              session, packet['block_number'], session.ack_block_number)
             return
 
-        if packet['block_number'] != session.block_number:
+        if packet['block_number'] > session.block_number:
             msg = "%s got ACK with block# %s while expecting %s" %\
                   (session, packet['block_number'], session.block_number)
             self._logger.error(msg)
             self._handle_error(session, 0, error_msg=msg)  # Error: block_number mismatch
             return
 
-        if session.is_waiting_for_last_ack:
+        session.ack_block_number = packet['block_number']
+        if session.ack_block_number == session.num_blocks:
             session.is_done = True
             return
 
-        data = self._get_next_data(session)
-        # send DATA
-        self._send_data_packet(session, session.block_number, data)
+        # send the next window of DATA, starting after the last block the receiver has
+        self._send_data_blocks(session, session.ack_block_number + 1,
+                               min(session.ack_block_number + session.window_size, session.num_blocks))
 
     def _handle_error(self, session, error_code, error_msg=""):
         """ Handles an error during packet processing.
@@ -511,7 +580,7 @@ class TftpHandler(TaskManager):
         msg = error_msg if error_msg else ERROR_DICT.get(error_code, error_msg)
         self._send_error_packet(session, error_code, msg)
 
-    def _send_packet(self, session, packet):
+    def _send_packet(self, session, packet, is_retransmission=False):
         packet_buff = encode_packet(packet)
         extra_msg = u" block_number = %s" % packet['block_number'] if packet.get('block_number') is not None else ""
         extra_msg += u" block_size = %s" % len(packet['data']) if packet.get('data') is not None else ""
@@ -524,7 +593,13 @@ class TftpHandler(TaskManager):
         session.last_contact_time = time()
         session.last_sent_packet = packet
 
-    def _send_request_packet(self, session):
+        # only measure the round trip time of packets that have been sent once (Karn's algorithm)
+        if is_retransmission:
+            session.rtt_start_time = None
+        elif session.rtt_start_time is None:
+            session.rtt_start_time = session.last_contact_time
+
+    def _send_request_packet(self, session, is_retransmission=False):
         assert session.request == OPCODE_RRQ, u"Invalid request_opcode %s" % repr(session.request)
 
         packet = {'opcode': session.request,
@@ -533,20 +608,23 @@ class TftpHandler(TaskManager):
                   'options': {'blksize': session.block_size,
                               'timeout': session.timeout,
                               }}
-        self._send_packet(session, packet)
+        if session.window_size > 1:
+            packet['options']['windowsize'] = session.window_size
+        self._send_packet(session, packet, is_retransmission=is_retransmission)
 
-    def _send_data_packet(self, session, block_number, data):
+    def _send_data_packet(self, session, block_number, data, is_retransmission=False):
         packet = {'opcode': OPCODE_DATA,
                   'session_id': session.session_id,
                   'block_number': block_number,
                   'data': data}
-        self._send_packet(session, packet)
+        self._send_packet(session, packet, is_retransmission=is_retransmission)
 
-    def _send_ack_packet(self, session, block_number):
+    def _send_ack_packet(self, session, block_number, is_retransmission=False):
         packet = {'opcode': OPCODE_ACK,
                   'session_id': session.session_id,
                   'block_number': block_number}
-        self._send_packet(session, packet)
+        session.ack_block_number = block_number
+        self._send_packet(session, packet, is_retransmission=is_retransmission)
 
     def _send_error_packet(self, session, error_code, error_msg):
         packet = {'opcode': OPCODE_ERROR,
@@ -565,4 +643,6 @@ class TftpHandler(TaskManager):
                               'tsize': session.file_size,
                               'checksum': session.checksum,
                               }}
+        if session.window_size > 1:
+            packet['options']['windowsize'] = session.window_size
         self._send_packet(session, packet)
@@ -3,15 +3,23 @@ from time import time
 
 # default packet data size
 DEFAULT_BLOCK_SIZE = 512
+# the largest block that still fits in a 1500 bytes MTU, including the IP/UDP, endpoint prefix and TFTP headers
+MAX_BLOCK_SIZE = 1400
+
+# default number of blocks sent before waiting for an ACK (RFC 7440), 1 means stop-and-wait
+DEFAULT_WINDOW_SIZE = 16
+MAX_WINDOW_SIZE = 64
 
 # default timeout and maximum retries
 DEFAULT_TIMEOUT = 2
+# lower bound of the retransmission timeout that is derived from the round trip time
+MIN_TIMEOUT = 0.2
 
 
 class Session(object):
 
     def __init__(self, is_client, session_id, address, request, file_name, file_data, file_size, checksum,
-                 extra_info=None, block_size=DEFAULT_BLOCK_SIZE, timeout=DEFAULT_TIMEOUT,
+                 extra_info=None, block_size=DEFAULT_BLOCK_SIZE, timeout=DEFAULT_TIMEOUT, window_size=1,
                  success_callback=None, failure_callback=None):
         self.is_client = is_client
         self.session_id = session_id
@@ -27,6 +35,16 @@ class Session(object):
         self.block_number = 0
         self.block_size = block_size
         self.timeout = timeout
+        self.window_size = window_size
+
+        # the last block that has been acknowledged, ACK 0 acknowledges the OACK
+        self.ack_block_number = -1
+
+        # round trip time estimation (RFC 6298)
+        self.srtt = None
+        self.rttvar = None
+        self.rtt_start_time = None
+
         self.success_callback = success_callback
         self.failure_callback = failure_callback
 
@@ -42,6 +60,30 @@ class Session(object):
 
         self.next_func = None
 
+    @property
+    def num_blocks(self):
+        """
+        The number of DATA blocks of the file, the last block is always shorter than the block size.
+        """
+        return self.file_size // self.block_size + 1
+
+    @property
+    def rto(self):
+        """
+        The retransmission timeout, based on the measured round trip time and bounded by the negotiated timeout.
+        """
+        if self.srtt is None:
+            return self.timeout
+        return max(MIN_TIMEOUT, min(self.timeout, self.srtt + 4 * self.rttvar))
+
+    def update_rtt(self, rtt):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+
     def __str__(self):
         type_str = "C" if self.is_client else "S"
         return "TFTP[%s %s %s:%s][%s]" % (self.session_id, type_str, self.address[0], self.address[1],
@@ -1,5 +1,7 @@
 import socket
-from binascii import hexlify
+from binascii import hexlify, unhexlify
+from collections import deque
+from heapq import heapify, heappop, heappush
 import logging
 import time
 from twisted.internet.error import ConnectingCancelledError
@@ -11,6 +13,7 @@ from twisted.python.failure import Failure
 from Tribler.dispersy.taskmanager import TaskManager
 from Tribler.dispersy.util import blocking_call_on_reactor_thread, call_on_reactor_thread
 
+from Tribler.Core.Modules.tracker_manager import TRACKER_RETRY_INTERVAL
 from Tribler.Core.simpledefs import NTFY_TORRENTS
 from Tribler.Core.TorrentChecker.session import create_tracker_session, FakeDHTSession, UdpSocketManager
 from Tribler.Core.Utilities.tracker_utils import MalformedTrackerURLException
@@ -22,6 +25,10 @@ DEFAULT_TORRENT_CHECK_INTERVAL = 900  # base multiplier for the check delay
 DEFAULT_MAX_TORRENT_CHECK_RETRIES = 8  # max check delay increments when failed.
 DEFAULT_TORRENT_CHECK_RETRY_INTERVAL = 30  # interval when the torrent was successfully checked for the last time
 
+TRACKER_QUEUE_REFRESH_INTERVAL = 600  # reload the queue of trackers to check from the database every 10 minutes
+TORRENTS_PER_TRACKER_CHECK = 30  # the maximum number of torrents that are checked in one tracker session
+SCRAPE_RATE_WINDOW = 60  # the number of seconds over which the scrape throughput is measured
+
 
 class TorrentChecker(TaskManager):
 
@@ -41,6 +48,16 @@ class TorrentChecker(TaskManager):
         self._session_list = {'DHT': []}
         self._last_torrent_selection_time = 0
 
+        # The trackers that are checked automatically, as a priority queue of (next check time, tracker URL) tuples
+        self._max_parallel_sessions = session.get_torrent_checking_max_parallel_sessions()
+        self._tracker_queue = []
+        self._tracker_queue_refresh_time = 0
+        self._auto_check_trackers = set()
+
+        # Statistics on the automatic tracker checks
+        self._checked_torrents = deque()
+        self._torrent_backlog = {}
+
         # Track all session cleanups
         self.session_stop_defer_list = []
 
@@ -107,41 +124,141 @@ class TorrentChecker(TaskManager):
 
     def _task_select_tracker(self):
         """
-        The regularly scheduled task that selects torrents associated with a specific tracker to check.
+        The regularly scheduled task that selects the trackers whose torrents should be checked.
         """
 
         # update the torrent selection interval
         self._reschedule_tracker_select()
 
-        # start selecting torrents
-        tracker_url = self.tribler_session.lm.tracker_manager.get_next_tracker_for_auto_check()
-        if tracker_url is None:
-            self._logger.warn(u"No tracker to select from, skip")
-            return succeed(None)
+        return self._start_tracker_checks()
+
+    def _start_tracker_checks(self):
+        """
+        Start checking the trackers that are due, until the maximum number of parallel tracker sessions is reached.
+        :returns A deferred that fires once the started tracker checks have completed.
+        """
+        deferred_list = []
+        current_time = time.time()
+        while not self._should_stop and len(self._auto_check_trackers) < self._max_parallel_sessions:
+            tracker_url = self._pop_due_tracker(current_time)
+            if tracker_url is None:
+                break
+            deferred_list.append(self._check_tracker(tracker_url))
+
+        if not deferred_list and not self._auto_check_trackers:
+            self._logger.debug(u"No tracker to select from, skip")
 
+        return DeferredList(deferred_list).addCallback(lambda _: None)
+
+    def _refresh_tracker_queue(self, current_time):
+        """
+        Reload the queue of trackers to check from the database, to pick up new trackers and drop dead ones.
+        """
+        tracker_list = self.tribler_session.lm.tracker_manager.get_trackers_for_auto_check()
+        self._tracker_queue = [(next_check, tracker_url) for tracker_url, next_check in tracker_list
+                               if tracker_url not in self._auto_check_trackers]
+        heapify(self._tracker_queue)
+
+        queued_trackers = set(tracker_url for _, tracker_url in self._tracker_queue) | self._auto_check_trackers
+        for tracker_url in self._torrent_backlog.keys():
+            if tracker_url not in queued_trackers:
+                del self._torrent_backlog[tracker_url]
+        self._tracker_queue_refresh_time = current_time + TRACKER_QUEUE_REFRESH_INTERVAL
+
+    def _pop_due_tracker(self, current_time):
+        """
+        Take the tracker that has been due the longest from the queue.
+        :return: The URL of the tracker, or None if no tracker is due.
+        """
+        if not self._tracker_queue or current_time >= self._tracker_queue_refresh_time:
+            self._refresh_tracker_queue(current_time)
+
+        if not self._tracker_queue or self._tracker_queue[0][0] > current_time:
+            return None
+        return heappop(self._tracker_queue)[1]
+
+    def _on_tracker_checked(self, tracker_url, num_checked=0):
+        """
+        Put a tracker back in the queue after it has been checked, unless it has been marked as dead.
+        """
+        self._auto_check_trackers.discard(tracker_url)
+        if num_checked:
+            self._checked_torrents.append((time.time(), num_checked))
+
+        tracker_info = self.tribler_session.lm.tracker_manager.get_tracker_info(tracker_url)
+        if tracker_info and tracker_info[u'is_alive']:
+            heappush(self._tracker_queue, (tracker_info[u'last_check'] + TRACKER_RETRY_INTERVAL, tracker_url))
+
+    def _check_tracker(self, tracker_url):
+        """
+        Check the torrents on a tracker that are due to be checked.
+        :returns A deferred that fires once the tracker check has completed.
+        """
+        self._auto_check_trackers.add(tracker_url)
         self._logger.debug(u"Start selecting torrents on tracker %s.", tracker_url)
 
         # get the torrents that should be checked
-        infohashes = self._torrent_db.getTorrentsOnTracker(tracker_url, int(time.time()))
+        current_time = int(time.time())
+        infohashes = self._torrent_db.getTorrentsOnTracker(tracker_url, current_time, TORRENTS_PER_TRACKER_CHECK)
+        self._torrent_backlog[tracker_url] = len(infohashes) if len(infohashes) < TORRENTS_PER_TRACKER_CHECK \
+            else self._torrent_db.getNumberOfTorrentsDueOnTracker(tracker_url, current_time)
 
         if len(infohashes) == 0:
             # We have not torrent to recheck for this tracker. Still update the last_check for this tracker.
             self._logger.info("No torrent to check for tracker %s", tracker_url)
             self.tribler_session.lm.tracker_manager.update_tracker_info(tracker_url, True)
+            self._on_tracker_checked(tracker_url)
             return succeed(None)
-        elif tracker_url != u'DHT' and tracker_url != u'no-DHT':
-            try:
-                session = self._create_session_for_request(tracker_url, timeout=30)
-            except MalformedTrackerURLException as e:
-                self._logger.error(e)
-                return succeed(None)
-
-            for infohash in infohashes:
-                session.add_infohash(infohash)
 
-            self._logger.info(u"Selected %d new torrents to check on tracker: %s", len(infohashes), tracker_url)
-            return session.connect_to_tracker().addCallbacks(*self.get_callbacks_for_session(session))\
-                .addErrback(lambda _: None)
+        try:
+            session = self._create_session_for_request(tracker_url, timeout=30)
+        except MalformedTrackerURLException as e:
+            # The tracker is not put back in the queue, it is only retried when the queue is reloaded
+            self._logger.error(e)
+            self._auto_check_trackers.discard(tracker_url)
+            return succeed(None)
+
+        for infohash in infohashes:
+            session.add_infohash(infohash)
+
+        def on_tracker_checked(result):
+            if self._should_stop:
+                return
+            if result:
+                self._store_tracker_results(result)
+            self._on_tracker_checked(tracker_url, len(infohashes) if result else 0)
+            # a tracker session is free again, start checking the next tracker that is due
+            self._start_tracker_checks()
+
+        self._logger.info(u"Selected %d new torrents to check on tracker: %s", len(infohashes), tracker_url)
+        return session.connect_to_tracker().addCallbacks(*self.get_callbacks_for_session(session))\
+            .addErrback(lambda _: None).addCallback(on_tracker_checked)
+
+    def _store_tracker_results(self, result):
+        """
+        Store the seeders and leechers that are reported by a tracker session in the database.
+        """
+        last_check = int(time.time())
+        for response_list in result.itervalues():
+            for response in response_list:
+                self._update_torrent_result({'infohash': unhexlify(response['infohash']),
+                                             'seeders': response['seeders'], 'leechers': response['leechers'],
+                                             'last_check': last_check})
+
+    def get_statistics(self):
+        """
+        Return statistics on the automatic tracker checks: the number of torrents checked in the last minute, the
+        number of trackers that are due to be checked and the number of due torrents found on the checked trackers.
+        """
+        current_time = time.time()
+        while self._checked_torrents and self._checked_torrents[0][0] < current_time - SCRAPE_RATE_WINDOW:
+            self._checked_torrents.popleft()
+
+        return {"torrents_checked_per_minute": sum(num_checked for _, num_checked in self._checked_torrents),
+                "active_tracker_checks": len(self._auto_check_trackers),
+                "trackers_queued": len(self._tracker_queue),
+                "trackers_due": sum(1 for next_check, _ in self._tracker_queue if next_check <= current_time),
+                "torrents_due": sum(self._torrent_backlog.itervalues())}
 
     def get_callbacks_for_session(self, session):
         success_lambda = lambda info_dict: self._on_result_from_session(session, info_dict)
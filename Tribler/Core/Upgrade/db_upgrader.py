@@ -12,7 +12,7 @@ from sqlite3 import Connection
 from Tribler.Core.Category.Category import Category
 from Tribler.Core.CacheDB.SqliteCacheDBHandler import TorrentDBHandler
 from Tribler.Core.CacheDB.db_versions import LOWEST_SUPPORTED_DB_VERSION, LATEST_DB_VERSION
-from Tribler.Core.CacheDB.sqlitecachedb import str2bin
+from Tribler.Core.CacheDB.sqlitecachedb import bin2blob, str2bin
 from Tribler.Core.TorrentDef import TorrentDef
 from Tribler.Core.Utilities.search_utils import split_into_keywords
 
@@ -82,6 +82,18 @@ class DBUpgrader(object):
         if self.db.version == 28:
             self._upgrade_28_to_29()
 
+        # version 29 -> 30
+        if self.db.version == 29:
+            self._upgrade_29_to_30()
+
+        # version 30 -> 31
+        if self.db.version == 30:
+            self._upgrade_30_to_31()
+
+        # version 31 -> 32
+        if self.db.version == 31:
+            self._upgrade_31_to_32()
+
         # check if we managed to upgrade to the latest DB version.
         if self.db.version == LATEST_DB_VERSION:
             self.status_update_func(u"Database upgrade finished.")
@@ -533,6 +545,66 @@ CREATE VIRTUAL TABLE FullTextIndex USING fts4(swarmname, filenames, fileextensio
         # update database version
         self.db.write_version(29)
 
+    def _upgrade_29_to_30(self):
+        self.status_update_func(u"Upgrading database from v%s to v%s..." % (29, 30))
+
+        # keep the next check time of every torrent next to its trackers, so the torrents to check on a tracker can be
+        # found with an index instead of scanning the Torrent table
+        self.db.execute(u"""
+ALTER TABLE TorrentTrackerMapping ADD COLUMN next_check integer DEFAULT 0;
+
+UPDATE TorrentTrackerMapping SET next_check =
+  (SELECT next_tracker_check FROM Torrent WHERE Torrent.torrent_id = TorrentTrackerMapping.torrent_id);
+
+CREATE INDEX IF NOT EXISTS TorrentTrackerMapping_next_check_idx
+  ON TorrentTrackerMapping (tracker_id, next_check, torrent_id);
+""")
+
+        # update database version
+        self.db.write_version(30)
+
+    def _upgrade_30_to_31(self):
+        self.status_update_func(u"Upgrading database from v%s to v%s..." % (30, 31))
+
+        # infohashes used to be stored base64 encoded, from now on they are stored as BLOBs. The channel cids are
+        # already stored as BLOBs.
+        self.db.connection.createscalarfunction(u"base64_to_blob", lambda data: bin2blob(str2bin(data)), 1)
+        self.db.execute(u"UPDATE Torrent SET infohash = base64_to_blob(infohash) WHERE typeof(infohash) == 'text';")
+
+        # update database version
+        self.db.write_version(31)
+
+    def _upgrade_31_to_32(self):
+        self.status_update_func(u"Upgrading database from v%s to v%s..." % (31, 32))
+
+        # store the eviction weight of every torrent, including its age, so the collected torrents to erase can be
+        # read in order from an index instead of computing the weight of every collected torrent. Inserts set the
+        # weight, a trigger keeps it up to date.
+        self.db.execute(u"""
+ALTER TABLE Torrent ADD COLUMN eviction_weight numeric DEFAULT 0;
+
+UPDATE Torrent SET eviction_weight =
+    MIN(IFNULL(relevance, 0), 2500) + MIN(500, IFNULL(num_leechers, 0)) + 4 * MIN(500, IFNULL(num_seeders, 0))
+    + MIN(CAST(strftime('%s', 'now') AS integer) / 86400,
+          MAX(IFNULL(creation_date, 0) / 86400, CAST(strftime('%s', 'now') AS integer) / 86400 - 500));
+
+CREATE INDEX IF NOT EXISTS Torrent_eviction_idx
+  ON Torrent (is_collected, eviction_weight);
+
+CREATE TRIGGER IF NOT EXISTS Torrent_eviction_weight_update
+  AFTER UPDATE OF relevance, num_seeders, num_leechers, creation_date ON Torrent
+BEGIN
+  UPDATE Torrent SET eviction_weight =
+    MIN(IFNULL(NEW.relevance, 0), 2500) + MIN(500, IFNULL(NEW.num_leechers, 0)) + 4 * MIN(500, IFNULL(NEW.num_seeders, 0))
+    + MIN(CAST(strftime('%s', 'now') AS integer) / 86400,
+          MAX(IFNULL(NEW.creation_date, 0) / 86400, CAST(strftime('%s', 'now') AS integer) / 86400 - 500))
+  WHERE torrent_id = NEW.torrent_id;
+END;
+""")
+
+        # update database version
+        self.db.write_version(32)
+
     def reimport_torrents(self):
         """Import all torrent files in the collected torrent dir, all the files already in the database will be ignored.
         """
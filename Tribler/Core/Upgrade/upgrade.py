@@ -107,7 +107,7 @@ class TriblerUpgrader(object):
         """
         try:
             from Tribler.Core.leveldbstore import LevelDbStore
-            torrent_store = LevelDbStore(self.session.get_torrent_store_dir())
+            torrent_store = LevelDbStore(self.session.get_torrent_store_dir(), compress=True)
             torrent_migrator = TorrentMigrator65(
                 self.session.get_torrent_collecting_dir(), self.session.get_state_dir(),
                 torrent_store=torrent_store, status_update_func=self.update_status)
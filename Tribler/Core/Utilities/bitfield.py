@@ -0,0 +1,85 @@
+"""
+Piece bitfield utilities.
+
+Bitfields are handled as a whole by the string and integer operations of Python, instead of piece by piece, so that
+the bitfields of torrents with many pieces and swarms with many peers stay cheap.
+"""
+from binascii import unhexlify
+
+# Maps every byte of a bytearray of a bitfield to '1' when the piece is there and to '0' when it is not
+_BIT_CHARS = '0' + '1' * 255
+
+
+def bitfield_to_string(bitfield):
+    """
+    Return a bitfield, a list of booleans, as a string of '0' and '1' characters.
+    """
+    return str(bytearray(bitfield)).translate(_BIT_CHARS)
+
+
+def bitfield_to_bytes(bitfield):
+    """
+    Pack a bitfield into bytes, the first piece being the most significant bit of the first byte. The last byte is
+    padded with zero bits.
+    """
+    bits = bitfield_to_string(bitfield)
+    if not bits:
+        return ''
+    num_bytes = (len(bits) + 7) // 8
+    return unhexlify('%0*x' % (num_bytes * 2, int(bits.ljust(num_bytes * 8, '0'), 2)))
+
+
+def bitfield_to_int(bitfield):
+    """
+    Return a bitfield as an integer in which bit i is set when piece i is there.
+    """
+    bits = bitfield_to_string(bitfield)
+    return int(bits[::-1], 2) if bits else 0
+
+
+def popcount(value):
+    """
+    Return the number of set bits of a non-negative integer.
+    """
+    return bin(value).count('1')
+
+
+class BitfieldCounter(object):
+    """
+    Counts for every piece how many of the added bitfields have that piece.
+
+    The counts are bit-sliced: plane k is an integer holding bit k of the count of every piece. Adding a bitfield is a
+    ripple-carry addition over the planes, so it takes a few integer operations per plane instead of one per piece.
+    """
+
+    def __init__(self, num_pieces):
+        self.num_pieces = num_pieces
+        self.mask = (1 << num_pieces) - 1
+        self.planes = []
+
+    def add(self, bitfield):
+        """
+        Add a bitfield, as returned by bitfield_to_int. Pieces beyond num_pieces are ignored.
+        """
+        carry = bitfield & self.mask
+        for index, plane in enumerate(self.planes):
+            if not carry:
+                return
+            self.planes[index] = plane ^ carry
+            carry &= plane
+        if carry:
+            self.planes.append(carry)
+
+    def get_minimum(self):
+        """
+        Return the lowest count of a piece and the number of pieces with that count.
+        """
+        candidates = self.mask
+        minimum = 0
+        for index in reversed(xrange(len(self.planes))):
+            zeros = candidates & ~self.planes[index]
+            if zeros:
+                candidates = zeros
+            else:
+                minimum |= 1 << index
+        return minimum, popcount(candidates)
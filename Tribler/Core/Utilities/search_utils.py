@@ -3,11 +3,18 @@ Search utilities.
 
 Author(s): Jelle Roozenburg, Arno Bakker
 """
+import math
 import re
+from struct import unpack_from
 
 RE_KEYWORD_SPLIT = re.compile(r"[\W_]", re.UNICODE)
 DIALOG_STOPWORDS = {'an', 'and', 'by', 'for', 'from', 'of', 'the', 'to', 'with'}
 
+BM25_K1 = 1.2
+# The relevance of a torrent is 80% dependent on matching in the name of the torrent, 10% on the names of the files in
+# the torrent and 10% on the extensions of files in the torrent (the columns of the FullTextIndex).
+BM25_COLUMN_WEIGHTS = (0.8, 0.1, 0.1)
+
 
 def split_into_keywords(string, to_filter_stopwords=False):
     """
@@ -27,3 +34,38 @@ def split_into_keywords(string, to_filter_stopwords=False):
 
 def filter_keywords(keywords):
     return [kw for kw in keywords if len(kw) > 0 and kw not in DIALOG_STOPWORDS]
+
+
+def bm25_inverse_document_frequency(num_rows, rows_with_term):
+    return math.log((num_rows - rows_with_term + 0.5) / (rows_with_term + 0.5), 2)
+
+
+def bm25_term_frequency(term_freq):
+    return (term_freq * (BM25_K1 + 1)) / (term_freq + BM25_K1)
+
+
+def bm25_relevance(matchinfo, num_seeders=0):
+    """
+    Calculates the relevance of a FullTextIndex row, based on its matchinfo(FullTextIndex, 'pcnalx') blob.
+    The algorithm is based on BM25. The document length factor is disregarded since our "documents" are very small
+    (often a few keywords). Torrents with seeders get their number of seeders added to the score.
+    This function is registered in the database as the bm25_relevance SQL function so results can be ranked (and
+    limited) by SQLite itself.
+    See https://en.wikipedia.org/wiki/Okapi_BM25 and https://www.sqlite.org/fts3.html#matchinfo for more information.
+    """
+    num_phrases, num_cols, num_rows = unpack_from('III', matchinfo)
+    # Skip the p, c, n, a and l values, what remains are the x values (3 per column per phrase)
+    hits = unpack_from('I' * (3 * num_cols * num_phrases), matchinfo, 4 * (3 + 2 * num_cols))
+
+    score = 0.0
+    for col_ind, weight in enumerate(BM25_COLUMN_WEIGHTS[:num_cols]):
+        for phrase_ind in xrange(num_phrases):
+            base_term_offset = 3 * (col_ind + phrase_ind * num_cols)
+            term_freq = hits[base_term_offset]
+            if term_freq:
+                score += weight * bm25_inverse_document_frequency(num_rows, hits[base_term_offset + 2]) * \
+                    bm25_term_frequency(term_freq)
+
+    if num_seeders > 0:
+        score += num_seeders
+    return score
@@ -107,6 +107,7 @@ sessdefaults['mainline_dht']['mainline_dht_port'] = -1
 # Torrent checking settings
 sessdefaults['torrent_checking'] = OrderedDict()
 sessdefaults['torrent_checking']['enabled'] = 1
+sessdefaults['torrent_checking']['max_parallel_sessions'] = 5
 
 # Torrent store settings
 sessdefaults['torrent_store'] = OrderedDict()
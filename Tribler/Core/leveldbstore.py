@@ -3,11 +3,13 @@ LevelDBStore.
 
 Author(s): Elric Milon
 """
-from collections import MutableMapping
-from itertools import chain
+from collections import MutableMapping, OrderedDict
+from itertools import chain, imap
 import os
+import zlib
 
 from shutil import rmtree
+from threading import RLock
 
 import logging
 
@@ -42,21 +44,40 @@ from Tribler.dispersy.taskmanager import TaskManager
 
 
 WRITEBACK_PERIOD = 120
+WRITEBACK_SIZE = 4 * 1024 * 1024  # pending writes are flushed as soon as they take this many bytes
+READ_CACHE_SIZE = 8 * 1024 * 1024
 
-# TODO(emilon): Make sure the caching makes an actual difference in IO and kill
-# it if it doesn't as it complicates the code.
+# Prefix of compressed values, bencoded torrents never start with this byte
+COMPRESSED_PREFIX = '\xff'
 
 
 class LevelDbStore(MutableMapping, TaskManager):
+    """
+    A dict-like LevelDB database with a write-back buffer and an LRU read cache.
+
+    Writes are collected in memory and written in one batch every WRITEBACK_PERIOD seconds, or as soon as they take
+    more than writeback_size bytes. The most recently read values are cached up to read_cache_size bytes. If compress
+    is set, values are stored zlib compressed when that makes them smaller.
+    """
     _reactor = reactor
     _leveldb = LevelDB
     _writebatch = get_write_batch
 
-    def __init__(self, store_dir):
+    def __init__(self, store_dir, read_cache_size=READ_CACHE_SIZE, writeback_size=WRITEBACK_SIZE, compress=False):
         super(LevelDbStore, self).__init__()
 
         self._store_dir = store_dir
         self._pending_torrents = {}
+        self._pending_size = 0
+        self._writeback_size = writeback_size
+        self._cache = OrderedDict()
+        self._cache_size = 0
+        self._read_cache_size = read_cache_size
+        self._compress = compress
+        # The read cache is also used by the threads that read from the store
+        self._lock = RLock()
+        # The number of keys in the database, counted when the length of the store is first requested
+        self._count = None
         self._logger = logging.getLogger(self.__class__.__name__)
         # This is done to work around LevelDB's inability to deal with non-ascii paths on windows.
         try:
@@ -88,62 +109,160 @@ class LevelDbStore(MutableMapping, TaskManager):
         try:
             return self._pending_torrents[key]
         except KeyError:
-            return self._db.Get(key)
+            pass
+
+        with self._lock:
+            value = self._cache.pop(key, None)
+            if value is None:
+                value = self._decode(self._db.Get(key))
+                self._cache_size += len(value)
+            # Mark this entry as the most recently used one
+            self._cache[key] = value
+            self._trim_cache()
+            return value
 
     def __setitem__(self, key, value):
-        self._pending_torrents[key] = value
+        self.multi_put(((key, value),))
 
     def __delitem__(self, key):
-        if key in self._pending_torrents:
-            self._pending_torrents.pop(key)
-        self._db.Delete(key)
+        self.multi_delete((key,))
 
     def __iter__(self):
-        for k in self._pending_torrents.iterkeys():
-            yield k
-        for k, _ in self._db.RangeIter():
+        for k in self._pending_torrents.keys():
             yield k
+        for k in self._db.RangeIter(include_value=False):
+            if k not in self._pending_torrents:
+                yield k
 
     def __contains__(self, key):
-        if key in self._pending_torrents:
-            return True
-        try:
-            self.__getitem__(key)
-            return True
-        except KeyError:
-            pass
-
-        return False
+        return key in self._pending_torrents or key in self._cache or self._db_contains(key)
 
     def __len__(self):
-        return len(self._pending_torrents) + len(list(self.keys()))
+        """
+        Return the number of keys in the store. Pending writes of keys that are already in the database are counted
+        twice until they are flushed.
+        """
+        if self._count is None:
+            self._count = sum(1 for _ in self._db.RangeIter(include_value=False, fill_cache=False))
+        return self._count + len(self._pending_torrents)
 
     def keys(self):
-        return [k for k, _ in self._db.RangeIter()]
+        return list(self)
 
     def iteritems(self):
-        return chain(self._pending_torrents, self._db.RangeIter())
+        pending_items = self._pending_torrents.items()
+        return chain(pending_items, ((k, self._decode(v)) for k, v in self._db.RangeIter()
+                                     if k not in self._pending_torrents))
 
     def put(self, k, v):
         self.__setitem__(k, v)
 
+    def multi_get(self, keys):
+        """
+        Return a dict with the values of the given keys, keys that are not in the store are left out.
+        """
+        values = {}
+        for key in sorted(keys):
+            try:
+                values[key] = self[key]
+            except KeyError:
+                pass
+        return values
+
+    def multi_put(self, items):
+        """
+        Store all (key, value) pairs of a dict or an iterable.
+        """
+        with self._lock:
+            for key, value in (items.iteritems() if isinstance(items, dict) else items):
+                self._uncache(key)
+                if key in self._pending_torrents:
+                    self._pending_size -= len(self._pending_torrents[key])
+                self._pending_torrents[key] = value
+                self._pending_size += len(value)
+
+            if self._pending_size > self._writeback_size:
+                self.flush()
+
+    def multi_delete(self, keys):
+        """
+        Delete the given keys from the store in one batch, keys that are not in the store are ignored.
+        """
+        with self._lock:
+            write_batch = self._writebatch(self._db)
+            for key in keys:
+                if key in self._pending_torrents:
+                    self._pending_size -= len(self._pending_torrents.pop(key))
+                self._uncache(key)
+                if self._count is not None and self._db_contains(key):
+                    self._count -= 1
+                write_batch.Delete(key)
+            return self._db.Write(write_batch)
+
     def rangescan(self, start=None, end=None):
         if start is None and end is None:
-            return self._db.RangeIter()
+            items = self._db.RangeIter()
         elif end is None:
-            return self._db.RangeIter(key_from=start)
+            items = self._db.RangeIter(key_from=start)
         else:
-            return self._db.RangeIter(key_from=start, key_to=end)
+            items = self._db.RangeIter(key_from=start, key_to=end)
+        return imap(lambda item: (item[0], self._decode(item[1])), items) if self._compress else items
 
     def flush(self):
-        if self._pending_torrents:
-            write_batch = self._writebatch(self._db)
-            for k, v in self._pending_torrents.iteritems():
-                write_batch.Put(k, v)
-            self._pending_torrents.clear()
-            return self._db.Write(write_batch)
+        with self._lock:
+            if self._pending_torrents:
+                write_batch = self._writebatch(self._db)
+                for k, v in self._pending_torrents.iteritems():
+                    if self._count is not None and not self._db_contains(k):
+                        self._count += 1
+                    write_batch.Put(k, self._encode(v))
+
+                # The flushed values are likely to be read soon
+                for k, v in self._pending_torrents.iteritems():
+                    self._cache[k] = v
+                    self._cache_size += len(v)
+                self._trim_cache()
+
+                self._pending_torrents.clear()
+                self._pending_size = 0
+                return self._db.Write(write_batch)
 
     def close(self):
         self.cancel_all_pending_tasks()
-        self.flush()
-        self._db = None
+        with self._lock:
+            self.flush()
+            self._cache.clear()
+            self._cache_size = 0
+            self._db = None
+
+    def get_statistics(self):
+        return {"pending": len(self._pending_torrents),
+                "pending_bytes": self._pending_size,
+                "cached": len(self._cache),
+                "cached_bytes": self._cache_size}
+
+    def _uncache(self, key):
+        value = self._cache.pop(key, None)
+        if value is not None:
+            self._cache_size -= len(value)
+
+    def _trim_cache(self):
+        while self._cache_size > self._read_cache_size:
+            _, value = self._cache.popitem(last=False)
+            self._cache_size -= len(value)
+
+    def _db_contains(self, key):
+        # Seek a key-only iterator, so the value is not read from disk
+        return next(self._db.RangeIter(key_from=key, include_value=False), None) == key
+
+    def _encode(self, value):
+        if self._compress:
+            compressed = zlib.compress(value)
+            if len(compressed) + 1 < len(value) or value[:1] == COMPRESSED_PREFIX:
+                return COMPRESSED_PREFIX + compressed
+        return value
+
+    def _decode(self, value):
+        if self._compress and value[:1] == COMPRESSED_PREFIX:
+            return zlib.decompress(value[1:])
+        return value
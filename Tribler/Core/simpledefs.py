@@ -42,6 +42,7 @@ For details see API.py
 """
 
 STATEDIR_DLPSTATE_DIR = u'dlcheckpoints'
+STATEDIR_CHECKPOINT_STORE_DIR = u'download_checkpoints'
 STATEDIR_PEERICON_DIR = u'icons'
 STATEDIR_TORRENT_STORE_DIR = u'collected_torrents'
 STATEDIR_METADATA_STORE_DIR = u'collected_metadata'
@@ -123,6 +124,11 @@ NTFY_ACT_MEET = 4
 # Infohashes are always 20 byte binary strings
 INFOHASH_LENGTH = 20
 
+# Priorities of metainfo lookups in the LibtorrentMgr, lower values are fetched first
+METAINFO_PRIORITY_USER = 0  # the user is waiting for the metainfo, e.g. in the torrent info dialog
+METAINFO_PRIORITY_COLLECTING = 1  # torrent collecting for channels and search
+METAINFO_PRIORITY_CREDIT_MINING = 2  # torrents that credit mining might want to boost
+
 
 # SIGNALS (for internal use)
 SIGNAL_ALLCHANNEL_COMMUNITY = 'signal_allchannel_community'
@@ -31,7 +31,19 @@ class TriblerStatistics(object):
 
                       "num_channels": channel_db_handler.getNrChannels(),
                       "database_size": os.path.getsize(
-                          os.path.join(self.session.get_state_dir(), DB_FILE_RELATIVE_PATH))}
+                          os.path.join(self.session.get_state_dir(), DB_FILE_RELATIVE_PATH)),
+                      "remote_search_cache": torrent_db_handler.remote_search_cache.get_statistics()}
+
+        if self.session.lm.resume_statistics:
+            stats_dict["resume"] = self.session.lm.get_resume_statistics()
+
+        stats_dict["notifier"] = self.session.notifier.get_statistics()
+
+        if self.session.lm.torrent_store is not None:
+            stats_dict["torrent_store"] = self.session.lm.torrent_store.get_statistics()
+
+        if self.session.lm.torrent_checker:
+            stats_dict["torrent_checker"] = self.session.lm.torrent_checker.get_statistics()
 
         if self.session.lm.rtorrent_handler:
             torrent_queue_stats = self.session.lm.rtorrent_handler.get_queue_stats()
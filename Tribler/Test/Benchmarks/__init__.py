@@ -0,0 +1,4 @@
+"""
+This package contains benchmarks for performance critical parts of Tribler. They are not part of the test suite and
+should be run as a module, i.e. python -m Tribler.Test.Benchmarks.benchmark_local_search.
+"""
@@ -0,0 +1,107 @@
+"""
+Benchmark of the piece bitfield analytics of a download in a large synthetic swarm.
+
+The availability of the swarm, the completion of the files and the base64 encoded bitfield of a download are computed
+with the bitfield utilities and with the piece by piece loops they replaced.
+
+Usage: python -m Tribler.Test.Benchmarks.benchmark_bitfield [--pieces 40000] [--peers 200] [--files 500]
+"""
+import argparse
+import base64
+import random
+from time import time
+
+from Tribler.Core.Utilities.bitfield import BitfieldCounter, bitfield_to_bytes, bitfield_to_int, bitfield_to_string
+
+
+def report(name, repeat, elapsed):
+    print "    %-24s %9.2f ms per call" % (name, elapsed / repeat * 1000)
+
+
+def legacy_availability(bitfields):
+    merged_bitfields = [0] * len(bitfields[0])
+    for have in bitfields:
+        for i in range(len(have)):
+            if have[i]:
+                merged_bitfields[i] += 1
+    nr_leechers_complete = min(merged_bitfields)
+    nr_more_than_min = len([x for x in merged_bitfields if x > nr_leechers_complete])
+    return nr_leechers_complete + float(nr_more_than_min) / len(merged_bitfields)
+
+
+def availability(bitfields):
+    counter = BitfieldCounter(len(bitfields[0]))
+    for have in bitfields:
+        counter.add(bitfield_to_int(have))
+    nr_leechers_complete, nr_min = counter.get_minimum()
+    return nr_leechers_complete + float(counter.num_pieces - nr_min) / counter.num_pieces
+
+
+def legacy_files_completion(have, filepieceranges):
+    completion = []
+    for t, tl in filepieceranges:
+        completed = 0
+        for index in range(t, tl):
+            if have[index]:
+                completed += 1
+        completion.append(completed / ((tl - t) * 1.0))
+    return completion
+
+
+def files_completion(have, filepieceranges):
+    have = bitfield_to_string(have)
+    return [have.count('1', t, tl) / ((tl - t) * 1.0) for t, tl in filepieceranges]
+
+
+def legacy_pieces_base64(have):
+    bitstr = ""
+    for bit in have:
+        bitstr += '1' if bit else '0'
+    encoded_str = ""
+    for i in range(0, len(bitstr), 8):
+        encoded_str += chr(int(bitstr[i:i + 8].ljust(8, '0'), 2))
+    return base64.b64encode(encoded_str)
+
+
+def pieces_base64(have):
+    return base64.b64encode(bitfield_to_bytes(have))
+
+
+def measure(name, func, args, repeat):
+    start = time()
+    for _ in xrange(repeat):
+        result = func(*args)
+    report(name, repeat, time() - start)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the piece bitfield analytics of a download")
+    parser.add_argument("--pieces", type=int, default=40000, help="number of pieces of the torrent")
+    parser.add_argument("--peers", type=int, default=200, help="number of leechers in the swarm")
+    parser.add_argument("--files", type=int, default=500, help="number of files in the torrent")
+    parser.add_argument("--repeat", type=int, default=5, help="number of calls per measurement")
+    args = parser.parse_args()
+
+    rand = random.Random(42)
+    bitfields = []
+    for _ in xrange(args.peers):
+        fraction = rand.random()
+        bitfields.append([rand.random() < fraction for _ in xrange(args.pieces)])
+    have = bitfields[0]
+    boundaries = sorted(rand.sample(xrange(1, args.pieces), args.files - 1))
+    filepieceranges = zip([0] + boundaries, boundaries + [args.pieces])
+
+    print "%d pieces, %d peers, %d files" % (args.pieces, args.peers, args.files)
+    for name, func, legacy_func, func_args in [("availability", availability, legacy_availability, (bitfields,)),
+                                               ("files completion", files_completion, legacy_files_completion,
+                                                (have, filepieceranges)),
+                                               ("pieces base64", pieces_base64, legacy_pieces_base64, (have,))]:
+        print "  %s" % name
+        legacy_result = measure("legacy", legacy_func, func_args, args.repeat)
+        result = measure("bitfield", func, func_args, args.repeat)
+        assert result == legacy_result
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Benchmark of storing the torrents of a channel snapshot received from dispersy.
+
+A synthetic channel snapshot is stored in an empty database twice: once torrent by torrent, the way
+ChannelCastDBHandler.on_torrents_from_dispersy used to store them, and once with the batched ingest path. Every path
+gets its own database, and the final commit is part of the measurement.
+
+Usage: python -m Tribler.Test.Benchmarks.benchmark_channel_ingest [--torrents 10000] [--batch 10000]
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+from collections import defaultdict
+from time import time
+
+from Tribler.Core.CacheDB.SqliteCacheDBHandler import ChannelCastDBHandler, TorrentDBHandler
+from Tribler.Core.CacheDB.sqlitecachedb import DB_SCRIPT_NAME, SQLiteCacheDB
+from Tribler.Core.Category.Category import Category
+from Tribler.Core.Utilities.install_dir import get_lib_path
+
+WORDS = ["ubuntu", "linux", "debian", "live", "desktop", "server", "amd64", "i386", "video", "music", "album",
+         "concert", "season", "episode", "pioneer", "one", "big", "buck", "bunny", "sintel", "creative", "commons",
+         "lecture", "course", "physics", "history", "dataset", "mirror", "archive"]
+EXTENSIONS = ["iso", "mkv", "mp4", "avi", "mp3", "flac", "txt", "pdf", "zip", "nfo"]
+TRACKERS = ["udp://tracker%d.example.org:6969/announce" % index for index in xrange(20)]
+
+
+class BenchmarkNotifier(object):
+
+    def notify(self, *args):
+        pass
+
+
+class BenchmarkSession(object):
+    """
+    The parts of a Tribler session that the database handlers use.
+    """
+
+    class LaunchMany(object):
+        tracker_manager = None
+
+    def __init__(self, sqlite_db):
+        self.sqlite_db = sqlite_db
+        self.notifier = BenchmarkNotifier()
+        self.lm = BenchmarkSession.LaunchMany()
+
+    def get_torrent_store(self):
+        return False
+
+
+def create_snapshot(num_torrents, channel_id):
+    rand = random.Random(42)
+    snapshot = []
+    for dispersy_id in xrange(num_torrents):
+        name = u" ".join(rand.sample(WORDS, rand.randint(2, 5)))
+        files = [(u"%s %d.%s" % (u" ".join(rand.sample(WORDS, rand.randint(1, 3))), index, rand.choice(EXTENSIONS)),
+                  rand.randint(1, 2 ** 30)) for index in xrange(rand.randint(1, 20))]
+        trackers = tuple(rand.sample(TRACKERS, rand.randint(0, 3)))
+        snapshot.append((channel_id, dispersy_id, None, os.urandom(20), 1457795713 + dispersy_id, name, files,
+                         trackers))
+    return snapshot
+
+
+def legacy_on_torrents_from_dispersy(channel_db, torrentlist):
+    """
+    The ingest path as it was before batching: every new torrent is added and indexed with its own statements.
+    """
+    infohashes = [torrent[3] for torrent in torrentlist]
+    torrent_ids, inserted = channel_db.torrent_db.addOrGetTorrentIDSReturn(infohashes)
+
+    insert_data = []
+    updated_channels = {}
+    for i, torrent in enumerate(torrentlist):
+        channel_id, dispersy_id, peer_id, infohash, timestamp, name, files, trackers = torrent
+        if infohash in inserted:
+            channel_db.torrent_db.addExternalTorrentNoDef(
+                infohash, name, files, trackers, timestamp, {'dispersy_id': dispersy_id})
+        insert_data.append((dispersy_id, torrent_ids[i], channel_id, peer_id, name, timestamp))
+        updated_channels[channel_id] = updated_channels.get(channel_id, 0) + 1
+
+    channel_db._db.executemany("INSERT INTO _ChannelTorrents (dispersy_id, torrent_id, channel_id, peer_id, name, "
+                               "time_stamp) VALUES (?,?,?,?,?,?)", insert_data)
+
+    updated_channel_torrent_dict = defaultdict(list)
+    for torrent in torrentlist:
+        channel_torrent_id = channel_db.get_channel_torrent_id(torrent[0], torrent[3])
+        updated_channel_torrent_dict[torrent[0]].append({u'info_hash': torrent[3],
+                                                         u'channel_torrent_id': channel_torrent_id})
+
+    channel_db._db.executemany("UPDATE _Channels SET modified = strftime('%s','now'), nr_torrents = nr_torrents+? "
+                               "WHERE id = ?", [(new_torrents, updated_channel_id)
+                                                for updated_channel_id, new_torrents in updated_channels.iteritems()])
+
+
+def run_path(name, ingest, num_torrents, batch_size):
+    state_dir = tempfile.mkdtemp()
+    try:
+        sqlite_db = SQLiteCacheDB(os.path.join(state_dir, "tribler.sdb"),
+                                  os.path.join(get_lib_path(), DB_SCRIPT_NAME))
+        sqlite_db.initialize()
+        sqlite_db.initial_begin()
+
+        session = BenchmarkSession(sqlite_db)
+        torrent_db = TorrentDBHandler(session)
+        torrent_db.category = Category()
+        channel_db = ChannelCastDBHandler(session)
+        channel_db.torrent_db = torrent_db
+
+        channel_id = sqlite_db.fetchone("INSERT INTO _Channels (dispersy_cid, peer_id, name, description) "
+                                        "VALUES (?, ?, ?, ?); SELECT last_insert_rowid();",
+                                        (buffer("1" * 20), -1, u"benchmark", u"benchmark"))
+        snapshot = create_snapshot(num_torrents, channel_id)
+
+        start = time()
+        for index in xrange(0, num_torrents, batch_size):
+            ingest(channel_db, snapshot[index:index + batch_size])
+        sqlite_db.commit_now()
+        elapsed = time() - start
+
+        stored = sqlite_db.fetchone("SELECT COUNT(*) FROM ChannelTorrents")
+        print "    %-18s %8.2f s %9.0f torrents/s (%d stored)" % (name, elapsed, num_torrents / elapsed, stored)
+        sqlite_db.close()
+    finally:
+        shutil.rmtree(state_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark storing the torrents of a channel snapshot")
+    parser.add_argument("--torrents", type=int, default=10000, help="number of torrents in the channel snapshot")
+    parser.add_argument("--batch", type=int, default=10000, help="number of torrents received at once")
+    args = parser.parse_args()
+
+    print "Storing a channel snapshot of %d torrents in batches of %d" % (args.torrents, args.batch)
+    run_path("torrent by torrent", legacy_on_torrents_from_dispersy, args.torrents, args.batch)
+    run_path("batched", lambda channel_db, torrents: channel_db.on_torrents_from_dispersy(torrents),
+             args.torrents, args.batch)
+
+
+if __name__ == "__main__":
+    main()
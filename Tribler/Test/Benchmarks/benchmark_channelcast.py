@@ -0,0 +1,217 @@
+"""
+Benchmark of composing channelcast messages from the channelcast pool and from ORDER BY random() queries.
+
+A database with the Tribler schema is filled with synthetic channels and channel torrents. The torrents of a
+channelcast message are selected with the queries getRecentAndRandomTorrents used before the channelcast pool was
+introduced, and drawn from a channelcast pool that is refreshed from the same database.
+
+Usage: python -m Tribler.Test.Benchmarks.benchmark_channelcast [--torrents 1000000] [--channels 1000]
+"""
+import argparse
+import os
+import random
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import time
+
+import apsw
+
+from Tribler.Core.CacheDB.channelcast_pool import ChannelcastPool
+from Tribler.Core.CacheDB.sqlitecachedb import bin2blob, blob2bin
+
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, "schema_sdb_v32.sql")
+OWN_CHANNEL_ID = 1
+
+
+def report(name, count, elapsed):
+    print "    %-24s %6d calls %8.2f s %10.2f ms per call" % (name, count, elapsed, elapsed / count * 1000)
+
+
+def create_database(db_path, args):
+    rand = random.Random(42)
+    connection = apsw.Connection(db_path)
+    cursor = connection.cursor()
+    with open(SCHEMA_PATH) as schema:
+        cursor.execute(schema.read())
+
+    start = time()
+    cursor.execute("BEGIN")
+    cursor.executemany("INSERT INTO _Channels (id, dispersy_cid, peer_id, name) VALUES (?, ?, ?, ?)",
+                       ((channel_id, bin2blob(os.urandom(20)), None if channel_id == OWN_CHANNEL_ID else channel_id,
+                         u"channel %d" % channel_id) for channel_id in xrange(1, args.channels + 1)))
+    cursor.executemany("INSERT INTO Torrent (torrent_id, infohash, name) VALUES (?, ?, ?)",
+                       ((torrent_id, bin2blob(os.urandom(20)), u"torrent %d" % torrent_id)
+                        for torrent_id in xrange(1, args.torrents + 1)))
+    cursor.executemany("INSERT INTO _ChannelTorrents (dispersy_id, torrent_id, channel_id, time_stamp) "
+                       "VALUES (?, ?, ?, ?)",
+                       ((torrent_id, torrent_id, rand.randint(1, args.channels), rand.randint(0, 10 ** 9))
+                        for torrent_id in xrange(1, args.torrents + 1)))
+    cursor.executemany("INSERT INTO _ChannelVotes (channel_id, voter_id, vote) VALUES (?, NULL, 2)",
+                       ((channel_id,) for channel_id in rand.sample(xrange(2, args.channels + 1), args.favorites)))
+    cursor.executemany("INSERT INTO MyPreference (torrent_id, destination_path, creation_time) VALUES (?, '', 0)",
+                       ((torrent_id,) for torrent_id in rand.sample(xrange(1, args.torrents + 1), args.downloads)))
+    cursor.execute("COMMIT")
+    print "  database created in %.2f s" % (time() - start)
+    return connection
+
+
+def legacy_recent_and_random_torrents(cursor, NUM_OWN_RECENT_TORRENTS=15, NUM_OWN_RANDOM_TORRENTS=10,
+                                      NUM_OTHERS_RECENT_TORRENTS=15, NUM_OTHERS_RANDOM_TORRENTS=10,
+                                      NUM_OTHERS_DOWNLOADED=5):
+    """
+    The queries of getRecentAndRandomTorrents before the channelcast pool.
+    """
+    torrent_dict = {}
+
+    least_recent = -1
+    sql = """SELECT dispersy_cid, infohash, time_stamp from ChannelTorrents, Channels, Torrent
+    WHERE ChannelTorrents.torrent_id = Torrent.torrent_id AND Channels.id = ChannelTorrents.channel_id
+    AND ChannelTorrents.channel_id==? and ChannelTorrents.dispersy_id <> -1 order by time_stamp desc limit ?"""
+    myrecenttorrents = list(cursor.execute(sql, (OWN_CHANNEL_ID, NUM_OWN_RECENT_TORRENTS)))
+    for cid, infohash, timestamp in myrecenttorrents:
+        torrent_dict.setdefault(str(cid), set()).add(blob2bin(infohash))
+        least_recent = timestamp
+
+    if len(myrecenttorrents) == NUM_OWN_RECENT_TORRENTS and least_recent != -1:
+        sql = """SELECT dispersy_cid, infohash from ChannelTorrents, Channels, Torrent
+        WHERE ChannelTorrents.torrent_id = Torrent.torrent_id AND Channels.id = ChannelTorrents.channel_id
+        AND ChannelTorrents.channel_id==? AND time_stamp<?
+        AND ChannelTorrents.dispersy_id <> -1 order by random() limit ?"""
+        for cid, infohash in cursor.execute(sql, (OWN_CHANNEL_ID, least_recent, NUM_OWN_RANDOM_TORRENTS)):
+            torrent_dict.setdefault(str(cid), set()).add(blob2bin(infohash))
+
+    nr_records = sum(len(torrents) for torrents in torrent_dict.values())
+    additionalSpace = (NUM_OWN_RECENT_TORRENTS + NUM_OWN_RANDOM_TORRENTS) - nr_records
+    if additionalSpace > 0:
+        NUM_OTHERS_RECENT_TORRENTS += additionalSpace / 2
+        NUM_OTHERS_RANDOM_TORRENTS += additionalSpace - (additionalSpace / 2)
+        NUM_OWN_RECENT_TORRENTS -= additionalSpace / 2
+        NUM_OWN_RANDOM_TORRENTS -= additionalSpace - (additionalSpace / 2)
+
+    least_recent = -1
+    sql = """SELECT dispersy_cid, infohash, time_stamp from ChannelTorrents, Channels, Torrent
+    WHERE ChannelTorrents.torrent_id = Torrent.torrent_id AND Channels.id = ChannelTorrents.channel_id
+    AND ChannelTorrents.channel_id in (select channel_id from ChannelVotes
+    WHERE voter_id ISNULL AND vote=2) and ChannelTorrents.dispersy_id <> -1 ORDER BY time_stamp desc limit ?"""
+    othersrecenttorrents = list(cursor.execute(sql, (NUM_OTHERS_RECENT_TORRENTS,)))
+    for cid, infohash, timestamp in othersrecenttorrents:
+        torrent_dict.setdefault(str(cid), set()).add(blob2bin(infohash))
+        least_recent = timestamp
+
+    if othersrecenttorrents and len(othersrecenttorrents) == NUM_OTHERS_RECENT_TORRENTS and least_recent != -1:
+        sql = """SELECT dispersy_cid, infohash FROM ChannelTorrents, Channels, Torrent
+        WHERE ChannelTorrents.torrent_id = Torrent.torrent_id AND Channels.id = ChannelTorrents.channel_id
+        AND ChannelTorrents.channel_id in (select channel_id from ChannelVotes
+        WHERE voter_id ISNULL and vote=2) and time_stamp < ?
+        AND ChannelTorrents.dispersy_id <> -1 order by random() limit ?"""
+        for cid, infohash in cursor.execute(sql, (least_recent, NUM_OTHERS_RANDOM_TORRENTS)):
+            torrent_dict.setdefault(str(cid), set()).add(blob2bin(infohash))
+
+    twomonthsago = long(time() - 5259487)
+    nr_records = sum(len(torrents) for torrents in torrent_dict.values())
+    additionalSpace = (NUM_OWN_RECENT_TORRENTS + NUM_OWN_RANDOM_TORRENTS +
+                       NUM_OTHERS_RECENT_TORRENTS + NUM_OTHERS_RANDOM_TORRENTS) - nr_records
+    NUM_OTHERS_DOWNLOADED += additionalSpace
+
+    sql = """SELECT dispersy_cid, infohash from ChannelTorrents, Channels, Torrent
+    WHERE ChannelTorrents.torrent_id = Torrent.torrent_id AND Channels.id = ChannelTorrents.channel_id
+    AND ChannelTorrents.channel_id in (select distinct channel_id from ChannelTorrents
+    WHERE torrent_id in (select torrent_id from MyPreference))
+    AND ChannelTorrents.dispersy_id <> -1 and Channels.modified > ? order by time_stamp desc limit ?"""
+    for cid, infohash in cursor.execute(sql, (twomonthsago, NUM_OTHERS_DOWNLOADED)):
+        torrent_dict.setdefault(str(cid), set()).add(blob2bin(infohash))
+
+    return torrent_dict
+
+
+def refresh_pool(cursor, pool):
+    """
+    The queries of ChannelCastDBHandler.refresh_channelcast_pool.
+    """
+    favorite_channel_ids = [channel_id for channel_id, in
+                            cursor.execute(u"SELECT channel_id FROM ChannelVotes WHERE voter_id ISNULL AND vote = 2")]
+    preferred_channel_ids = [channel_id for channel_id, in cursor.execute(
+        u"SELECT DISTINCT channel_id FROM ChannelTorrents WHERE torrent_id IN (SELECT torrent_id FROM MyPreference)")]
+
+    channel_ids = list(set([OWN_CHANNEL_ID] + favorite_channel_ids + preferred_channel_ids))
+    parameters = ",".join("?" * len(channel_ids))
+    samples = {}
+    for channel_id, dispersy_cid, modified in cursor.execute(
+            u"SELECT id, dispersy_cid, modified FROM Channels WHERE id IN (%s)" % parameters, channel_ids):
+        samples[channel_id] = pool.create_sample(str(dispersy_cid), modified)
+    for channel_id, infohash, timestamp in cursor.execute(u"""SELECT ChannelTorrents.channel_id, infohash,
+    IFNULL(time_stamp, 0) FROM ChannelTorrents, Torrent
+    WHERE ChannelTorrents.torrent_id = Torrent.torrent_id AND ChannelTorrents.channel_id IN (%s)
+    AND ChannelTorrents.dispersy_id <> -1""" % parameters, channel_ids):
+        pool.add_to_sample(samples[channel_id], blob2bin(infohash), timestamp)
+    pool.replace(OWN_CHANNEL_ID, favorite_channel_ids, preferred_channel_ids, samples)
+
+
+def pool_recent_and_random_torrents(pool):
+    """
+    The selection of ChannelCastDBHandler.getRecentAndRandomTorrents with its default arguments, from the pool.
+    """
+    torrent_dict = {}
+    recent = pool.get_recent([OWN_CHANNEL_ID], 15)
+    for timestamp, cid, infohash in recent:
+        torrent_dict.setdefault(cid, set()).add(infohash)
+    if len(recent) == 15:
+        for cid, infohash in pool.get_random([OWN_CHANNEL_ID], 10, recent[-1][0]):
+            torrent_dict.setdefault(cid, set()).add(infohash)
+
+    recent = pool.get_recent(pool.favorite_channel_ids, 15)
+    for timestamp, cid, infohash in recent:
+        torrent_dict.setdefault(cid, set()).add(infohash)
+    if len(recent) == 15:
+        for cid, infohash in pool.get_random(pool.favorite_channel_ids, 10, recent[-1][0]):
+            torrent_dict.setdefault(cid, set()).add(infohash)
+
+    for _, cid, infohash in pool.get_recent(pool.preferred_channel_ids, 5, modified_since=long(time() - 5259487)):
+        torrent_dict.setdefault(cid, set()).add(infohash)
+    return torrent_dict
+
+
+def run(args):
+    print "%d channel torrents in %d channels, %d favorite channels, %d downloads" % (
+        args.torrents, args.channels, args.favorites, args.downloads)
+
+    work_dir = mkdtemp(prefix="benchmark_channelcast")
+    try:
+        connection = create_database(os.path.join(work_dir, "tribler.sdb"), args)
+        cursor = connection.cursor()
+
+        start = time()
+        for _ in xrange(args.calls):
+            legacy_torrents = legacy_recent_and_random_torrents(cursor)
+        report("ORDER BY random()", args.calls, time() - start)
+
+        pool = ChannelcastPool()
+        start = time()
+        refresh_pool(cursor, pool)
+        report("pool refresh", 1, time() - start)
+
+        start = time()
+        for _ in xrange(args.calls):
+            pool_torrents = pool_recent_and_random_torrents(pool)
+        report("channelcast pool", args.calls, time() - start)
+
+        print "  %d torrents per message with the queries, %d from the pool" % (
+            sum(len(infohashes) for infohashes in legacy_torrents.itervalues()),
+            sum(len(infohashes) for infohashes in pool_torrents.itervalues()))
+        connection.close()
+    finally:
+        rmtree(work_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark composing channelcast messages")
+    parser.add_argument("--torrents", type=int, default=1000000, help="number of channel torrents")
+    parser.add_argument("--channels", type=int, default=1000, help="number of channels")
+    parser.add_argument("--favorites", type=int, default=20, help="number of channels marked as favorite")
+    parser.add_argument("--downloads", type=int, default=50, help="number of downloaded torrents")
+    parser.add_argument("--calls", type=int, default=20, help="number of channelcast messages to compose")
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
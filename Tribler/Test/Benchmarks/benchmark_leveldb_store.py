@@ -0,0 +1,92 @@
+"""
+Benchmark of the get and put throughput of the LevelDB store.
+
+The store is filled with random values, after which random keys are read with and without the read cache. Reads are
+skewed towards a small set of popular keys, like the torrents that are served over TFTP.
+
+Usage: python -m Tribler.Test.Benchmarks.benchmark_leveldb_store [--entries 1000000] [--value-size 512]
+"""
+import argparse
+import os
+import random
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import time
+
+from Tribler.Core.leveldbstore import LevelDbStore, READ_CACHE_SIZE
+
+
+def report(name, count, elapsed):
+    print "    %-28s %9d ops %7.2f s %10.0f ops/s" % (name, count, elapsed, count / elapsed if elapsed else 0)
+
+
+def fill(store, entries, value_size, batch_size):
+    value = os.urandom(value_size)
+    start = time()
+    for first in xrange(0, entries, batch_size):
+        store.multi_put(("%040x" % i, value) for i in xrange(first, min(entries, first + batch_size)))
+    store.flush()
+    report("multi_put", entries, time() - start)
+
+
+def put(store, keys):
+    value = os.urandom(512)
+    start = time()
+    for key in keys:
+        store[key] = value
+    store.flush()
+    report("put", len(keys), time() - start)
+
+
+def get(store, name, keys):
+    start = time()
+    for key in keys:
+        store[key]
+    report(name, len(keys), time() - start)
+
+
+def multi_get(store, keys, batch_size):
+    start = time()
+    for first in xrange(0, len(keys), batch_size):
+        store.multi_get(keys[first:first + batch_size])
+    report("multi_get", len(keys), time() - start)
+
+
+def run(args):
+    print "%d entries of %d bytes, %d reads" % (args.entries, args.value_size, args.reads)
+    popular_keys = ["%040x" % random.randrange(args.entries) for _ in xrange(1000)]
+    skewed_keys = [random.choice(popular_keys) if random.random() < 0.8 else "%040x" % random.randrange(args.entries)
+                   for _ in xrange(args.reads)]
+    random_keys = ["%040x" % random.randrange(args.entries) for _ in xrange(args.reads)]
+
+    for cache_size in (0, READ_CACHE_SIZE):
+        store_dir = mkdtemp(prefix="benchmark_leveldb_store")
+        store = LevelDbStore(store_dir, read_cache_size=cache_size, compress=args.compress)
+        print "  read cache %d bytes" % cache_size
+        try:
+            fill(store, args.entries, args.value_size, args.batch_size)
+            put(store, ["%040x" % random.randrange(args.entries) for _ in xrange(args.reads)])
+            get(store, "get (uniform)", random_keys)
+            get(store, "get (skewed)", skewed_keys)
+            multi_get(store, random_keys, args.batch_size)
+
+            start = time()
+            length = len(store)
+            report("len (first call)", length, time() - start)
+        finally:
+            store.close()
+            rmtree(store_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the get and put throughput of the LevelDB store")
+    parser.add_argument("--entries", type=int, default=1000000, help="number of entries in the store")
+    parser.add_argument("--value-size", type=int, default=512, help="size of the values in bytes")
+    parser.add_argument("--reads", type=int, default=100000, help="number of reads per test")
+    parser.add_argument("--batch-size", type=int, default=1000, help="number of entries per multi_put and multi_get")
+    parser.add_argument("--compress", action="store_true", help="compress the stored values")
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
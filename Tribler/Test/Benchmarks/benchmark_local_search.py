@@ -0,0 +1,135 @@
+"""
+Benchmark of the local torrent search on a synthetic database.
+
+It compares the previous search path, which fetched every match and scored it in Python, with the ranked search that
+scores inside SQLite and only returns the top results. Every path runs in its own process so the peak memory usage
+can be reported per path.
+
+Usage: python -m Tribler.Test.Benchmarks.benchmark_local_search [--torrents 1000000] [--db /tmp/search.db]
+"""
+import argparse
+import math
+import os
+import random
+import resource
+from multiprocessing import Process, Queue
+from struct import unpack_from
+from time import time
+
+import apsw
+
+from Tribler.Core.CacheDB.sqlitecachedb import DB_SCRIPT_NAME, register_sql_functions
+from Tribler.Core.Utilities.install_dir import get_lib_path
+
+WORDS = ["ubuntu", "linux", "debian", "live", "desktop", "server", "amd64", "i386", "iso", "video", "music",
+         "album", "concert", "season", "episode", "pioneer", "one", "big", "buck", "bunny", "sintel", "creative",
+         "commons", "lecture", "course", "physics", "history", "dataset", "mirror", "archive"]
+EXTENSIONS = ["iso", "mkv", "mp4", "avi", "mp3", "flac", "txt", "pdf", "zip", "nfo"]
+QUERIES = ["ubuntu", "linux desktop", "season episode", "pioneer one", "creative commons music"]
+
+SEARCH_SQL = "SELECT DISTINCT T.torrent_id, infohash, T.name, length, category, num_seeders, num_leechers, " \
+             "last_tracker_check%s FROM Torrent T, FullTextIndex " \
+             "LEFT OUTER JOIN _ChannelTorrents C ON T.torrent_id = C.torrent_id " \
+             "WHERE t.name IS NOT NULL AND t.torrent_id = FullTextIndex.rowid " \
+             "AND C.deleted_at IS NULL AND FullTextIndex MATCH ?%s"
+
+
+def create_database(db_path, num_torrents):
+    connection = apsw.Connection(db_path)
+    cursor = connection.cursor()
+    with open(os.path.join(get_lib_path(), DB_SCRIPT_NAME)) as script:
+        cursor.execute(script.read())
+
+    rand = random.Random(42)
+    cursor.execute("BEGIN")
+    for torrent_id in xrange(1, num_torrents + 1):
+        name = " ".join(rand.sample(WORDS, rand.randint(2, 5)))
+        files = " ".join(rand.sample(WORDS, rand.randint(0, 6)))
+        extensions = " ".join(rand.sample(EXTENSIONS, rand.randint(1, 2)))
+        cursor.execute("INSERT INTO Torrent (torrent_id, infohash, name, length, num_seeders, num_leechers, status) "
+                       "VALUES (?, ?, ?, ?, ?, ?, 'unknown')",
+                       (torrent_id, "%040x" % torrent_id, name, rand.randint(1, 2 ** 32),
+                        rand.choice([0, 0, 0, rand.randint(1, 5000)]), rand.randint(0, 100)))
+        cursor.execute("INSERT INTO FullTextIndex (rowid, swarmname, filenames, fileextensions) VALUES (?, ?, ?, ?)",
+                       (torrent_id, name, files, extensions))
+    cursor.execute("COMMIT")
+    connection.close()
+
+
+def legacy_search(cursor, query):
+    """
+    The search as it was done before ranking moved into SQLite: every match is unpacked and scored in Python.
+    """
+    search_results = []
+    keywords = query.split()
+    results = cursor.execute(SEARCH_SQL % (", Matchinfo(FullTextIndex, 'pcnalx')", ""), (" OR ".join(keywords),))
+    for result in results:
+        result = list(result)
+        matchinfo = result[-1]
+        num_phrases, num_cols, num_rows = unpack_from('III', matchinfo)
+        matchinfo = unpack_from('I' * 9 + 'I' * (3 * num_cols * num_phrases), matchinfo)[9:]
+
+        scores = []
+        for col_ind in xrange(num_cols):
+            score = 0
+            for phrase_ind in xrange(num_phrases):
+                base_term_offset = 3 * (col_ind + phrase_ind * num_cols)
+                rows_with_term = matchinfo[base_term_offset + 2]
+                term_freq = matchinfo[base_term_offset]
+                inv_doc_freq = math.log((num_rows - rows_with_term + 0.5) / (rows_with_term + 0.5), 2)
+                score += inv_doc_freq * ((term_freq * (1.2 + 1)) / (term_freq + 1.2))
+            scores.append(score)
+
+        rel_score = 0.8 * scores[0] + 0.1 * scores[1] + 0.1 * scores[2]
+        if result[5] > 0:
+            rel_score += result[5]
+        search_results.append(result[:-1] + [rel_score])
+    search_results.sort(key=lambda result: result[-1], reverse=True)
+    return search_results[:50]
+
+
+def ranked_search(cursor, query):
+    keywords = query.split()
+    return list(cursor.execute(SEARCH_SQL % (", bm25_relevance(Matchinfo(FullTextIndex, 'pcnalx'), T.num_seeders) "
+                                             "AS relevance", " ORDER BY relevance DESC LIMIT 50"),
+                               (" OR ".join(keywords),)))
+
+
+def run_path(db_path, search, result_queue):
+    connection = apsw.Connection(db_path)
+    register_sql_functions(connection)
+    cursor = connection.cursor()
+
+    latencies = {}
+    for query in QUERIES:
+        start = time()
+        search(cursor, query)
+        latencies[query] = time() - start
+    # ru_maxrss is in kilobytes on Linux
+    result_queue.put((latencies, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the local torrent search")
+    parser.add_argument("--torrents", type=int, default=1000000, help="number of synthetic torrents")
+    parser.add_argument("--db", default="benchmark_local_search.db", help="database file, reused if it exists")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print "Creating a database with %d torrents in %s..." % (args.torrents, args.db)
+        create_database(args.db, args.torrents)
+
+    for name, search in [("python scoring", legacy_search), ("sqlite ranking", ranked_search)]:
+        result_queue = Queue()
+        process = Process(target=run_path, args=(args.db, search, result_queue))
+        process.start()
+        latencies, peak_memory = result_queue.get()
+        process.join()
+
+        print "%s (peak memory %.1f MB)" % (name, peak_memory / 1024.0)
+        for query in QUERIES:
+            print "    %-25s %8.1f ms" % (query, latencies[query] * 1000)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Benchmark of the queue of pending requests of the requesters in the RemoteTorrentHandler.
+
+Torrents are announced by a few busy peers and many quiet ones, and every announcement is checked against the queue
+before it is added. The deque the requesters used before the RequestQueue was introduced is measured as well.
+
+Usage: python -m Tribler.Test.Benchmarks.benchmark_request_queue [--requests 20000] [--sources 500]
+"""
+import argparse
+import random
+from collections import deque
+from time import time
+
+from Tribler.Core.RemoteTorrentHandler import RequestQueue
+
+
+def legacy_queue(announcements):
+    queue = deque()
+    for key, _ in announcements:
+        if key not in queue:
+            queue.append(key)
+    while queue:
+        queue.popleft()
+
+
+def request_queue(announcements):
+    queue = RequestQueue()
+    for key, source in announcements:
+        queue.push(key, source)
+    while queue.pop() is not None:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the queue of pending requests")
+    parser.add_argument("--requests", type=int, default=20000, help="number of announced torrents")
+    parser.add_argument("--sources", type=int, default=500, help="number of peers announcing torrents")
+    args = parser.parse_args()
+
+    # a tenth of the peers announces most of the torrents, and a torrent is announced twice on average
+    sources = range(args.sources)
+    busy_sources = sources[:max(1, args.sources / 10)]
+    keys = ["%020d" % index for index in xrange(args.requests)]
+    announcements = [(random.choice(keys), random.choice(busy_sources if random.random() < 0.8 else sources))
+                     for _ in xrange(args.requests * 2)]
+
+    print "%d announcements of %d torrents from %d sources" % (len(announcements), args.requests, args.sources)
+    for name, run in [("legacy", legacy_queue), ("request queue", request_queue)]:
+        start = time()
+        run(announcements)
+        elapsed = time() - start
+        print "    %-16s %9.0f announcements/s" % (name, len(announcements) / elapsed)
+
+
+if __name__ == "__main__":
+    main()
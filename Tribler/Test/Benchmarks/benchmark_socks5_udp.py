@@ -0,0 +1,112 @@
+"""
+Benchmark of the SOCKS5 UDP associate path from the tunnels to the SOCKS5 client.
+
+Data from many peers arrives over a few circuits and is sent to the SOCKS5 client over the loopback interface, the way
+libtorrent receives the data of its peers through the tunnels. The path as it was before the circuit index and the UDP
+header cache were introduced is measured as well. The encoding of the SOCKS5 UDP packets is also measured on its own,
+with and without the header cache, for packets from a single peer and from all peers.
+
+Usage: python -m Tribler.Test.Benchmarks.benchmark_socks5_udp [--packets 200000] [--peers 5000] [--size 1400]
+"""
+import argparse
+import os
+import random
+import socket
+import struct
+from time import time
+
+from Tribler.community.tunnel.Socks5 import conversion
+from Tribler.community.tunnel.Socks5.server import Socks5Connection, SocksUDPConnection
+
+
+class SocketTransport(object):
+
+    def __init__(self, sock):
+        self.sock = sock
+
+    def write(self, data, address):
+        self.sock.sendto(data, address)
+
+
+def create_udp_connection(sock, client_address):
+    udp_connection = SocksUDPConnection.__new__(SocksUDPConnection)
+    udp_connection.remote_udp_address = client_address
+    udp_connection.transport = SocketTransport(sock)
+    return udp_connection
+
+
+def legacy_on_incoming_from_tunnel(connection, community, circuit, origin, data):
+    """
+    The path as it was before the circuit index: the circuit is looked up in a list of all destinations, the header
+    is encoded for every packet and every packet is written on its own.
+    """
+    if circuit in connection.destinations.values():
+        connection.destinations[origin] = circuit
+        socks5_data = ''.join([struct.pack("!HBB", 0, 0, conversion.ADDRESS_TYPE_IPV4), socket.inet_aton(origin[0]),
+                               struct.pack("!H", origin[1]), data])
+        udp_socket = connection._udp_socket
+        udp_socket.transport.write(socks5_data, udp_socket.remote_udp_address)
+        return True
+    return False
+
+
+def legacy_encode_udp_packet(rsv, frag, address_type, address, port, payload):
+    """
+    The encoding as it was before the header cache: the header is encoded for every packet.
+    """
+    return ''.join([struct.pack("!HBB", rsv, frag, address_type), socket.inet_aton(address), struct.pack("!H", port),
+                    payload])
+
+
+def benchmark_encoding(num_packets, peers, payload):
+    for num_peers in sorted(set([1, len(peers)])):
+        origins = [random.choice(peers[:num_peers]) for _ in xrange(num_packets)]
+        for name, encode in [("uncached", legacy_encode_udp_packet),
+                             ("header cache", conversion.encode_udp_packet)]:
+            conversion._udp_header_cache.clear()
+            start = time()
+            for host, port in origins:
+                encode(0, 0, conversion.ADDRESS_TYPE_IPV4, host, port, payload)
+            elapsed = time() - start
+            print "    encode %-16s %5d peers %7.3f s %9.0f packets/s" % (name, num_peers, elapsed,
+                                                                         num_packets / elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the SOCKS5 UDP associate path")
+    parser.add_argument("--packets", type=int, default=200000, help="number of packets per measurement")
+    parser.add_argument("--peers", type=int, default=5000, help="number of peers the data comes from")
+    parser.add_argument("--circuits", type=int, default=4, help="number of circuits the data arrives on")
+    parser.add_argument("--size", type=int, default=1400, help="size of the payload of a packet in bytes")
+    args = parser.parse_args()
+
+    client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    client.bind(("127.0.0.1", 0))
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    circuits = [object() for _ in xrange(args.circuits)]
+    peers = [("10.%d.%d.%d" % (i >> 16 & 255, i >> 8 & 255, i & 255), 6881) for i in xrange(args.peers)]
+    packets = [(random.choice(circuits), random.choice(peers)) for _ in xrange(args.packets)]
+    payload = os.urandom(args.size)
+
+    print "%d packets of %d bytes from %d peers over %d circuits" % (args.packets, args.size, args.peers,
+                                                                    args.circuits)
+    for name, incoming in [("legacy", legacy_on_incoming_from_tunnel),
+                           ("circuit index", Socks5Connection.on_incoming_from_tunnel)]:
+        connection = Socks5Connection(None, None, 1)
+        connection._udp_socket = create_udp_connection(server, client.getsockname())
+        for index, peer in enumerate(peers):
+            connection.on_incoming_from_tunnel(None, circuits[index % args.circuits], peer, payload, force=True)
+
+        start = time()
+        for circuit, origin in packets:
+            incoming(connection, None, circuit, origin, payload)
+        elapsed = time() - start
+        print "    %-16s %9.0f packets/s %8.1f MB/s" % (name, args.packets / elapsed,
+                                                         args.packets * args.size / elapsed / 1024 ** 2)
+
+    benchmark_encoding(args.packets, peers, payload)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Benchmark of torrent and metadata transfers over TFTP.
+
+Two TFTP handlers run in the same process and exchange their packets through an endpoint that delays every packet by
+half the round trip time and drops packets at random. Every file is downloaded with the stop-and-wait settings that
+were used before windowed transfers were supported, and with the current block size and window size.
+
+Usage: python -m Tribler.Test.Benchmarks.benchmark_tftp [--rtt 0.15] [--loss 0.01] [--sizes 10,50,200]
+"""
+import argparse
+import os
+import random
+from time import time
+
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred, inlineCallbacks
+
+from Tribler.Core.TFTP.handler import TftpHandler
+from Tribler.Core.TFTP.session import DEFAULT_BLOCK_SIZE, DEFAULT_WINDOW_SIZE, MAX_BLOCK_SIZE
+
+PREFIX = "fffffffd".decode('hex')
+
+CLIENT_ADDRESS = ("10.0.0.1", 7759)
+SERVER_ADDRESS = ("10.0.0.2", 7759)
+
+
+class LossyEndpoint(object):
+    """
+    Delivers the packets of a TFTP handler to the handler at the other side after a delay, or not at all.
+    """
+
+    def __init__(self, address, latency, loss):
+        self.address = address
+        self.latency = latency
+        self.loss = loss
+        self.peer = None
+        self.data_came_in = None
+
+    def listen_to(self, prefix, data_came_in):
+        self.data_came_in = data_came_in
+
+    def stop_listen_to(self, prefix):
+        self.data_came_in = None
+
+    def send_packet(self, candidate, packet, prefix=None):
+        if random.random() >= self.loss:
+            reactor.callLater(self.latency, self.deliver, packet)
+
+    def deliver(self, packet):
+        if self.peer.data_came_in:
+            self.peer.data_came_in(self.address, packet)
+
+
+class BenchmarkStore(dict):
+
+    def get(self, key, default=None):
+        return dict.get(self, key, default)
+
+
+class BenchmarkSession(object):
+    """
+    The parts of a Tribler session that the TFTP handler uses.
+    """
+
+    class LaunchMany(object):
+        pass
+
+    def __init__(self, address):
+        self.lm = BenchmarkSession.LaunchMany()
+        self.lm.dispersy = BenchmarkSession.LaunchMany()
+        self.lm.dispersy.wan_address = address
+        self.lm.torrent_store = BenchmarkStore()
+
+    def get_enable_metadata(self):
+        return False
+
+    def get_torrent_store(self):
+        return True
+
+
+def create_handlers(rtt, loss, block_size, window_size):
+    client_endpoint = LossyEndpoint(CLIENT_ADDRESS, rtt / 2, loss)
+    server_endpoint = LossyEndpoint(SERVER_ADDRESS, rtt / 2, loss)
+    client_endpoint.peer, server_endpoint.peer = server_endpoint, client_endpoint
+
+    server_session = BenchmarkSession(SERVER_ADDRESS)
+    client = TftpHandler(BenchmarkSession(CLIENT_ADDRESS), client_endpoint, PREFIX, block_size=block_size,
+                         window_size=window_size)
+    server = TftpHandler(server_session, server_endpoint, PREFIX, block_size=block_size, window_size=window_size)
+    client.initialize()
+    server.initialize()
+    return client, server, server_session.lm.torrent_store
+
+
+def download(client, file_name):
+    deferred = Deferred()
+    client.download_file(file_name, SERVER_ADDRESS[0], SERVER_ADDRESS[1],
+                         success_callback=lambda *_: deferred.callback(True),
+                         failure_callback=lambda *_: deferred.callback(False))
+    return deferred
+
+
+@inlineCallbacks
+def run(args):
+    sizes = [int(size) for size in args.sizes.split(",")]
+    print "Round trip time %.0f ms, %.1f%% packet loss, %d run(s) per file" % (args.rtt * 1000, args.loss * 100,
+                                                                               args.runs)
+    for name, block_size, window_size in [("stop-and-wait", DEFAULT_BLOCK_SIZE, 1),
+                                          ("windowed", MAX_BLOCK_SIZE, DEFAULT_WINDOW_SIZE)]:
+        client, server, torrent_store = create_handlers(args.rtt, args.loss, block_size, window_size)
+        for size in sizes:
+            infohash = os.urandom(20).encode('hex')
+            torrent_store[infohash] = os.urandom(size * 1024)
+
+            elapsed, failed = 0, 0
+            for _ in xrange(args.runs):
+                start = time()
+                success = yield download(client, u"%s.torrent" % infohash)
+                elapsed += time() - start
+                failed += not success
+
+            print "    %-13s blksize %4d windowsize %2d %4d KB %7.2f s (%d failed)" % (
+                name, block_size, window_size, size, elapsed / args.runs, failed)
+        client.shutdown()
+        server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark TFTP transfers under latency and packet loss")
+    parser.add_argument("--rtt", type=float, default=0.15, help="round trip time in seconds")
+    parser.add_argument("--loss", type=float, default=0.01, help="fraction of the packets that is dropped")
+    parser.add_argument("--sizes", default="10,50,200", help="comma separated file sizes in KB")
+    parser.add_argument("--runs", type=int, default=1, help="number of downloads per file")
+    args = parser.parse_args()
+
+    run(args).addErrback(lambda failure: failure.printTraceback()).addBoth(lambda _: reactor.stop())
+    reactor.run()
+
+
+if __name__ == "__main__":
+    main()
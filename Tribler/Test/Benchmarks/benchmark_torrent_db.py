@@ -0,0 +1,97 @@
+"""
+Benchmark of infohash lookups in the Torrent table with base64 text and with BLOB infohashes.
+
+Both databases hold the same synthetic torrents. The lookups mirror getTorrentIDS (chunked IN queries), hasTorrent
+(single lookups) and the search path (a scan that returns the infohash of every match), including the conversion of
+the infohashes on both sides of the query.
+
+Usage: python -m Tribler.Test.Benchmarks.benchmark_torrent_db [--torrents 2000000] [--lookups 100000]
+"""
+import argparse
+import os
+import random
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import time
+
+import apsw
+
+from Tribler.Core.CacheDB.SqliteCacheDBHandler import split_into_chunks
+from Tribler.Core.CacheDB.sqlitecachedb import bin2blob, bin2str, blob2bin, str2bin
+
+SCHEMA = "CREATE TABLE Torrent (torrent_id integer PRIMARY KEY AUTOINCREMENT NOT NULL, infohash %s NOT NULL, " \
+         "name text); CREATE UNIQUE INDEX infohash_idx ON Torrent (infohash);"
+
+ENCODINGS = (("text", bin2str, str2bin), ("blob", bin2blob, blob2bin))
+
+
+def report(name, count, elapsed):
+    print "    %-28s %9d ops %7.2f s %10.0f ops/s" % (name, count, elapsed, count / elapsed if elapsed else 0)
+
+
+def create_database(db_path, column_type, encode, infohashes):
+    connection = apsw.Connection(db_path)
+    cursor = connection.cursor()
+    cursor.execute(SCHEMA % column_type)
+    start = time()
+    cursor.execute("BEGIN")
+    cursor.executemany("INSERT INTO Torrent (infohash, name) VALUES (?, ?)",
+                       ((encode(infohash), "torrent %d" % i) for i, infohash in enumerate(infohashes)))
+    cursor.execute("COMMIT")
+    report("insert", len(infohashes), time() - start)
+    return connection
+
+
+def get_torrent_ids(cursor, encode, decode, infohashes):
+    start = time()
+    for chunk in split_into_chunks([encode(infohash) for infohash in infohashes]):
+        sql = u"SELECT torrent_id, infohash FROM Torrent WHERE infohash IN (%s)" % ",".join("?" * len(chunk))
+        dict((decode(infohash), torrent_id) for torrent_id, infohash in cursor.execute(sql, chunk))
+    report("getTorrentIDS", len(infohashes), time() - start)
+
+
+def has_torrent(cursor, encode, infohashes):
+    start = time()
+    for infohash in infohashes:
+        list(cursor.execute(u"SELECT torrent_id FROM Torrent WHERE infohash = ?", (encode(infohash),)))
+    report("hasTorrent", len(infohashes), time() - start)
+
+
+def search(cursor, decode):
+    start = time()
+    results = [decode(infohash) for infohash, _ in
+               cursor.execute(u"SELECT infohash, name FROM Torrent WHERE name LIKE 'torrent 1%'")]
+    report("search", len(results), time() - start)
+
+
+def run(args):
+    rand = random.Random(42)
+    infohashes = [os.urandom(20) for _ in xrange(args.torrents)]
+    lookups = [rand.choice(infohashes) if rand.random() < 0.5 else os.urandom(20) for _ in xrange(args.lookups)]
+    print "%d torrents, %d lookups" % (args.torrents, args.lookups)
+
+    work_dir = mkdtemp(prefix="benchmark_torrent_db")
+    try:
+        for column_type, encode, decode in ENCODINGS:
+            print "  %s infohashes" % column_type
+            db_path = os.path.join(work_dir, "%s.db" % column_type)
+            connection = create_database(db_path, column_type, encode, infohashes)
+            cursor = connection.cursor()
+            get_torrent_ids(cursor, encode, decode, lookups)
+            has_torrent(cursor, encode, lookups)
+            search(cursor, decode)
+            connection.close()
+            print "    database size %d bytes" % os.path.getsize(db_path)
+    finally:
+        rmtree(work_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark infohash lookups with text and BLOB infohashes")
+    parser.add_argument("--torrents", type=int, default=2000000, help="number of torrents in the database")
+    parser.add_argument("--lookups", type=int, default=100000, help="number of infohashes to look up per test")
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Benchmark of the relay path of the tunnel community.
+
+Cells are sent through a relay that forwards them over the loopback interface, the way a relay node handles the data
+of the circuits it is part of. Both directions are measured: towards the exit node, where the relay removes its
+encryption layer, and towards the originator, where it adds one. The relay path as it was before the relay fast path
+was introduced is measured as well.
+
+Usage: python -m Tribler.Test.Benchmarks.benchmark_tunnel_relay [--packets 50000] [--size 1400]
+"""
+import argparse
+import logging
+import os
+import socket
+from collections import defaultdict
+from struct import pack
+from time import time
+
+from Tribler.community.tunnel import EXIT_NODE, EXIT_NODE_SALT, ORIGINATOR
+from Tribler.community.tunnel.conversion import TunnelConversion
+from Tribler.community.tunnel.crypto.tunnelcrypto import TunnelCrypto
+from Tribler.community.tunnel.routing import RelayRoute
+from Tribler.community.tunnel.tunnel_community import TunnelCommunity
+
+CIRCUIT_TOWARDS_ORIGINATOR = 1234
+CIRCUIT_TOWARDS_EXIT = 5678
+
+
+class BenchmarkSettings(object):
+
+    def __init__(self):
+        self.crypto = TunnelCrypto()
+
+
+def legacy_relay_packet(community, circuit_id, message_type, packet):
+    """
+    The relay path as it was before the relay fast path: the packet is split, re-encrypted and the circuit id is
+    swapped, each of which copies the packet.
+    """
+    next_relay = community.relay_from_to[circuit_id]
+    this_relay = community.relay_from_to.get(next_relay.circuit_id, None)
+    if this_relay:
+        community.increase_bytes_received(this_relay, len(packet))
+
+    plaintext, encrypted = TunnelConversion.split_encrypted_packet(packet, message_type)
+    keys = community.relay_session_keys[circuit_id]
+    if community.directions[circuit_id] == ORIGINATOR:
+        encrypted = community.crypto.encrypt_str(encrypted, *community.get_session_keys(keys, ORIGINATOR))
+    else:
+        encrypted = community.crypto.decrypt_str(encrypted, keys[EXIT_NODE], keys[EXIT_NODE_SALT])
+    packet = plaintext + encrypted
+
+    packet = TunnelConversion.swap_circuit_id(packet, message_type, circuit_id, next_relay.circuit_id)
+    community.increase_bytes_sent(next_relay, community.send_packet([next_relay], message_type, packet))
+    return True
+
+
+def create_relay(relay_socket, originator_address, exit_address):
+    community = TunnelCommunity.__new__(TunnelCommunity)
+    community.tunnel_logger = logging.getLogger("TunnelLogger")
+    community.settings = BenchmarkSettings()
+    community.stats = defaultdict(int)
+
+    session_keys = community.crypto.generate_session_keys(os.urandom(64))
+    # Large enough to get IVs that are accepted by all versions of cryptography
+    session_keys[4] = session_keys[5] = 10 ** 8
+
+    community.relay_session_keys = {CIRCUIT_TOWARDS_ORIGINATOR: session_keys, CIRCUIT_TOWARDS_EXIT: session_keys}
+    community.directions = {CIRCUIT_TOWARDS_ORIGINATOR: EXIT_NODE, CIRCUIT_TOWARDS_EXIT: ORIGINATOR}
+    community.relay_from_to = {CIRCUIT_TOWARDS_ORIGINATOR: RelayRoute(CIRCUIT_TOWARDS_EXIT, exit_address),
+                               CIRCUIT_TOWARDS_EXIT: RelayRoute(CIRCUIT_TOWARDS_ORIGINATOR, originator_address)}
+
+    def send_packet(candidates, _, packet):
+        relay_socket.sendto(packet, candidates[0].sock_addr)
+        return len(packet)
+    community.send_packet = send_packet
+    return community, session_keys
+
+
+def create_socket():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    return sock
+
+
+def measure(relay, relay_socket, sender, receiver, packets, circuit_id):
+    start = time()
+    for packet in packets:
+        sender.sendto(packet, relay_socket.getsockname())
+        relay(circuit_id, u"data", relay_socket.recv(65536))
+        receiver.recv(65536)
+    return time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the relay path of the tunnel community")
+    parser.add_argument("--packets", type=int, default=50000, help="number of packets per measurement")
+    parser.add_argument("--size", type=int, default=1400, help="size of the payload of a packet in bytes")
+    args = parser.parse_args()
+
+    originator, relay_socket, exit_node = create_socket(), create_socket(), create_socket()
+    community, session_keys = create_relay(relay_socket, originator.getsockname(), exit_node.getsockname())
+
+    # The cells as the originator and the exit node would send them to the relay
+    towards_exit = [pack('!I', CIRCUIT_TOWARDS_ORIGINATOR) +
+                    community.crypto.encrypt_str(os.urandom(args.size), session_keys[EXIT_NODE],
+                                                 session_keys[EXIT_NODE_SALT], 10 ** 8 + index)
+                    for index in xrange(args.packets)]
+    towards_originator = [pack('!I', CIRCUIT_TOWARDS_EXIT) + os.urandom(args.size) for _ in xrange(args.packets)]
+    num_bytes = args.packets * args.size
+
+    print "Relaying %d packets of %d bytes over the loopback interface" % (args.packets, args.size)
+    for name, relay in [("legacy relay", lambda *relay_args: legacy_relay_packet(community, *relay_args)),
+                        ("relay fast path", community.relay_packet)]:
+        for direction, packets, sender, receiver, circuit_id in [
+                ("towards exit", towards_exit, originator, exit_node, CIRCUIT_TOWARDS_ORIGINATOR),
+                ("towards originator", towards_originator, exit_node, originator, CIRCUIT_TOWARDS_EXIT)]:
+            elapsed = measure(relay, relay_socket, sender, receiver, packets, circuit_id)
+            print "    %-16s %-19s %9.0f packets/s %8.1f MB/s" % (name, direction, args.packets / elapsed,
+                                                                  num_bytes / elapsed / 1024 ** 2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Benchmark of the relay throughput of the crypto workers of the tunnel helper.
+
+Every worker process does the crypto of the data cells of its own relay, which it receives over the loopback interface
+with the header the coordinator puts in front of them. The total throughput is reported for an increasing number of
+workers.
+
+Usage: python -m Tribler.Test.Benchmarks.benchmark_tunnel_workers [--workers 4] [--packets 20000] [--size 1400]
+"""
+import argparse
+import os
+from multiprocessing import Event, Process, Queue, cpu_count
+from struct import pack
+
+from Tribler.community.tunnel import EXIT_NODE, EXIT_NODE_SALT
+from Tribler.community.tunnel.crypto.tunnelcrypto import TunnelCrypto
+from Tribler.community.tunnel.workers import OP_RELAY, TunnelWorker, pack_header
+from Tribler.Test.Benchmarks.benchmark_tunnel_relay import (CIRCUIT_TOWARDS_EXIT, CIRCUIT_TOWARDS_ORIGINATOR,
+                                                             create_socket, measure)
+
+
+class SocketTransport(object):
+
+    def __init__(self, sock):
+        self.sock = sock
+
+    def write(self, data, address):
+        self.sock.sendto(data, address)
+
+
+def run_worker(num_packets, size, ready_queue, start_event, result_queue):
+    coordinator, worker_socket, receiver = create_socket(), create_socket(), create_socket()
+    worker = TunnelWorker(TunnelCrypto(), receiver.getsockname())
+    worker.transport = SocketTransport(worker_socket)
+    session_keys = worker.crypto.generate_session_keys(os.urandom(64))
+    worker.add_relay(CIRCUIT_TOWARDS_ORIGINATOR, CIRCUIT_TOWARDS_EXIT, session_keys[:4])
+
+    header = pack_header(OP_RELAY, CIRCUIT_TOWARDS_ORIGINATOR)
+    packets = [header + pack('!I', CIRCUIT_TOWARDS_ORIGINATOR) +
+               worker.crypto.encrypt_str(os.urandom(size), session_keys[EXIT_NODE], session_keys[EXIT_NODE_SALT],
+                                         10 ** 8 + index)
+               for index in xrange(num_packets)]
+
+    def relay(_, __, data):
+        worker.datagramReceived(data, receiver.getsockname())
+
+    # Wait until all workers are ready, so they relay at the same time
+    ready_queue.put(True)
+    start_event.wait()
+    elapsed = measure(relay, worker_socket, coordinator, receiver, packets, CIRCUIT_TOWARDS_ORIGINATOR)
+    result_queue.put(elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the relay throughput of the crypto workers")
+    parser.add_argument("--workers", type=int, default=cpu_count(), help="maximum number of worker processes")
+    parser.add_argument("--packets", type=int, default=20000, help="number of packets relayed by every worker")
+    parser.add_argument("--size", type=int, default=1400, help="size of the payload of a packet in bytes")
+    args = parser.parse_args()
+
+    print "Relaying %d packets of %d bytes per worker" % (args.packets, args.size)
+    for num_workers in xrange(1, args.workers + 1):
+        ready_queue, start_event, result_queue = Queue(), Event(), Queue()
+        workers = [Process(target=run_worker, args=(args.packets, args.size, ready_queue, start_event, result_queue))
+                   for _ in xrange(num_workers)]
+        for worker in workers:
+            worker.start()
+        for _ in workers:
+            ready_queue.get()
+        start_event.set()
+
+        # The workers run in parallel, so the slowest one determines the total time
+        elapsed = max(result_queue.get() for _ in workers)
+        for worker in workers:
+            worker.join()
+
+        num_packets = num_workers * args.packets
+        print "    %2d worker(s) %9.0f packets/s %8.1f MB/s" % (num_workers, num_packets / elapsed,
+                                                                num_packets * args.size / elapsed / 1024 ** 2)
+
+
+if __name__ == "__main__":
+    main()
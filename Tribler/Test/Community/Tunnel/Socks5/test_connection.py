@@ -94,6 +94,23 @@ class TestSocks5Connection(AbstractServer):
         # Second close
         self.assertTrue(self.connection.close())
 
+    def test_circuit_destinations(self):
+        """
+        Test whether data from a circuit is only accepted after the circuit has been used, and whether the
+        destinations of a dead circuit are removed
+        """
+        circuit = object()
+        self.assertFalse(self.connection.on_incoming_from_tunnel(None, circuit, ("1.2.3.4", 5), "data"))
+        self.assertNotIn(("1.2.3.4", 5), self.connection.destinations)
+
+        self.connection.on_incoming_from_tunnel(None, circuit, ("1.2.3.4", 5), "data", force=True)
+        self.connection.on_incoming_from_tunnel(None, circuit, ("1.2.3.4", 6), "data")
+        self.assertEqual(self.connection.destinations[("1.2.3.4", 6)], circuit)
+
+        self.assertEqual(self.connection.circuit_dead(circuit), {("1.2.3.4", 5), ("1.2.3.4", 6)})
+        self.assertFalse(self.connection.destinations)
+        self.assertFalse(self.connection.circuit_destinations)
+
 
 class TestSocksUDPConnection(AbstractServer):
 
@@ -124,3 +141,16 @@ class TestSocksUDPConnection(AbstractServer):
 
         # Second close
         self.assertTrue(self.connection.close())
+
+    @blocking_call_on_reactor_thread
+    def test_send_datagrams(self):
+        """
+        Test whether datagrams are sent to the client right away
+        """
+        sent = []
+        self.connection.remote_udp_address = ("127.0.0.1", 1234)
+        self.connection.transport.write = lambda data, address: sent.append((data, address))
+
+        self.connection.sendDatagram("a")
+        self.connection.sendDatagram("b")
+        self.assertEqual(sent, [("a", ("127.0.0.1", 1234)), ("b", ("127.0.0.1", 1234))])
@@ -1,7 +1,9 @@
 import struct
 
 from Tribler.Test.Core.base_test import TriblerCoreTest
-from Tribler.community.tunnel.Socks5.conversion import decode_request, IPV6AddrError
+from Tribler.community.tunnel.Socks5 import conversion
+from Tribler.community.tunnel.Socks5.conversion import (decode_request, IPV6AddrError, encode_udp_packet,
+                                                        decode_udp_packet, ADDRESS_TYPE_IPV4)
 
 
 class TestSocks5Conversion(TriblerCoreTest):
@@ -12,3 +14,26 @@ class TestSocks5Conversion(TriblerCoreTest):
         """
         self.assertIsNone(decode_request(0, struct.pack("!BBBB", 5, 0, 0, 5))[1])  # Invalid address type
         self.assertRaises(IPV6AddrError, decode_request, 0, struct.pack("!BBBB", 5, 0, 0, 4))  # IPv6
+
+    def test_encode_udp_packet(self):
+        """
+        Test whether UDP packets with a cached header decode to the right origin and payload
+        """
+        for payload in ("abc", "def"):
+            request = decode_udp_packet(encode_udp_packet(0, 0, ADDRESS_TYPE_IPV4, "1.2.3.4", 5, payload))
+            self.assertEqual(request.destination, ("1.2.3.4", 5))
+            self.assertEqual(request.payload, payload)
+
+    def test_udp_header_cache_full(self):
+        """
+        Test whether the header cache is emptied when it is full
+        """
+        conversion._udp_header_cache.clear()
+        for port in xrange(conversion.UDP_HEADER_CACHE_SIZE):
+            encode_udp_packet(0, 0, ADDRESS_TYPE_IPV4, "1.2.3.4", port, "")
+        encode_udp_packet(0, 0, ADDRESS_TYPE_IPV4, "1.2.3.4", 0, "")
+        self.assertEqual(len(conversion._udp_header_cache), conversion.UDP_HEADER_CACHE_SIZE)
+
+        encode_udp_packet(0, 0, ADDRESS_TYPE_IPV4, "1.2.3.5", 0, "")
+        self.assertEqual(conversion._udp_header_cache.keys(), [(0, 0, ADDRESS_TYPE_IPV4, "1.2.3.5", 0)])
+        conversion._udp_header_cache.clear()
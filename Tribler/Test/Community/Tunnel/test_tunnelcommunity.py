@@ -1,9 +1,12 @@
 import time
+from struct import pack
 
 from twisted.internet.defer import inlineCallbacks, returnValue
 
 from Tribler.Test.Community.Tunnel.test_tunnel_base import AbstractTestTunnelCommunity
 from Tribler.Test.twisted_thread import deferred
+from Tribler.community.tunnel import (EXIT_NODE, EXIT_NODE_SALT, EXIT_NODE_SALT_EXPLICIT, ORIGINATOR, ORIGINATOR_SALT,
+                                      ORIGINATOR_SALT_EXPLICIT)
 from Tribler.community.tunnel.conversion import TunnelConversion
 from Tribler.community.tunnel.crypto.tunnelcrypto import CryptoException, TunnelCrypto
 from Tribler.community.tunnel.routing import Circuit, Hop, RelayRoute
@@ -161,6 +164,37 @@ class TestTunnelCommunity(AbstractTestTunnelCommunity):
         _, encrypted = TunnelConversion.split_encrypted_packet(packet, u"data")
         self.assertRaises(CryptoException, self.tunnel_community.crypto_in, 42, encrypted, is_data=True)
 
+    @blocking_call_on_reactor_thread
+    def test_relay_packet(self):
+        """
+        A relayed data packet should get the circuit id of the next hop and lose or gain the encryption layer of
+        the relay, depending on its direction.
+        """
+        self.tunnel_community.settings = TunnelSettings()
+        crypto = self.tunnel_community.crypto
+        session_keys = crypto.generate_session_keys("1234")
+        session_keys[ORIGINATOR_SALT_EXPLICIT] = session_keys[EXIT_NODE_SALT_EXPLICIT] = 10 ** 8
+        self.tunnel_community.relay_session_keys[42] = self.tunnel_community.relay_session_keys[43] = session_keys
+        self.tunnel_community.directions[42] = EXIT_NODE
+        self.tunnel_community.directions[43] = ORIGINATOR
+        self.tunnel_community.relay_from_to[42] = RelayRoute(43, ("127.0.0.1", 1337))
+        self.tunnel_community.relay_from_to[43] = RelayRoute(42, ("127.0.0.1", 1338))
+
+        sent = []
+        self.tunnel_community.send_packet = lambda _, __, packet: sent.append(packet) or len(packet)
+
+        encrypted = crypto.encrypt_str("content", session_keys[EXIT_NODE], session_keys[EXIT_NODE_SALT], 10 ** 8)
+        self.assertTrue(self.tunnel_community.relay_packet(42, u"data", pack('!I', 42) + encrypted))
+        self.assertEqual(sent[-1], pack('!I', 43) + "content")
+
+        self.assertTrue(self.tunnel_community.relay_packet(43, u"data", pack('!I', 43) + "content"))
+        self.assertEqual(sent[-1][:4], pack('!I', 42))
+        self.assertEqual(crypto.decrypt_str(sent[-1][4:], session_keys[ORIGINATOR], session_keys[ORIGINATOR_SALT]),
+                         "content")
+
+        del self.tunnel_community.relay_from_to[42]
+        del self.tunnel_community.relay_from_to[43]
+
     @blocking_call_on_reactor_thread
     def test_valid_member_on_tunnel_remove(self):
         """
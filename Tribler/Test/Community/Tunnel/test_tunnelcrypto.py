@@ -0,0 +1,72 @@
+import os
+
+from cryptography.exceptions import InvalidTag
+
+from Tribler.Test.Core.base_test import TriblerCoreTest
+from Tribler.community.tunnel.crypto import tunnelcrypto
+from Tribler.community.tunnel.crypto.tunnelcrypto import TunnelCrypto, CryptoException
+
+
+class TestTunnelCrypto(TriblerCoreTest):
+
+    def setUp(self, annotate=True):
+        TriblerCoreTest.setUp(self, annotate=annotate)
+        self.crypto = TunnelCrypto()
+        self.key, _, self.salt, _, _, _ = self.crypto.generate_session_keys(os.urandom(64))
+
+    def test_encrypt_decrypt(self):
+        """
+        Test whether an encrypted packet can be decrypted again
+        """
+        encrypted = self.crypto.encrypt_str("content", self.key, self.salt, 10 ** 8)
+        self.assertEqual(self.crypto.decrypt_str(encrypted, self.key, self.salt), "content")
+
+    def test_decrypt_invalid(self):
+        """
+        Test whether tampered and truncated packets are refused
+        """
+        encrypted = self.crypto.encrypt_str("content", self.key, self.salt, 10 ** 8)
+        self.assertRaises(InvalidTag, self.crypto.decrypt_str, encrypted[:-1] + "x", self.key, self.salt)
+        self.assertRaises(CryptoException, self.crypto.decrypt_str, encrypted[:23], self.key, self.salt)
+
+    def test_cipher_context_cache(self):
+        """
+        Test whether cipher contexts are reused and the least recently used one is dropped when the cache is full
+        """
+        context = self.crypto.get_cipher_context(self.key)
+        self.assertIs(self.crypto.get_cipher_context(self.key), context)
+
+        old_max = tunnelcrypto.MAX_CIPHER_CONTEXTS
+        tunnelcrypto.MAX_CIPHER_CONTEXTS = 2
+        try:
+            other_key = os.urandom(16)
+            self.crypto.get_cipher_context(other_key)
+            self.crypto.get_cipher_context(self.key)
+            self.crypto.get_cipher_context(os.urandom(16))
+            self.assertEqual(len(self.crypto._cipher_contexts), 2)
+            self.assertIs(self.crypto.get_cipher_context(self.key), context)
+            self.assertNotIn(other_key, self.crypto._cipher_contexts)
+        finally:
+            tunnelcrypto.MAX_CIPHER_CONTEXTS = old_max
+
+    def test_drop_cipher_contexts(self):
+        """
+        Test whether the cipher contexts of removed session keys are dropped
+        """
+        session_keys = self.crypto.generate_session_keys(os.urandom(64))
+        self.crypto.get_cipher_context(session_keys[0])
+        self.crypto.get_cipher_context(session_keys[1])
+        self.crypto.get_cipher_context(self.key)
+        self.crypto.drop_cipher_contexts(session_keys)
+        self.crypto.drop_cipher_contexts(None)
+        self.assertEqual(self.crypto._cipher_contexts.keys(), [self.key])
+
+    def test_batch(self):
+        """
+        Test whether batched encryption matches encrypting the packets one by one
+        """
+        contents = ["a" * 10, "b" * 20, "c" * 30]
+        encrypted = self.crypto.encrypt_str_batch(contents, self.key, self.salt, 10 ** 8)
+        self.assertEqual(encrypted, [self.crypto.encrypt_str(content, self.key, self.salt, 10 ** 8 + index)
+                                     for index, content in enumerate(contents)])
+        self.assertEqual(self.crypto.decrypt_str_batch(encrypted, self.key, self.salt), contents)
@@ -0,0 +1,324 @@
+import logging
+import os
+from collections import defaultdict
+from struct import pack, unpack_from
+
+from twisted.internet.address import IPv4Address
+from twisted.internet.error import ProcessTerminated
+from twisted.internet.task import Clock
+from twisted.python.failure import Failure
+
+from Tribler.Test.Core.base_test import MockObject, TriblerCoreTest
+from Tribler.community.tunnel import EXIT_NODE, EXIT_NODE_SALT, ORIGINATOR, ORIGINATOR_SALT
+from Tribler.community.tunnel.conversion import TunnelConversion
+from Tribler.community.tunnel.crypto.tunnelcrypto import TunnelCrypto
+from Tribler.community.tunnel.routing import RelayRoute
+from Tribler.community.tunnel.tunnel_community import TunnelCommunity
+from Tribler.community.tunnel.workers import (CircuitRouter, OP_ADD_EXIT, OP_ADD_RELAY, OP_EXIT_OUT, OP_RELAY,
+                                              RESTART_DELAY, TunnelWorker, TunnelWorkerPool, WORKER_SALT_EXPLICIT,
+                                              WorkerControlProtocol)
+
+ROUTER_ADDRESS = ('127.0.0.1', 2000)
+ORIGINATOR_ADDRESS = ('1.2.3.4', 1234)
+EXIT_ADDRESS = ('1.2.3.5', 1235)
+
+
+class FakeTransport(object):
+
+    def __init__(self):
+        self.written = []
+
+    def write(self, data, address):
+        self.written.append((data, address))
+
+
+class FakePort(object):
+
+    def getHost(self):
+        return IPv4Address('UDP', *ROUTER_ADDRESS)
+
+
+class FakeProcessTransport(object):
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.signals = []
+        self.stdin = ''
+
+    def write(self, data):
+        self.stdin += data
+
+    def signalProcess(self, signal):
+        self.signals.append(signal)
+
+
+class FakeWorkerPool(TunnelWorkerPool):
+
+    def __init__(self, router, num_workers):
+        super(FakeWorkerPool, self).__init__(router, num_workers)
+        self.clock = Clock()
+        self.spawned = []
+
+    def spawn_process(self, protocol):
+        transport = FakeProcessTransport(1000 + len(self.spawned))
+        self.spawned.append((protocol, transport))
+        return transport
+
+
+class FakeSettings(object):
+
+    def __init__(self):
+        self.crypto = TunnelCrypto()
+
+
+class TestWorkers(TriblerCoreTest):
+
+    def setUp(self, annotate=True):
+        super(TestWorkers, self).setUp(annotate=annotate)
+        self.community = TunnelCommunity.__new__(TunnelCommunity)
+        self.community.tunnel_logger = logging.getLogger("TunnelLogger")
+        self.community.settings = FakeSettings()
+        self.community.stats = defaultdict(int)
+        self.community.circuits = {}
+        self.community.exit_sockets = {}
+        self.community.relay_session_keys = {}
+        self.community.directions = {}
+        self.community.relay_from_to = {}
+        self.community.circuit_router = None
+
+        self.sent = []
+        self.removed = []
+
+        def send_packet(candidates, message_type, packet):
+            self.sent.append((candidates[0].sock_addr, message_type, packet))
+            return len(packet)
+        self.community.send_packet = send_packet
+        self.community.remove_relay = lambda circuit_id, *_, **__: self.removed.append(circuit_id)
+        self.community.remove_exit_socket = lambda circuit_id, *_, **__: self.removed.append(circuit_id)
+
+        self.router = CircuitRouter(self.community)
+        self.router.transport = FakeTransport()
+        self.router.port = FakePort()
+        self.community.circuit_router = self.router
+
+        self.crypto = TunnelCrypto()
+        self.session_keys = self.crypto.generate_session_keys(os.urandom(64))
+        self.session_keys[4] = self.session_keys[5] = 10 ** 8
+
+    def add_relay(self, from_circuit_id, to_circuit_id):
+        self.community.relay_session_keys[from_circuit_id] = self.session_keys
+        self.community.relay_session_keys[to_circuit_id] = self.session_keys
+        self.community.directions[from_circuit_id] = EXIT_NODE
+        self.community.directions[to_circuit_id] = ORIGINATOR
+        self.community.relay_from_to[from_circuit_id] = RelayRoute(to_circuit_id, EXIT_ADDRESS)
+        self.community.relay_from_to[to_circuit_id] = RelayRoute(from_circuit_id, ORIGINATOR_ADDRESS)
+        return self.router.add_relay(from_circuit_id, to_circuit_id, self.session_keys)
+
+    def deliver(self, worker, address):
+        """
+        Hand the messages the router sent to a worker to that worker, and return its answers to the router.
+        """
+        messages, self.router.transport.written = self.router.transport.written, []
+        for data, destination in messages:
+            self.assertEqual(destination, address)
+            worker.datagramReceived(data, ROUTER_ADDRESS)
+
+        answers, worker.transport.written = worker.transport.written, []
+        for data, destination in answers:
+            self.assertEqual(destination, ROUTER_ADDRESS)
+            self.router.datagramReceived(data, address)
+
+    def create_worker(self, index):
+        worker = TunnelWorker(TunnelCrypto(), ROUTER_ADDRESS)
+        worker.transport = FakeTransport()
+        self.router.add_worker(index, ('127.0.0.1', 3000 + index))
+        return worker
+
+    def test_assign_circuits(self):
+        """
+        Test whether both sides of a relay are assigned to the same worker, and circuits to the least busy worker
+        """
+        self.assertFalse(self.add_relay(1, 2))
+
+        self.create_worker(0)
+        self.create_worker(1)
+        self.assertTrue(self.add_relay(1, 2))
+        self.assertIs(self.router.circuits[1][0], self.router.circuits[2][0])
+        self.assertEqual(unpack_from('!B', self.router.transport.written[0][0])[0], OP_ADD_RELAY)
+
+        self.assertTrue(self.router.add_exit(3, self.session_keys))
+        self.assertIsNot(self.router.circuits[3][0], self.router.circuits[1][0])
+
+        # A relay that replaces an exit socket stays with the worker of the exit socket
+        self.assertTrue(self.add_relay(3, 4))
+        self.router.remove_exit(3)
+        self.assertIs(self.router.circuits[4][0], self.router.circuits[3][0])
+
+        self.router.remove(1)
+        self.router.remove(2)
+        self.assertEqual(sum(len(worker.circuit_ids) for worker in self.router.workers.values()), 2)
+
+    def test_route_relay(self):
+        """
+        Test whether relayed data cells are routed to the worker of the circuit and sent on by the community
+        """
+        worker = self.create_worker(0)
+        self.add_relay(1234, 5678)
+        self.deliver(worker, ('127.0.0.1', 3000))
+        self.assertIn(1234, worker.circuits)
+        self.assertIn(5678, worker.circuits)
+
+        # Towards the exit node, the worker removes the encryption layer
+        content = os.urandom(100)
+        packet = pack('!I', 1234) + self.crypto.encrypt_str(content, self.session_keys[EXIT_NODE],
+                                                            self.session_keys[EXIT_NODE_SALT], 10 ** 8)
+        self.assertTrue(self.community.relay_packet(1234, u"data", packet))
+        self.assertFalse(self.sent)
+        self.assertEqual(unpack_from('!B', self.router.transport.written[0][0])[0], OP_RELAY)
+        self.deliver(worker, ('127.0.0.1', 3000))
+        self.assertEqual(self.sent, [(EXIT_ADDRESS, u"data", pack('!I', 5678) + content)])
+        self.assertEqual(self.community.stats['bytes_relay_up'], len(content) + 4)
+
+        # Towards the originator, the worker adds an encryption layer with its own salt_explicit values
+        del self.sent[:]
+        self.community.relay_packet(5678, u"data", pack('!I', 5678) + content)
+        self.deliver(worker, ('127.0.0.1', 3000))
+        address, _, packet = self.sent[0]
+        self.assertEqual(address, ORIGINATOR_ADDRESS)
+        self.assertEqual(TunnelConversion.get_circuit_id(packet, u"data"), 1234)
+        self.assertGreater(unpack_from('!q', packet, 4)[0], WORKER_SALT_EXPLICIT)
+        self.assertEqual(self.crypto.decrypt_str(packet[4:], self.session_keys[ORIGINATOR],
+                                                 self.session_keys[ORIGINATOR_SALT]), content)
+
+    def test_route_exit(self):
+        """
+        Test whether data of an exit socket is encrypted by its worker and sent to the previous hop
+        """
+        worker = self.create_worker(0)
+        exit_socket = MockObject()
+        exit_socket.sock_addr = ORIGINATOR_ADDRESS
+        self.community.exit_sockets[42] = exit_socket
+        self.router.add_exit(42, self.session_keys)
+        self.assertEqual(unpack_from('!B', self.router.transport.written[0][0])[0], OP_ADD_EXIT)
+        self.deliver(worker, ('127.0.0.1', 3000))
+
+        self.community.send_data([], 42, ('0.0.0.0', 0), EXIT_ADDRESS, 'data')
+        self.assertEqual(unpack_from('!B', self.router.transport.written[0][0])[0], OP_EXIT_OUT)
+        self.deliver(worker, ('127.0.0.1', 3000))
+
+        address, _, packet = self.sent[0]
+        self.assertEqual(address, ORIGINATOR_ADDRESS)
+        plaintext = packet[:4] + self.crypto.decrypt_str(packet[4:], self.session_keys[ORIGINATOR],
+                                                         self.session_keys[ORIGINATOR_SALT])
+        self.assertEqual(TunnelConversion.decode_data(plaintext), (42, ('0.0.0.0', 0), EXIT_ADDRESS, 'data'))
+
+        # The worker drops the cipher contexts of the exit socket once it is removed
+        self.assertTrue(worker.crypto._cipher_contexts)
+        self.router.remove_exit(42)
+        self.deliver(worker, ('127.0.0.1', 3000))
+        self.assertNotIn(42, worker.circuits)
+        self.assertFalse(worker.crypto._cipher_contexts)
+
+    def test_unrouted(self):
+        """
+        Test whether circuits that are not owned by a worker are left to the community
+        """
+        self.create_worker(0)
+        self.assertFalse(self.router.relay_packet(1234, 'packet'))
+        self.assertFalse(self.router.send_data(1234, 'packet'))
+        self.assertFalse(self.router.transport.written)
+
+    def test_stale_answer(self):
+        """
+        Test whether answers for circuits that were removed in the meantime are dropped
+        """
+        worker = self.create_worker(0)
+        self.add_relay(1234, 5678)
+        self.deliver(worker, ('127.0.0.1', 3000))
+        self.community.relay_packet(5678, u"data", pack('!I', 5678) + 'content')
+        messages, self.router.transport.written = self.router.transport.written, []
+
+        self.router.remove(1234)
+        self.router.remove(5678)
+        self.router.transport.written = messages
+        self.deliver(worker, ('127.0.0.1', 3000))
+        self.assertFalse(self.sent)
+
+    def test_foreign_sender(self):
+        """
+        Test whether a worker drops the datagrams of every sender but the coordinator
+        """
+        worker = self.create_worker(0)
+        self.add_relay(1234, 5678)
+        for data, _ in self.router.transport.written:
+            worker.datagramReceived(data, ('127.0.0.1', 4000))
+        self.assertFalse(worker.circuits)
+        self.assertEqual(worker.num_rejected, 1)
+
+        # a worker that did not learn the address of its coordinator yet accepts nothing
+        worker = TunnelWorker(TunnelCrypto())
+        worker.datagramReceived(self.router.transport.written[0][0], ROUTER_ADDRESS)
+        self.assertFalse(worker.circuits)
+
+    def test_worker_control(self):
+        """
+        Test whether a worker learns the address of its coordinator from its stdin
+        """
+        worker = TunnelWorker(TunnelCrypto())
+        control = WorkerControlProtocol(worker, 3000)
+        control.lineReceived('coordinator 127.0.0.1 abc')
+        self.assertIsNone(worker.coordinator)
+        control.lineReceived('coordinator %s %d' % ROUTER_ADDRESS)
+        self.assertEqual(worker.coordinator, ROUTER_ADDRESS)
+
+    def test_spawn_workers(self):
+        """
+        Test whether the pool starts its workers and adds them to the router once they report their port
+        """
+        pool = FakeWorkerPool(self.router, 2)
+        pool.start()
+        self.assertEqual(len(pool.spawned), 2)
+        self.assertEqual(pool.spawned[0][1].stdin, 'coordinator %s %d\n' % ROUTER_ADDRESS)
+        self.assertFalse(self.router.workers)
+
+        pool.spawned[0][0].outReceived('port 3000\n')
+        pool.spawned[1][0].outReceived('po')
+        pool.spawned[1][0].outReceived('rt 3001\n')
+        self.assertEqual(self.router.workers[0].address, ('127.0.0.1', 3000))
+        self.assertEqual(self.router.workers[1].pid, 1001)
+        self.assertEqual([stats['circuits'] for stats in pool.get_worker_stats()], [0, 0])
+
+    def test_restart_worker(self):
+        """
+        Test whether a worker that dies is restarted, and the circuits it owned are destroyed
+        """
+        pool = FakeWorkerPool(self.router, 1)
+        pool.start()
+        protocol, _ = pool.spawned[0]
+        protocol.outReceived('port 3000\n')
+        self.add_relay(1234, 5678)
+
+        protocol.processEnded(Failure(ProcessTerminated(exitCode=1)))
+        self.assertFalse(self.router.workers)
+        self.assertFalse(self.router.circuits)
+        self.assertIn(1234, self.removed)
+        self.assertTrue(protocol.ended.called)
+
+        pool.clock.advance(RESTART_DELAY)
+        self.assertEqual(len(pool.spawned), 2)
+        pool.spawned[1][0].outReceived('port 3002\n')
+        self.assertEqual(self.router.workers[0].address, ('127.0.0.1', 3002))
+        self.assertEqual(pool.get_worker_stats()[0]['restarts'], 1)
+
+    def test_stop_pool(self):
+        """
+        Test whether stopping the pool stops the workers and cancels their restarts
+        """
+        pool = FakeWorkerPool(self.router, 2)
+        pool.start()
+        pool.spawned[0][0].processEnded(Failure(ProcessTerminated(exitCode=1)))
+        pool.stop()
+
+        self.assertEqual(pool.spawned[1][1].signals, ['TERM'])
+        pool.clock.advance(RESTART_DELAY)
+        self.assertEqual(len(pool.spawned), 2)
@@ -516,7 +516,7 @@ class TestBoostingManagerSysChannel(TestBoostingManagerSys, BaseTestChannel):
         self.create_torrents_in_channel(dispersy_cid_hex)
 
         self.session.download_torrentfile = \
-            lambda dummy_ihash, function, _: function(binascii.hexlify(TORRENT_UBUNTU_FILE_INFOHASH))
+            lambda dummy_ihash, function, _, **__: function(binascii.hexlify(TORRENT_UBUNTU_FILE_INFOHASH))
 
         def get_bin_torrent(_):
             """
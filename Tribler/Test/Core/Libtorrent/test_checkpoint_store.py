@@ -0,0 +1,89 @@
+import binascii
+import os
+
+from twisted.internet.defer import inlineCallbacks
+
+from Tribler.Core.Libtorrent.checkpoint_store import CheckpointStore
+from Tribler.Core.Utilities.configparser import CallbackConfigParser
+from Tribler.Test.Core.base_test import TriblerCoreTest
+from Tribler.dispersy.util import blocking_call_on_reactor_thread
+
+
+class TriblerCoreTestCheckpointStore(TriblerCoreTest):
+
+    @blocking_call_on_reactor_thread
+    @inlineCallbacks
+    def setUp(self, annotate=True):
+        yield super(TriblerCoreTestCheckpointStore, self).setUp(annotate=annotate)
+        self.store = CheckpointStore(os.path.join(self.session_base_dir, 'checkpoints'))
+
+        self.pstate = CallbackConfigParser()
+        self.pstate.add_section('downloadconfig')
+        self.pstate.set('downloadconfig', 'saveas', u'/tmp/d\xe9st')
+        self.pstate.add_section('state')
+        self.pstate.set('state', 'metainfo', {'info': {'name': 'test', 'pieces': 'a' * 20}})
+        self.pstate.set('state', 'engineresumedata', {'info-hash': 'a' * 20})
+
+    @blocking_call_on_reactor_thread
+    @inlineCallbacks
+    def tearDown(self, annotate=True):
+        self.store.close()
+        yield super(TriblerCoreTestCheckpointStore, self).tearDown(annotate=annotate)
+
+    def test_put_get(self):
+        self.store.put('a' * 20, self.pstate)
+        pstate = self.store.get('a' * 20)
+        self.assertEqual(pstate.get('downloadconfig', 'saveas'), u'/tmp/d\xe9st')
+        self.assertEqual(pstate.get('state', 'metainfo'), self.pstate.get('state', 'metainfo'))
+        self.assertEqual(pstate.get('state', 'engineresumedata'), {'info-hash': 'a' * 20})
+        self.assertIsNone(self.store.get('b' * 20))
+
+    def test_put_no_metainfo(self):
+        self.pstate.set('state', 'metainfo', {'infohash': 'a' * 20, 'name': 'test', 'url': None})
+        self.store.put('a' * 20, self.pstate)
+        self.assertEqual(self.store.get('a' * 20).get('state', 'metainfo'), self.pstate.get('state', 'metainfo'))
+
+    def test_put_unchanged(self):
+        self.store.put('a' * 20, self.pstate)
+        self.store.flush()
+        self.store.put('a' * 20, self.pstate)
+        self.assertFalse(self.store._store._pending_torrents)
+
+        self.pstate.set('state', 'engineresumedata', {'info-hash': 'b' * 20})
+        self.store.put('a' * 20, self.pstate)
+        self.assertTrue(self.store._store._pending_torrents)
+
+    def test_get_infohashes(self):
+        self.store.put('a' * 20, self.pstate)
+        self.store.put('b' * 20, self.pstate)
+        self.assertEqual(sorted(self.store.get_infohashes()), ['a' * 20, 'b' * 20])
+        self.assertEqual(len(self.store), 2)
+
+    def test_reopen(self):
+        self.store.put('a' * 20, self.pstate)
+        self.store.close()
+        self.store = CheckpointStore(os.path.join(self.session_base_dir, 'checkpoints'))
+        self.assertIn('a' * 20, self.store)
+        self.assertEqual(len(self.store), 1)
+
+    def test_delete(self):
+        self.store.put('a' * 20, self.pstate)
+        self.store.flush()
+        self.store.delete('a' * 20)
+        self.assertNotIn('a' * 20, self.store)
+        self.assertIsNone(self.store.get('a' * 20))
+
+    def test_migrate(self):
+        pstate_dir = os.path.join(self.session_base_dir, 'dlcheckpoints')
+        os.mkdir(pstate_dir)
+        self.pstate.write_file(os.path.join(pstate_dir, binascii.hexlify('a' * 20) + '.state'))
+        with open(os.path.join(pstate_dir, binascii.hexlify('b' * 20) + '.state'), 'wb') as state_file:
+            state_file.write("hi")
+
+        self.assertEqual(self.store.migrate(pstate_dir), 2)
+        self.assertFalse(os.listdir(pstate_dir))
+        self.assertEqual(self.store.get('a' * 20).get('state', 'engineresumedata'), {'info-hash': 'a' * 20})
+
+        # The unparsable checkpoint is kept, so the download can be resumed from the torrent store
+        self.assertIn('b' * 20, self.store)
+        self.assertIsNone(self.store.get('b' * 20))
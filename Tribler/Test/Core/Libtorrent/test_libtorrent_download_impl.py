@@ -1,4 +1,3 @@
-import binascii
 import os
 from twisted.internet.defer import Deferred
 
@@ -10,7 +9,7 @@ from Tribler.Core.SessionConfig import SessionStartupConfig
 from Tribler.Core.TorrentDef import TorrentDef
 from Tribler.Core.Utilities.configparser import CallbackConfigParser
 from Tribler.Core.Utilities.torrent_utils import get_info_from_handle
-from Tribler.Core.simpledefs import DLSTATUS_DOWNLOADING, DLMODE_VOD
+from Tribler.Core.simpledefs import DLSTATUS_DOWNLOADING, DLMODE_VOD, DLMODE_NORMAL, UPLOAD
 from Tribler.Test.Core.base_test import TriblerCoreTest, MockObject
 from Tribler.Test.common import TESTS_DATA_DIR
 from Tribler.Test.test_as_server import TestAsServer
@@ -172,11 +171,7 @@ class TestLibtorrentDownloadImpl(TestAsServer):
             """
             check if resume data is ready
             """
-            basename = binascii.hexlify(tdef.get_infohash()) + '.state'
-            filename = os.path.join(self.session.get_downloads_pstate_dir(), basename)
-
-            engine_data = CallbackConfigParser()
-            engine_data.read_file(filename)
+            engine_data = self.session.lm.checkpoint_store.get(tdef.get_infohash())
 
             self.assertEqual(tdef.get_infohash(), engine_data.get('state', 'engineresumedata').get('info-hash'))
 
@@ -206,10 +201,7 @@ class TestLibtorrentDownloadImpl(TestAsServer):
             """
             callback after finishing setup in LibtorrentDownloadImpl
             """
-            basename = binascii.hexlify(tdef.get_infohash()) + '.state'
-            filename = os.path.join(self.session.get_downloads_pstate_dir(), basename)
-
-            self.assertFalse(os.path.isfile(filename))
+            self.assertNotIn(tdef.get_infohash(), self.session.lm.checkpoint_store)
 
         # This should not cause a checkpoint
         result_deferred = impl.setup(None, None, 0, checkpoint_disabled=True)
@@ -479,6 +471,54 @@ class TestLibtorrentDownloadImplNoSession(TriblerCoreTest):
         self.assertFalse(self.libtorrent_download_impl.checkpoint_after_next_hashcheck)
         self.assertTrue(mocked_pause_checkpoint.called)
 
+    def test_process_alerts_no_status_query(self):
+        """
+        Testing whether alerts without a handler do not lead to a status query
+        """
+        def mocked_update_lt_stats():
+            mocked_update_lt_stats.called += 1
+
+        mocked_update_lt_stats.called = 0
+        self.libtorrent_download_impl.update_lt_stats = mocked_update_lt_stats
+
+        mock_alert = MockObject()
+        mock_alert.category = lambda: lt.alert.category_t.status_notification
+        self.libtorrent_download_impl.process_alerts([(mock_alert, 'state_changed_alert'),
+                                                      (mock_alert, 'stats_alert')])
+        self.assertEqual(mocked_update_lt_stats.called, 0)
+
+    def test_update_lt_status(self):
+        """
+        Testing whether the getters read the status snapshot of a state update instead of querying the handle
+        """
+        def mocked_status():
+            mocked_status.called += 1
+            return None
+
+        mocked_status.called = 0
+        self.libtorrent_download_impl.handle.status = mocked_status
+        self.libtorrent_download_impl.get_mode = lambda: DLMODE_NORMAL
+        self.libtorrent_download_impl._stop_if_finished = lambda: None
+
+        lt_status = MockObject()
+        lt_status.state = 3
+        lt_status.paused = False
+        lt_status.error = None
+        lt_status.progress = 0.5
+        lt_status.total_wanted = 1024
+        lt_status.download_payload_rate = 10
+        lt_status.upload_payload_rate = 20
+        lt_status.all_time_upload = 30
+        lt_status.all_time_download = 40
+        lt_status.finished_time = 0
+        lt_status.pieces = [True, False]
+        self.libtorrent_download_impl.update_lt_status(lt_status)
+
+        self.assertEqual(self.libtorrent_download_impl.progress, 0.5)
+        self.assertEqual(self.libtorrent_download_impl.curspeeds[UPLOAD], 20)
+        self.assertEqual(self.libtorrent_download_impl.get_piece_progress([0, 1]), 0.5)
+        self.assertEqual(mocked_status.called, 0)
+
     def test_get_length(self):
         """
         Testing whether the right length of the content of the download is returned
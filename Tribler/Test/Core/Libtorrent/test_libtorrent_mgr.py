@@ -1,4 +1,3 @@
-import binascii
 import os
 import shutil
 import tempfile
@@ -8,9 +7,14 @@ from twisted.internet.defer import inlineCallbacks, Deferred
 
 from Tribler.Core.CacheDB.Notifier import Notifier
 from Tribler.Core.Libtorrent.LibtorrentDownloadImpl import LibtorrentDownloadImpl
-from Tribler.Core.Libtorrent.LibtorrentMgr import LibtorrentMgr
+from Tribler.Core.Libtorrent.LibtorrentMgr import LibtorrentMgr, MAX_ALERTS_PER_TICK
+from Tribler.Core.Libtorrent.checkpoint_store import CheckpointStore
+from Tribler.Core.TorrentDef import TorrentDef
 from Tribler.Core.exceptions import DuplicateDownloadException, TorrentFileException
+from Tribler.Core.simpledefs import (METAINFO_PRIORITY_COLLECTING, METAINFO_PRIORITY_CREDIT_MINING,
+                                     METAINFO_PRIORITY_USER)
 from Tribler.Test.Core.base_test import MockObject, TriblerCoreTest
+from Tribler.Test.common import TORRENT_UBUNTU_FILE
 from Tribler.Test.twisted_thread import deferred
 from Tribler.dispersy.util import blocking_call_on_reactor_thread
 
@@ -145,16 +149,30 @@ class TestLibtorrentMgr(TriblerCoreTest):
         test_deferred = Deferred()
 
         def metainfo_cb(metainfo):
-            self.assertEqual(metainfo, "test")
+            self.assertEqual(metainfo, {'info': {'pieces': 'a'}})
             test_deferred.callback(None)
 
         self.ltmgr.initialize()
         self.ltmgr.is_dht_ready = lambda: True
-        self.ltmgr.metainfo_cache[("a" * 20).encode('hex')] = {'meta_info': 'test'}
+        self.ltmgr.metainfo_cache.put(("a" * 20).encode('hex'), {'info': {'pieces': 'a'}})
         self.ltmgr.get_metainfo("a" * 20, metainfo_cb)
 
         return test_deferred
 
+    def test_metainfo_cache_spill(self):
+        """
+        Testing whether torrents evicted from the metainfo cache are saved as collected torrents
+        """
+        saved_tdefs = []
+        self.tribler_session.lm = MockObject()
+        self.tribler_session.lm.rtorrent_handler = MockObject()
+        self.tribler_session.lm.rtorrent_handler.save_torrent = saved_tdefs.append
+
+        tdef = TorrentDef.load(TORRENT_UBUNTU_FILE)
+        self.ltmgr.metainfo_cache.max_bytes = 1
+        self.ltmgr.metainfo_cache.put(tdef.get_infohash().encode('hex'), tdef.get_metainfo())
+        self.assertEqual(saved_tdefs[0].get_infohash(), tdef.get_infohash())
+
     @deferred(timeout=20)
     def test_got_metainfo(self):
         """
@@ -245,6 +263,127 @@ class TestLibtorrentMgr(TriblerCoreTest):
         self.ltmgr.get_metainfo(magnet_link, lambda _: None)
         return test_deferred
 
+    def mock_metainfo_lookups(self, max_lookups):
+        """
+        Let the metainfo lookups of the libtorrent manager start without adding torrents to libtorrent
+        """
+        fake_handle = MockObject()
+        fake_handle.is_valid = lambda: True
+        fake_handle.has_metadata = lambda: False
+
+        self.ltmgr.initialize()
+        self.ltmgr.ltsession_metainfo.add_torrent = lambda *_: fake_handle
+        self.ltmgr.ltsession_metainfo.remove_torrent = lambda *_: None
+        self.ltmgr.is_dht_ready = lambda: True
+        self.ltmgr.max_metainfo_lookups = max_lookups
+
+    def test_get_metainfo_concurrency_limit(self):
+        """
+        Testing whether metainfo lookups are queued when too many lookups are in flight
+        """
+        self.mock_metainfo_lookups(2)
+        for infohash in ("a" * 20, "b" * 20, "c" * 20):
+            self.ltmgr.get_metainfo(infohash, lambda _: None)
+
+        self.assertEqual(len(self.ltmgr.metainfo_requests), 2)
+        self.assertEqual(self.ltmgr.metainfo_queue.keys(), [("c" * 20).encode('hex')])
+
+        self.ltmgr.got_metainfo(("a" * 20).encode('hex'), timeout=True)
+        self.assertIn(("c" * 20).encode('hex'), self.ltmgr.metainfo_requests)
+        self.assertFalse(self.ltmgr.metainfo_queue)
+
+    def test_get_metainfo_priority(self):
+        """
+        Testing whether queued metainfo lookups are started in order of priority
+        """
+        self.mock_metainfo_lookups(1)
+        self.ltmgr.get_metainfo("a" * 20, lambda _: None)
+        self.ltmgr.get_metainfo("b" * 20, lambda _: None, priority=METAINFO_PRIORITY_CREDIT_MINING)
+        self.ltmgr.get_metainfo("c" * 20, lambda _: None, priority=METAINFO_PRIORITY_COLLECTING)
+        self.ltmgr.get_metainfo("d" * 20, lambda _: None, priority=METAINFO_PRIORITY_CREDIT_MINING)
+        # the user is waiting for this torrent now
+        self.ltmgr.get_metainfo("d" * 20, lambda _: None, priority=METAINFO_PRIORITY_USER)
+
+        started = []
+        for _ in xrange(4):
+            infohash = self.ltmgr.metainfo_requests.keys()[0]
+            started.append(infohash)
+            self.ltmgr.got_metainfo(infohash, timeout=True)
+
+        self.assertEqual(started, [(char * 20).encode('hex') for char in "adcb"])
+
+    def test_get_metainfo_coalesce(self):
+        """
+        Testing whether lookups of the same torrent share one queued lookup
+        """
+        timed_out = []
+        callbacks = [lambda _: None, lambda _: None]
+
+        self.mock_metainfo_lookups(0)
+        self.ltmgr.get_metainfo("a" * 20, callbacks[0], timeout_callback=timed_out.append)
+        self.ltmgr.get_metainfo("a" * 20, callbacks[1], timeout_callback=timed_out.append, notify=False)
+        self.ltmgr.get_metainfo("a" * 20, callbacks[1], notify=False)
+
+        request = self.ltmgr.metainfo_queue[("a" * 20).encode('hex')]
+        self.assertEqual(request['callbacks'], callbacks)
+        self.assertTrue(request['notify'])
+        self.assertEqual(len(request['timeout_callbacks']), 1)
+        self.assertEqual(self.ltmgr.get_metainfo_lookup_statistics()['queued'], {METAINFO_PRIORITY_USER: 1})
+
+        # lookups that waited too long in the queue time out instead of being started
+        request['deadline'] = 0
+        self.ltmgr.max_metainfo_lookups = 1
+        self.ltmgr._process_metainfo_queue()
+        self.assertEqual(timed_out, ["a" * 20])
+        self.assertFalse(self.ltmgr.metainfo_requests)
+        self.assertFalse(self.ltmgr.metainfo_queue)
+        self.assertEqual(self.ltmgr.get_metainfo_lookup_statistics()['expired'], 1)
+
+    def test_get_metainfo_coalesce_in_flight(self):
+        """
+        Testing whether a lookup that is in flight notifies its progress once a caller asks for it
+        """
+        notifications = []
+        self.mock_metainfo_lookups(1)
+        self.ltmgr.notifier.notify = lambda *args: notifications.append(args)
+        self.ltmgr.get_metainfo("a" * 20, lambda _: None, notify=False)
+        self.assertFalse(notifications)
+
+        self.ltmgr.get_metainfo("a" * 20, lambda _: None)
+        self.assertTrue(self.ltmgr.metainfo_requests[("a" * 20).encode('hex')]['notify'])
+        self.assertEqual(len(notifications), 1)
+
+    def test_get_metainfo_queued_timeout(self):
+        """
+        Testing whether the time a lookup waited in the queue counts towards its timeout
+        """
+        scheduled = []
+        self.mock_metainfo_lookups(0)
+        self.ltmgr.get_metainfo_lookup_timeout = lambda timeout: scheduled.append(timeout) or timeout
+        self.ltmgr.get_metainfo("a" * 20, lambda _: None, timeout=30)
+        self.ltmgr.metainfo_queue[("a" * 20).encode('hex')]['deadline'] -= 20
+
+        self.ltmgr.max_metainfo_lookups = 1
+        self.ltmgr._process_metainfo_queue()
+        self.assertLessEqual(scheduled[0], 10)
+
+    def test_get_metainfo_lookup_timeout(self):
+        """
+        Testing whether the timeout of a lookup adapts to the time in which earlier lookups succeeded
+        """
+        self.assertEqual(self.ltmgr.get_metainfo_lookup_timeout(30), 30)
+
+        self.ltmgr.metainfo_latencies.extend([1] * 15 + [6] * 5)
+        self.assertEqual(self.ltmgr.get_metainfo_lookup_timeout(30), 12)
+        self.assertEqual(self.ltmgr.get_metainfo_lookup_timeout(8), 8)
+
+        self.ltmgr.metainfo_latencies.extend([1] * 30)
+        self.assertEqual(self.ltmgr.get_metainfo_lookup_timeout(30), 10)
+
+        statistics = self.ltmgr.get_metainfo_lookup_statistics()
+        self.assertEqual(statistics['latency_p50'], 1)
+        self.assertEqual(statistics['latency_p99'], 6)
+
     def test_add_torrent(self):
         """
         Testing the addition of a torrent to the libtorrent manager
@@ -322,6 +461,84 @@ class TestLibtorrentMgr(TriblerCoreTest):
 
         self.assertNotIn('0'*20, self.ltmgr.torrents)
 
+    def test_process_alerts_per_download(self):
+        """
+        Tests whether all alerts of a download are handed to that download at once
+        """
+        processed = []
+        mock_handle = MockObject()
+        mock_handle.is_valid = lambda: True
+        mock_handle.info_hash = lambda: 'a' * 20
+        mock_dl = MockObject()
+        mock_dl.process_alerts = processed.append
+        self.ltmgr.torrents['a' * 20] = (mock_dl, None)
+
+        state_changed_alert = type('state_changed_alert', (object, ), dict(handle=mock_handle))
+        stats_alert = type('lt.stats_alert', (object, ), dict(handle=mock_handle))
+        self.ltmgr.process_alerts([state_changed_alert(), stats_alert(), stats_alert()])
+
+        self.assertEqual([[alert_type for _, alert_type in alerts] for alerts in processed],
+                         [['state_changed_alert', 'stats_alert', 'stats_alert']])
+        self.assertEqual(self.ltmgr.alert_counts, {'state_changed_alert': 1, 'stats_alert': 2})
+
+    def test_process_state_update_alert(self):
+        """
+        Tests whether the status snapshots of a state update alert are handed to the downloads they belong to
+        """
+        updated = []
+        mock_handle = MockObject()
+        mock_handle.is_valid = lambda: True
+        mock_handle.info_hash = lambda: 'a' * 20
+        mock_status = MockObject()
+        mock_status.handle = mock_handle
+        mock_dl = MockObject()
+        mock_dl.update_lt_status = updated.append
+        mock_dl.process_alerts = lambda _: None
+        self.ltmgr.torrents['a' * 20] = (mock_dl, None)
+
+        unknown_handle = MockObject()
+        unknown_handle.is_valid = lambda: True
+        unknown_handle.info_hash = lambda: 'b' * 20
+        unknown_status = MockObject()
+        unknown_status.handle = unknown_handle
+
+        alert = type('state_update_alert', (object, ), dict(status=[mock_status, unknown_status]))
+        self.ltmgr.process_alert(alert())
+        self.assertEqual(updated, [mock_status])
+
+    def test_process_alert_queue_limit(self):
+        """
+        Tests whether the alerts that exceed the limit per reactor tick are processed later
+        """
+        mock_handle = MockObject()
+        mock_handle.is_valid = lambda: False
+        alert = type('stats_alert', (object, ), dict(handle=mock_handle))
+        self.ltmgr.alert_queue.extend(alert() for _ in xrange(MAX_ALERTS_PER_TICK + 5))
+
+        self.ltmgr._process_alert_queue()
+        self.assertEqual(len(self.ltmgr.alert_queue), 5)
+        self.assertEqual(self.ltmgr.get_alert_statistics()['processed'], MAX_ALERTS_PER_TICK)
+        self.assertTrue(self.ltmgr.is_pending_task_active(u"process_alert_queue"))
+
+    def test_process_alerts_not_drained(self):
+        """
+        Tests whether no new alerts are popped from libtorrent while earlier alerts are still queued
+        """
+        popped = []
+        mock_ltsession = MockObject()
+        mock_ltsession.pop_alerts = lambda: popped.append(True) or []
+        mock_ltsession.post_torrent_updates = lambda: None
+        self.ltmgr.ltsessions[1] = mock_ltsession
+        self.ltmgr.alert_queue.append(object())
+
+        self.ltmgr._task_process_alerts()
+        self.assertFalse(popped)
+        self.assertEqual(len(self.ltmgr.alert_queue), 1)
+
+        self.ltmgr.alert_queue.clear()
+        self.ltmgr._task_process_alerts()
+        self.assertTrue(popped)
+
     def test_start_download_corrupt(self):
         """
         Testing whether starting the download of a corrupt torrent file raises an exception
@@ -387,11 +604,11 @@ class TestLibtorrentMgr(TriblerCoreTest):
         mock_tdef.get_infohash = lambda: 'a' * 20
 
         self.tribler_session.get_download = lambda _: None
-        self.tribler_session.get_downloads_pstate_dir = lambda: self.ltmgr.metadata_tmpdir
 
         mock_lm = MockObject()
         mock_lm.ltmgr = self.ltmgr
         mock_lm.tunnel_community = None
+        mock_lm.checkpoint_store = CheckpointStore(os.path.join(self.session_base_dir, 'checkpoints'))
         self.tribler_session.lm = mock_lm
 
         def dl_from_tdef(tdef, _):
@@ -403,7 +620,5 @@ class TestLibtorrentMgr(TriblerCoreTest):
 
         download = self.ltmgr.start_download_from_magnet("magnet:?xt=urn:btih:" + ('1'*40))
 
-        basename = binascii.hexlify(download.get_def().get_infohash()) + '.state'
-        filename = os.path.join(download.session.get_downloads_pstate_dir(), basename)
-
-        self.assertTrue(os.path.isfile(filename))
+        self.assertIn(download.get_def().get_infohash(), mock_lm.checkpoint_store)
+        mock_lm.checkpoint_store.close()
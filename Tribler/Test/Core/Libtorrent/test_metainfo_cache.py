@@ -0,0 +1,60 @@
+from libtorrent import bencode
+from twisted.internet.defer import inlineCallbacks
+
+from Tribler.Core.Libtorrent.metainfo_cache import MetainfoCache
+from Tribler.Test.Core.base_test import TriblerCoreTest
+from Tribler.dispersy.util import blocking_call_on_reactor_thread
+
+
+class TriblerCoreTestMetainfoCache(TriblerCoreTest):
+
+    @blocking_call_on_reactor_thread
+    @inlineCallbacks
+    def setUp(self, annotate=True):
+        yield super(TriblerCoreTestMetainfoCache, self).setUp(annotate=annotate)
+        self.spilled = {}
+        self.metainfo = {"info": {"name": "test", "pieces": "a" * 20}, "seeders": 3, "initial peers": ["1.2.3.4"]}
+        self.torrent_size = len(bencode({"info": self.metainfo["info"]}))
+        self.cache = MetainfoCache(max_bytes=self.torrent_size * 2, ttl=60, spill_callback=self.spilled.__setitem__)
+
+    def test_get_copy(self):
+        self.cache.put("a" * 40, self.metainfo)
+        metainfo = self.cache.get("a" * 40)
+        self.assertEqual(metainfo, self.metainfo)
+
+        # Modifying the returned metainfo does not affect the cache
+        metainfo["info"]["name"] = "changed"
+        metainfo["initial peers"].append("5.6.7.8")
+        self.assertEqual(self.cache.get("a" * 40), self.metainfo)
+        self.assertIsNone(self.cache.get("b" * 40))
+        self.assertEqual(self.cache.get_statistics()["hits"], 2)
+        self.assertEqual(self.cache.get_statistics()["misses"], 1)
+
+    def test_evict_least_recently_used(self):
+        self.cache.put("a" * 40, self.metainfo)
+        self.cache.put("b" * 40, self.metainfo)
+        self.cache.get("a" * 40)
+        self.cache.put("c" * 40, self.metainfo)
+
+        self.assertIn("a" * 40, self.cache)
+        self.assertNotIn("b" * 40, self.cache)
+        self.assertEqual(self.cache.get_statistics()["evictions"], 1)
+        self.assertEqual(self.cache.get_statistics()["bytes"], self.torrent_size * 2)
+
+        # The evicted torrent is spilled, without the swarm information
+        self.assertEqual(self.spilled, {"b" * 40: bencode({"info": self.metainfo["info"]})})
+
+    def test_expire(self):
+        self.cache.put("a" * 40, self.metainfo)
+        self.cache.ttl = -1
+        self.cache.expire()
+
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual(self.cache.get_statistics()["bytes"], 0)
+        self.assertIn("a" * 40, self.spilled)
+
+    def test_too_large(self):
+        self.cache.max_bytes = 1
+        self.cache.put("a" * 40, self.metainfo)
+        self.assertEqual(len(self.cache), 0)
+        self.assertIn("a" * 40, self.spilled)
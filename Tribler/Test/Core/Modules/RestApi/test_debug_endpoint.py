@@ -5,6 +5,7 @@ import os
 from twisted.internet.defer import inlineCallbacks
 
 import Tribler.Core.Utilities.json_util as json
+from Tribler.Core.Libtorrent.metainfo_cache import MetainfoCache
 from Tribler.Core.SessionConfig import SessionStartupConfig
 from Tribler.Test.Core.Modules.RestApi.base_api_test import AbstractApiTest
 from Tribler.Test.Core.base_test import MockObject
@@ -219,3 +220,53 @@ class TestCircuitDebugEndpoint(AbstractApiTest):
         self.should_check_equality = False
         return self.do_request('debug/log?process=gui&max_lines=', expected_code=200)\
             .addCallback(verify_max_logs_returned)
+
+    @deferred(timeout=10)
+    def test_get_metainfo_cache_statistics(self):
+        """
+        Test whether the API returns the statistics of the metainfo cache
+        """
+        self.session.lm.ltmgr = MockObject()
+        self.session.lm.ltmgr.metainfo_cache = MetainfoCache()
+        self.session.lm.ltmgr.shutdown = lambda: None
+        self.session.lm.ltmgr.metainfo_cache.get("a" * 40)
+
+        def verify_statistics(response):
+            json_response = json.loads(response)
+            self.assertEqual(json_response['metainfo_cache']['misses'], 1)
+            self.assertEqual(json_response['metainfo_cache']['hits'], 0)
+
+        self.should_check_equality = False
+        return self.do_request('debug/metainfo_cache', expected_code=200).addCallback(verify_statistics)
+
+    @deferred(timeout=10)
+    def test_get_metainfo_lookup_statistics(self):
+        """
+        Test whether the API returns the statistics of the metainfo lookups
+        """
+        self.session.lm.ltmgr = MockObject()
+        self.session.lm.ltmgr.get_metainfo_lookup_statistics = lambda: {"queued": {}, "in_flight": 3}
+        self.session.lm.ltmgr.shutdown = lambda: None
+
+        def verify_statistics(response):
+            json_response = json.loads(response)
+            self.assertEqual(json_response['metainfo_lookups']['in_flight'], 3)
+
+        self.should_check_equality = False
+        return self.do_request('debug/metainfo_lookups', expected_code=200).addCallback(verify_statistics)
+
+    @deferred(timeout=10)
+    def test_get_alert_statistics(self):
+        """
+        Test whether the API returns the statistics of the libtorrent alerts
+        """
+        self.session.lm.ltmgr = MockObject()
+        self.session.lm.ltmgr.get_alert_statistics = lambda: {"alerts_per_second": {"stats_alert": 2.5}, "queued": 0}
+        self.session.lm.ltmgr.shutdown = lambda: None
+
+        def verify_statistics(response):
+            json_response = json.loads(response)
+            self.assertEqual(json_response['alerts']['alerts_per_second'], {"stats_alert": 2.5})
+
+        self.should_check_equality = False
+        return self.do_request('debug/alerts', expected_code=200).addCallback(verify_statistics)
@@ -7,8 +7,10 @@ from twisted.internet.defer import fail
 from Tribler.Core.DownloadConfig import DownloadStartupConfig
 from Tribler.Core.DownloadState import DownloadState
 import Tribler.Core.Utilities.json_util as json
+from Tribler.Core.Modules.restapi.downloads_endpoint import DownloadChangeTracker, DownloadsEndpoint
 from Tribler.Core.Utilities.network_utils import get_random_port
 from Tribler.Test.Core.Modules.RestApi.base_api_test import AbstractApiTest
+from Tribler.Test.Core.base_test import MockObject, TriblerCoreTest
 from Tribler.Test.common import UBUNTU_1504_INFOHASH, TESTS_DATA_DIR
 from Tribler.Test.twisted_thread import deferred
 
@@ -44,6 +46,40 @@ class TestDownloadsEndpoint(AbstractApiTest):
         self.should_check_equality = False
         return self.do_request('downloads?get_peers=1&get_pieces=1', expected_code=200).addCallback(verify_download)
 
+    @deferred(timeout=20)
+    def test_get_downloads_since(self):
+        """
+        Testing whether the API only returns the changed downloads when a token is passed
+        """
+        def verify_changes(response):
+            response_json = json.loads(response)
+            self.assertFalse(response_json['full'])
+            self.assertEqual(response_json['removed'], [])
+            for download_json in response_json['downloads']:
+                self.assertNotIn('files', download_json)
+
+        def verify_full(response):
+            response_json = json.loads(response)
+            self.assertTrue(response_json['full'])
+            self.assertEqual(len(response_json['downloads']), 1)
+            self.assertIn('files', response_json['downloads'][0])
+            return self.do_request('downloads?since=%d' % response_json['token'], expected_code=200)\
+                .addCallback(verify_changes)
+
+        video_tdef, _ = self.create_local_torrent(os.path.join(TESTS_DATA_DIR, 'video.avi'))
+        self.session.start_download_from_tdef(video_tdef, DownloadStartupConfig())
+
+        self.should_check_equality = False
+        return self.do_request('downloads?since=0', expected_code=200).addCallback(verify_full)
+
+    @deferred(timeout=10)
+    def test_get_downloads_since_invalid(self):
+        """
+        Testing whether an error is returned when an invalid token is passed
+        """
+        self.should_check_equality = False
+        return self.do_request('downloads?since=abc', expected_code=400)
+
     @deferred(timeout=10)
     def test_start_download_no_uri(self):
         """
@@ -462,3 +498,144 @@ class TestDownloadsDispersyEndpoint(AbstractApiTest):
         return self.do_request('downloads/%s' % infohash, post_data={"remove_data": True}, expected_code=500,
                                expected_json={u'error': {u'message': u'', u'code': u'RuntimeError', u'handled': True}},
                                request_type='DELETE')
+
+
+class TestDownloadChangeTracker(TriblerCoreTest):
+
+    def setUp(self, annotate=True):
+        TriblerCoreTest.setUp(self, annotate=annotate)
+        self.tracker = DownloadChangeTracker(max_removed=1)
+
+    def test_changed_fields(self):
+        """
+        Testing whether only the changed fields of changed downloads are returned
+        """
+        first_token, changed, _ = self.tracker.update([{"infohash": "aa", "progress": 0.1, "name": "a"},
+                                                       {"infohash": "bb", "progress": 0.5, "name": "b"}])
+        self.assertEqual(len(changed), 2)
+
+        token, changed, removed = self.tracker.update([{"infohash": "aa", "progress": 0.2, "name": "a"},
+                                                       {"infohash": "bb", "progress": 0.5, "name": "b"}])
+        self.assertGreater(token, first_token)
+        self.assertEqual(changed, [{"infohash": "aa", "progress": 0.2}])
+        self.assertEqual(removed, [])
+        self.assertEqual(self.tracker.get_changes(first_token), ([{"infohash": "aa", "progress": 0.2}], []))
+        self.assertEqual(self.tracker.get_changes(token), ([], []))
+
+        # Nothing changed, so the token stays the same
+        self.assertEqual(self.tracker.update([{"infohash": "aa", "progress": 0.2, "name": "a"},
+                                              {"infohash": "bb", "progress": 0.5, "name": "b"}]), (token, [], []))
+
+    def test_removed(self):
+        """
+        Testing whether removed downloads are returned and old tokens are refused
+        """
+        first_token, _, _ = self.tracker.update([{"infohash": "aa"}, {"infohash": "bb"}, {"infohash": "cc"}])
+        token, _, removed = self.tracker.update([{"infohash": "aa"}, {"infohash": "bb"}])
+        self.assertEqual(removed, ["cc"])
+        self.assertEqual(self.tracker.get_changes(first_token), ([], ["cc"]))
+
+        # Only one removed download is remembered, so the changes since the first token are lost
+        self.tracker.update([{"infohash": "aa"}])
+        self.assertIsNone(self.tracker.get_changes(first_token))
+        self.assertEqual(self.tracker.get_changes(token), ([], ["bb"]))
+        self.assertEqual(self.tracker.get_downloads(), [{"infohash": "aa"}])
+
+    def test_unknown_token(self):
+        """
+        Testing whether the changes since unknown tokens are not returned
+        """
+        token, _, _ = self.tracker.update([{"infohash": "aa"}])
+        self.assertIsNone(self.tracker.get_changes(0))
+        self.assertIsNone(self.tracker.get_changes(token + 1))
+        self.assertIsNone(self.tracker.get_changes(None))
+
+    def test_partial_update(self):
+        """
+        Testing whether downloads that are not in an update are only removed when their infohash is missing
+        """
+        token, _, _ = self.tracker.update([{"infohash": "aa", "progress": 0.1}, {"infohash": "bb", "progress": 0.1}])
+        self.assertEqual(self.tracker.update([], ["aa", "bb"]), (token, [], []))
+
+        token, changed, removed = self.tracker.update([{"infohash": "aa", "progress": 0.2}], ["aa"])
+        self.assertEqual(changed, [{"infohash": "aa", "progress": 0.2}])
+        self.assertEqual(removed, ["bb"])
+
+
+class FakeDownload(object):
+
+    def __init__(self, infohash):
+        self.tdef = MockObject()
+        self.tdef.get_infohash = lambda: infohash
+        self.state_version = 0
+
+    def get_def(self):
+        return self.tdef
+
+    def get_state_version(self):
+        return self.state_version
+
+    def get_status(self):
+        return 0
+
+    def get_mode(self):
+        return 0
+
+    def get_hops(self):
+        return 0
+
+    def get_anon_mode(self):
+        return False
+
+    def get_safe_seeding(self):
+        return False
+
+    def get_max_speed(self, _):
+        return 0
+
+    def get_dest_dir(self):
+        return u"/"
+
+    def get_selected_files(self):
+        return []
+
+    def network_get_state(self, *_):
+        return None
+
+
+class TestDownloadChanges(TriblerCoreTest):
+
+    def setUp(self, annotate=True):
+        TriblerCoreTest.setUp(self, annotate=annotate)
+        session = MockObject()
+        session.add_observer = lambda *_: None
+        self.endpoint = DownloadsEndpoint(session)
+        self.built = []
+
+        def get_download_json(download, _):
+            self.built.append(download)
+            return {"infohash": download.get_def().get_infohash().encode('hex'), "version": download.state_version}
+        self.endpoint.get_download_json = get_download_json
+
+    def test_update_changed_downloads(self):
+        """
+        Testing whether the JSON representation is only created again for downloads of which the state changed
+        """
+        download_a, download_b = FakeDownload('a' * 20), FakeDownload('b' * 20)
+        token = self.endpoint.update_download_changes([download_a, download_b])
+        self.assertEqual(self.built, [download_a, download_b])
+
+        del self.built[:]
+        self.assertEqual(self.endpoint.update_download_changes([download_a, download_b]), token)
+        self.assertEqual(self.built, [])
+
+        download_a.state_version += 1
+        new_token = self.endpoint.update_download_changes([download_a, download_b])
+        self.assertEqual(self.built, [download_a])
+        self.assertEqual(self.endpoint.download_changes.get_changes(token),
+                         ([{"infohash": ('a' * 20).encode('hex'), "version": 1}], []))
+
+        del self.built[:]
+        self.endpoint.update_download_changes([download_a])
+        self.assertEqual(self.built, [])
+        self.assertEqual(self.endpoint.download_changes.get_changes(new_token), ([], [('b' * 20).encode('hex')]))
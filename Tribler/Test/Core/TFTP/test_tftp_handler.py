@@ -3,7 +3,8 @@ from twisted.internet.defer import inlineCallbacks
 
 from Tribler.Core.TFTP.exception import FileNotFound
 from Tribler.Core.TFTP.handler import TftpHandler, METADATA_PREFIX
-from Tribler.Core.TFTP.packet import OPCODE_OACK, OPCODE_ERROR, OPCODE_RRQ
+from Tribler.Core.TFTP.packet import OPCODE_OACK, OPCODE_ERROR, OPCODE_RRQ, OPCODE_ACK, OPCODE_DATA
+from Tribler.Core.TFTP.session import Session
 from Tribler.Test.Core.base_test import TriblerCoreTest, MockObject
 from Tribler.dispersy.util import blocking_call_on_reactor_thread
 
@@ -43,10 +44,42 @@ class TestTFTPHandler(TriblerCoreTest):
         mock_session = MockObject()
         mock_session.retries = 2
         mock_session.timeout = 1
+        mock_session.rto = 1
         mock_session.last_contact_time = 2
         self.handler._max_retries = 1
         self.assertTrue(self.handler._check_session_timeout(mock_session))
 
+    def test_check_session_timeout_retransmit_window(self):
+        """
+        Testing whether only the blocks that have not been acknowledged are retransmitted on a timeout
+        """
+        sent_packets = []
+        self.handler._send_packet = lambda _, packet, is_retransmission=False: sent_packets.append(packet)
+        session = Session(False, 1, ("127.0.0.1", 1234), OPCODE_RRQ, "test", "a" * 3500, 3500, None,
+                          block_size=1000, window_size=4)
+        session.block_number = 3
+        session.ack_block_number = 1
+        session.last_sent_packet = {'opcode': OPCODE_DATA}
+        session.last_contact_time = 0
+
+        self.assertFalse(self.handler._check_session_timeout(session))
+        self.assertEqual([packet['block_number'] for packet in sent_packets], [2, 3])
+        self.assertEqual(session.retries, 1)
+
+    def test_check_session_timeout_request_fallback(self):
+        """
+        Testing whether a windowed request is retransmitted without the windowsize option on a timeout
+        """
+        sent_packets = []
+        self.handler._send_packet = lambda _, packet, is_retransmission=False: sent_packets.append(packet)
+        session = Session(True, 1, ("127.0.0.1", 1234), OPCODE_RRQ, u"test", '', None, None, window_size=16)
+        session.last_sent_packet = {'opcode': OPCODE_RRQ}
+        session.last_contact_time = 0
+
+        self.assertFalse(self.handler._check_session_timeout(session))
+        self.assertEqual(session.window_size, 1)
+        self.assertNotIn('windowsize', sent_packets[0]['options'])
+
     def test_schedule_callback_processing(self):
         """
         Testing whether scheduling a TFTP callback works correctly
@@ -204,6 +237,72 @@ class TestTFTPHandler(TriblerCoreTest):
         self.handler._handle_packet_as_sender(None, packet)
         self.assertTrue(mocked_handle_error.called)
 
+    def test_handle_packet_as_sender_window(self):
+        """
+        Testing whether the sender sends a window of blocks for every ACK and finishes on the last ACK
+        """
+        sent_packets = []
+        self.handler._send_packet = lambda _, packet, is_retransmission=False: sent_packets.append(packet)
+        session = Session(False, 1, ("127.0.0.1", 1234), OPCODE_RRQ, "test", "a" * 3000, 3000, None,
+                          block_size=1000, window_size=2)
+
+        self.handler._handle_packet_as_sender(session, {'opcode': OPCODE_ACK, 'block_number': 0})
+        self.assertEqual([packet['block_number'] for packet in sent_packets], [1, 2])
+
+        # an old ACK is ignored, the last block is empty since the file size is a multiple of the block size
+        self.handler._handle_packet_as_sender(session, {'opcode': OPCODE_ACK, 'block_number': 0})
+        self.handler._handle_packet_as_sender(session, {'opcode': OPCODE_ACK, 'block_number': 2})
+        self.assertEqual([packet['block_number'] for packet in sent_packets], [1, 2, 3, 4])
+        self.assertEqual(sent_packets[-1]['data'], "")
+        self.assertFalse(session.is_done)
+
+        self.handler._handle_packet_as_sender(session, {'opcode': OPCODE_ACK, 'block_number': 4})
+        self.assertTrue(session.is_done)
+
+    def test_handle_packet_as_receiver_window(self):
+        """
+        Testing whether the receiver acknowledges full windows, gaps and the last block
+        """
+        sent_packets = []
+        self.handler._send_packet = lambda _, packet, is_retransmission=False: sent_packets.append(packet)
+        session = Session(True, 1, ("127.0.0.1", 1234), OPCODE_RRQ, u"test", '', None, None,
+                          block_size=2, window_size=2)
+        self.handler._handle_packet_as_receiver(session, {'opcode': OPCODE_OACK,
+                                                          'options': {'blksize': 2, 'timeout': session.timeout,
+                                                                      'windowsize': 2, 'tsize': 5,
+                                                                      'checksum': "A95sVwv+JL/DKMzXyka3bq2vQzQ="}})
+        self.assertEqual(sent_packets.pop()['block_number'], 0)
+
+        self.handler._handle_packet_as_receiver(session, {'opcode': OPCODE_DATA, 'block_number': 1, 'data': "ab"})
+        self.assertFalse(sent_packets)
+        # block 2 is lost, so the receiver asks for the blocks after block 1
+        self.handler._handle_packet_as_receiver(session, {'opcode': OPCODE_DATA, 'block_number': 3, 'data': "e"})
+        self.assertEqual(sent_packets.pop()['block_number'], 1)
+
+        self.handler._handle_packet_as_receiver(session, {'opcode': OPCODE_DATA, 'block_number': 2, 'data': "cd"})
+        self.assertFalse(sent_packets)
+        self.handler._handle_packet_as_receiver(session, {'opcode': OPCODE_DATA, 'block_number': 3, 'data': "e"})
+        self.assertEqual(sent_packets.pop()['block_number'], 3)
+        self.assertEqual(session.file_data, "abcde")
+        self.assertTrue(session.is_done)
+
+    def test_handle_packet_as_receiver_smaller_window(self):
+        """
+        Testing whether the receiver adopts a smaller window size and refuses a larger one
+        """
+        self.handler._send_packet = lambda _, packet, is_retransmission=False: None
+        session = Session(True, 1, ("127.0.0.1", 1234), OPCODE_RRQ, u"test", '', None, None, window_size=16)
+        packet = {'opcode': OPCODE_OACK, 'options': {'blksize': session.block_size, 'timeout': session.timeout,
+                                                     'tsize': 1, 'checksum': ""}}
+        self.handler._handle_packet_as_receiver(session, packet)
+        self.assertEqual(session.window_size, 1)
+        self.assertFalse(session.is_failed)
+
+        session = Session(True, 1, ("127.0.0.1", 1234), OPCODE_RRQ, u"test", '', None, None, window_size=16)
+        packet['options']['windowsize'] = 32
+        self.handler._handle_packet_as_receiver(session, packet)
+        self.assertTrue(session.is_failed)
+
     def test_handle_error(self):
         """
         Testing the error handling of a tftp handler
@@ -0,0 +1,40 @@
+from Tribler.Core.TFTP.packet import OPCODE_RRQ
+from Tribler.Core.TFTP.session import Session, MIN_TIMEOUT
+from Tribler.Test.Core.base_test import TriblerCoreTest
+
+
+class TestTFTPSession(TriblerCoreTest):
+    """
+    This class contains tests for the TFTP session class.
+    """
+
+    def setUp(self, annotate=True):
+        TriblerCoreTest.setUp(self, annotate=annotate)
+        self.session = Session(True, 1, ("127.0.0.1", 1234), OPCODE_RRQ, u"test", '', 2500, None, block_size=1000,
+                               timeout=2)
+
+    def test_num_blocks(self):
+        """
+        Testing whether the number of blocks includes the last, shorter, block
+        """
+        self.assertEqual(self.session.num_blocks, 3)
+        self.session.file_size = 3000
+        self.assertEqual(self.session.num_blocks, 4)
+
+    def test_rto(self):
+        """
+        Testing whether the retransmission timeout follows the round trip time within its bounds
+        """
+        self.assertEqual(self.session.rto, 2)
+
+        self.session.update_rtt(0.1)
+        self.assertAlmostEqual(self.session.rto, 0.3)
+        self.session.update_rtt(0.1)
+        self.assertAlmostEqual(self.session.rto, 0.25)
+
+        self.session.update_rtt(0.001)
+        self.session.srtt = self.session.rttvar = 0.001
+        self.assertEqual(self.session.rto, MIN_TIMEOUT)
+
+        self.session.update_rtt(10)
+        self.assertEqual(self.session.rto, 2)
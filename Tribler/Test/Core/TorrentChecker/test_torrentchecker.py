@@ -125,6 +125,46 @@ class TestTorrentChecker(TriblerCoreTest):
 
         self.assertEqual(len(controlled_session.infohash_list), 1)
 
+    @blocking_call_on_reactor_thread
+    def test_task_select_tracker_parallel(self):
+        """
+        Test whether no more trackers are checked at the same time than the configured maximum
+        """
+        for index in range(3):
+            self.torrent_checker._torrent_db.addExternalTorrentNoDef(
+                chr(ord('a') + index) * 20, 'ubuntu.iso', [['a.test', 1234]],
+                ['http://tracker%d.com/announce' % index], 5)
+
+        def create_controlled_session(*_, **__):
+            controlled_session = HttpTrackerSession(None, None, None, None)
+            controlled_session.connect_to_tracker = lambda: Deferred()
+            return controlled_session
+
+        self.torrent_checker._max_parallel_sessions = 2
+        self.torrent_checker._create_session_for_request = create_controlled_session
+        self.torrent_checker._task_select_tracker()
+
+        statistics = self.torrent_checker.get_statistics()
+        self.assertEqual(statistics["active_tracker_checks"], 2)
+        self.assertEqual(statistics["trackers_due"], 1)
+        self.assertEqual(statistics["torrents_due"], 2)
+
+    @blocking_call_on_reactor_thread
+    def test_store_tracker_results(self):
+        """
+        Test whether the results of an automatic tracker check are stored and the torrent is not due anymore
+        """
+        self.torrent_checker._torrent_db.addExternalTorrentNoDef(
+            'a' * 20, 'ubuntu.iso', [['a.test', 1234]], ['http://google.com/announce'], 5)
+        self.torrent_checker._store_tracker_results({'http://google.com/announce': [
+            {'infohash': ('a' * 20).encode('hex'), 'seeders': 5, 'leechers': 10}]})
+
+        result = self.torrent_checker._torrent_db.getTorrent('a' * 20, (u'num_seeders', u'num_leechers'), False)
+        self.assertEqual(result[u'num_seeders'], 5)
+        self.assertEqual(result[u'num_leechers'], 10)
+        self.assertFalse(self.torrent_checker._torrent_db.getTorrentsOnTracker(u'http://google.com/announce',
+                                                                                int(time.time())))
+
     @deferred(timeout=30)
     def test_tracker_test_error_resolve(self):
         """
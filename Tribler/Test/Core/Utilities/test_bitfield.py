@@ -0,0 +1,44 @@
+from Tribler.Core.Utilities.bitfield import (BitfieldCounter, bitfield_to_bytes, bitfield_to_int, bitfield_to_string,
+                                             popcount)
+from Tribler.Test.Core.base_test import TriblerCoreTest
+
+
+class TestBitfield(TriblerCoreTest):
+    """
+    Tests for the piece bitfield utilities.
+    """
+
+    def test_bitfield_to_string(self):
+        self.assertEqual(bitfield_to_string([True, False, 2, 0]), '1010')
+        self.assertEqual(bitfield_to_string([]), '')
+
+    def test_bitfield_to_bytes(self):
+        self.assertEqual(bitfield_to_bytes([True, False, True, False, False]), '\xa0')
+        self.assertEqual(bitfield_to_bytes([True] * 9), '\xff\x80')
+        self.assertEqual(bitfield_to_bytes([False] * 16), '\x00\x00')
+        self.assertEqual(bitfield_to_bytes([]), '')
+
+    def test_bitfield_to_int(self):
+        self.assertEqual(bitfield_to_int([True, False, True, True]), 0b1101)
+        self.assertEqual(bitfield_to_int([]), 0)
+
+    def test_popcount(self):
+        self.assertEqual(popcount(0), 0)
+        self.assertEqual(popcount(0b1011), 3)
+        self.assertEqual(popcount(1 << 1000), 1)
+
+    def test_bitfield_counter(self):
+        bitfields = [[True, False, True, False],
+                     [True, True, False, False],
+                     [True, False, True, False, True]]
+        counter = BitfieldCounter(4)
+        for bitfield in bitfields:
+            counter.add(bitfield_to_int(bitfield))
+        self.assertEqual(counter.get_minimum(), (0, 1))
+
+        counter.add(bitfield_to_int([False, False, False, True]))
+        self.assertEqual(counter.get_minimum(), (1, 2))
+
+    def test_bitfield_counter_empty(self):
+        self.assertEqual(BitfieldCounter(3).get_minimum(), (0, 3))
+        self.assertEqual(BitfieldCounter(0).get_minimum(), (0, 0))
@@ -0,0 +1,72 @@
+import random
+
+from Tribler.Core.CacheDB.channelcast_pool import ChannelcastPool
+from Tribler.Test.Core.base_test import TriblerCoreTest
+
+
+class TriblerCoreTestChannelcastPool(TriblerCoreTest):
+
+    def setUp(self, annotate=True):
+        super(TriblerCoreTestChannelcastPool, self).setUp(annotate=annotate)
+        self.pool = ChannelcastPool(recent_size=3, reservoir_size=5, rand=random.Random(42))
+
+    def fill_pool(self):
+        samples = {}
+        for channel_id, cid, num_torrents in [(1, 'a', 10), (2, 'b', 2)]:
+            sample = self.pool.create_sample(cid, modified=100 * channel_id)
+            for timestamp in xrange(num_torrents):
+                self.pool.add_to_sample(sample, '%s%d' % (cid, timestamp), timestamp)
+            samples[channel_id] = sample
+        self.pool.replace(1, [2], [1, 2], samples)
+
+    def test_get_recent(self):
+        self.fill_pool()
+        self.assertEqual(self.pool.get_recent([1], 2), [(9, 'a', 'a9'), (8, 'a', 'a8')])
+        self.assertEqual(self.pool.get_recent([1, 2], 4), [(9, 'a', 'a9'), (8, 'a', 'a8'), (7, 'a', 'a7'),
+                                                           (1, 'b', 'b1')])
+        self.assertEqual(self.pool.get_recent([2], 5, modified_since=200), [])
+        self.assertEqual(self.pool.get_recent([3], 5), [])
+
+    def test_get_random(self):
+        self.fill_pool()
+        self.assertEqual(len(self.pool.get_sample(1).reservoir), 5)
+        self.assertEqual(self.pool.get_sample(1).seen, 10)
+
+        torrents = self.pool.get_random([1], 3, before=7)
+        self.assertEqual(len(set(torrents)), len(torrents))
+        for cid, infohash in torrents:
+            self.assertEqual(cid, 'a')
+            self.assertLess(int(infohash[1:]), 7)
+        self.assertEqual(self.pool.get_random([3], 3, before=7), [])
+        self.assertEqual(self.pool.get_random([2], 3, before=0), [])
+
+    def test_add_remove_torrent(self):
+        self.fill_pool()
+        self.pool.add_torrent(2, 'b9', 9, modified=300)
+        self.pool.add_torrent(3, 'c9', 9)
+        self.assertEqual(self.pool.get_recent([2, 3], 1, modified_since=200), [(9, 'b', 'b9')])
+        self.assertNotIn(3, self.pool)
+
+        self.pool.remove_torrent(2, 'b9')
+        self.assertEqual(self.pool.get_recent([2], 5), [(1, 'b', 'b1'), (0, 'b', 'b0')])
+        self.assertNotIn(('b', 'b9'), self.pool.get_random([2], 5, before=10))
+
+    def test_remove_torrent_seen(self):
+        """
+        Test whether removing a torrent that is not in the reservoir still lowers the number of torrents seen
+        """
+        self.fill_pool()
+        sample = self.pool.get_sample(1)
+        infohash = next('a%d' % timestamp for timestamp in xrange(10)
+                        if (timestamp, 'a%d' % timestamp) not in sample.reservoir)
+        self.pool.remove_torrent(1, infohash)
+        self.assertEqual(sample.seen, 9)
+        self.assertEqual(len(sample.reservoir), 5)
+
+    def test_set_own_channel(self):
+        self.pool.set_own_channel(5, 'e')
+        self.assertEqual(self.pool.own_channel_id, 5)
+        self.pool.add_torrent(5, 'e1', 1)
+        self.assertEqual(self.pool.get_recent([5], 5), [(1, 'e', 'e1')])
+        self.pool.clear()
+        self.assertEqual(len(self.pool), 0)
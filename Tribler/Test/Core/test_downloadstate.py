@@ -120,6 +120,10 @@ class TestDownloadState(TriblerCoreTest):
         self.assertEqual(download_state.get_files_completion(), [(['test.txt', 42], 1.0)])
         self.mock_download.get_selected_files = lambda: [['test.txt', 42], ['test2.txt', 43]]
         self.assertEqual(download_state.get_files_completion(), [(['test.txt', 42], 1.0)])
+        download_state.progress = 0.6
+        download_state.haveslice_total = [True, False, True, True, False, True, True, False, True, False]
+        download_state.filepieceranges = [(0, 4, None, ['test.txt', 42]), (4, 10, None, ['test2.txt', 43])]
+        self.assertEqual(download_state.get_files_completion(), [(['test.txt', 42], 0.75), (['test2.txt', 43], 0.5)])
 
     def test_get_availability(self):
         """
@@ -132,3 +136,8 @@ class TestDownloadState(TriblerCoreTest):
         self.assertEqual(download_state.get_availability(), 1.0)
         download_state.stats = {'spew': [{'completed': 0.6}]}
         self.assertEqual(download_state.get_availability(), 0.0)
+        download_state.stats = {'spew': [{'completed': 1.0},
+                                         {'completed': 0.5, 'have': [True, True, False, False]},
+                                         {'completed': 0.5, 'have': [False, True, True, False]},
+                                         {'completed': 0.25, 'have': [False, False, True, True]}]}
+        self.assertEqual(download_state.get_availability(), 2.5)
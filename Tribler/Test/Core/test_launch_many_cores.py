@@ -4,10 +4,9 @@ from nose.tools import raises
 from twisted.internet.defer import Deferred
 
 from Tribler.Core import NoDispersyRLock
-from Tribler.Core.APIImplementation.LaunchManyCore import TriblerLaunchMany
+from Tribler.Core.APIImplementation.LaunchManyCore import TriblerLaunchMany, RESUME_BATCH_SIZE
 from Tribler.Core.DownloadConfig import DefaultDownloadStartupConfig
 from Tribler.Core.TorrentDef import TorrentDef
-from Tribler.Core.Utilities.configparser import CallbackConfigParser
 from Tribler.Core.exceptions import DuplicateDownloadException
 from Tribler.Core.simpledefs import DLSTATUS_STOPPED_ON_ERROR, DLSTATUS_SEEDING
 from Tribler.Test.Core.base_test import TriblerCoreTest, MockObject
@@ -57,15 +56,6 @@ class TestLaunchManyCore(TriblerCoreTest):
 
         self.lm.add(tdef, DefaultDownloadStartupConfig.getInstance())
 
-    def test_load_download_pstate(self):
-        """
-        Testing whether a pstate is successfully loaded
-        """
-        config_file_path = os.path.abspath(os.path.join(self.DATA_DIR, u"config_files", u"config1.conf"))
-        config = self.lm.load_download_pstate(config_file_path)
-        self.assertIsInstance(config, CallbackConfigParser)
-        self.assertEqual(config.get('general', 'version'), 11)
-
     def test_sessconfig_changed_cb(self):
         """
         Testing whether the callback works correctly when changing session config parameters
@@ -110,31 +100,49 @@ class TestLaunchManyCore(TriblerCoreTest):
 
         return error_stop_deferred
 
+    @deferred(timeout=10)
     def test_load_checkpoint(self):
         """
         Test whether we are resuming downloads after loading checkpoint
         """
-        def mocked_resume_download(filename, setupDelay=3):
-            self.assertTrue(filename.endswith('abcd.state'))
-            self.assertEqual(setupDelay, 0)
+        def mocked_resume_download(infohash, resume_state=None):
+            self.assertEqual(infohash, 'a' * 20)
+            self.assertEqual(resume_state[1:], (None, None))
             mocked_resume_download.called = True
 
-        mocked_resume_download.called = False
-        self.lm.session.get_downloads_pstate_dir = lambda: self.session_base_dir
+        def verify_resumed(_):
+            self.assertTrue(mocked_resume_download.called)
+            self.assertEqual(self.lm.get_resume_statistics()['resumed'], 1)
 
-        with open(os.path.join(self.lm.session.get_downloads_pstate_dir(), 'abcd.state'), 'wb') as state_file:
-            state_file.write("hi")
+        mocked_resume_download.called = False
+        self.lm.checkpoint_store = MockObject()
+        self.lm.checkpoint_store.get_infohashes = lambda: ['a' * 20]
+        self.lm.checkpoint_store.get = lambda _: None
 
         self.lm.initComplete = True
         self.lm.resume_download = mocked_resume_download
-        self.lm.load_checkpoint()
-        self.assertTrue(mocked_resume_download.called)
+        return self.lm.load_checkpoint().addCallback(verify_resumed)
+
+    def test_resume_downloads_batch(self):
+        """
+        Test whether at most one batch of downloads is resumed at a time
+        """
+        resumed = []
+        self.lm.resume_download = lambda infohash, **_: resumed.append(infohash)
+        self.lm.resume_statistics = {"resumed": 0}
+        self.lm.resume_queue.extend(('%020x' % i, None) for i in xrange(RESUME_BATCH_SIZE + 5))
+
+        self.lm._resume_downloads(0, Deferred(), Deferred())
+        self.assertEqual(len(resumed), RESUME_BATCH_SIZE)
+        self.assertEqual(len(self.lm.resume_queue), 5)
+        self.assertTrue(self.lm.is_pending_task_active("resume_downloads"))
+        self.lm.cancel_all_pending_tasks()
 
     def test_resume_download(self):
         with open(os.path.join(TESTS_DATA_DIR, "bak_single.torrent"), mode='rb') as torrent_file:
             torrent_data = torrent_file.read()
 
-        def mocked_load_download_pstate(_):
+        def mocked_get_checkpoint(_):
             raise ValueError()
 
         def mocked_add(tdef, dscfg, pstate, **_):
@@ -144,13 +152,14 @@ class TestLaunchManyCore(TriblerCoreTest):
             mocked_add.called = True
         mocked_add.called = False
 
-        self.lm.load_download_pstate = mocked_load_download_pstate
+        self.lm.checkpoint_store = MockObject()
+        self.lm.checkpoint_store.get = mocked_get_checkpoint
         self.lm.torrent_store = MockObject()
         self.lm.torrent_store.get = lambda _: torrent_data
         self.lm.add = mocked_add
         self.lm.mypref_db = MockObject()
         self.lm.mypref_db.getMyPrefStatsInfohash = lambda _: TESTS_DATA_DIR
-        self.lm.resume_download('%s.state' % ('a' * 20))
+        self.lm.resume_download('a' * 20)
         self.assertTrue(mocked_add.called)
 
 
@@ -12,7 +12,8 @@ from tempfile import mkdtemp
 
 from twisted.internet.task import Clock
 
-from Tribler.Core.leveldbstore import LevelDbStore, WRITEBACK_PERIOD, get_write_batch_plyvel, get_write_batch_leveldb
+from Tribler.Core.leveldbstore import (LevelDbStore, WRITEBACK_PERIOD, COMPRESSED_PREFIX, get_write_batch_plyvel,
+                                       get_write_batch_leveldb)
 from Tribler.Test.test_as_server import BaseTestCase
 
 
@@ -95,6 +96,14 @@ class AbstractTestLevelDBStore(BaseTestCase):
         self.store[K] = V
         self.assertTrue(K in self.store)
 
+    def test_contains_flushed(self):
+        self.store[K] = V
+        self.store.flush()
+        self.store._uncache(K)
+        self.assertTrue(K in self.store)
+        self.assertFalse(K[:-1] in self.store)
+        self.assertFalse(K + "x" in self.store)
+
     @raises(StopIteration)
     def test_iter_empty(self):
         iteritems = self.store.iteritems()
@@ -103,13 +112,84 @@ class AbstractTestLevelDBStore(BaseTestCase):
     def test_iter_one_element(self):
         self.store[K] = V
         iteritems = self.store.iteritems()
-        self.assertEqual(iteritems.next(), K)
+        self.assertEqual(iteritems.next(), (K, V))
+
+    def test_iteritems_flushed(self):
+        self.store[K] = V
+        self.store.flush()
+        self.store["foo2"] = "bar2"
+        self.assertEqual(sorted(self.store.iteritems()), [(K, V), ("foo2", "bar2")])
+        self.assertEqual(sorted(self.store.keys()), [K, "foo2"])
 
     def test_iter(self):
         self.store[K] = V
         for key in iter(self.store):
             self.assertTrue(key)
 
+    def test_len_overwrite_flushed(self):
+        self.store[K] = V
+        self.store.flush()
+        self.assertEqual(1, len(self.store))
+        self.store[K] = "bar2"
+        self.store.flush()
+        self.assertEqual(1, len(self.store))
+        del self.store[K]
+        self.assertEqual(0, len(self.store))
+
+    def test_multi_get_put(self):
+        self.store.multi_put({K: V, "foo2": "bar2"})
+        self.store.flush()
+        self.store.multi_put([("foo3", "bar3")])
+        self.assertEqual(self.store.multi_get([K, "foo3", "foo4"]), {K: V, "foo3": "bar3"})
+
+    def test_multi_delete(self):
+        self.store.multi_put({K: V, "foo2": "bar2"})
+        self.store.flush()
+        self.store["foo3"] = "bar3"
+        self.assertEqual(3, len(self.store))
+        self.store.multi_delete([K, "foo3", "foo4"])
+        self.assertEqual(self.store.keys(), ["foo2"])
+        self.assertEqual(1, len(self.store))
+
+    def test_flush_on_size(self):
+        self.store._writeback_size = 10
+        self.store[K] = "a" * 5
+        self.assertEqual(1, len(self.store._pending_torrents))
+        self.store["foo2"] = "a" * 6
+        self.assertEqual(0, len(self.store._pending_torrents))
+        self.assertEqual(self.store._db.Get("foo2"), "a" * 6)
+
+    def test_read_cache(self):
+        self.store._read_cache_size = 10
+        self.store._db.Put(K, "a" * 5)
+        self.store._db.Put("foo2", "b" * 5)
+        self.store._db.Put("foo3", "c" * 5)
+        self.assertEqual(self.store[K], "a" * 5)
+        self.assertEqual(self.store["foo2"], "b" * 5)
+        self.assertEqual(self.store[K], "a" * 5)
+        self.assertEqual(self.store["foo3"], "c" * 5)
+
+        # The least recently used value is evicted
+        self.assertEqual(self.store._cache.keys(), [K, "foo3"])
+        self.assertEqual(self.store.get_statistics()["cached_bytes"], 10)
+
+        # Writing a key invalidates its cached value
+        self.store[K] = V
+        self.assertEqual(self.store[K], V)
+        self.assertNotIn(K, self.store._cache)
+
+    def test_compress(self):
+        self.store._compress = True
+        torrent = "d4:info" + "l4:spam" * 100 + "ee"
+        self.store.multi_put({K: torrent, "foo2": V, "foo3": COMPRESSED_PREFIX})
+        self.store.flush()
+        self.assertTrue(self.store._db.Get(K).startswith(COMPRESSED_PREFIX))
+        self.assertEqual(self.store._db.Get("foo2"), V)
+
+        self.store._cache.clear()
+        self.assertEqual(self.store.multi_get([K, "foo2", "foo3"]), {K: torrent, "foo2": V, "foo3": COMPRESSED_PREFIX})
+        self.assertEqual(dict(self.store.iteritems())[K], torrent)
+
 
 class TestLevelDBStore(AbstractTestLevelDBStore):
     __test__ = True
@@ -1,6 +1,6 @@
 from twisted.internet.defer import inlineCallbacks, Deferred
 
-from Tribler.Core.CacheDB.Notifier import Notifier
+from Tribler.Core.CacheDB.Notifier import Notifier, OVERFLOW_DROP_NEWEST
 from Tribler.Core.simpledefs import NTFY_TORRENTS, NTFY_STARTED, NTFY_FINISHED
 from Tribler.Test.Core.base_test import TriblerCoreTest
 from Tribler.Test.twisted_thread import deferred
@@ -22,15 +22,14 @@ class TriblerCoreTestNotifier(TriblerCoreTest):
 
     def cache_callback_func(self, events):
         self.called_callback = True
-        self.test_deferred.callback(None)
+        self.test_deferred.callback(events)
 
     @deferred(timeout=10)
     def test_notifier(self):
         notifier = Notifier()
         notifier.add_observer(self.callback_func, NTFY_TORRENTS, [NTFY_STARTED])
         notifier.notify(NTFY_TORRENTS, NTFY_STARTED, None)
-        notifier.remove_observer(self.callback_func)
-        return self.test_deferred
+        return self.test_deferred.addCallback(lambda _: notifier.remove_observer(self.callback_func))
 
     def test_notifier_remove_observers(self):
         notifier = Notifier()
@@ -70,3 +69,60 @@ class TriblerCoreTestNotifier(TriblerCoreTest):
         notifier.notify(NTFY_TORRENTS, NTFY_STARTED, None)
         notifier.remove_observers()
         self.assertEqual(len(notifier.observertimers), 0)
+
+    @deferred(timeout=10)
+    def test_notifier_cache_collapse(self):
+        notifier = Notifier()
+        notifier.add_observer(self.cache_callback_func, NTFY_TORRENTS, [NTFY_STARTED], cache=0.1)
+        notifier.notify(NTFY_TORRENTS, NTFY_STARTED, 'a')
+        notifier.notify(NTFY_TORRENTS, NTFY_STARTED, 'b')
+        notifier.notify(NTFY_TORRENTS, NTFY_STARTED, 'a')
+
+        def verify_events(events):
+            self.assertEqual([event[2] for event in events], ['a', 'b'])
+        return self.test_deferred.addCallback(verify_events)
+
+    @deferred(timeout=10)
+    def test_notifier_statistics(self):
+        notifier = Notifier()
+        notifier.add_observer(self.callback_func, NTFY_TORRENTS, [NTFY_STARTED])
+        notifier.notify(NTFY_TORRENTS, NTFY_STARTED, None)
+
+        def verify_statistics(_):
+            statistics = notifier.get_statistics()[NTFY_TORRENTS]
+            self.assertEqual(statistics["notified"], 1)
+            self.assertEqual(statistics["delivered"], 1)
+            self.assertEqual(statistics["queued"], 0)
+        return self.test_deferred.addCallback(verify_statistics)
+
+    @blocking_call_on_reactor_thread
+    def test_notifier_unbounded(self):
+        notifier = Notifier()
+        notifier.add_observer(self.callback_func, NTFY_TORRENTS, [NTFY_STARTED])
+        for obj_id in xrange(5000):
+            notifier.notify(NTFY_TORRENTS, NTFY_STARTED, obj_id)
+        self.assertEqual(len(notifier.observers[0].events), 5000)
+        self.assertEqual(notifier.get_statistics()[NTFY_TORRENTS]["dropped"], 0)
+        notifier.remove_observers()
+
+    @blocking_call_on_reactor_thread
+    def test_notifier_drop_oldest(self):
+        notifier = Notifier()
+        notifier.add_observer(self.callback_func, NTFY_TORRENTS, [NTFY_STARTED], queue_size=2)
+        for obj_id in xrange(3):
+            notifier.notify(NTFY_TORRENTS, NTFY_STARTED, obj_id)
+        self.assertEqual([args[2] for args, _ in notifier.observers[0].events], [1, 2])
+        self.assertEqual(notifier.get_statistics()[NTFY_TORRENTS]["dropped"], 1)
+        notifier.remove_observers()
+        self.assertEqual(notifier.get_statistics()[NTFY_TORRENTS]["queued"], 0)
+
+    @blocking_call_on_reactor_thread
+    def test_notifier_drop_newest(self):
+        notifier = Notifier()
+        notifier.add_observer(self.callback_func, NTFY_TORRENTS, [NTFY_STARTED], queue_size=2,
+                              overflow=OVERFLOW_DROP_NEWEST)
+        for obj_id in xrange(3):
+            notifier.notify(NTFY_TORRENTS, NTFY_STARTED, obj_id)
+        self.assertEqual([args[2] for args, _ in notifier.observers[0].events], [0, 1])
+        notifier.remove_observers()
+        self.assertFalse(self.called_callback)
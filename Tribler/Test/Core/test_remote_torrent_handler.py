@@ -1,10 +1,106 @@
+from time import time
+
 from twisted.internet.defer import inlineCallbacks
 
-from Tribler.Core.RemoteTorrentHandler import TftpRequester, RemoteTorrentHandler
+from Tribler.Core.RemoteTorrentHandler import TftpRequester, RemoteTorrentHandler, RequestQueue
 from Tribler.Test.Core.base_test import TriblerCoreTest, MockObject
 from Tribler.dispersy.util import blocking_call_on_reactor_thread
 
 
+class TestRequestQueue(TriblerCoreTest):
+    """
+    This class contains tests for the queue of pending requests of a requester.
+    """
+
+    def test_push_duplicate(self):
+        """
+        Test whether a key is queued only once
+        """
+        queue = RequestQueue()
+        request, is_new = queue.push('a', 'source')
+        self.assertTrue(is_new)
+        self.assertEqual(queue.push('a', 'other source'), (request, False))
+        self.assertIn('a', queue)
+        self.assertEqual(len(queue), 1)
+
+    def test_pop_round_robin(self):
+        """
+        Test whether the sources take turns and the requests of a source are served in order
+        """
+        queue = RequestQueue()
+        for key in ['a1', 'a2', 'a3']:
+            queue.push(key, 'a')
+        for key in ['b1', 'b2']:
+            queue.push(key, 'b')
+
+        self.assertEqual([queue.pop().key for _ in xrange(5)], ['a1', 'b1', 'a2', 'b2', 'a3'])
+        self.assertIsNone(queue.pop())
+
+    def test_push_front(self):
+        """
+        Test whether a request that is queued again is served first
+        """
+        queue = RequestQueue()
+        queue.push('a', 'source')
+        queue.push('b', 'source')
+        request = queue.pop()
+        queue.push_front(request)
+        self.assertEqual([queue.pop().key for _ in xrange(2)], ['a', 'b'])
+
+    def test_remove(self):
+        """
+        Test whether a removed request is skipped
+        """
+        queue = RequestQueue()
+        queue.push('a', 'source')
+        queue.push('b', 'source')
+        queue.remove('a')
+        self.assertNotIn('a', queue)
+        self.assertEqual(queue.pop().key, 'b')
+        self.assertIsNone(queue.pop())
+
+    def test_expire(self):
+        """
+        Test whether requests that passed their deadline are dropped and handed to the expired callback
+        """
+        expired = []
+        queue = RequestQueue(expired_callback=lambda request: expired.append(request.key))
+        queue.push('a', 'source')[0].deadline = time() - 1
+        queue.push('b', 'source')
+        self.assertEqual(queue.pop().key, 'b')
+        self.assertEqual(queue.expired, 1)
+        self.assertEqual(expired, ['a'])
+
+    def test_no_expire(self):
+        """
+        Test whether requests that should not expire stay queued after their timeout
+        """
+        queue = RequestQueue()
+        queue.push('a', 'source', expires=False)
+        queue.push('b', 'source')[0].deadline = time() - 1
+        queue.push('b', 'source', expires=False)
+        self.assertEqual([queue.pop().key for _ in xrange(2)], ['a', 'b'])
+        self.assertEqual(queue.expired, 0)
+
+    def test_histograms(self):
+        """
+        Test the histograms of the age of the requests and of the number of requests per source
+        """
+        queue = RequestQueue()
+        queue.push('a', 'source')[0].added = time() - 100
+        queue.push('b', 'source')
+        queue.push('c', 'other source')
+
+        ages, depths = queue.get_histograms()
+        self.assertEqual(ages, [2, 0, 1, 0, 0])
+        self.assertEqual(depths, [1, 1, 0, 0, 0])
+
+        queue.get('c').deadline = time() - 1
+        queue.get_histograms()
+        self.assertEqual(len(queue), 3)
+        self.assertEqual(queue.expired, 0)
+
+
 class TestTftpRequester(TriblerCoreTest):
     """
     This class contains tests for the TFTP requester.
@@ -19,12 +115,90 @@ class TestTftpRequester(TriblerCoreTest):
         self.remote_torrent_handler.running = True
         self.tftp_requester = TftpRequester('test', self.mock_session, self.remote_torrent_handler, 1)
 
+        self.downloads = []
+        self.mock_session.lm = MockObject()
+        self.mock_session.lm.tftp_handler = MockObject()
+        self.mock_session.lm.tftp_handler.download_file = lambda file_name, ip, port, **_: \
+            self.downloads.append((file_name, ip, port))
+
+    @blocking_call_on_reactor_thread
+    @inlineCallbacks
+    def tearDown(self, annotate=True):
+        self.tftp_requester.stop()
+        yield super(TestTftpRequester, self).tearDown(annotate=annotate)
+
+    @staticmethod
+    def create_candidate(port):
+        candidate = MockObject()
+        candidate.sock_addr = ("127.0.0.1", port)
+        return candidate
+
     def test_download_successful_invalid(self):
         """
         Test the callback when a download from a remote peer has finished (with an invalid torrent)
         """
         extra_info = {u'key': 'a' * 20, u'info_hash': 'a' * 20}
-        self.tftp_requester._active_request_list.append('a' * 20)
-        self.tftp_requester._untried_sources['a' * 20] = 'test'
-        self.tftp_requester._tried_sources['a' * 20] = 'test'
+        self.tftp_requester._running_requests['a' * 20] = MockObject()
         self.tftp_requester._on_download_successful('192.168.1.1', 'test.txt', 'a' * 20, extra_info)
+        self.assertFalse(self.tftp_requester._running_requests)
+
+    @blocking_call_on_reactor_thread
+    def test_download_window(self):
+        """
+        Test whether no more downloads than the concurrency window are started at the same time
+        """
+        self.tftp_requester.max_concurrent = 2
+        for index in xrange(3):
+            self.tftp_requester.add_request(chr(index) * 20, self.create_candidate(index + 1))
+        self.tftp_requester._do_request()
+
+        self.assertEqual(len(self.downloads), 2)
+        self.assertEqual(self.tftp_requester.running_request_count, 2)
+        self.assertEqual(self.tftp_requester.pending_request_queue_size, 1)
+
+    @blocking_call_on_reactor_thread
+    def test_download_failed_retry(self):
+        """
+        Test whether a failed download is retried from another candidate first
+        """
+        key = '\x01' * 20
+        candidate = self.create_candidate(1)
+        self.tftp_requester.add_request(key, candidate)
+        self.tftp_requester.add_request(key, candidate)
+        self.tftp_requester.add_request(key, self.create_candidate(2))
+        self.tftp_requester.add_request('\x02' * 20, self.create_candidate(3))
+        self.tftp_requester._do_request()
+
+        self.tftp_requester._on_download_failed(("127.0.0.1", 1), 'test', 'error', {u'key': key.encode('hex')})
+        self.assertEqual(self.tftp_requester.requests_failed, 1)
+
+        self.remote_torrent_handler.cancel_pending_task(self.tftp_requester._name)
+        self.tftp_requester._do_request()
+        self.assertEqual([port for _, _, port in self.downloads], [1, 2])
+
+    @blocking_call_on_reactor_thread
+    def test_expired_callbacks(self):
+        """
+        Test whether the callbacks of expired requests are dropped, unless the torrent is still requested elsewhere
+        """
+        message_requester = MockObject()
+        message_requester.has_request = lambda key: key == '\x03' * 20
+        self.remote_torrent_handler.metadata_requester = self.tftp_requester
+        self.remote_torrent_handler.torrent_requesters[1] = self.tftp_requester
+        self.remote_torrent_handler.torrent_message_requesters[1] = message_requester
+
+        for index, is_metadata in [(1, True), (2, False), (3, False)]:
+            key = chr(index) * 20
+            callbacks = self.remote_torrent_handler.metadata_callbacks if is_metadata \
+                else self.remote_torrent_handler.torrent_callbacks
+            callbacks[key] = set([lambda _: None])
+            self.tftp_requester.add_request(key, self.create_candidate(index), is_metadata=is_metadata)
+        self.assertTrue(self.remote_torrent_handler.is_requested('\x01' * 20, is_metadata=True))
+
+        for request in self.tftp_requester._pending_request_queue._requests.values():
+            request.deadline = time() - 1
+        self.assertIsNone(self.tftp_requester._pending_request_queue.pop())
+
+        self.assertEqual(self.tftp_requester.requests_expired, 3)
+        self.assertFalse(self.remote_torrent_handler.metadata_callbacks)
+        self.assertEqual(self.remote_torrent_handler.torrent_callbacks.keys(), ['\x03' * 20])
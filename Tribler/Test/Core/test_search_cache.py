@@ -0,0 +1,67 @@
+from twisted.internet.defer import inlineCallbacks
+
+from Tribler.Core.CacheDB.search_cache import SearchResultCache
+from Tribler.Test.Core.base_test import TriblerCoreTest
+from Tribler.dispersy.util import blocking_call_on_reactor_thread
+
+
+class TriblerCoreTestSearchResultCache(TriblerCoreTest):
+
+    @blocking_call_on_reactor_thread
+    @inlineCallbacks
+    def setUp(self, annotate=True):
+        yield super(TriblerCoreTestSearchResultCache, self).setUp(annotate=annotate)
+        self.cache = SearchResultCache(max_entries=2, ttl=60)
+
+    def test_get_normalized_keywords(self):
+        self.cache.put([u"Ubuntu", u"iso", u"the"], ["result"], ["a" * 20])
+        self.assertEqual(self.cache.get([u"ISO", u"ubuntu"]), ["result"])
+        self.assertIsNone(self.cache.get([u"ubuntu"]))
+        self.assertEqual(self.cache.get_statistics()["hits"], 1)
+        self.assertEqual(self.cache.get_statistics()["misses"], 1)
+
+    def test_expired(self):
+        self.cache.ttl = -1
+        self.cache.put([u"ubuntu"], ["result"], [])
+        self.assertIsNone(self.cache.get([u"ubuntu"]))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_evict_least_recently_used(self):
+        self.cache.put([u"ubuntu"], ["ubuntu"], [])
+        self.cache.put([u"debian"], ["debian"], [])
+        self.cache.get([u"ubuntu"])
+        self.cache.put([u"fedora"], ["fedora"], [])
+
+        self.assertIsNone(self.cache.get([u"debian"]))
+        self.assertEqual(self.cache.get([u"ubuntu"]), ["ubuntu"])
+        self.assertEqual(self.cache.get_statistics()["evictions"], 1)
+
+    def test_invalidate_terms(self):
+        self.cache.put([u"ubuntu", u"iso"], ["result"], [])
+        self.cache.put([u"ubuntu", u"-server"], ["result"], [])
+
+        self.cache.invalidate_terms([u"ubuntu", u"desktop"])
+        self.assertIsNotNone(self.cache.get([u"ubuntu", u"iso"]))
+        self.assertIsNone(self.cache.get([u"ubuntu", u"-server"]))
+
+        self.cache.invalidate_terms([u"ubuntu", u"iso", u"desktop"])
+        self.assertIsNone(self.cache.get([u"ubuntu", u"iso"]))
+        self.assertEqual(self.cache.get_statistics()["invalidations"], 2)
+
+    def test_invalidate_infohashes(self):
+        self.cache.put([u"ubuntu"], ["result"], ["a" * 20, "b" * 20])
+        self.cache.invalidate_infohashes(["c" * 20])
+        self.assertIsNotNone(self.cache.get([u"ubuntu"]))
+        self.cache.invalidate_infohashes(["b" * 20])
+        self.assertIsNone(self.cache.get([u"ubuntu"]))
+
+    def test_invalidate_channels(self):
+        self.cache.put([u"ubuntu"], ["result"], ["a" * 20], [1, 2])
+        self.cache.invalidate_channels([3])
+        self.assertIsNotNone(self.cache.get([u"ubuntu"]))
+        self.cache.invalidate_channels([2])
+        self.assertIsNone(self.cache.get([u"ubuntu"]))
+
+    def test_empty_query_not_cached(self):
+        self.cache.put([u"the"], ["result"], [])
+        self.assertEqual(len(self.cache), 0)
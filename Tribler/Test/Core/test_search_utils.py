@@ -1,4 +1,6 @@
-from Tribler.Core.Utilities.search_utils import split_into_keywords, filter_keywords
+from struct import pack
+
+from Tribler.Core.Utilities.search_utils import split_into_keywords, filter_keywords, bm25_relevance
 from Tribler.Test.Core.base_test import TriblerCoreTest
 
 
@@ -17,3 +19,26 @@ class TriblerCoreTestSearchUtils(TriblerCoreTest):
         result = filter_keywords(["to", "be", "or", "not", "to", "be"])
         self.assertIsInstance(result, list)
         self.assertEqual(len(result), 4)
+
+    @staticmethod
+    def create_matchinfo(num_rows, hits):
+        """
+        Create a matchinfo('pcnalx') blob for one phrase and three columns, with hits a list of
+        (hits in this row, rows with the term) per column.
+        """
+        values = [1, 3, num_rows] + [0] * 6
+        for hits_this_row, rows_with_term in hits:
+            values += [hits_this_row, hits_this_row, rows_with_term]
+        return pack('I' * len(values), *values)
+
+    def test_bm25_relevance(self):
+        name_match = self.create_matchinfo(100, [(1, 5), (0, 0), (0, 0)])
+        file_match = self.create_matchinfo(100, [(0, 5), (1, 5), (0, 0)])
+        self.assertGreater(bm25_relevance(name_match), bm25_relevance(file_match))
+        self.assertGreater(bm25_relevance(file_match), 0)
+        self.assertEqual(bm25_relevance(self.create_matchinfo(100, [(0, 0)] * 3)), 0)
+
+    def test_bm25_relevance_seeders(self):
+        matchinfo = self.create_matchinfo(100, [(1, 5), (0, 0), (0, 0)])
+        self.assertEqual(bm25_relevance(matchinfo, 10), bm25_relevance(matchinfo) + 10)
+        self.assertEqual(bm25_relevance(matchinfo, None), bm25_relevance(matchinfo))
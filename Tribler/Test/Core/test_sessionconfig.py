@@ -91,6 +91,9 @@ class TestSessionConfig(TriblerCoreTest):
         sci.set_torrent_checking(False)
         self.assertFalse(sci.get_torrent_checking())
 
+        sci.set_torrent_checking_max_parallel_sessions(3)
+        self.assertEqual(sci.get_torrent_checking_max_parallel_sessions(), 3)
+
         sci.set_stop_collecting_threshold(1337)
         self.assertEqual(sci.get_stop_collecting_threshold(), 1337)
 
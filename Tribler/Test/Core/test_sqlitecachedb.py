@@ -9,6 +9,7 @@ from twisted.internet.defer import inlineCallbacks
 
 from Tribler.Test.Core.base_test import TriblerCoreTest, MockObject
 from Tribler.Core.CacheDB.sqlitecachedb import SQLiteCacheDB, DB_SCRIPT_NAME, CorruptedDatabaseError
+from Tribler.Test.twisted_thread import deferred
 from Tribler.dispersy.util import blocking_call_on_reactor_thread
 
 
@@ -86,7 +87,7 @@ class TestSqliteCacheDB(TriblerCoreTest):
     @blocking_call_on_reactor_thread
     @raises(SQLError)
     def test_failed_commit(self):
-        sqlite_test_2 = SQLiteCacheDB(os.path.join(self.session_base_dir, "test_db.db"), self.tribler_db_script)
+        sqlite_test_2 = SQLiteCacheDB(u":memory:", self.tribler_db_script)
         sqlite_test_2.initialize()
         sqlite_test_2.write_version(4)
 
@@ -238,3 +239,101 @@ class TestSqliteCacheDB(TriblerCoreTest):
         self.sqlite_test.delete("person", lastname=("LIKE", "a"))
         one = self.sqlite_test.fetchone(u"SELECT * FROM person")
         self.assertEqual(one, ('x', 'z'))
+
+    @blocking_call_on_reactor_thread
+    def test_no_executor_in_memory(self):
+        self.assertIsNone(self.sqlite_test.executor)
+
+    @deferred(timeout=10)
+    @blocking_call_on_reactor_thread
+    @inlineCallbacks
+    def test_deferred_in_memory(self):
+        self.test_create_db()
+        yield self.sqlite_test.execute_write_deferred(u"INSERT INTO person VALUES (?, ?)", ('a', 'b'))
+        yield self.sqlite_test.executemany_deferred(u"INSERT INTO person VALUES (?, ?)", [('c', 'd'), ('e', 'f')])
+        rows = yield self.sqlite_test.fetchall_deferred(u"SELECT * FROM person")
+        self.assertEqual(len(rows), 3)
+        first_name = yield self.sqlite_test.fetchone_deferred(u"SELECT firstname FROM person WHERE lastname = 'c'")
+        self.assertEqual(first_name, 'd')
+
+    @deferred(timeout=10)
+    @blocking_call_on_reactor_thread
+    @inlineCallbacks
+    def test_deferred_executor(self):
+        sqlite_test_2 = SQLiteCacheDB(os.path.join(self.session_base_dir, "test_db.db"))
+        sqlite_test_2.initialize()
+        sqlite_test_2.execute(u"CREATE TABLE person(lastname, firstname);")
+        self.assertIsNotNone(sqlite_test_2.executor)
+
+        writes = [sqlite_test_2.execute_write_deferred(u"INSERT INTO person VALUES (?, ?)", (str(i), str(i)))
+                  for i in range(50)]
+        writes.append(sqlite_test_2.executemany_deferred(u"INSERT INTO person VALUES (?, ?)",
+                                                         [(str(i), str(i)) for i in range(50, 100)]))
+        for write in writes:
+            yield write
+
+        # The writes should have been coalesced in a few group commits
+        statistics = sqlite_test_2.executor.get_statistics()
+        self.assertEqual(statistics["written_rows"], 100)
+        self.assertLess(statistics["commits"], 51)
+
+        rows = yield sqlite_test_2.fetchall_deferred(u"SELECT * FROM person")
+        self.assertEqual(len(rows), 100)
+        person = yield sqlite_test_2.fetchone_deferred(u"SELECT * FROM person WHERE lastname = '42'")
+        self.assertEqual(person, ('42', '42'))
+        sqlite_test_2.close()
+
+    @deferred(timeout=10)
+    @blocking_call_on_reactor_thread
+    @inlineCallbacks
+    def test_deferred_executor_reactor_writes(self):
+        """
+        Test whether writes on the reactor thread and writes through the executor mix, and whether both are visible
+        to the reactor connection and to the reader connections right away
+        """
+        sqlite_test_2 = SQLiteCacheDB(os.path.join(self.session_base_dir, "test_db.db"))
+        sqlite_test_2.initialize()
+        sqlite_test_2.execute(u"CREATE TABLE person(lastname, firstname);")
+        sqlite_test_2.initial_begin()
+
+        sqlite_test_2.execute_write(u"INSERT INTO person VALUES (?, ?)", ('a', 'a'))
+        yield sqlite_test_2.execute_write_deferred(u"INSERT INTO person VALUES (?, ?)", ('b', 'b'))
+        sqlite_test_2.execute_write(u"INSERT INTO person VALUES (?, ?)", ('c', 'c'))
+        yield sqlite_test_2.executemany_deferred(u"INSERT INTO person VALUES (?, ?)", [('d', 'd'), ('e', 'e')])
+        sqlite_test_2.executemany(u"INSERT INTO person VALUES (?, ?)", [('f', 'f'), ('g', 'g')])
+
+        statistics = sqlite_test_2.executor.get_statistics()
+        self.assertEqual(statistics["failed_writes"], 0)
+        self.assertEqual(statistics["written_rows"], 7)
+        self.assertEqual(sqlite_test_2.fetchone(u"SELECT COUNT(*) FROM person"), 7)
+        count = yield sqlite_test_2.fetchone_deferred(u"SELECT COUNT(*) FROM person")
+        self.assertEqual(count, 7)
+        sqlite_test_2.commit_now(exiting=True)
+        sqlite_test_2.close()
+
+    @blocking_call_on_reactor_thread
+    @raises(SQLError)
+    def test_executor_reactor_write_error(self):
+        """
+        Test whether a failing write on the reactor thread raises and leaves no transaction open
+        """
+        sqlite_test_2 = SQLiteCacheDB(os.path.join(self.session_base_dir, "test_db.db"))
+        sqlite_test_2.initialize()
+        try:
+            sqlite_test_2.execute_write(u"INSERT INTO nonexisting VALUES (?)", (1,))
+        finally:
+            self.assertTrue(sqlite_test_2.executor._write_connection.getautocommit())
+            sqlite_test_2.close()
+
+    @deferred(timeout=10)
+    @blocking_call_on_reactor_thread
+    def test_deferred_executor_write_error(self):
+        sqlite_test_2 = SQLiteCacheDB(os.path.join(self.session_base_dir, "test_db.db"))
+        sqlite_test_2.initialize()
+
+        def on_error(failure):
+            self.assertTrue(failure.check(SQLError))
+            sqlite_test_2.close()
+
+        return sqlite_test_2.execute_write_deferred(u"INSERT INTO nonexisting VALUES (?)", (1,))\
+            .addCallbacks(lambda _: self.fail("Write into a non existing table should fail"), on_error)
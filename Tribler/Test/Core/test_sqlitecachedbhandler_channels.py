@@ -4,6 +4,7 @@ from twisted.internet.defer import inlineCallbacks
 
 from Tribler.Core.CacheDB.SqliteCacheDBHandler import ChannelCastDBHandler, TorrentDBHandler, VoteCastDBHandler
 from Tribler.Core.CacheDB.sqlitecachedb import str2bin
+from Tribler.Core.Category.Category import Category
 from Tribler.Test.Core.test_sqlitecachedbhandler import AbstractDB
 from Tribler.dispersy.util import blocking_call_on_reactor_thread
 
@@ -55,6 +56,28 @@ class TestChannelDBHandler(AbstractDB):
         channels = self.cdb.getChannels([1, 2, 3])
         self.assertEqual(len(channels), 3)
 
+    def test_get_cached_channels(self):
+        channels = self.cdb.get_cached_channels([1, 2, 3])
+        self.assertEqual(len(channels), 3)
+        self.assertEqual(channels[1], self.cdb.getChannel(1))
+
+        # Cached channels should be returned without querying the database
+        self.cdb.getChannels = lambda _: self.fail("Cached channels should not be fetched again")
+        self.assertEqual(self.cdb.get_cached_channels([1, 2]).keys(), [1, 2])
+
+    def test_invalidate_channel_cache(self):
+        self.cdb.get_cached_channels([1, 2])
+        self.cdb._db.execute_write(u"UPDATE _Channels SET nr_spam = 42 WHERE id = 1")
+        self.assertEqual(self.cdb.get_cached_channels([1])[1][6], 5)
+
+        self.cdb.invalidate_channel_cache(1)
+        self.assertEqual(self.cdb.get_cached_channels([1])[1][6], 42)
+
+    def test_get_torrents_from_channel_id_invalidates_cache(self):
+        self.cdb.get_cached_channels([1])
+        self.cdb.getTorrentsFromChannelId(1, True, ["infohash"])
+        self.assertNotIn(1, self.cdb._channel_cache)
+
     def test_get_channels_by_cid(self):
         self.assertEqual(len(self.cdb.getChannelsByCID(["3"])), 0)
 
@@ -116,6 +139,59 @@ class TestChannelDBHandler(AbstractDB):
         self.cdb.on_remove_torrent_from_dispersy(1, 3, False)
         self.assertIsNone(self.cdb.getTorrentFromChannelTorrentId(1, ['ChannelTorrents.dispersy_id']))
 
+    def test_on_torrents_from_dispersy(self):
+        self.tdb.category = Category()
+        infohash = unhexlify('53865489ac16e2f34ea0cd3043cfd970cc24ec09')
+        existing_infohash = str2bin('AA8cTG7ZuPsyblbRE7CyxsrKUCg=')
+        self.cdb.on_torrents_from_dispersy([
+            (1, 1234, None, infohash, 1457795713, u"new torrent", [(u"file1.txt", 42)], ()),
+            (2, 1235, None, existing_infohash, 1457795713, u"existing torrent", [(u"file1.txt", 42)], ())])
+
+        self.assertTrue(self.cdb.hasTorrent(1, infohash))
+        self.assertTrue(self.cdb.hasTorrent(2, existing_infohash))
+        self.assertEqual(self.tdb.getOne('name', torrent_id=self.tdb.getTorrentID(infohash)), u"new torrent")
+
+    @blocking_call_on_reactor_thread
+    @inlineCallbacks
+    def test_get_recent_and_random_torrents(self):
+        """
+        Testing whether channelcast draws the torrents of our favorite channels from the refreshed channelcast pool
+        """
+        self.assertEqual(self.cdb.getRecentAndRandomTorrents(), {})
+
+        yield self.cdb.refresh_channelcast_pool()
+        self.assertIn(1, self.cdb.channelcast_pool)
+        torrents = self.cdb.getRecentAndRandomTorrents()
+        self.assertEqual(torrents.keys(), ['1'])
+        self.assertIn(str2bin('AA8cTG7ZuPsyblbRE7CyxsrKUCg='), torrents['1'])
+        self.assertEqual(len(torrents['1']), 2)
+
+        self.tdb.category = Category()
+        infohash = unhexlify('53865489ac16e2f34ea0cd3043cfd970cc24ec09')
+        self.cdb.on_torrents_from_dispersy([(1, 1234, None, infohash, 1457795713, u"new torrent",
+                                             [(u"file1.txt", 42)], ())])
+        self.assertIn(infohash, self.cdb.getRecentAndRandomTorrents()['1'])
+
+        self.cdb.on_remove_torrent_from_dispersy(1, 1234, False)
+        self.assertNotIn(infohash, self.cdb.getRecentAndRandomTorrents()['1'])
+
+    @blocking_call_on_reactor_thread
+    @inlineCallbacks
+    def test_channelcast_pool_known_torrent(self):
+        """
+        Testing whether a channel torrent that is received again is not added to the channelcast pool twice
+        """
+        yield self.cdb.refresh_channelcast_pool()
+        sample = self.cdb.channelcast_pool.get_sample(1)
+        seen = sample.seen
+
+        self.tdb.category = Category()
+        infohash = unhexlify('53865489ac16e2f34ea0cd3043cfd970cc24ec09')
+        torrent = (1, 1234, None, infohash, 1457795713, u"new torrent", [(u"file1.txt", 42)], ())
+        self.cdb.on_torrents_from_dispersy([torrent, torrent])
+        self.cdb.on_torrents_from_dispersy([torrent])
+        self.assertEqual(sample.seen, seen + 1)
+
     def test_search_local_channels(self):
         """
         Testing whether the right results are returned when searching in the local database for channels
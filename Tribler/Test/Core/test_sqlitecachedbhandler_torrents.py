@@ -1,11 +1,13 @@
 from binascii import unhexlify
 import os
 from shutil import copy as copyfile
+from time import time
 from twisted.internet.defer import inlineCallbacks
 
 from Tribler.Core.Category.Category import Category
-from Tribler.Core.CacheDB.SqliteCacheDBHandler import TorrentDBHandler, MyPreferenceDBHandler, ChannelCastDBHandler
-from Tribler.Core.CacheDB.sqlitecachedb import str2bin
+from Tribler.Core.CacheDB.SqliteCacheDBHandler import (TorrentDBHandler, MyPreferenceDBHandler, ChannelCastDBHandler,
+                                                     MAX_EVICTION_AGE_PENALTY)
+from Tribler.Core.CacheDB.sqlitecachedb import bin2blob, str2bin
 from Tribler.Core.TorrentDef import TorrentDef
 from Tribler.Core.leveldbstore import LevelDbStore
 from Tribler.Test.Core.test_sqlitecachedbhandler import AbstractDB
@@ -196,6 +198,9 @@ class TestTorrentDBHandler(AbstractDB):
         self.tdb.addExternalTorrentNoDef(infohash, "test torrent", [("file1", 42), ("file2", 43)],
                                          [], 1234, extra_info={"seeder": 2, "leecher": 3})
         self.assertTrue(self.tdb.getTorrentID(infohash))
+        # created in 1970, so the creation day is clamped to the maximum age penalty
+        self.assertEqual(self.tdb.getOne('eviction_weight', infohash=bin2blob(infohash)),
+                         11 + long(time()) // 86400 - MAX_EVICTION_AGE_PENALTY)
 
     @blocking_call_on_reactor_thread
     def test_add_external_torrent_no_def_invalid(self):
@@ -204,6 +209,32 @@ class TestTorrentDBHandler(AbstractDB):
                                          [], 1234)
         self.assertFalse(self.tdb.getTorrentID(infohash))
 
+    @blocking_call_on_reactor_thread
+    def test_add_external_torrents_no_def(self):
+        infohash = unhexlify('51865489ac16e2f34ea0cd3043cfd970cc24ec09')
+        other_infohash = unhexlify('52865489ac16e2f34ea0cd3043cfd970cc24ec09')
+        added = self.tdb.addExternalTorrentsNoDef([
+            (infohash, u"test torrent", [(u"file1.txt", 42), (u"file2.txt", 43)], ['http://localhost/announce'],
+             1234, {}),
+            (infohash, u"duplicate torrent", [(u"file1.txt", 42)], [], 1234, {}),
+            (other_infohash, u"test torrent", [], [], 1234, {})])
+        self.assertEqual(added, [infohash])
+
+        torrent_id = self.tdb.getTorrentID(infohash)
+        self.assertEqual(self.tdb.getOne('name', torrent_id=torrent_id), u"test torrent")
+        self.assertEqual(self.tdb.getOne('length', torrent_id=torrent_id), 85)
+        self.assertEqual(len(self.tdb.getTorrentFiles(torrent_id)), 2)
+        self.assertIn(u"DHT", self.tdb.getTrackerListByTorrentID(torrent_id))
+        self.assertFalse(self.tdb.getTorrentID(other_infohash))
+
+    @blocking_call_on_reactor_thread
+    def test_add_external_torrents_no_def_collected(self):
+        infohash = str2bin('AA8cTG7ZuPsyblbRE7CyxsrKUCg=')
+        name = self.tdb.getOne('name', infohash=bin2blob(infohash))
+        self.assertEqual(self.tdb.addExternalTorrentsNoDef([(infohash, u"test torrent", [(u"file1", 42)], [], 1234,
+                                                              {})]), [])
+        self.assertEqual(self.tdb.getOne('name', infohash=bin2blob(infohash)), name)
+
     @blocking_call_on_reactor_thread
     def test_add_get_torrent_id(self):
         infohash = str2bin('AA8cTG7ZuPsyblbRE7CyxsrKUCg=')
@@ -239,6 +270,38 @@ class TestTorrentDBHandler(AbstractDB):
         self.session.lm.torrent_store.close()
         self.assertEqual(res, old_res-20)
 
+    @blocking_call_on_reactor_thread
+    def test_freeSpace_keeps_preferences(self):
+        self.session.lm.torrent_store = LevelDbStore(self.session.get_torrent_store_dir())
+        torrent_id = self.tdb._db.fetchone(u"SELECT torrent_id FROM Torrent WHERE is_collected == 1 "
+                                           u"ORDER BY eviction_weight LIMIT 1")
+        self.tdb._db.insert('MyPreference', torrent_id=torrent_id, destination_path=u'/tmp', creation_time=0)
+        self.tdb.freeSpace(20)
+        self.session.lm.torrent_store.close()
+        self.assertEqual(self.tdb.getOne('is_collected', torrent_id=torrent_id), 1)
+
+    @blocking_call_on_reactor_thread
+    def test_freeSpace_age_penalty(self):
+        self.session.lm.torrent_store = LevelDbStore(self.session.get_torrent_store_dir())
+        torrent_ids = self.tdb._db.fetchall(u"SELECT torrent_id FROM Torrent WHERE is_collected == 1 "
+                                            u"AND torrent_id NOT IN (SELECT torrent_id FROM MyPreference) "
+                                            u"ORDER BY eviction_weight LIMIT 2")
+        # the torrent with the higher stored weight is erased first, because it is much older
+        self.tdb._db.executemany(u"UPDATE Torrent SET relevance = ?, creation_date = ? WHERE torrent_id = ?",
+                                 [(-1000, 0, torrent_ids[0][0]), (-1100, long(time()), torrent_ids[1][0])])
+        self.tdb.freeSpace(1)
+        self.session.lm.torrent_store.close()
+        self.assertEqual(self.tdb.getOne('is_collected', torrent_id=torrent_ids[0][0]), 0)
+        self.assertEqual(self.tdb.getOne('is_collected', torrent_id=torrent_ids[1][0]), 1)
+
+    @blocking_call_on_reactor_thread
+    def test_eviction_weight_updated(self):
+        infohash = str2bin('AA8cTG7ZuPsyblbRE7CyxsrKUCg=')
+        self.tdb.updateTorrent(infohash, notify=False, num_seeders=0)
+        weight = self.tdb.getOne('eviction_weight', infohash=bin2blob(infohash))
+        self.tdb.updateTorrent(infohash, notify=False, num_seeders=10)
+        self.assertEqual(self.tdb.getOne('eviction_weight', infohash=bin2blob(infohash)), weight + 40)
+
     @blocking_call_on_reactor_thread
     def test_get_search_suggestions(self):
         self.assertEqual(self.tdb.getSearchSuggestion(["content", "cont"]), ["content 1"])
@@ -286,6 +349,18 @@ class TestTorrentDBHandler(AbstractDB):
         self.assertEqual(len(results), 4848)
         self.assertEqual(results[0][3], 493785)
 
+    @blocking_call_on_reactor_thread
+    def test_search_names_remote(self):
+        """
+        Test whether a remote search only returns the best torrents, sorted on seeders
+        """
+        columns = ['infohash', 'T.name', 'T.num_seeders']
+        self.tdb.channelcast_db = ChannelCastDBHandler(self.session)
+        results = self.tdb.searchNames(['content'], local=False, keys=columns)
+        self.assertEqual(len(results), 25)
+        seeders = [result[2] for result in results]
+        self.assertEqual(seeders, sorted(seeders, reverse=True))
+
     @blocking_call_on_reactor_thread
     def test_search_local_torrents(self):
         """
@@ -296,3 +371,18 @@ class TestTorrentDBHandler(AbstractDB):
         self.assertNotEqual(results[0][-1], 0.0)  # Relevance score of result should not be zero
         results = self.tdb.search_in_local_torrents_db('fdsafasfds', ['infohash'])
         self.assertEqual(len(results), 0)
+
+    @blocking_call_on_reactor_thread
+    def test_search_local_torrents_limit(self):
+        """
+        Test whether the local torrent search returns the best ranked torrents, paginated with limit and offset
+        """
+        all_results = self.tdb.search_in_local_torrents_db('content', ['infohash', 'num_seeders'])
+        relevances = [result[-1] for result in all_results]
+        self.assertEqual(relevances, sorted(relevances, reverse=True))
+
+        results = self.tdb.search_in_local_torrents_db('content', ['infohash', 'num_seeders'], limit=10)
+        self.assertEqual([result[-1] for result in results], relevances[:10])
+        results = self.tdb.search_in_local_torrents_db('content', ['infohash', 'num_seeders'], limit=10, offset=10)
+        self.assertEqual([result[-1] for result in results], relevances[10:20])
+        self.assertIsNotNone(self.tdb.latest_matchinfo_torrent)
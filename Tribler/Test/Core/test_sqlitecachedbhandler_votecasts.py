@@ -1,6 +1,6 @@
 from twisted.internet.defer import inlineCallbacks
 
-from Tribler.Core.CacheDB.SqliteCacheDBHandler import VoteCastDBHandler, ChannelCastDBHandler
+from Tribler.Core.CacheDB.SqliteCacheDBHandler import VoteCastDBHandler, ChannelCastDBHandler, TorrentDBHandler
 from Tribler.Test.Core.test_sqlitecachedbhandler import AbstractDB
 from Tribler.dispersy.util import blocking_call_on_reactor_thread
 
@@ -13,12 +13,16 @@ class TestVotecastDBHandler(AbstractDB):
         yield super(TestVotecastDBHandler, self).setUp()
 
         self.cdb = ChannelCastDBHandler(self.session)
+        self.tdb = TorrentDBHandler(self.session)
         self.vdb = VoteCastDBHandler(self.session)
         self.vdb.channelcast_db = self.cdb
+        self.vdb.torrent_db = self.tdb
 
     def tearDown(self):
         self.cdb.close()
         self.cdb = None
+        self.tdb.close()
+        self.tdb = None
         self.vdb.close()
         self.vdb = None
 
@@ -54,6 +58,15 @@ class TestVotecastDBHandler(AbstractDB):
         self.vdb.updatedChannels = {}
         self.vdb._flush_to_database()
 
+    @blocking_call_on_reactor_thread
+    def test_flush_to_database_invalidates_caches(self):
+        self.cdb.get_cached_channels([1])
+        self.tdb.remote_search_cache.put([u"ubuntu"], ["result"], ["a" * 20], [1])
+        self.vdb.updatedChannels = {1}
+        self.vdb._flush_to_database()
+        self.assertNotIn(1, self.cdb._channel_cache)
+        self.assertIsNone(self.tdb.remote_search_cache.get([u"ubuntu"]))
+
     @blocking_call_on_reactor_thread
     def test_get_latest_vote_dispersy_id(self):
         self.assertEqual(self.vdb.get_latest_vote_dispersy_id(2, 5), 3)
@@ -6,7 +6,7 @@ from traceback import print_stack
 
 from twisted.python.threadable import isInIOThread
 
-from Tribler.Core.CacheDB.sqlitecachedb import str2bin
+from Tribler.Core.CacheDB.sqlitecachedb import blob2bin
 from Tribler.Core.simpledefs import NTFY_CHANNEL, NTFY_TORRENT
 from Tribler.Core.simpledefs import NTFY_DISCOVERED
 import Tribler.Core.Utilities.json_util as json
@@ -734,7 +734,7 @@ class ChannelCommunity(Community):
                     infohash = self._channelcast_db._db.fetchone(
                         u"SELECT infohash FROM Torrent WHERE torrent_id = ?", (torrent_id,))
                     if infohash:
-                        infohash = str2bin(infohash)
+                        infohash = blob2bin(infohash)
                         logger.debug(
                             "Incoming metadata-json with infohash %s from %s",
                             infohash.encode("HEX"),
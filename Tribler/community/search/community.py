@@ -342,7 +342,13 @@ class SearchCommunity(Community):
             if self.log_incoming_searches:
                 self.log_incoming_searches(message.candidate.sock_addr, keywords)
 
+            results = self._torrent_db.remote_search_cache.get(keywords)
+            if results is not None:
+                self._create_search_response(message.payload.identifier, results, message.candidate)
+                continue
+
             results = []
+            channel_ids = set()
             dbresults = self._torrent_db.searchNames(keywords, local=False, keys=['infohash', 'T.name', 'T.length', 'T.num_files', 'T.category', 'T.creation_date', 'T.num_seeders', 'T.num_leechers'])
             if len(dbresults) > 0:
                 for dbresult in dbresults:
@@ -359,12 +365,15 @@ class SearchCommunity(Community):
                     # cid
                     if channel_details[1]:
                         channel_details[1] = str(channel_details[1])
+                        channel_ids.add(channel_details[0])
                     dbresult.append(channel_details[1])
 
                     results.append(tuple(dbresult))
             elif DEBUG:
                 self._logger.debug(u"no results")
 
+            self._torrent_db.remote_search_cache.put(keywords, results, [result[0] for result in results],
+                                                     channel_ids)
             self._create_search_response(message.payload.identifier, results, message.candidate)
 
     def _create_search_response(self, identifier, results, candidate):
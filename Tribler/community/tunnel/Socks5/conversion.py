@@ -27,6 +27,10 @@ REP_ADDRESS_TYPE_NOT_SUPPORTED = 0x08
 
 logger = logging.getLogger(__name__)
 
+# The maximum number of encoded SOCKS5 UDP headers that are kept for reuse, the cache is emptied when it is full
+UDP_HEADER_CACHE_SIZE = 10000
+_udp_header_cache = {}
+
 
 class MethodRequest(object):
 
@@ -247,14 +251,17 @@ def encode_udp_packet(rsv, frag, address_type, address, port, payload):
     @return: serialised byte string
     @rtype: str
     """
-    strings = [
-        struct.pack("!HBB", rsv, frag, address_type),
-        __encode_address(address_type, address),
-        struct.pack("!H", port),
-        payload
-    ]
-
-    return ''.join(strings)
+    # Most packets come from the same peers, so their headers are encoded once. Keeping track of the least recently
+    # used header costs more than encoding it again, so a full cache is simply emptied.
+    key = (rsv, frag, address_type, address, port)
+    header = _udp_header_cache.get(key)
+    if header is None:
+        if len(_udp_header_cache) >= UDP_HEADER_CACHE_SIZE:
+            _udp_header_cache.clear()
+        header = _udp_header_cache[key] = struct.pack("!HBB", rsv, frag, address_type) + \
+            __encode_address(address_type, address) + struct.pack("!H", port)
+
+    return header + payload
 
 
 class IPV6AddrError(NotImplementedError):
@@ -1,4 +1,5 @@
 import logging
+from collections import defaultdict
 
 from twisted.internet import reactor
 from twisted.internet.defer import DeferredList, maybeDeferred
@@ -102,6 +103,8 @@ class Socks5Connection(Protocol):
         self.buffer = ''
 
         self.destinations = {}
+        # The destinations per circuit, so the circuit of incoming data can be checked without a scan
+        self.circuit_destinations = defaultdict(set)
 
     def dataReceived(self, data):
         self.buffer = self.buffer + data
@@ -241,11 +244,28 @@ class Socks5Connection(Protocol):
             if not selected_circuit:
                 return None
 
-            self.destinations[destination] = selected_circuit
+            self._set_circuit(destination, selected_circuit)
             self._logger.info("SELECT circuit {0} for {1}".format(self.destinations[destination].circuit_id,
                                                                   destination))
         return self.destinations[destination]
 
+    def _set_circuit(self, destination, circuit):
+        old_circuit = self.destinations.get(destination)
+        if old_circuit is circuit:
+            return
+        if old_circuit is not None:
+            self._remove_destination(old_circuit, destination)
+
+        self.destinations[destination] = circuit
+        self.circuit_destinations[circuit].add(destination)
+
+    def _remove_destination(self, circuit, destination):
+        destinations = self.circuit_destinations.get(circuit)
+        if destinations is not None:
+            destinations.discard(destination)
+            if not destinations:
+                del self.circuit_destinations[circuit]
+
     def circuit_dead(self, broken_circuit):
         """
         When a circuit breaks and it affects our operation we should re-add the
@@ -254,22 +274,18 @@ class Socks5Connection(Protocol):
         @param Circuit broken_circuit: the circuit that has been broken
         @return Set with destinations using this circuit
         """
-        affected_destinations = set(
-            destination for destination, tunnel_circuit in self.destinations.iteritems() if tunnel_circuit == broken_circuit)
-        counter = 0
+        affected_destinations = self.circuit_destinations.pop(broken_circuit, set())
         for destination in affected_destinations:
-            if destination in self.destinations:
-                del self.destinations[destination]
-                counter += 1
+            del self.destinations[destination]
 
-        if counter > 0:
-            self._logger.debug("Deleted %d peers from destination list", counter)
+        if affected_destinations:
+            self._logger.debug("Deleted %d peers from destination list", len(affected_destinations))
 
         return affected_destinations
 
     def on_incoming_from_tunnel(self, community, circuit, origin, data, force=False):
-        if circuit in self.destinations.values() or force:
-            self.destinations[origin] = circuit
+        if circuit in self.circuit_destinations or force:
+            self._set_circuit(origin, circuit)
 
             if self._udp_socket:
                 socks5_data = conversion.encode_udp_packet(
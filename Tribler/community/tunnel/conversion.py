@@ -449,11 +449,25 @@ class TunnelConversion(BinaryConversion):
         circuit_id, = unpack_from('!I', packet, circuit_id_pos)
         return circuit_id
 
+    @staticmethod
+    def get_encrypted_pos(message_type):
+        return 4 if message_type == u"data" else 36
+
     @staticmethod
     def split_encrypted_packet(packet, message_type):
-        encryped_pos = 4 if message_type == u"data" else 36
+        encryped_pos = TunnelConversion.get_encrypted_pos(message_type)
         return packet[:encryped_pos], packet[encryped_pos:]
 
+    @staticmethod
+    def get_relay_header(packet, message_type, packed_circuit_id):
+        """
+        Return the plaintext header of a packet that is relayed, with the circuit id replaced by the packed circuit id
+        of the next hop.
+        """
+        if message_type == u"data":
+            return packed_circuit_id
+        return packet[:31] + packed_circuit_id + packet[35]
+
     @staticmethod
     def encode_data(circuit_id, dest_address, org_address, data):
         assert org_address
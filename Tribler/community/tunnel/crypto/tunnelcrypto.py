@@ -1,15 +1,60 @@
 import struct
+from collections import OrderedDict
 
-from cryptowrapper import crypto_box_beforenm, crypto_auth, crypto_auth_verify, Cipher, algorithms, modes, HKDFExpand, hashes, default_backend
+from cryptowrapper import crypto_box_beforenm, crypto_auth, crypto_auth_verify, Cipher, algorithms, modes, HKDFExpand, hashes, default_backend, AESGCM
 from Tribler.dispersy.crypto import ECCrypto, LibNaCLPK
 
+# The number of session keys for which a cipher context is kept around, the least recently used are dropped first
+MAX_CIPHER_CONTEXTS = 4096
+# AESGCM refuses nonces shorter than this
+MIN_AEAD_NONCE_LENGTH = 8
+
 
 class CryptoException(Exception):
     pass
 
 
+class CipherContext(object):
+    """
+    The AES-GCM state of a single session key, reused for every packet that is encrypted or decrypted with that key.
+    """
+
+    __slots__ = ['_algorithm', '_backend', '_aead']
+
+    def __init__(self, key):
+        self._algorithm = algorithms.AES(key)
+        self._backend = default_backend()
+        self._aead = AESGCM(key) if AESGCM else None
+
+    def encrypt(self, content, iv, salt_explicit, header=''):
+        # The header is prepended while assembling the result, so it does not cost an extra copy of the content
+        if self._aead and len(iv) >= MIN_AEAD_NONCE_LENGTH:
+            encrypted = self._aead.encrypt(iv, content, None)
+            return header + struct.pack('!q16s', salt_explicit, encrypted[-16:]) + encrypted[:-16]
+
+        cipher = Cipher(self._algorithm, modes.GCM(initialization_vector=iv), backend=self._backend).encryptor()
+        ciphertext = cipher.update(content)
+        cipher.finalize()
+        return header + struct.pack('!q16s', salt_explicit, cipher.tag) + ciphertext
+
+    def decrypt(self, content, iv, gcm_tag, header='', offset=0):
+        # The encrypted part of content starts at offset and is preceded by the salt_explicit and the gcm tag
+        if self._aead and len(iv) >= MIN_AEAD_NONCE_LENGTH:
+            return header + self._aead.decrypt(iv, content[offset + 24:] + gcm_tag, None)
+
+        cipher = Cipher(self._algorithm, modes.GCM(initialization_vector=iv, tag=gcm_tag),
+                        backend=self._backend).decryptor()
+        plaintext = cipher.update(content[offset + 24:])
+        cipher.finalize()
+        return header + plaintext
+
+
 class TunnelCrypto(ECCrypto):
 
+    def __init__(self):
+        super(TunnelCrypto, self).__init__()
+        self._cipher_contexts = OrderedDict()
+
     def initialize(self, community):
         self.community = community
         self.key = self.community.my_member._ec
@@ -61,15 +106,33 @@ class TunnelCrypto(ECCrypto):
 
         return salt + str(salt_explicit)
 
+    def get_cipher_context(self, key):
+        """
+        Return the cipher context of a session key, creating it if this key has not been used before.
+        """
+        context = self._cipher_contexts.pop(key, None)
+        if context is None:
+            if len(self._cipher_contexts) >= MAX_CIPHER_CONTEXTS:
+                # Contexts of circuits that are still in use are simply recreated on their next packet
+                self._cipher_contexts.popitem(last=False)
+            context = CipherContext(key)
+        # Mark this context as the most recently used one
+        self._cipher_contexts[key] = context
+        return context
+
+    def drop_cipher_contexts(self, session_keys):
+        """
+        Drop the cipher contexts of the session keys of a circuit, relay or exit socket that is being removed.
+        :param session_keys: the session keys as returned by generate_session_keys, may be None.
+        """
+        if session_keys:
+            for key in session_keys[:2]:
+                self._cipher_contexts.pop(key, None)
+
     def encrypt_str(self, content, key, salt, salt_explicit):
         # return the encrypted content prepended with the
         # gcm tag and salt_explicit
-        cipher = Cipher(algorithms.AES(key),
-                        modes.GCM(initialization_vector=self._bulid_iv(salt, salt_explicit)),
-                        backend=default_backend()
-                        ).encryptor()
-        ciphertext = cipher.update(content) + cipher.finalize()
-        return struct.pack('!q16s', salt_explicit, cipher.tag) + ciphertext
+        return self.get_cipher_context(key).encrypt(content, self._bulid_iv(salt, salt_explicit), salt_explicit)
 
     def decrypt_str(self, content, key, salt):
         # content contains the gcm tag and salt_explicit in plaintext
@@ -77,11 +140,49 @@ class TunnelCrypto(ECCrypto):
             raise CryptoException("truncated content")
 
         salt_explicit, gcm_tag = struct.unpack_from('!q16s', content)
-        cipher = Cipher(algorithms.AES(key),
-                        modes.GCM(initialization_vector=self._bulid_iv(salt, salt_explicit), tag=gcm_tag),
-                        backend=default_backend()
-                        ).decryptor()
-        return cipher.update(content[24:]) + cipher.finalize()
+        return self.get_cipher_context(key).decrypt(content, self._bulid_iv(salt, salt_explicit), gcm_tag)
+
+    def relay_encrypt_str(self, header, packet, offset, key, salt, salt_explicit):
+        """
+        Encrypt the part of a relayed packet that starts at offset and put it behind a new plaintext header.
+        """
+        content = packet[offset:] if offset else packet
+        return self.get_cipher_context(key).encrypt(content, self._bulid_iv(salt, salt_explicit), salt_explicit,
+                                                    header)
+
+    def relay_decrypt_str(self, header, packet, offset, key, salt):
+        """
+        Decrypt the part of a relayed packet that starts at offset and put it behind a new plaintext header.
+        """
+        if len(packet) < offset + 24:
+            raise CryptoException("truncated content")
+
+        salt_explicit, gcm_tag = struct.unpack_from('!q16s', packet, offset)
+        return self.get_cipher_context(key).decrypt(packet, self._bulid_iv(salt, salt_explicit), gcm_tag, header,
+                                                    offset)
+
+    def encrypt_str_batch(self, contents, key, salt, salt_explicit):
+        """
+        Encrypt a list of packets with the same session key. The packets use consecutive salt_explicit values,
+        starting at salt_explicit.
+        """
+        context = self.get_cipher_context(key)
+        return [context.encrypt(content, self._bulid_iv(salt, salt_explicit + index), salt_explicit + index)
+                for index, content in enumerate(contents)]
+
+    def decrypt_str_batch(self, contents, key, salt):
+        """
+        Decrypt a list of packets that were encrypted with the same session key.
+        """
+        context = self.get_cipher_context(key)
+        decrypted = []
+        for content in contents:
+            if len(content) < 24:
+                raise CryptoException("truncated content")
+
+            salt_explicit, gcm_tag = struct.unpack_from('!q16s', content)
+            decrypted.append(context.decrypt(content, self._bulid_iv(salt, salt_explicit), gcm_tag))
+        return decrypted
 
 class NoTunnelCrypto(TunnelCrypto):
 
@@ -110,5 +211,17 @@ class NoTunnelCrypto(TunnelCrypto):
     def decrypt_str(self, content, key, salt):
         return content
 
+    def relay_encrypt_str(self, header, packet, offset, key, salt, salt_explicit):
+        return header + packet[offset:]
+
+    def relay_decrypt_str(self, header, packet, offset, key, salt):
+        return header + packet[offset:]
+
+    def encrypt_str_batch(self, contents, key, salt, salt_explicit):
+        return list(contents)
+
+    def decrypt_str_batch(self, contents, key, salt):
+        return list(contents)
+
 if __name__ == "__main__":
     tc = TunnelCrypto()
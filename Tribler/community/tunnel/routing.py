@@ -1,4 +1,5 @@
 import time
+from struct import pack
 
 from Tribler.community.tunnel import CIRCUIT_STATE_READY, CIRCUIT_STATE_BROKEN, CIRCUIT_STATE_EXTENDING, \
     CIRCUIT_TYPE_DATA
@@ -190,6 +191,8 @@ class RelayRoute(object):
 
         self.sock_addr = sock_addr
         self.circuit_id = circuit_id
+        # Header bytes of the packets that are relayed to this route, so they are not packed for every packet
+        self.packed_circuit_id = pack('!I', circuit_id)
         self.creation_time = time.time()
         self.last_incoming = time.time()
         self.bytes_up = self.bytes_down = 0
@@ -299,6 +299,8 @@ class TunnelCommunity(Community):
                              '43e8807e6f86ef2f0a784fbc8fa21f8bc49a82ae'.decode('hex'),
                              'e79efd8853cef1640b93c149d7b0f067f6ccf221'.decode('hex')]
         self.bittorrent_peers = {}
+        # Set by a CircuitRouter that hands the crypto of relays and exit sockets to worker processes
+        self.circuit_router = None
 
         self.trsession = self.settings = self.socks_server = None
 
@@ -418,10 +420,10 @@ class TunnelCommunity(Community):
     def crypto(self):
         return self.settings.crypto
 
-    def get_session_keys(self, keys, direction):
-        # increment salt_explicit
-        keys[direction + 4] += 1
-        return keys[direction], keys[direction + 2], keys[direction + 4]
+    def get_session_keys(self, keys, direction, count=1):
+        # increment salt_explicit, reserving one value for each of the count packets
+        keys[direction + 4] += count
+        return keys[direction], keys[direction + 2], keys[direction + 4] - count + 1
 
     @property
     def dispersy_enable_bloom_filter_sync(self):
@@ -614,6 +616,9 @@ class TunnelCommunity(Community):
                 self.destroy_circuit(circuit_id)
 
             circuit = self.circuits.pop(circuit_id)
+            for hop in circuit.hops:
+                self.crypto.drop_cipher_contexts(hop.session_keys)
+            self.crypto.drop_cipher_contexts(circuit.hs_session_keys)
             if self.notifier:
                 peer = (circuit.first_hop[0], circuit.first_hop[1])
                 from Tribler.Core.simpledefs import NTFY_TUNNEL, NTFY_REMOVE
@@ -660,13 +665,15 @@ class TunnelCommunity(Community):
                 self.tunnel_logger.info("Removing relay %d %s", cid, additional_info)
                 # Remove the relay
                 relay = self.relay_from_to.pop(cid)
+                if self.circuit_router:
+                    self.circuit_router.remove(cid)
                 if self.notifier:
                     peer = (relay.sock_addr[0], relay.sock_addr[1])
                     from Tribler.Core.simpledefs import NTFY_TUNNEL, NTFY_REMOVE
                     self.notifier.notify(NTFY_TUNNEL, NTFY_REMOVE, relay, self.copy_shallow_candidate(relay, peer))
                 # Remove old session key
                 if cid in self.relay_session_keys:
-                    del self.relay_session_keys[cid]
+                    self.crypto.drop_cipher_contexts(self.relay_session_keys.pop(cid))
 
                 if cid in self.directions:
                     del self.directions[cid]
@@ -680,6 +687,8 @@ class TunnelCommunity(Community):
 
             # Close socket
             exit_socket = self.exit_sockets.pop(circuit_id)
+            if self.circuit_router:
+                self.circuit_router.remove_exit(circuit_id)
             if self.notifier:
                 peer = (exit_socket.sock_addr[0], exit_socket.sock_addr[1])
                 from Tribler.Core.simpledefs import NTFY_TUNNEL, NTFY_REMOVE
@@ -691,7 +700,7 @@ class TunnelCommunity(Community):
                 def on_exit_socket_closed(_):
                     # Remove old session key
                     if circuit_id in self.relay_session_keys:
-                        del self.relay_session_keys[circuit_id]
+                        self.crypto.drop_cipher_contexts(self.relay_session_keys.pop(circuit_id))
 
                 exit_socket.close().addCallback(on_exit_socket_closed)
 
@@ -757,6 +766,10 @@ class TunnelCommunity(Community):
 
     def send_data(self, candidates, circuit_id, dest_address, source_address, data):
         packet = TunnelConversion.encode_data(circuit_id, dest_address, source_address, data)
+        if self.circuit_router and circuit_id not in self.circuits and \
+                self.circuit_router.send_data(circuit_id, packet):
+            # The worker of the exit socket encrypts the packet, after which the router sends it
+            return len(packet)
         return self.send_message(candidates, u"data", packet, circuit_id)
 
     def send_message(self, candidates, message_type, packet, circuit_id):
@@ -800,20 +813,28 @@ class TunnelCommunity(Community):
             this_relay.last_incoming = time.time()
             self.increase_bytes_received(this_relay, len(packet))
 
-        plaintext, encrypted = TunnelConversion.split_encrypted_packet(packet, message_type)
+        if self.circuit_router and message_type == u"data" and not next_relay.rendezvous_relay and \
+                self.circuit_router.relay_packet(circuit_id, packet):
+            # The worker of the relay does the crypto, after which the router sends the packet to the next hop
+            return True
+
         try:
             if next_relay.rendezvous_relay:
+                plaintext, encrypted = TunnelConversion.split_encrypted_packet(packet, message_type)
                 decrypted = self.crypto_in(circuit_id, encrypted)
                 encrypted = self.crypto_out(next_relay.circuit_id, decrypted)
+                packet = TunnelConversion.swap_circuit_id(plaintext + encrypted, message_type, circuit_id,
+                                                          next_relay.circuit_id)
             else:
-                encrypted = self.crypto_relay(circuit_id, encrypted)
-            packet = plaintext + encrypted
+                # Fast path: the new header is put in front of the re-encrypted part while it is being assembled
+                header = TunnelConversion.get_relay_header(packet, message_type, next_relay.packed_circuit_id)
+                packet = self.crypto_relay(circuit_id, packet, TunnelConversion.get_encrypted_pos(message_type),
+                                           header)
 
         except CryptoException, e:
             self.tunnel_logger.error(str(e))
             return False
 
-        packet = TunnelConversion.swap_circuit_id(packet, message_type, circuit_id, next_relay.circuit_id)
         self.increase_bytes_sent(next_relay, self.send_packet([Candidate(next_relay.sock_addr, False)], message_type, packet))
         return True
 
@@ -1070,6 +1091,8 @@ class TunnelCommunity(Community):
             else:
                 candidate_mid = self.dispersy.get_member(public_key=message.payload.node_public_key).mid.encode('hex')
             self.exit_sockets[circuit_id] = TunnelExitSocket(circuit_id, self, candidate.sock_addr, candidate_mid)
+            if self.circuit_router:
+                self.circuit_router.add_exit(circuit_id, self.relay_session_keys[circuit_id])
 
             if self.notifier:
                 from Tribler.Core.simpledefs import NTFY_TUNNEL, NTFY_JOINED
@@ -1101,6 +1124,9 @@ class TunnelCommunity(Community):
                 self.relay_session_keys[request.to_circuit_id] = self.relay_session_keys[request.from_circuit_id]
 
                 self.directions[request.from_circuit_id] = EXIT_NODE
+                if self.circuit_router:
+                    self.circuit_router.add_relay(request.from_circuit_id, request.to_circuit_id,
+                                                  self.relay_session_keys[request.from_circuit_id])
                 self.remove_exit_socket(request.from_circuit_id)
 
                 self.send_cell([Candidate(forwarding_relay.sock_addr, False)], u"extended", (forwarding_relay.circuit_id,
@@ -1174,6 +1200,11 @@ class TunnelCommunity(Community):
         if self.is_relay(circuit_id):
             self.relay_packet(circuit_id, message_type, packet)
 
+        elif self.circuit_router and circuit_id not in self.circuits and \
+                self.circuit_router.exit_data(circuit_id, sock_addr, packet):
+            # The worker of the exit socket decrypts the packet, after which the router exits it
+            pass
+
         else:
             plaintext, encrypted = TunnelConversion.split_encrypted_packet(packet, message_type)
 
@@ -1292,23 +1323,38 @@ class TunnelCommunity(Community):
             self.tunnel_logger.error("Dropping data packets with unknown circuit_id")
 
     def crypto_out(self, circuit_id, content, is_data=False):
+        return self.crypto_out_batch(circuit_id, [content], is_data=is_data)[0]
+
+    def crypto_out_batch(self, circuit_id, contents, is_data=False):
+        """
+        Add the encryption layers of a circuit to a list of packets, one onion layer at a time.
+        """
         circuit = self.circuits.get(circuit_id, None)
         if circuit:
             if circuit and is_data and circuit.ctype in [CIRCUIT_TYPE_RENDEZVOUS, CIRCUIT_TYPE_RP]:
                 direction = int(circuit.ctype == CIRCUIT_TYPE_RP)
-                content = self.crypto.encrypt_str(content, *self.get_session_keys(circuit.hs_session_keys, direction))
+                contents = self.crypto.encrypt_str_batch(contents, *self.get_session_keys(circuit.hs_session_keys,
+                                                                                          direction, len(contents)))
 
             for hop in reversed(circuit.hops):
-                content = self.crypto.encrypt_str(content, *self.get_session_keys(hop.session_keys, EXIT_NODE))
-            return content
+                contents = self.crypto.encrypt_str_batch(contents, *self.get_session_keys(hop.session_keys, EXIT_NODE,
+                                                                                          len(contents)))
+            return contents
 
         elif circuit_id in self.relay_session_keys:
-            return self.crypto.encrypt_str(content,
-                                           *self.get_session_keys(self.relay_session_keys[circuit_id], ORIGINATOR))
+            return self.crypto.encrypt_str_batch(contents, *self.get_session_keys(self.relay_session_keys[circuit_id],
+                                                                                  ORIGINATOR, len(contents)))
 
         raise CryptoException("Don't know how to encrypt outgoing message for circuit_id %d" % circuit_id)
 
     def crypto_in(self, circuit_id, content, is_data=False):
+        return self.crypto_in_batch(circuit_id, [content], is_data=is_data)[0]
+
+    def crypto_in_batch(self, circuit_id, contents, is_data=False):
+        """
+        Remove the encryption layers of a circuit from a list of packets, one onion layer at a time. If any of the
+        packets cannot be decrypted a CryptoException is raised for the entire batch.
+        """
         circuit = self.circuits.get(circuit_id, None)
         if circuit:
             if len(circuit.hops) > 0:
@@ -1317,47 +1363,53 @@ class TunnelCommunity(Community):
                 for hop in self.circuits[circuit_id].hops:
                     layer += 1
                     try:
-                        content = self.crypto.decrypt_str(content,
-                                                          hop.session_keys[ORIGINATOR],
-                                                          hop.session_keys[ORIGINATOR_SALT])
+                        contents = self.crypto.decrypt_str_batch(contents,
+                                                                 hop.session_keys[ORIGINATOR],
+                                                                 hop.session_keys[ORIGINATOR_SALT])
                     except InvalidTag as e:
                         raise CryptoException("Got exception %r when trying to remove encryption layer %s "
-                                              "for message: %r received for circuit_id: %s, is_data: %i, circuit_hops:"
-                                              " %r" % (e, layer, content, circuit_id, is_data, circuit.hops))
+                                              "for messages: %r received for circuit_id: %s, is_data: %i, "
+                                              "circuit_hops: %r" % (e, layer, contents, circuit_id, is_data,
+                                                                    circuit.hops))
 
                 if is_data and circuit.ctype in [CIRCUIT_TYPE_RENDEZVOUS, CIRCUIT_TYPE_RP]:
                     direction = int(circuit.ctype != CIRCUIT_TYPE_RP)
                     direction_salt = direction + 2
-                    content = self.crypto.decrypt_str(content,
-                                                      circuit.hs_session_keys[direction],
-                                                      circuit.hs_session_keys[direction_salt])
-                return content
+                    contents = self.crypto.decrypt_str_batch(contents,
+                                                             circuit.hs_session_keys[direction],
+                                                             circuit.hs_session_keys[direction_salt])
+                return contents
 
             else:
                 raise CryptoException("Error decrypting message for circuit %d, circuit is set to 0 hops.")
 
         elif circuit_id in self.relay_session_keys:
             try:
-                return self.crypto.decrypt_str(content,
-                                               self.relay_session_keys[circuit_id][EXIT_NODE],
-                                               self.relay_session_keys[circuit_id][EXIT_NODE_SALT])
+                return self.crypto.decrypt_str_batch(contents,
+                                                     self.relay_session_keys[circuit_id][EXIT_NODE],
+                                                     self.relay_session_keys[circuit_id][EXIT_NODE_SALT])
             except InvalidTag as e:
-                raise CryptoException("Got exception %r when trying to decrypt relay message: "
+                raise CryptoException("Got exception %r when trying to decrypt relay messages: "
                                       "%r received for circuit_id: %s, is_data: %i, " %
-                                      (e, content, circuit_id, is_data))
+                                      (e, contents, circuit_id, is_data))
 
         raise CryptoException("Received message for unknown circuit ID: %d" % circuit_id)
 
-    def crypto_relay(self, circuit_id, content):
+    def crypto_relay(self, circuit_id, packet, offset, header):
+        """
+        Add or remove the encryption layer of a relayed packet, for the part of the packet starting at offset.
+        The result is returned behind the given plaintext header.
+        """
         direction = self.directions[circuit_id]
         if direction == ORIGINATOR:
-            return self.crypto.encrypt_str(content,
-                                           *self.get_session_keys(self.relay_session_keys[circuit_id], ORIGINATOR))
+            return self.crypto.relay_encrypt_str(header, packet, offset,
+                                                 *self.get_session_keys(self.relay_session_keys[circuit_id],
+                                                                        ORIGINATOR))
         elif direction == EXIT_NODE:
             try:
-                return self.crypto.decrypt_str(content,
-                                               self.relay_session_keys[circuit_id][EXIT_NODE],
-                                               self.relay_session_keys[circuit_id][EXIT_NODE_SALT])
+                return self.crypto.relay_decrypt_str(header, packet, offset,
+                                                     self.relay_session_keys[circuit_id][EXIT_NODE],
+                                                     self.relay_session_keys[circuit_id][EXIT_NODE_SALT])
             except InvalidTag:
                 # Reasons that can cause this:
                 # - The introductionpoint circuit is extended with a candidate
@@ -1379,7 +1431,7 @@ class TunnelCommunity(Community):
                                      "  circuit_id: %r\n"
                                      "  content: : %r\n"
                                      "  Possibly corrupt data?",
-                                     direction, circuit_id, content)
+                                     direction, circuit_id, packet[offset:])
 
         raise CryptoException("Direction must be either ORIGINATOR or EXIT_NODE")
 
@@ -0,0 +1,466 @@
+"""
+Crypto workers of the tunnel community.
+
+A tunnel helper that runs with crypto workers is still a single peer. The coordinator process runs the walker, sets up
+every circuit and sends and receives every packet from its own Dispersy socket. Only the crypto of the data cells of
+the relays and exit sockets it is part of is done elsewhere: each of these circuits is assigned to one worker process,
+the worker gets the session keys of the circuit once, and from then on the coordinator routes the data cells of the
+circuit to that worker by circuit id, over the loopback interface. A worker learns the address of its coordinator over
+its stdin and drops the datagrams of every other sender, so no other local process can install session keys in a
+worker or have it encrypt and decrypt cells.
+
+Both sides of a relay share their session keys, so they are always assigned to the same worker. Workers encrypt with
+salt_explicit values starting at WORKER_SALT_EXPLICIT, which keeps them clear of the values the coordinator uses for
+the cells it still encrypts itself. The circuits of a worker that dies are destroyed, since their nonce state is lost
+with the worker.
+
+The worker process is started with: python -m Tribler.community.tunnel.workers
+"""
+import logging
+import os
+import socket
+import sys
+from struct import pack, unpack_from
+
+from cryptography.exceptions import InvalidTag
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred, DeferredList, maybeDeferred, succeed
+from twisted.internet.error import MessageLengthError, ProcessExitedAlready
+from twisted.internet.protocol import DatagramProtocol, ProcessProtocol
+from twisted.protocols.basic import LineReceiver
+
+from Tribler.community.tunnel import EXIT_NODE, EXIT_NODE_SALT, ORIGINATOR, ORIGINATOR_SALT
+from Tribler.community.tunnel.conversion import TunnelConversion
+from Tribler.community.tunnel.crypto.tunnelcrypto import CryptoException, TunnelCrypto
+from Tribler.dispersy.candidate import Candidate
+
+# The operations of the messages between the coordinator and its workers
+OP_ADD_RELAY = 1
+OP_ADD_EXIT = 2
+OP_REMOVE = 3
+OP_RELAY = 4
+OP_EXIT_IN = 5
+OP_EXIT_OUT = 6
+
+# Every message starts with the operation, the circuit id and the address the coordinator got the packet from.
+# The worker echoes this header in front of its result.
+HEADER_FORMAT = '!BI4sH'
+HEADER_LENGTH = 11
+SESSION_KEYS_FORMAT = '!16s16s4s4s'
+
+# The first salt_explicit a worker encrypts with, far above the ones of the coordinator
+WORKER_SALT_EXPLICIT = 1 << 62
+
+# The number of seconds after which a worker that died is started again
+RESTART_DELAY = 5.0
+
+DATA_ENCRYPTED_POS = TunnelConversion.get_encrypted_pos(u"data")
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+
+
+def pack_header(op, circuit_id, sock_addr=('0.0.0.0', 0)):
+    return pack(HEADER_FORMAT, op, circuit_id, socket.inet_aton(sock_addr[0]), sock_addr[1])
+
+
+def unpack_header(data):
+    op, circuit_id, host, port = unpack_from(HEADER_FORMAT, data)
+    return op, circuit_id, (socket.inet_ntoa(host), port)
+
+
+class TunnelWorker(DatagramProtocol):
+    """
+    Does the crypto of the data cells of the circuits that the coordinator assigned to this worker.
+    """
+
+    def __init__(self, crypto, coordinator=None):
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self.crypto = crypto
+        # the address of the circuit router of the coordinator, the only sender this worker accepts datagrams from
+        self.coordinator = coordinator
+        # circuit_id -> (direction, packed circuit id of the next hop, session keys, [last salt_explicit])
+        self.circuits = {}
+        self.num_packets = 0
+        self.num_dropped = 0
+        self.num_rejected = 0
+
+    def datagramReceived(self, data, source):
+        if source != self.coordinator:
+            self.num_rejected += 1
+            return
+
+        if len(data) < HEADER_LENGTH:
+            return
+
+        op, circuit_id = unpack_from('!BI', data)
+        payload = data[HEADER_LENGTH:]
+
+        if op == OP_ADD_RELAY:
+            to_circuit_id, = unpack_from('!I', payload)
+            self.add_relay(circuit_id, to_circuit_id, unpack_from(SESSION_KEYS_FORMAT, payload, 4))
+        elif op == OP_ADD_EXIT:
+            self.add_exit(circuit_id, unpack_from(SESSION_KEYS_FORMAT, payload))
+        elif op == OP_REMOVE:
+            circuit = self.circuits.pop(circuit_id, None)
+            if circuit:
+                self.crypto.drop_cipher_contexts(circuit[2])
+        else:
+            try:
+                result = self.process_packet(op, circuit_id, payload)
+            except (CryptoException, InvalidTag, KeyError) as e:
+                self.num_dropped += 1
+                self._logger.warning("Dropping packet for circuit %d: %r", circuit_id, e)
+                return
+
+            self.num_packets += 1
+            try:
+                self.transport.write(data[:HEADER_LENGTH] + result, source)
+            except (AttributeError, MessageLengthError, socket.error) as e:
+                self.num_dropped += 1
+                self._logger.error("Failed to return packet for circuit %d: %r", circuit_id, e)
+
+    def add_relay(self, from_circuit_id, to_circuit_id, session_keys):
+        # A relay can be set up on the circuit of an exit socket, which may already have encrypted with these keys
+        counter = self.circuits[from_circuit_id][3] if from_circuit_id in self.circuits else [WORKER_SALT_EXPLICIT]
+        self.circuits[from_circuit_id] = (EXIT_NODE, pack('!I', to_circuit_id), session_keys, counter)
+        self.circuits[to_circuit_id] = (ORIGINATOR, pack('!I', from_circuit_id), session_keys, counter)
+
+    def add_exit(self, circuit_id, session_keys):
+        self.circuits[circuit_id] = (None, None, session_keys, [WORKER_SALT_EXPLICIT])
+
+    def process_packet(self, op, circuit_id, packet):
+        direction, next_circuit_id, keys, counter = self.circuits[circuit_id]
+
+        if op == OP_RELAY:
+            if direction == ORIGINATOR:
+                counter[0] += 1
+                return self.crypto.relay_encrypt_str(next_circuit_id, packet, DATA_ENCRYPTED_POS, keys[ORIGINATOR],
+                                                     keys[ORIGINATOR_SALT], counter[0])
+            elif direction == EXIT_NODE:
+                return self.crypto.relay_decrypt_str(next_circuit_id, packet, DATA_ENCRYPTED_POS, keys[EXIT_NODE],
+                                                     keys[EXIT_NODE_SALT])
+
+        elif op == OP_EXIT_IN:
+            return packet[:DATA_ENCRYPTED_POS] + self.crypto.decrypt_str(packet[DATA_ENCRYPTED_POS:],
+                                                                        keys[EXIT_NODE], keys[EXIT_NODE_SALT])
+
+        elif op == OP_EXIT_OUT:
+            counter[0] += 1
+            return packet[:DATA_ENCRYPTED_POS] + self.crypto.encrypt_str(packet[DATA_ENCRYPTED_POS:],
+                                                                        keys[ORIGINATOR], keys[ORIGINATOR_SALT],
+                                                                        counter[0])
+
+        raise CryptoException("Can't process operation %d for circuit %d" % (op, circuit_id))
+
+
+class WorkerHandle(object):
+    """
+    The coordinator side of a single worker.
+    """
+
+    def __init__(self, index, address, pid=None):
+        self.index = index
+        self.address = address
+        self.pid = pid
+        self.circuit_ids = set()
+        self.packets_sent = 0
+        self.packets_received = 0
+
+    def get_stats(self):
+        return {'index': self.index, 'pid': self.pid, 'port': self.address[1], 'circuits': len(self.circuit_ids),
+                'packets_sent': self.packets_sent, 'packets_received': self.packets_received}
+
+
+class CircuitRouter(DatagramProtocol):
+    """
+    Assigns the relays and exit sockets of a tunnel community to its workers, and routes their data cells to the
+    worker that owns them. The results are sent on from the community, so peers only ever see the coordinator.
+    """
+
+    def __init__(self, community):
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self.community = community
+        self.workers = {}
+        # circuit_id -> (worker, OP_ADD_RELAY or OP_ADD_EXIT)
+        self.circuits = {}
+        self.port = None
+
+    def start(self):
+        self.port = reactor.listenUDP(0, self, interface='127.0.0.1')
+        self.community.circuit_router = self
+
+    def get_address(self):
+        """
+        Return the address the workers get their datagrams from.
+        """
+        host = self.port.getHost()
+        return host.host, host.port
+
+    def stop(self):
+        if self.community.circuit_router is self:
+            self.community.circuit_router = None
+        if self.port:
+            port, self.port = self.port, None
+            return maybeDeferred(port.stopListening)
+        return succeed(None)
+
+    def add_worker(self, index, address, pid=None):
+        self._logger.info("Worker %d is listening on %s:%d", index, *address)
+        self.workers[index] = WorkerHandle(index, address, pid)
+
+    def remove_worker(self, index):
+        worker = self.workers.pop(index, None)
+        if not worker:
+            return
+
+        for circuit_id in worker.circuit_ids:
+            self.circuits.pop(circuit_id, None)
+
+        # The nonce state of these circuits died with the worker, so they can't be continued by anyone else
+        for circuit_id in worker.circuit_ids:
+            if circuit_id in self.community.relay_from_to:
+                self.community.remove_relay(circuit_id, "worker %d died" % index, destroy=True)
+            elif circuit_id in self.community.exit_sockets:
+                self.community.remove_exit_socket(circuit_id, "worker %d died" % index, destroy=True)
+
+    def select_worker(self):
+        if self.workers:
+            return min(self.workers.itervalues(), key=lambda worker: len(worker.circuit_ids))
+
+    def add_relay(self, from_circuit_id, to_circuit_id, session_keys):
+        """
+        Assign both sides of a relay to a worker. A relay that replaces an exit socket stays with its worker.
+        """
+        if from_circuit_id in self.circuits:
+            worker = self.circuits[from_circuit_id][0]
+        else:
+            worker = self.select_worker()
+            if not worker:
+                return False
+
+        for circuit_id in (from_circuit_id, to_circuit_id):
+            self.circuits[circuit_id] = (worker, OP_ADD_RELAY)
+            worker.circuit_ids.add(circuit_id)
+        self.send(worker, pack_header(OP_ADD_RELAY, from_circuit_id) + pack('!I', to_circuit_id) +
+                  pack(SESSION_KEYS_FORMAT, *session_keys[:4]))
+        return True
+
+    def add_exit(self, circuit_id, session_keys):
+        worker = self.select_worker()
+        if not worker:
+            return False
+
+        self.circuits[circuit_id] = (worker, OP_ADD_EXIT)
+        worker.circuit_ids.add(circuit_id)
+        self.send(worker, pack_header(OP_ADD_EXIT, circuit_id) + pack(SESSION_KEYS_FORMAT, *session_keys[:4]))
+        return True
+
+    def remove(self, circuit_id):
+        worker, _ = self.circuits.pop(circuit_id, (None, None))
+        if worker:
+            worker.circuit_ids.discard(circuit_id)
+            self.send(worker, pack_header(OP_REMOVE, circuit_id))
+
+    def remove_exit(self, circuit_id):
+        # The exit socket of a circuit is removed after a relay took over its circuit id
+        if self.circuits.get(circuit_id, (None, None))[1] == OP_ADD_EXIT:
+            self.remove(circuit_id)
+
+    def relay_packet(self, circuit_id, packet):
+        return self.forward(OP_RELAY, circuit_id, packet)
+
+    def exit_data(self, circuit_id, sock_addr, packet):
+        return self.forward(OP_EXIT_IN, circuit_id, packet, sock_addr)
+
+    def send_data(self, circuit_id, packet):
+        return self.forward(OP_EXIT_OUT, circuit_id, packet)
+
+    def forward(self, op, circuit_id, packet, sock_addr=('0.0.0.0', 0)):
+        """
+        Hand a data cell to the worker that owns its circuit. Returns False if the circuit is not owned by a worker.
+        """
+        worker, _ = self.circuits.get(circuit_id, (None, None))
+        if not worker:
+            return False
+
+        worker.packets_sent += 1
+        self.send(worker, pack_header(op, circuit_id, sock_addr) + packet)
+        return True
+
+    def send(self, worker, data):
+        try:
+            self.transport.write(data, worker.address)
+        except (AttributeError, MessageLengthError, socket.error) as e:
+            self._logger.error("Failed to write to worker %d: %r", worker.index, e)
+
+    def datagramReceived(self, data, source):
+        if len(data) < HEADER_LENGTH:
+            return
+
+        op, circuit_id, sock_addr = unpack_header(data)
+        worker, _ = self.circuits.get(circuit_id, (None, None))
+        if not worker or worker.address != source:
+            # The circuit was removed while the worker was busy with this packet
+            return
+
+        worker.packets_received += 1
+        packet = data[HEADER_LENGTH:]
+
+        if op == OP_RELAY:
+            next_relay = self.community.relay_from_to.get(circuit_id)
+            if next_relay:
+                self.community.increase_bytes_sent(next_relay, self.community.send_packet(
+                    [Candidate(next_relay.sock_addr, False)], u"data", packet))
+
+        elif op == OP_EXIT_IN:
+            circuit_id, destination, _, data = TunnelConversion.decode_data(packet)
+            if destination != ('0.0.0.0', 0):
+                self.community.exit_data(circuit_id, sock_addr, destination, data)
+            else:
+                self._logger.warning("cannot exit data, destination is 0.0.0.0:0")
+
+        elif op == OP_EXIT_OUT:
+            exit_socket = self.community.exit_sockets.get(circuit_id)
+            if exit_socket:
+                self.community.send_packet([Candidate(exit_socket.sock_addr, False)], u"data", packet)
+
+    def get_worker_stats(self):
+        return [worker.get_stats() for _, worker in sorted(self.workers.iteritems())]
+
+
+class TunnelWorkerProtocol(ProcessProtocol):
+    """
+    Monitors a single worker process, which reports the port it listens on over stdout.
+    """
+
+    def __init__(self, pool, index):
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self.pool = pool
+        self.index = index
+        self.ended = Deferred()
+        self.buffer = ''
+
+    def outReceived(self, data):
+        self.buffer += data
+        while '\n' in self.buffer:
+            line, self.buffer = self.buffer.split('\n', 1)
+            if line.startswith('port '):
+                self.pool.on_worker_started(self.index, int(line[5:]))
+            else:
+                self._logger.info("Worker %d: %s", self.index, line)
+
+    def errReceived(self, data):
+        for line in data.splitlines():
+            self._logger.warning("Worker %d: %s", self.index, line)
+
+    def processEnded(self, reason):
+        self._logger.warning("Worker %d ended: %s", self.index, reason.getErrorMessage())
+        self.pool.on_worker_ended(self.index)
+        self.ended.callback(None)
+
+
+class TunnelWorkerPool(object):
+    """
+    Starts the worker processes of a circuit router and restarts the ones that die.
+    """
+
+    def __init__(self, router, num_workers):
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self.router = router
+        self.num_workers = num_workers
+        self.should_run = True
+        self.clock = reactor
+        # index -> (protocol, transport)
+        self.processes = {}
+        self.restart_calls = {}
+        self.restarts = [0] * num_workers
+
+    def start(self):
+        for index in xrange(self.num_workers):
+            self.start_worker(index)
+
+    def spawn_process(self, protocol):
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(path for path in [ROOT_DIR, env.get('PYTHONPATH')] if path)
+        args = [sys.executable, '-m', 'Tribler.community.tunnel.workers']
+        return reactor.spawnProcess(protocol, args[0], args, env=env)
+
+    def start_worker(self, index):
+        self.restart_calls.pop(index, None)
+        if self.should_run:
+            self._logger.info("Starting worker %d", index)
+            protocol = TunnelWorkerProtocol(self, index)
+            transport = self.spawn_process(protocol)
+            self.processes[index] = (protocol, transport)
+            # the worker only accepts datagrams from the circuit router
+            transport.write('coordinator %s %d\n' % self.router.get_address())
+
+    def on_worker_started(self, index, port):
+        if index in self.processes:
+            self.router.add_worker(index, ('127.0.0.1', port), self.processes[index][1].pid)
+
+    def on_worker_ended(self, index):
+        self.processes.pop(index, None)
+        self.router.remove_worker(index)
+        if self.should_run:
+            self.restarts[index] += 1
+            self.restart_calls[index] = self.clock.callLater(RESTART_DELAY, self.start_worker, index)
+
+    def get_worker_stats(self):
+        stats = self.router.get_worker_stats()
+        for worker_stats in stats:
+            worker_stats['restarts'] = self.restarts[worker_stats['index']]
+        return stats
+
+    def stop(self):
+        self.should_run = False
+        for restart_call in self.restart_calls.values():
+            restart_call.cancel()
+        self.restart_calls.clear()
+
+        deferreds = []
+        for protocol, transport in self.processes.values():
+            deferreds.append(protocol.ended)
+            try:
+                transport.signalProcess('TERM')
+            except ProcessExitedAlready:
+                pass
+        return DeferredList(deferreds)
+
+
+class WorkerControlProtocol(LineReceiver):
+    """
+    Tells the coordinator the port of the worker and hands the address of the coordinator to the worker. Stops the
+    worker when the coordinator closes its stdin.
+    """
+    delimiter = '\n'
+
+    def __init__(self, worker, port):
+        self.worker = worker
+        self.port = port
+
+    def connectionMade(self):
+        self.sendLine('port %d' % self.port)
+
+    def lineReceived(self, line):
+        parts = line.split()
+        if len(parts) == 3 and parts[0] == 'coordinator' and parts[2].isdigit():
+            self.worker.coordinator = (parts[1], int(parts[2]))
+
+    def connectionLost(self, reason):
+        if reactor.running:
+            reactor.stop()
+
+
+def main():
+    from twisted.internet.stdio import StandardIO
+
+    logging.basicConfig(level=logging.WARNING, stream=sys.stderr)
+    worker = TunnelWorker(TunnelCrypto())
+    port = reactor.listenUDP(0, worker, interface='127.0.0.1')
+    StandardIO(WorkerControlProtocol(worker, port.getHost().port))
+    reactor.run()
+
+
+if __name__ == "__main__":
+    main()
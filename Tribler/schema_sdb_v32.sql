@@ -32,7 +32,7 @@ CREATE UNIQUE INDEX permid_idx
 
 CREATE TABLE Torrent (
   torrent_id       integer PRIMARY KEY AUTOINCREMENT NOT NULL,
-  infohash		   text NOT NULL,
+  infohash		   blob NOT NULL,
   name             text,
   length           integer,
   creation_date    integer,
@@ -49,13 +49,31 @@ CREATE TABLE Torrent (
   is_collected     integer DEFAULT 0,
   last_tracker_check    integer DEFAULT 0,
   tracker_check_retries integer DEFAULT 0,
-  next_tracker_check    integer DEFAULT 0
+  next_tracker_check    integer DEFAULT 0,
+  eviction_weight       numeric DEFAULT 0
 );
 
 CREATE UNIQUE INDEX infohash_idx
   ON Torrent
   (infohash);
 
+-- the weight of a collected torrent plus the day it was created on, clamped to at most 500 days ago, the torrents
+-- with the lowest weight are erased first when the collection is full
+CREATE INDEX Torrent_eviction_idx
+  ON Torrent
+  (is_collected, eviction_weight);
+
+-- inserts set the weight themselves, updates of the swarm information or the creation date recompute it
+CREATE TRIGGER Torrent_eviction_weight_update
+  AFTER UPDATE OF relevance, num_seeders, num_leechers, creation_date ON Torrent
+BEGIN
+  UPDATE Torrent SET eviction_weight =
+    MIN(IFNULL(NEW.relevance, 0), 2500) + MIN(500, IFNULL(NEW.num_leechers, 0)) + 4 * MIN(500, IFNULL(NEW.num_seeders, 0))
+    + MIN(CAST(strftime('%s', 'now') AS integer) / 86400,
+          MAX(IFNULL(NEW.creation_date, 0) / 86400, CAST(strftime('%s', 'now') AS integer) / 86400 - 500))
+  WHERE torrent_id = NEW.torrent_id;
+END;
+
 ----------------------------------------
 
 CREATE TABLE TrackerInfo (
@@ -69,11 +87,16 @@ CREATE TABLE TrackerInfo (
 CREATE TABLE TorrentTrackerMapping (
   torrent_id  integer NOT NULL,
   tracker_id  integer NOT NULL,
+  next_check  integer DEFAULT 0,
   FOREIGN KEY (torrent_id) REFERENCES Torrent(torrent_id),
   FOREIGN KEY (tracker_id) REFERENCES TrackerInfo(tracker_id),
   PRIMARY KEY (torrent_id, tracker_id)
 );
 
+CREATE INDEX TorrentTrackerMapping_next_check_idx
+  ON TorrentTrackerMapping
+  (tracker_id, next_check, torrent_id);
+
 ----------------------------------------
 
 CREATE VIEW CollectedTorrent AS SELECT * FROM Torrent WHERE is_collected == 1;
@@ -83,7 +106,7 @@ CREATE VIEW CollectedTorrent AS SELECT * FROM Torrent WHERE is_collected == 1;
 
 CREATE TABLE IF NOT EXISTS _Channels (
   id                        integer         PRIMARY KEY ASC,
-  dispersy_cid              text,
+  dispersy_cid              blob,
   peer_id                   integer,
   name                      text            NOT NULL,
   description               text,
@@ -277,7 +300,7 @@ COMMIT TRANSACTION create_table;
 
 BEGIN TRANSACTION init_values;
 
-INSERT INTO MyInfo VALUES ('version', 28);
+INSERT INTO MyInfo VALUES ('version', 32);
 
 INSERT INTO TrackerInfo (tracker) VALUES ('no-DHT');
 INSERT INTO TrackerInfo (tracker) VALUES ('DHT');
@@ -13,7 +13,7 @@ from collections import defaultdict, deque
 from twisted.application.service import MultiService, IServiceMaker
 from twisted.conch import manhole_tap
 from twisted.internet import reactor
-from twisted.internet.defer import maybeDeferred, succeed
+from twisted.internet.defer import gatherResults, maybeDeferred, succeed
 from twisted.internet.stdio import StandardIO
 from twisted.internet.task import LoopingCall
 
@@ -41,6 +41,7 @@ from Tribler.Core.simpledefs import dlstatus_strings
 from Tribler.Core.DownloadConfig import DefaultDownloadStartupConfig
 from Tribler.community.tunnel.hidden_community import HiddenTunnelCommunity
 from Tribler.community.tunnel.tunnel_community import TunnelSettings
+from Tribler.community.tunnel.workers import CircuitRouter, TunnelWorkerPool
 from Tribler.dispersy.candidate import Candidate
 from Tribler.dispersy.tool.clean_observers import clean_twisted_observers
 from Tribler.dispersy.util import blockingCallFromThread
@@ -89,6 +90,14 @@ def check_json_port(val):
 check_json_port.coerceDoc = "Json API port must be greater than 0."
 
 
+def check_num_workers(val):
+    num_workers = int(val)
+    if num_workers < 0:
+        raise ValueError("Invalid number of workers")
+    return num_workers
+check_num_workers.coerceDoc = "The number of workers must be 0 or greater."
+
+
 class Options(usage.Options):
     optFlags = [
         ["exit", "x", "Allow being an exit-node"],
@@ -102,6 +111,8 @@ class Options(usage.Options):
         ["dispersy", "d", -1, 'Dispersy port', check_dispersy_port],
         ["crawl", "c", None, 'Enable crawler and use the keypair specified in the given filename', check_crawler_keypair],
         ["tunnelapi", "j", 0, 'Enable JSON api, which will run on the provided port number', check_json_port],
+        ["workers", "w", 0, 'Do the crypto of relays and exit sockets in the given number of worker processes',
+         check_num_workers],
     ]
 
 
@@ -138,15 +149,46 @@ class TunnelRootEndpoint(resource.Resource):
 class TunnelStatsEndpoint(resource.Resource):
     """
     This endpoint is responsible for handling tunnel stats requests.
+
+    It returns the average traffic in KB/s as originator, exit node and relay, as seen by the crawler. Crypto workers
+    do not change this: the coordinator still sends and receives all traffic and keeps all traffic stats.
     """
     def __init__(self, tunnel):
         resource.Resource.__init__(self)
         self.tunnel = tunnel
+        self.putChild("community", TunnelCommunityStatsEndpoint(self.tunnel))
+        self.putChild("workers", TunnelWorkerStatsEndpoint(self.tunnel))
 
     def render_GET(self, request):
         return json.dumps(self.tunnel.get_stats())
 
 
+class TunnelCommunityStatsEndpoint(resource.Resource):
+    """
+    This endpoint is responsible for handling requests for the traffic and circuit stats of the tunnel community,
+    including the traffic of the circuits of which a worker does the crypto.
+    """
+    def __init__(self, tunnel):
+        resource.Resource.__init__(self)
+        self.tunnel = tunnel
+
+    def render_GET(self, request):
+        return json.dumps(self.tunnel.get_community_stats())
+
+
+class TunnelWorkerStatsEndpoint(resource.Resource):
+    """
+    This endpoint is responsible for handling requests for the stats of the individual crypto workers: the number of
+    circuits they own, the number of packets routed to them and back, and how often they were restarted.
+    """
+    def __init__(self, tunnel):
+        resource.Resource.__init__(self)
+        self.tunnel = tunnel
+
+    def render_GET(self, request):
+        return json.dumps(self.tunnel.get_worker_stats())
+
+
 class TunnelHistoryEndpoint(resource.Resource):
     """
     This endpoint is responsible for handling tunnel history requests.
@@ -173,7 +215,7 @@ class TunnelCommunityCrawler(HiddenTunnelCommunity):
 class Tunnel(object):
     __single = None
 
-    def __init__(self, settings, crawl_keypair_filename=None, dispersy_port=-1):
+    def __init__(self, settings, crawl_keypair_filename=None, dispersy_port=-1, num_workers=0):
         if Tunnel.__single:
             raise RuntimeError("Tunnel is singleton")
         Tunnel.__single = self
@@ -182,6 +224,8 @@ class Tunnel(object):
         self.should_run = True
         self.crawl_keypair_filename = crawl_keypair_filename
         self.dispersy_port = dispersy_port
+        self.num_workers = num_workers
+        self.circuit_router = self.worker_pool = None
         self.crawl_data = defaultdict(lambda: [])
         self.crawl_message = {}
         self.current_stats = [0, 0, 0]
@@ -278,6 +322,13 @@ class Tunnel(object):
             if introduce_port:
                 self.community.add_discovered_candidate(Candidate(('127.0.0.1', introduce_port), tunnel=False))
 
+            if self.num_workers:
+                logger.info("Starting %d crypto workers", self.num_workers)
+                self.circuit_router = CircuitRouter(self.community)
+                self.circuit_router.start()
+                self.worker_pool = TunnelWorkerPool(self.circuit_router, self.num_workers)
+                self.worker_pool.start()
+
         blockingCallFromThread(reactor, start_community)
 
         self.session.set_download_states_callback(self.download_states_callback, interval=4.0)
@@ -299,9 +350,22 @@ class Tunnel(object):
             self.build_history_lc.stop()
             self.build_history_lc = None
 
-        if self.session:
-            logger.info("Going to shutdown session")
-            return self.session.shutdown()
+        deferreds = []
+        if self.worker_pool:
+            deferreds.append(self.worker_pool.stop())
+            deferreds.append(self.circuit_router.stop())
+            self.worker_pool = self.circuit_router = None
+
+        def on_workers_failed(failure):
+            logger.error("Failed to stop the crypto workers: %s", failure.value.subFailure.getErrorMessage())
+
+        def shutdown_session(_):
+            if self.session:
+                logger.info("Going to shutdown session")
+                return self.session.shutdown()
+
+        # the session is shut down once the workers have been killed and the circuit router stopped listening
+        return gatherResults(deferreds, consumeErrors=True).addErrback(on_workers_failed).addCallback(shutdown_session)
 
     def preprocess_stats(self, stats):
         result = defaultdict(int)
@@ -316,6 +380,19 @@ class Tunnel(object):
     def get_stats(self):
         return [round(f, 2) for f in self.current_stats]
 
+    def get_community_stats(self):
+        if not self.community:
+            return {}
+
+        stats = dict(self.community.stats)
+        stats['circuits'] = len(self.community.circuits)
+        stats['relays'] = len(self.community.relay_from_to)
+        stats['exit_sockets'] = len(self.community.exit_sockets)
+        return stats
+
+    def get_worker_stats(self):
+        return self.worker_pool.get_worker_stats() if self.worker_pool else []
+
 
 class LineHandler(LineReceiver):
     delimiter = os.linesep
@@ -463,7 +540,7 @@ class TunnelHelperServiceMaker(object):
         else:
             logger.info("Multichain disabled")
 
-        tunnel = Tunnel(settings, crawl_keypair_filename, dispersy_port)
+        tunnel = Tunnel(settings, crawl_keypair_filename, dispersy_port, options["workers"])
         StandardIO(LineHandler(tunnel))
 
         def stop_tunnel_api():